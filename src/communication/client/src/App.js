@@ -47,7 +47,6 @@ import ViewStats from "./components/Pages/ViewStats";
 
 
 
-let socket_alt = null
 let socket = null
 let server_url = "https://localhost:443/"
 
@@ -98,7 +97,8 @@ class App extends Component {
     createRealtimeSocket = () => {
         if (this.state.isLoggedIn === true) {
             if (socket === null || !socket.connected) {
-                socket = io.connect(server_url + this.state.username)
+                // one namespace for all the users, the server puts the socket in the rooms of the user on init
+                socket = io.connect(server_url + "notifications")
                 socket.on("store_update", (msg) => {
                     let txt = msg['data']
                     console.log(txt)
@@ -111,11 +111,7 @@ class App extends Component {
                     }, this.forceUpdate)
                 });
                 socket.on('connect', () => {
-                    if (socket_alt === null || !socket_alt.connected) {
-                        console.log("at alt:: connect")
-                        socket_alt = io.connect(server_url + "accept")
-                    }
-                    socket_alt.emit('init', {data: this.state.username})
+                    socket.emit('init', {data: this.state.username})
                 });
                 console.log("after connect, username: " + this.state.username)
 
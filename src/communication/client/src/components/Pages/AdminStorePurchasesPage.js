@@ -15,7 +15,9 @@ export class AdminStorePurchasesPage extends Component {
         errors: FormUtils.defaultStoreNameDictionary(),
         been_submitted: false,
         msg: "",
-        purchases: []
+        purchases: [],
+        searched_store: "",
+        next_cursor: null
     };
     formUtils = new FormUtils();
 
@@ -29,23 +31,40 @@ export class AdminStorePurchasesPage extends Component {
     }
     sendIfPossible = () => {
         if (this.state.errors["is_valid"]) {
-            axios.get(
-                `/fetch_store_purchases_as_admin/${this.props.getUserId()}/${this.state.storename}`
-            )
-                .then((res) => {
-                    console.log(res)
-                    this.dealWithSearchResult(res);
-                }).catch(error => {
-                console.log(error)
-                this.dealWithSearchResult(error.response);
-            });
+            this.fetchPurchases(this.state.storename, null);
         }
     }
 
-    dealWithSearchResult = (res) => {
+    fetchPurchases = (storename, cursor) => {
+        axios.get(
+            `/fetch_store_purchases_as_admin/${this.props.getUserId()}/${storename}`,
+            {
+                params: cursor !== null ? {cursor: cursor} : {}
+            }
+        )
+            .then((res) => {
+                console.log(res)
+                this.dealWithSearchResult(res, storename, cursor);
+            }).catch(error => {
+            console.log(error)
+            this.dealWithSearchResult(error.response, storename, cursor);
+        });
+    }
+
+    loadMore = () => {
+        this.fetchPurchases(this.state.searched_store, this.state.next_cursor);
+    }
+
+    dealWithSearchResult = (res, storename, cursor) => {
         if(res){
             if (res.status === HttpStatus.CREATED || res.status === HttpStatus.OK) {
-            this.setState({msg: "", purchases: res.data !== null && 'purchases' in res.data ? res.data.purchases : []})
+            const page = res.data !== null && 'purchases' in res.data ? res.data.purchases : [];
+            this.setState({
+                msg: "",
+                purchases: cursor !== null ? this.state.purchases.concat(page) : page,
+                searched_store: storename,
+                next_cursor: res.data !== null && 'next_cursor' in res.data ? res.data.next_cursor : null
+            })
             } else {
             this.setState({msg: this.convertErrorToMessage(res.data["error"])})
             }
@@ -116,6 +135,10 @@ export class AdminStorePurchasesPage extends Component {
                         <MDBRow>
                             <PurchaseTable purchases={this.state.purchases}/>
                         </MDBRow>
+                        {this.state.next_cursor !== null ?
+                            <MDBRow style={{justifyContent: "center"}}>
+                                <MDBBtn onClick={this.loadMore} outline color="info">Load More</MDBBtn>
+                            </MDBRow> : null}
                     </MDBContainer>
                 </React.Fragment>
             );
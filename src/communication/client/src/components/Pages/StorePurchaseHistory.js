@@ -1,29 +1,52 @@
 import React, {Component} from "react";
 import axios from "axios";
+import {MDBBtn} from "mdbreact";
 import PurchaseTable from "../PurchaseTable";
 import {withRouter} from "react-router-dom";
 
 export class StorePurchaseHistory extends Component {
     state = {
-        purchases: []
+        purchases: [],
+        next_cursor: null
     }
 
     componentDidMount() {
+        this.fetchPurchases(null);
+    }
+
+    fetchPurchases = (cursor) => {
         axios.get(
-            `/fetch_store_purchases/${this.props.getUserId()}/${this.props.match.params.storename}`)
+            `/fetch_store_purchases/${this.props.getUserId()}/${this.props.match.params.storename}`,
+            {
+                params: cursor !== null ? {cursor: cursor} : {}
+            })
             .then((res) => {
-                this.setState({purchases: res.data !== null && 'purchases' in res.data ? res.data.purchases : []})
+                const page = res.data !== null && 'purchases' in res.data ? res.data.purchases : [];
+                this.setState({
+                    purchases: cursor !== null ? this.state.purchases.concat(page) : page,
+                    next_cursor: res.data !== null && 'next_cursor' in res.data ? res.data.next_cursor : null
+                })
                 console.log(res.data.purchases)
             }).catch(error => {
             console.log(error)
         });
     }
 
+    loadMore = () => {
+        this.fetchPurchases(this.state.next_cursor);
+    }
+
     render() {
         return (
-            <PurchaseTable purchases={this.state.purchases}/>
+            <React.Fragment>
+                <PurchaseTable purchases={this.state.purchases}/>
+                {this.state.next_cursor !== null ?
+                    <div className="text-center">
+                        <MDBBtn onClick={this.loadMore} outline color="info">Load More</MDBBtn>
+                    </div> : null}
+            </React.Fragment>
         );
     }
 }
 
-export default withRouter(StorePurchaseHistory);
\ No newline at end of file
+export default withRouter(StorePurchaseHistory);
@@ -40,7 +40,11 @@ export class ViewStats extends Component {
 
     createRealtimeSocket = () => {
             if (this.state.socket === null || !this.state.socket.connected) {
-                this.state.socket = io.connect(server_url + "stats")
+                this.state.socket = io.connect(server_url + "notifications")
+                // the stats are sent to the room of the admins, that the server puts the socket in on init
+                this.state.socket.on('connect', () => {
+                    this.state.socket.emit('init', {data: this.props.getUserName()})
+                });
                 this.state.socket.on("stats", (msg) => {
                     if (!msg['data']){
                         return
@@ -0,0 +1,57 @@
+import os
+
+import socketio
+
+# url of the message queue that the Socket.IO servers of all the processes share, e.g redis://localhost:6379/0.
+# LOCAL_MESSAGE_QUEUE for the in-process stand-in, not set for no queue at all
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+LOCAL_MESSAGE_QUEUE = 'local'
+
+
+class LocalPubSubManager(socketio.PubSubManager):
+    """
+    stand-in for the message queue of a multi-process deployment (redis / kombu), inside a single process.
+    the emits go through the same publish / listen cycle as with a real queue, so the application can be run and
+    tested in that mode without a queue server
+    """
+    name = 'local'
+
+    def __init__(self, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel, write_only, logger)
+        self._messages = None
+
+    def _queue(self):
+        # created by the server, so it fits its async mode (e.g an eventlet queue)
+        if self._messages is None:
+            self._messages = self.server.eio.create_queue()
+        return self._messages
+
+    def _publish(self, data):
+        self._queue().put(data)
+
+    def _listen(self):
+        while True:
+            data = self._queue().get()
+            if data is None:
+                return
+            yield data
+
+    def close(self):
+        """
+        stop listening, the listening task of the server ends
+        :return: None
+        """
+        self._queue().put(None)
+
+
+def socket_io_options(message_queue: str = SOCKETIO_MESSAGE_QUEUE) -> dict:
+    """
+    :param message_queue: (str) url of a message queue, LOCAL_MESSAGE_QUEUE or None
+    :return: dictionary of the keyword arguments of flask_socketio.SocketIO that use the message queue
+    """
+    if message_queue is None:
+        return {}
+    if message_queue == LOCAL_MESSAGE_QUEUE:
+        return {'client_manager': LocalPubSubManager()}
+    # the client of the queue (redis / kombu) is only needed when it is used
+    return {'message_queue': message_queue}
@@ -0,0 +1,182 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from src.domain.system.DAL import DAL
+from src.logger.log import Log
+
+# most messages handed to the notification handler at once, a larger publication is handed alone
+DISPATCH_BATCH_SIZE = 500
+# times a failed batch is sent again before its messages are sent one by one
+DISPATCH_RETRIES = int(os.environ.get('DISPATCH_RETRIES', 3))
+# seconds before the first retry of a failed batch, doubled on every retry
+DISPATCH_RETRY_DELAY_SECONDS = float(os.environ.get('DISPATCH_RETRY_DELAY_SECONDS', 0.5))
+# seconds between the checks of flush with a timeout, on a queue that can't be waited on
+FLUSH_POLL_SECONDS = 0.01
+
+
+def _start_daemon_thread(target) -> None:
+    threading.Thread(target=target, name="notification_dispatcher", daemon=True).start()
+
+
+class NotificationDispatcher:
+    """
+    outbox of the notifications. publishing only puts the message in a queue, and a background worker drains the
+    queue and hands the messages to the notification handler in batches - so a use case (e.g a purchase in a store
+    with a large staff) does not wait for the messages to be emitted or saved as pending messages.
+    a batch that fails is sent again, with a growing delay, and then message by message, so a message is dropped only
+    if it still fails on its own. a message may be emitted again when a batch fails after its emits
+    """
+
+    def __init__(self, notification_handler, start_worker=_start_daemon_thread,
+                 batch_size: int = DISPATCH_BATCH_SIZE, create_queue=queue.Queue, queue_empty=queue.Empty,
+                 sleep=time.sleep, retries: int = DISPATCH_RETRIES, retry_delay: float = DISPATCH_RETRY_DELAY_SECONDS):
+        """
+        :param notification_handler: (NotificationHandler) handler that sends the batches to the clients
+        :param start_worker: function that runs the given function in the background (e.g
+                             SocketIO.start_background_task). a new thread by default
+        :param batch_size: (int) most messages in a batch
+        :param create_queue: function that creates the queue, it has to fit start_worker (e.g the create_queue of
+                             the engineio server, that creates an eventlet queue when the server uses eventlet)
+        :param queue_empty: the exception the queue raises when it is empty
+        :param sleep: function that waits the given number of seconds, it has to fit start_worker (e.g SocketIO.sleep)
+        :param retries: (int) times a failed batch is sent again
+        :param retry_delay: (float) seconds before the first retry, doubled on every retry
+        """
+        self._notification_handler = notification_handler
+        self._start_worker = start_worker
+        self._batch_size = batch_size
+        self._queue = create_queue()
+        self._queue_empty = queue_empty
+        self._sleep = sleep
+        self._retries = retries
+        self._retry_delay = retry_delay
+        self._worker_started = False
+        self._worker_lock = threading.Lock()
+
+    def send_to_client(self, msg_type: str, msg, user_name: str = None) -> None:
+        """
+        queue a message, the same as NotificationHandler.send_to_client but without waiting for it to be sent
+        :param msg_type: (str) type of the message
+        :param msg: the message
+        :param user_name: (str) name of the receiver, None to send to the group of msg_type
+        :return: None
+        """
+        self._put([(user_name, msg_type, msg, datetime.now(), None)])
+
+    def send_to_store(self, msg_type: str, msg, store_name: str, user_names: list) -> None:
+        """
+        queue a message to the staff of a store, the same as NotificationHandler.send_to_store
+        :param msg_type: (str) type of the message
+        :param msg: the message
+        :param store_name: (str) name of the store
+        :param user_names: list of names of the staff members
+        :return: None
+        """
+        now = datetime.now()
+        self._put([(user_name, msg_type, msg, now, store_name) for user_name in user_names])
+
+    def _put(self, messages: list) -> None:
+        # the messages of a publication are queued together, so a message to a store is never split between batches
+        self._queue.put(messages)
+        if not self._worker_started:
+            with self._worker_lock:
+                if not self._worker_started:
+                    self._worker_started = True
+                    self._start_worker(self._run)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        wait until all the messages that were queued so far are sent
+        :param timeout: (float) most seconds to wait, forever if None
+        :return: (bool) True if the messages were sent, False if the timeout passed before
+        """
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        all_tasks_done = getattr(self._queue, 'all_tasks_done', None)
+        while self._queue.unfinished_tasks > 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if all_tasks_done is not None:
+                with all_tasks_done:
+                    if self._queue.unfinished_tasks > 0:
+                        all_tasks_done.wait(remaining)
+            else:
+                # a queue of another library (e.g eventlet) has no condition to wait on
+                self._sleep(min(remaining, FLUSH_POLL_SECONDS))
+        return True
+
+    def _next_batch(self) -> tuple:
+        """
+        wait for a publication, and take it with the publications that are already waiting behind it
+        :return: tuple of (list of messages, as NotificationHandler.send_batch expects them, number of publications)
+        """
+        batch = list(self._queue.get())
+        publications = 1
+        while len(batch) < self._batch_size:
+            try:
+                batch.extend(self._queue.get_nowait())
+                publications += 1
+            except self._queue_empty:
+                break
+        return batch, publications
+
+    def _send(self, messages: list) -> bool:
+        """
+        :param messages: list of messages, as NotificationHandler.send_batch expects them
+        :return: (bool) True if the messages were sent, False if sending them failed
+        """
+        dal: DAL = DAL.get_instance()
+        try:
+            # the worker has a session of its own, the pending messages of a batch are committed together
+            dal.renew_session()
+            self._notification_handler.send_batch(messages)
+            dal.drop_session()
+            return True
+        except Exception as e:
+            dal.discard_session()
+            self._log_error(f"failed to dispatch {len(messages)} notifications: {e}")
+            return False
+
+    def _dispatch(self, batch: list) -> None:
+        """
+        send a batch, again and again with a growing delay if it fails, and then message by message
+        :param batch: list of messages, as NotificationHandler.send_batch expects them
+        :return: None
+        """
+        delay = self._retry_delay
+        for attempt in range(self._retries + 1):
+            if attempt > 0:
+                self._sleep(delay)
+                delay *= 2
+            if self._send(batch):
+                return
+        # a single message that can not be sent fails the whole batch, the others are sent without it
+        dropped = batch if len(batch) == 1 else [message for message in batch if not self._send([message])]
+        if len(dropped) > 0:
+            self._log_error(f"dropped {len(dropped)} notifications after {self._retries} retries")
+
+    @staticmethod
+    def _log_error(msg: str) -> None:
+        try:
+            Log.get_instance().get_logger().error(msg)
+        except Exception:
+            # e.g the logs directory is missing. the worker keeps sending without the log
+            pass
+
+    def _run(self) -> None:
+        while True:
+            batch, publications = self._next_batch()
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                # the worker never stops, the messages that are queued after the batch still have to be sent
+                self._log_error(f"failed to dispatch {len(batch)} notifications: {e}")
+            finally:
+                for _ in range(publications):
+                    self._queue.task_done()
@@ -1,6 +1,9 @@
 import enum
+import os
+import threading
 from abc import abstractmethod
 from datetime import date, datetime
+import socket
 from socket import SocketIO
 
 from src.domain.system.DAL import DAL
@@ -8,6 +11,29 @@ from src.domain.system.db_config import db
 from src.external.publisher import Publisher
 from src.protocol_classes.classes_utils import TypedList, TypedDict
 
+# most pending messages of a user that are kept in memory, the rest are only in the database
+PENDING_OUTBOX_SIZE = 50
+# pending messages that are read from the database at once, when a user connects
+PENDING_PAGE_SIZE = 500
+
+# all the notifications are sent on a single namespace, to rooms: every socket of a user is in the room of the
+# user, the sockets of the staff of a store are in the room of the store, and the sockets of admins in ADMINS_ROOM
+NOTIFICATIONS_NAMESPACE = "/notifications"
+ADMINS_ROOM = "admins"
+# the room that the messages to the group of a message type are sent to, the room of the type itself by default
+GROUP_ROOMS = {"stats": ADMINS_ROOM}
+# name of this server among the processes that share a message queue, it has to be different in every process and the
+# same after a restart, so the restarted process clears the presence it left behind (see OnlineUser)
+SERVER_ID = os.environ.get('SERVER_ID', f"{socket.gethostname()}:{os.environ.get('PORT', '443')}")
+
+
+def user_room(user_name: str) -> str:
+    return f"user:{user_name}"
+
+
+def store_room(store_name: str) -> str:
+    return f"store:{store_name}"
+
 
 class Emitter:
     @abstractmethod
@@ -18,16 +44,71 @@ class Emitter:
     def emit_group(self, msg_type: str, msg) -> None:
         pass
 
+    def emit_many(self, user_name: str, messages: list) -> None:
+        """
+        emit the messages of a user one after the other
+        :param user_name: (str) name of the receiver
+        :param messages: list of tuples of (message type, message)
+        :return: None
+        """
+        for msg_type, msg in messages:
+            self.emit(user_name, msg_type, msg)
+
+    def emit_to_store(self, store_name: str, user_names: list, msg_type: str, msg) -> None:
+        """
+        emit a message to the connected staff of a store, to each of them by default
+        :param store_name: (str) name of the store
+        :param user_names: list of names of the connected staff members
+        :param msg_type: (str) type of the message
+        :param msg: the message
+        :return: None
+        """
+        for user_name in user_names:
+            self.emit(user_name, msg_type, msg)
+
 
 class SocketEmitter(Emitter):
     def __init__(self, socket: SocketIO):
         self._socket = socket
 
     def emit(self, user_name: str, msg_type: str, msg) -> None:
-        self._socket.emit(msg_type, {'data': msg}, namespace=f"/{user_name}")
+        self._socket.emit(msg_type, {'data': msg}, namespace=NOTIFICATIONS_NAMESPACE, room=user_room(user_name))
 
     def emit_group(self, msg_type: str, msg) -> None:
-        self._socket.emit(msg_type, {'data': msg}, namespace=f"/{msg_type}")
+        self._socket.emit(msg_type, {'data': msg}, namespace=NOTIFICATIONS_NAMESPACE,
+                          room=GROUP_ROOMS.get(msg_type, msg_type))
+
+    def emit_to_store(self, store_name: str, user_names: list, msg_type: str, msg) -> None:
+        """
+        emit a message to the room of a store once, instead of to the room of every staff member.
+        the room is synchronized with the given staff first, so sockets that connected or were appointed since the
+        last message are entered to it, and the sockets of removed staff members leave it. only the sockets of this
+        server are moved, so with several servers behind a message queue the rooms of the stores are not used (see
+        NotificationHandler)
+        :param store_name: (str) name of the store
+        :param user_names: list of names of the connected staff members
+        :param msg_type: (str) type of the message
+        :param msg: the message
+        :return: None
+        """
+        room = store_room(store_name)
+        staff_sids = set()
+        for user_name in user_names:
+            staff_sids.update(self._sids_in(user_room(user_name)))
+        room_sids = self._sids_in(room)
+        for sid in staff_sids - room_sids:
+            self._socket.server.enter_room(sid, room, namespace=NOTIFICATIONS_NAMESPACE)
+        for sid in room_sids - staff_sids:
+            self._socket.server.leave_room(sid, room, namespace=NOTIFICATIONS_NAMESPACE)
+        self._socket.emit(msg_type, {'data': msg}, namespace=NOTIFICATIONS_NAMESPACE, room=room)
+
+    def _sids_in(self, room: str) -> set:
+        """
+        :param room: (str) name of a room in the notifications namespace
+        :return: set of the ids of the sockets of this server in the room
+        """
+        rooms = self._socket.server.manager.rooms.get(NOTIFICATIONS_NAMESPACE, {})
+        return set(rooms.get(room, {}))
 
 
 class TestEmitter(Emitter):
@@ -184,81 +265,208 @@ class StatManager:
 
 class PendingMessage(db.Model):
     __tablename__ = 'PendingMessages'
+    # the primary key starts with the user name, so the messages of a user are found through its index
     _username = db.Column(db.VARCHAR(50), primary_key=True)
     _message = db.Column(db.VARCHAR(300), primary_key=True)
     _time = db.Column(db.DateTime, primary_key=True)
     _msg_type = db.Column(db.VARCHAR(50))
 
-    def __init__(self, username: str, msg_type: str, message: str):
+    def __init__(self, username: str, msg_type: str, message: str, time: datetime = None):
         self._username = username
         self._message = message
         self._msg_type = msg_type
-        self._time = datetime.now()
+        self._time = datetime.now() if time is None else time
+
+
+class OnlineUser(db.Model):
+    """
+    a user that is connected to one of the servers that share a message queue, so the other servers emit its messages
+    through the queue instead of saving them as pending messages
+    """
+    __tablename__ = 'OnlineUsers'
+    _username = db.Column(db.VARCHAR(50), primary_key=True)
+    _server_id = db.Column(db.VARCHAR(100), primary_key=True)
+
+    def __init__(self, username: str, server_id: str):
+        self._username = username
+        self._server_id = server_id
 
 
 class NotificationHandler:
     """
         Interface of Observer.
+        observers are created on demand. the pending messages of a user are always saved in the database, and the
+        last PENDING_OUTBOX_SIZE of them are also kept in the outbox of its observer, so connecting does not have to
+        read them back. when the outbox overflows, or the observer was created after its messages were saved (e.g after
+        a restart), connecting reads them from the database page by page.
+        with shared presence (several servers behind a message queue), the users that are connected to each server are
+        also kept in the database, and a message to a user that is connected to another server is emitted to the room
+        of the user through the queue. the messages to the staff of a store are then emitted to the room of each staff
+        member, since a server can only move its own sockets between the rooms of the stores
     """
 
-    def __init__(self, emitter: Emitter):
+    def __init__(self, emitter: Emitter, shared_presence: bool = False, server_id: str = SERVER_ID):
+        """
+        :param emitter: (Emitter) emitter of the messages to the connected users
+        :param shared_presence: (bool) True if other servers share the message queue of the emitter
+        :param server_id: (str) name of this server among the servers that share the message queue
+        """
         self._observers = {}
         self._emitter = emitter
+        self._shared_presence = shared_presence
+        self._server_id = server_id
+        # the observers are changed by the requests and by the worker of the NotificationDispatcher
+        self._observers_lock = threading.RLock()
+
+    def _new_observer(self, outbox_complete: bool) -> dict:
+        """
+        :param outbox_complete: (bool) True if all the pending messages of the user are known to be in the outbox
+        :return: observer that is not logged in
+        """
+        return {"logged_in": False, 'stats': False, "pending_messages": TypedList(tuple),
+                "outbox_complete": outbox_complete}
 
     # creates observer if
     def connect(self, user_name: str) -> None:
-        if user_name in self._observers.keys():
-            print("found in observer list")
-            self._observers[user_name]["logged_in"] = True
-            pending = self._observers[user_name]["pending_messages"]
-            if len(pending) > 0:
-                for p in pending:
-                    self._emitter.emit(user_name, *p)
-                pending.clear()
-                from src.domain.system.DAL import DAL
-                DAL.get_instance().clear_pending_messages_for_user(user_name)
+        dal: DAL = DAL.get_instance()
+        # the pending messages are collected under the lock, and emitted and cleared after it is released, so the
+        # emits of other users do not wait for them
+        messages = []
+        last = None
+        if self._shared_presence:
+            # before the pending messages are read, so the messages the other servers send meanwhile are emitted
+            dal.add_online_user(user_name, self._server_id)
+        with self._observers_lock:
+            if user_name not in self._observers.keys():
+                # the user may have pending messages from before the observer was created
+                self._observers[user_name] = self._new_observer(outbox_complete=False)
+            observer = self._observers[user_name]
+            observer["logged_in"] = True
+            pending = observer["pending_messages"]
+            if observer["outbox_complete"]:
+                if len(pending) > 0:
+                    messages = [(msg_type, msg) for msg_type, msg, _ in pending]
+                    last = max((time, msg) for _, msg, time in pending)
+            else:
+                page = dal.get_pending_messages_page(user_name, None, PENDING_PAGE_SIZE)
+                while len(page) > 0:
+                    messages.extend([(m._msg_type, m._message) for m in page])
+                    last = (page[-1]._time, page[-1]._message)
+                    page = dal.get_pending_messages_page(user_name, last, PENDING_PAGE_SIZE)
+                observer["outbox_complete"] = True
+            pending.clear()
+        if last is not None:
+            self._emitter.emit_many(user_name, messages)
+            # messages that were saved meanwhile, if the user disconnected again, are left for the next connect
+            dal.clear_pending_messages_for_user(user_name, last)
 
     def add_observer(self, user_name: str) -> None:
-        if user_name not in self._observers.keys():
-            self._observers[user_name] = {"logged_in": False, 'stats': False, "pending_messages": TypedList(tuple)}
+        with self._observers_lock:
+            if user_name not in self._observers.keys():
+                # called when the user registers, so it has no pending messages yet
+                self._observers[user_name] = self._new_observer(outbox_complete=True)
 
     def disconnect(self, user_name: str) -> None:
-        if user_name in self._observers.keys():
-            self._observers[user_name]["logged_in"] = False
+        with self._observers_lock:
+            if user_name in self._observers.keys():
+                self._observers[user_name]["logged_in"] = False
+        if self._shared_presence:
+            DAL.get_instance().remove_online_user(user_name, self._server_id)
+
+    def rooms_of(self, user_name: str) -> list:
+        """
+        :param user_name: (str) name of a connecting user
+        :return: list of the rooms its sockets should be in - its own room, the rooms of the stores of its permissions
+                 (without shared presence) and the room of the admins if it is one
+        """
+        dal: DAL = DAL.get_instance()
+        rooms = [user_room(user_name)]
+        # with shared presence the messages to the staff of a store are emitted to the rooms of its members
+        if not self._shared_presence:
+            rooms += [store_room(store_name) for store_name in dal.get_store_names_of_user(user_name)]
+        if dal.is_admin(user_name):
+            rooms.append(ADMINS_ROOM)
+        return rooms
 
     def send_to_client(self, msg_type: str, msg: str, user_name: str = None) -> None:
-        if user_name is None:
-            self._emitter.emit_group(msg_type, msg)
-            # print(f"in observer sent {msg} to group: {msg_type}")
-        else:
-            if user_name in self._observers.keys():
-                if self._observers[user_name]["logged_in"]:
-                    self._emitter.emit(user_name, msg_type, msg)
-                    # print(f"in observer sent {msg} to user name: {user_name}")
-                else:
-                    # print(f"added to pending , message: {msg}")
-                    pending_message: PendingMessage = PendingMessage(user_name, msg_type, msg)
-                    from src.domain.system.DAL import DAL
-                    DAL.get_instance().add(pending_message, add_only=True)
-                    self._observers[user_name]["pending_messages"].append((msg_type, msg))
+        self.send_batch([(user_name, msg_type, msg, datetime.now(), None)])
+
+    def send_to_store(self, msg_type: str, msg: str, store_name: str, user_names: list) -> None:
+        now = datetime.now()
+        self.send_batch([(user_name, msg_type, msg, now, store_name) for user_name in user_names])
+
+    def send_batch(self, messages: list) -> None:
+        """
+        send many messages at once. the messages of each connected user are emitted together, a message to the staff
+        of a store is emitted once to all of its connected members, and the messages of the users that are not
+        connected are saved as pending messages with a single insert
+        :param messages: list of tuples of (receiver name or None for the group of the type, message type, message,
+                         time it was sent, name of the store if it was sent to the staff of the store or None)
+        :return: None
+        """
+        messages_by_user = dict()
+        for user_name, msg_type, msg, time, store_name in messages:
+            if user_name is None:
+                self._emitter.emit_group(msg_type, msg)
+            else:
+                messages_by_user.setdefault(user_name, []).append((msg_type, msg, time, store_name))
+        # users that are not connected to this server, but to another server that shares the message queue
+        online_elsewhere = set()
+        if self._shared_presence and len(messages_by_user) > 0:
+            with self._observers_lock:
+                not_here = [user_name for user_name in messages_by_user.keys() if
+                            not self._observers.get(user_name, {}).get("logged_in", False)]
+            if len(not_here) > 0:
+                online_elsewhere = DAL.get_instance().get_users_online_elsewhere(not_here, self._server_id)
+        to_emit = []
+        to_emit_to_stores = dict()
+        pending_messages = []
+        with self._observers_lock:
+            for user_name, user_messages in messages_by_user.items():
+                observer = self._observers.get(user_name)
+                if user_name in online_elsewhere or (observer is not None and observer["logged_in"]):
+                    own_messages = []
+                    for msg_type, msg, _, store_name in user_messages:
+                        if store_name is None or self._shared_presence:
+                            own_messages.append((msg_type, msg))
+                        else:
+                            to_emit_to_stores.setdefault((store_name, msg_type, msg), []).append(user_name)
+                    if len(own_messages) > 0:
+                        to_emit.append((user_name, own_messages))
+                    continue
+                for msg_type, msg, time, _ in user_messages:
+                    pending_messages.append(PendingMessage(user_name, msg_type, msg, time))
+                # users without an observer are not kept in memory, their messages are only in the database
+                if observer is not None and observer["outbox_complete"]:
+                    outbox = observer["pending_messages"]
+                    if len(outbox) + len(user_messages) <= PENDING_OUTBOX_SIZE:
+                        outbox.extend([(msg_type, msg, time) for msg_type, msg, time, _ in user_messages])
+                    else:
+                        # overflow - connecting will read all the messages from the database
+                        outbox.clear()
+                        observer["outbox_complete"] = False
+            if len(pending_messages) > 0:
+                DAL.get_instance().add_pending_messages(pending_messages)
+        for user_name, user_messages in to_emit:
+            self._emitter.emit_many(user_name, user_messages)
+        for (store_name, msg_type, msg), user_names in to_emit_to_stores.items():
+            self._emitter.emit_to_store(store_name, user_names, msg_type, msg)
 
     def init_notification_handler(self):
-        from src.domain.system.DAL import DAL
-        d: DAL = DAL.get_instance()
-        all_registered_users = d.get_all_registered_users()
-        if len(all_registered_users) > 0:
-            for user in all_registered_users:
-                from src.domain.system.users_classes import LoggedInUser
-                user: LoggedInUser = user
-                self.add_observer(user.user_name)
-        all_messages = d.get_all_pending_message()
-        if len(all_messages) != 0:
-            for m in all_messages:
-                m: PendingMessage = m
-                d.add(m, add_only=True)
-                if m._username in self._observers:
-                    list1 = self._observers[m._username]
-                    list1["pending_messages"].append((m._msg_type, m._message))
-                else:
-                    list1 = [(m._msg_type, m._message)]
-                    self._observers[m._username]["pending_messages"] = list1
+        """
+        prepare the handler after a restart. nothing is loaded - the observers are created when their users
+        connect, and the pending messages of a user are read when it connects. with shared presence, the users that
+        were connected to this server before the restart are not connected anymore
+        :return: None
+        """
+        with self._observers_lock:
+            self._observers.clear()
+        if self._shared_presence:
+            dal: DAL = DAL.get_instance()
+            dal.renew_session()
+            try:
+                dal.clear_online_users_of_server(self._server_id)
+                dal.drop_session()
+            except Exception:
+                dal.discard_session()
+                raise
@@ -0,0 +1,106 @@
+import calendar
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask.helpers import total_seconds
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import BadSignature
+
+# most sessions that are kept decoded in memory, the cookies of the least recently used ones are decoded again
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 10_000))
+# key that the session cookies are signed with. it has to be secret, and the same in every process of the server
+SECRET_KEY = os.environ.get('SECRET_KEY')
+
+
+def secret_key(key: str = SECRET_KEY) -> str:
+    """
+    :param key: (str) key to sign the session cookies with, SECRET_KEY by default
+    :return: (str) the key, raises RuntimeError if it is not set, so the server never signs cookies with a known key
+    """
+    if not key:
+        raise RuntimeError("SECRET_KEY is not set, set it to a random secret to sign the session cookies with")
+    return key
+
+
+class CachedCookieSessionInterface(SecureCookieSessionInterface):
+    """
+    the session is kept in a signed cookie, so it needs no storage (and no database round trip), and every process of
+    the server can read it. the sessions of the last SESSION_CACHE_SIZE cookies are kept in memory, keyed by the cookie
+    itself, so the cookie of a returning client is not verified and decoded again on every request.
+    only cookies that this process signed or verified are cached, so a forged cookie never matches an entry
+    """
+
+    def __init__(self, cache_size: int = SESSION_CACHE_SIZE, clock=time.time):
+        """
+        :param cache_size: (int) most sessions in memory
+        :param clock: function that returns the current time in seconds, as the timestamps of the cookies
+        """
+        self._cache_size = cache_size
+        self._clock = clock
+        # cookie -> tuple of (the data of the session, time the cookie expires)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open_session(self, app, request):
+        serializer = self.get_signing_serializer(app)
+        if serializer is None:
+            return None
+        cookie = request.cookies.get(app.session_cookie_name)
+        if not cookie:
+            return self.session_class()
+        data = self._cached(cookie)
+        if data is not None:
+            return self.session_class(data)
+        max_age = total_seconds(app.permanent_session_lifetime)
+        try:
+            data, signed_at = serializer.loads(cookie, max_age=max_age, return_timestamp=True)
+        except BadSignature:
+            return self.session_class()
+        # the timestamp of the cookie is a naive datetime in utc
+        self._cache(cookie, data, calendar.timegm(signed_at.utctimetuple()) + max_age)
+        return self.session_class(data)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        # an empty session has no cookie, a session that was emptied removes it
+        if not session:
+            if session.modified:
+                response.delete_cookie(app.session_cookie_name, domain=domain, path=path)
+            return
+        if session.accessed:
+            response.vary.add("Cookie")
+        if not self.should_set_cookie(app, session):
+            return
+        data = dict(session)
+        cookie = self.get_signing_serializer(app).dumps(data)
+        self._cache(cookie, data, self._clock() + total_seconds(app.permanent_session_lifetime))
+        response.set_cookie(app.session_cookie_name, cookie, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def _cached(self, cookie: str):
+        """
+        :param cookie: (str) value of the session cookie
+        :return: copy of the data of the session of the cookie, None if it is not in memory or expired
+        """
+        with self._lock:
+            entry = self._sessions.get(cookie)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires <= self._clock():
+                del self._sessions[cookie]
+                return None
+            self._sessions.move_to_end(cookie)
+            # the session may be changed by the request, the cached data is changed only by a new cookie
+            return dict(data)
+
+    def _cache(self, cookie: str, data: dict, expires: float) -> None:
+        with self._lock:
+            self._sessions[cookie] = (data, expires)
+            self._sessions.move_to_end(cookie)
+            while len(self._sessions) > self._cache_size:
+                self._sessions.popitem(last=False)
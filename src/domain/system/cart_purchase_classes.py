@@ -65,6 +65,8 @@ class ProductInShoppingCart(db.Model):
     _product_data = db.Column(MutableDict.as_mutable(db.JSON))
 
     _basket_id = db.Column(db.Integer, db.ForeignKey('basket.id'))
+    # the products of a basket are queried by its id, see DAL.get_all_products_of_baskets
+    __table_args__ = (db.Index('ix_product_in_shopping_cart_basket', '_basket_id'),)
 
     # item: ProductInInventory
     # total_price: float = None
@@ -119,33 +121,49 @@ class Basket(db.Model):
 
     __tablename__ = 'basket'
     id = db.Column(db.Integer, primary_key=True)
-    _products_ls = db.Column(MutableList.as_mutable(db.JSON))
+    # products are queried by ProductInShoppingCart's basket id
     _is_used = db.Column(db.Boolean)
     # _products_ls = db.relationship("ProductInShoppingCart", lazy="joined")
     # _cart_id = db.Column(db.Integer, db.ForeignKey('shopping_cart.id'), nullable=True)
     _user = db.Column(db.String(50), nullable=True)
     _store_name = db.Column(db.String(50), db.ForeignKey('store._name'))
     # _store = db.relationship("Store", lazy="joined")
+    # the baskets in use of a user are loaded at login, see DAL.get_baskets_by_user
+    __table_args__ = (db.Index('ix_basket_user_used', '_user', '_is_used'),)
     _dal: DAL = DAL.get_instance()
 
     def __init__(self, store_name: str, products=None, user=None):
         if not isinstance(store_name, str):
             raise TypeError("Not a str")
         self.store_name = store_name
-        self._products_ls = [] if products is None else list(products.keys())
         self.products = TypedDict(str, ProductInShoppingCart)
         self._user = user
         self._is_used = True
+        self._total_value = None
 
     @orm.reconstructor
     def loaded(self):
-        self._products = TypedDict(str, ProductInShoppingCart)
-        baskets_products = self._dal.get_all_products_of_basket(self.id)
-        for p in baskets_products:
-            p: ProductInShoppingCart = p
-            p._product_name = p._product_data["name"]
-            self._products[p._product_data["name"]] = p
-            self._products_ls.append(p._product_data["name"])
+        # products are loaded on first use, together with all the baskets loaded in the same session
+        self._products = None
+        self._dal.defer_load('basket_products', self)
+
+        # summed on first use, see get_total_value_of_basket
+        self._total_value = None
+
+    def _load_deferred_products(self):
+        """
+        load the products of this basket, and of all the other baskets that were loaded in the same session
+        and did not load their products yet, with a single query
+        :return: None
+        """
+        baskets = [b for b in self._dal.take_deferred('basket_products', self) if b._products is None]
+        loaded = self._dal.get_all_products_of_baskets([b.id for b in baskets])
+        for b in baskets:
+            b._products = TypedDict(str, ProductInShoppingCart)
+            for p in loaded[b.id]:
+                p: ProductInShoppingCart = p
+                p._product_name = p._product_data["name"]
+                b._products[p._product_data["name"]] = p
 
     # @property
     # def store(self):
@@ -171,6 +189,8 @@ class Basket(db.Model):
 
     @property
     def products(self):
+        if self._products is None:
+            self._load_deferred_products()
         return self._products
 
     @products.setter
@@ -180,6 +200,13 @@ class Basket(db.Model):
         else:
             raise TypeError("Not of type ProductInShoppingCart: products")
 
+    def invalidate_total_value(self):
+        """
+        drop the cached total price of the basket, after its products or their prices were changed
+        :return: None
+        """
+        self._total_value = None
+
     def clear_connections_to_inventory(self):
         for product in self.products.values():
             product: ProductInShoppingCart = product
@@ -210,6 +237,7 @@ class Basket(db.Model):
                            "total_price": round(self.products[product_name]._total_price, 2)})
         else:
             if product_name in self.products:
+                self.invalidate_total_value()
                 if new_quantity == 0:
                     # del self.products[product_name]
                     p = self.products.pop(product_name)
@@ -255,6 +283,7 @@ class Basket(db.Model):
             elif not to_add:
                 return Result(False, -1, "not enough quantity in the store", None)
             else:
+                self.invalidate_total_value()
                 if product_name in self.products:  # product is already in basket -> add to it
                     p: ProductInShoppingCart = self.products[product_name]
                     self._dal.add(p, add_only=True)
@@ -267,7 +296,6 @@ class Basket(db.Model):
                     p = ProductInShoppingCart((to_add.price * quantity), to_add, self.id, quantity)
                     # p = ProductInShoppingCart((to_add.price * to_add.quantity), to_add, self.id)
                     self._dal.add(p, add_only=True)
-                    self._products_ls.append(p.item.product_name)
                     self.products[product_name] = p
                     self._dal.add(self, add_only=True)
                 return Result(True, -1, "product was added to basket successfully", None)
@@ -284,6 +312,7 @@ class Basket(db.Model):
             p = self.products.pop(product_name)
             self._dal.add(p, add_only=True)
             self._dal.delete(p)
+            self.invalidate_total_value()
             # del self.products[product_name]
             return Result(True, -1, "removal success", None)
 
@@ -301,13 +330,16 @@ class Basket(db.Model):
 
     def get_total_value_of_basket(self):
         """
-        return the total price of the basket according to it's baskets
+        return the total price of the basket according to it's baskets. the total is kept until the products of
+        the basket or their prices change
         :return: positive number(int or float) which is the total price of the basket
         """
-        output = 0
-        for p_name in self.products.keys():
-            output += self.get_total_price_of_product(p_name)
-        return output
+        if self._total_value is None:
+            output = 0
+            for p_name in self.products.keys():
+                output += self.get_total_price_of_product(p_name)
+            self._total_value = output
+        return self._total_value
 
     def get_total_quantity_of_category(self, category: str):
         """
@@ -332,34 +364,36 @@ class Basket(db.Model):
             products.append(product.to_dictionary())
         return {"store": self.store_name, "basket": products, "total_price": round(self.get_total_value_of_basket(), 2)}
 
-    def pre_purchase(self):
-        """
-        save actual products from store before actual purchase
-        :return: list of tuples
-        """
-        my_store: Store = self._dal.get_store_by_name(self.store_name)
-        if not my_store.open:
-            output = [(p, "store is closed, cannot purchase product") for p in self.products]
-            self.products.clear()
-            return output
-        else:
-            missing_products = {"store_name": self.store_name, "problems": []}
-            for p in self.products.values():
-                product = p.item
-                result_quantity = my_store.pre_purchase_from_store(product.product_name, p._product_quantity)
-                if p._product_quantity > result_quantity:
-                    p._product_quantity = result_quantity
-                    missing_products['problems'].append((product.product_name, f"there are only {result_quantity} left"))
-            return missing_products
+    def pre_purchase(self, store: Store):
+        """
+        match the products of the basket with the products in the inventory of the store, before purchasing them.
+        products that are not in the inventory anymore are cut to 0
+        :param store: (Store) the store of the basket
+        :return: tuple of (list of tuples of (ProductInInventory, ProductInShoppingCart) to take out of the inventory,
+                 dict of the missing products)
+        """
+        lines = []
+        missing_products = {"store_name": self.store_name, "problems": []}
+        for name, p in self.products.items():
+            if p._product_quantity == 0:
+                continue
+            if name in store.inventory:
+                lines.append((store.inventory[name], p))
+            else:
+                self.cut_to_available(p, 0, missing_products)
+        return lines, missing_products
 
-    def cancel_purchase(self):
+    def cut_to_available(self, product: ProductInShoppingCart, available: int, missing_products: dict):
         """
-        Cancel pre-purchase because products were missing
-        :return None
+        cut the quantity of a product in the basket to what is left of it in the inventory
+        :param product: (ProductInShoppingCart) the product to cut
+        :param available: (int) quantity left in the inventory
+        :param missing_products: (dict) missing products of the basket, as returned by pre_purchase
+        :return: None
         """
-        for p in self.products.values():
-            my_store: Store = self._dal.get_store_by_name(self.store_name)
-            my_store.add_product_after_product_cancellation(p)
+        product._product_quantity = available
+        self.invalidate_total_value()
+        missing_products['problems'].append((product._product_name, f"there are only {available} left"))
 
     def copy(self):
         return Basket(self.store_name,
@@ -374,6 +408,7 @@ class ShoppingCart:
 
     # id = db.Column(db.Integer, primary_key=True)
     # _baskets_ls = db.relationship("Basket", lazy="joined")
+    __slots__ = ('_baskets', '_user')
     _dal: DAL = DAL.get_instance()
 
     def __init__(self, baskets: TypedDict = None, user=None):
@@ -456,7 +491,9 @@ class ShoppingCart:
                 basket: Basket = self.baskets[store.name]
                 self._dal.add(basket, add_only=True)
                 is_added: Result = basket.add_product_to_basket(product_to_add, quantity)
-            self.calc_update_price_of_basket(basket.store_name)
+            if product_to_add in basket.products:
+                self.calc_update_price_of_changed_product(store, product_to_add,
+                                                          basket.products[product_to_add].item.categories)
             # self._baskets_ls.append(basket)
             self._dal.add(basket, add_only=True)
             return is_added
@@ -489,6 +526,25 @@ class ShoppingCart:
         else:
             return False  # store was not found
 
+    def calc_update_price_of_changed_product(self, store: Store, product_name: str, categories: list):
+        """
+        updating price of a single basket after one of its products was added, edited or removed.
+        only the products of the basket that the discounts of the store affected by the change can reach are
+        priced again (see Store.apply_discount_on_changed_products)
+        :param store: (Store) the store of the basket
+        :param product_name: (str) name of the changed product
+        :param categories: (list of str) categories of the changed product
+        :return: True if the basket was updated, False if there is no basket of the given store
+        """
+        if store.name in self.baskets:
+            bas: Basket = self.baskets[store.name]
+            self._dal.add(bas, add_only=True)
+            for p in store.apply_discount_on_changed_products(bas, {product_name: set(categories)}):
+                self._dal.add(p, add_only=True)
+            return True
+        else:
+            return False  # store was not found
+
     def remove_product(self, store_name: str, product_name: str):
         """
         Removing product from basket of given store
@@ -516,6 +572,7 @@ class ShoppingCart:
                         b = self.baskets.pop(basket.store_name)
                         self._dal.delete(b)
                     return Result(False, -1, "Store is closed", None)
+                categories = basket.products[product_name].item.categories if product_name in basket.products else []
                 res: Result = basket.remove_product_from_basket(product_name)
                 if res.succeed and len(
                         basket.products) == 0:  # if removal was successful and basket is empty - remove basket
@@ -523,7 +580,7 @@ class ShoppingCart:
                     b = self.baskets.pop(store_name)
                     self._dal.add(b, add_only=True)
                     self._dal.delete(b)
-                self.calc_update_price_of_basket(basket.store_name)
+                self.calc_update_price_of_changed_product(store, product_name, categories)
                 return res
 
     def edit_product(self, store: str, product_name: str, new_quantity: int):
@@ -556,13 +613,14 @@ class ShoppingCart:
                     s = self.baskets.pop(basket.store_name)
                     self._dal.delete(s)
                 return Result(False, -1, "Store is closed", None)
+            categories = basket.products[product_name].item.categories if product_name in basket.products else []
             res = basket.edit_quantity_of_product(product_name, new_quantity)
             if res.succeed and len(basket.products) == 0:
                 # del self.baskets[store]
                 s = self.baskets.pop(store)
                 self._dal.delete(s)
             elif res.succeed:
-                self.calc_update_price_of_basket(basket.store_name)
+                self.calc_update_price_of_changed_product(store, product_name, categories)
                 self._dal.add(basket)
                 return Result(True, res.requesting_id, res.msg,
                               {"product_name": product_name, "store_name": store._name,
@@ -608,21 +666,35 @@ class ShoppingCart:
                 "total_price": round(self.get_total_value_of_shopping_cart(), 2)}
 
     def pre_purchase(self):
+        """
+        take all the products of the shopping cart out of the inventories of the stores, with one batched update of the
+        database. if any product is missing, nothing is taken and the quantities in the cart are cut to what is left
+        :return: Result with the total value of the cart, or with the missing products as data
+        """
         self.calc_updated_price_of_all_baskets()
         baskets_to_delete = []
         problems_with_products = []
+        lines = []
         for basket in self.baskets.values():
             store: Store = self._dal.get_store_by_name(basket.store_name)
             if not store.open:
                 baskets_to_delete.append(basket.store_name)
-            res: dict = basket.pre_purchase()
-            if res['problems']:
-                problems_with_products.append(res)
+                continue
+            basket_lines, missing_products = basket.pre_purchase(store)
+            lines += [(basket, item, p, missing_products) for item, p in basket_lines]
+            if missing_products['problems']:
+                problems_with_products.append(missing_products)
         for name in baskets_to_delete:
             # del self.baskets[name]
             s = self.baskets.pop(name)
             self._dal.delete(s, del_only=True)
             self._dal.flush()  # So we ill able to call .id
+        left = self._dal.reserve_quantities([(item, p._product_quantity) for _, item, p, _ in lines])
+        for basket, item, p, missing_products in lines:
+            if item.id in left:
+                basket.cut_to_available(p, left[item.id], missing_products)
+                if missing_products not in problems_with_products:
+                    problems_with_products.append(missing_products)
         if not problems_with_products:  # if list is empty -> no problems at all:
             for basket in self.baskets.values():
                 if not self.apply_policies_for_basket(basket.store_name):
@@ -631,16 +703,29 @@ class ShoppingCart:
             return Result(True, -1, "all products are ready for purchase", self.get_total_value_of_shopping_cart())
 
         else:
-            self.cancel_purchase()
+            if not left:
+                # products of other baskets were taken before the missing ones were found
+                self._dal.release_quantities([(item, p._product_quantity) for _, item, p, _ in lines])
             return Result(False, -1, "Some Products were missing. details in data", problems_with_products)
 
+    def reserved_quantities(self):
+        """
+        :return: (dict) name of store -> (dict) name of product -> quantity, of all the products in the cart
+        """
+        return {store_name: {name: p._product_quantity for name, p in basket.products.items()} for store_name, basket
+                in self.baskets.items()}
+
     def cancel_purchase(self):
         """
-        return items in shopping cart back to inventory
+        return items in shopping cart back to inventory, with one batched update of the database
         :return: None
         """
-        for basket in self.baskets.values():
-            basket.cancel_purchase()
+        lines = []
+        for store_name, quantities in self.reserved_quantities().items():
+            store: Store = self._dal.get_store_by_name(store_name)
+            if store is not None:
+                lines += store.inventory_lines(quantities)
+        self._dal.release_quantities(lines)
 
     def after_purchase(self, user_id: int, user_name: str = None):
         """
@@ -705,6 +790,10 @@ class Purchase(db.Model):
     _basket_fk = db.Column(db.Integer, db.ForeignKey("basket.id"))
     _basket = db.relationship("Basket", lazy="joined")
     _at_date_time = db.Column(db.DateTime)
+    # store purchase history is paged newest first, see DAL.get_purchases_page_of_store. the history of a user is
+    # queried by the user name
+    __table_args__ = (db.Index('ix_purchase_store_date', '_store_name', '_at_date_time', '_purchase_id'),
+                      db.Index('ix_purchase_user', '_user_name'))
 
     def __init__(self, purchase_type: int, user_name: str, basket_fk: int,
                  store_name: str, at_dt: datetime = datetime.now(), basket_obj=None):
@@ -11,12 +11,26 @@ if TYPE_CHECKING:
     from src.domain.system.permission_classes import Permission, Role
     from src.domain.system.users_classes import User, LoggedInUser
 
+import os
 import threading
+import time
+from collections import OrderedDict
 # Exceptions
 from src.protocol_classes.classes_utils import Result, TypedList, TypedDict
 
 from src.domain.system.db_config import db
 
+# most guest users that are kept in memory, the least recently seen guests are evicted first
+GUEST_USERS_LIMIT = int(os.environ.get('GUEST_USERS_LIMIT', 100_000))
+# seconds a guest user may be idle before it is evicted
+GUEST_IDLE_TTL = int(os.environ.get('GUEST_IDLE_TTL', 60 * 60))
+# evict guests with products in their carts too - their baskets are rows in the database already, and are loaded again
+# when the guest returns. when false, such guests are kept in memory
+SPILL_GUEST_CARTS = os.environ.get('SPILL_GUEST_CARTS', 'true').lower() == 'true'
+# most evicted guests whose carts are loaded again when they return, the carts of the guests that were evicted first
+# are forgotten first
+SPILLED_GUEST_CARTS_LIMIT = int(os.environ.get('SPILLED_GUEST_CARTS_LIMIT', 1_000_000))
+
 
 class UserNotExists(Exception):
     """When user trying to perform actions while he is not logged in"""
@@ -39,7 +53,18 @@ class DataHandler:
         self._db = None
         self._admins = TypedList(User)
         self._users = TypedDict(int, User)
+        # username -> id of the connected user that is logged in with it
+        self._user_ids_by_name = TypedDict(str, int)
         self._users_lock = threading.Lock()
+        # id of a guest user -> the last time it was seen, the least recently seen first
+        self._guests_seen = OrderedDict()
+        # ids of the evicted guests whose baskets are loaded again when they return, the first evicted first
+        self._spilled_guest_carts = OrderedDict()
+        self._spilled_guest_carts_limit = SPILLED_GUEST_CARTS_LIMIT
+        self._guest_users_limit = GUEST_USERS_LIMIT
+        self._guest_idle_ttl = GUEST_IDLE_TTL
+        self._spill_guest_carts = SPILL_GUEST_CARTS
+        self._clock = time.monotonic
         self._stores = dict()
         self._stores_lock = threading.Lock()
         self._purchases = TypedList(Purchase)
@@ -85,7 +110,88 @@ class DataHandler:
         :param new_user: (User) user to add
         :return: None
         """
-        self._users[user_id] = new_user
+        with self._users_lock:
+            old_user: User = self._users.get(user_id, None)
+            if old_user is not None and old_user.user_state is not None:
+                self._unindex_username(old_user.user_state.user_name, user_id)
+            self._users[user_id] = new_user
+            if new_user.user_state is not None:
+                self._user_ids_by_name[new_user.user_state.user_name] = user_id
+                self._guests_seen.pop(user_id, None)
+            else:
+                self._guests_seen[user_id] = self._clock()
+                self._guests_seen.move_to_end(user_id)
+                self._evict_guests()
+            returned_guest = new_user.user_state is None and user_id in self._spilled_guest_carts
+            self._spilled_guest_carts.pop(user_id, None)
+        if returned_guest:
+            # the baskets of a guest are saved with its id as the user
+            new_user.shopping_cart.baskets = self._dal.get_baskets_by_user(str(user_id))
+
+    def _evict_guests(self):
+        """
+        evict the least recently seen guest users, while there are more than the limit or they are idle for longer than
+        the ttl. must be called with the users lock
+        :return: None
+        """
+        idle_since = self._clock() - self._guest_idle_ttl
+        while len(self._guests_seen) > 0:
+            user_id, last_seen = next(iter(self._guests_seen.items()))
+            if len(self._guests_seen) <= self._guest_users_limit and last_seen > idle_since:
+                return
+            del self._guests_seen[user_id]
+            user: User = self._users.get(user_id, None)
+            if user is None or user.user_state is not None:
+                # not a guest anymore
+                continue
+            if user.has_products_in_cart():
+                if not self._spill_guest_carts:
+                    continue
+                self._spilled_guest_carts[user_id] = None
+                if len(self._spilled_guest_carts) > self._spilled_guest_carts_limit:
+                    self._spilled_guest_carts.popitem(last=False)
+            del self._users[user_id]
+
+    def _unindex_username(self, username: str, user_id: int):
+        """
+        remove the given username from the username index, only if it still points to the given user id
+        :param username: (str) username to remove
+        :param user_id: (int) id of the user that is disconnecting from that username
+        :return: None
+        """
+        if self._user_ids_by_name.get(username, None) == user_id:
+            del self._user_ids_by_name[username]
+
+    def _get_connected_user_by_username(self, name: str):
+        """
+        get the connected user that is logged in with the given username, using the username index
+        :param name: (str) username to look for
+        :return: tuple of (user id, User) if found, (-1, None) otherwise
+        """
+        user_id = self._user_ids_by_name.get(name, None)
+        if user_id is None:
+            return -1, None
+        current: User = self._users.get(user_id, None)
+        if current is None or current.user_state is None or current.user_state.user_name != name:
+            # stale entry - the user was removed or replaced without going through the data handler
+            with self._users_lock:
+                self._unindex_username(name, user_id)
+            return -1, None
+        return user_id, current
+
+    def _get_connected_user_state_by_username(self, name: str):
+        """
+        get the state of the connected user that is logged in with the given username, attached to the session
+        :param name: (str) username to look for
+        :return: tuple of (user id, LoggedInUser) if found, (-1, None) otherwise
+        """
+        user_id, current = self._get_connected_user_by_username(name)
+        if current is None:
+            return -1, None
+        temp = self._dal.add(current.user_state, add_only=True)
+        if temp:
+            current.user_state = temp
+        return user_id, current.user_state
 
     def add_admin(self, admin: User, user_name: str):
         from src.domain.system.permission_classes import Permission, Role
@@ -139,14 +245,9 @@ class DataHandler:
         :param name: (str) id of a user
         :return: SavedUser object if exists, None otherwise
         """
-        for user_id in self._users:
-            current: User = self._users[user_id]
-            if current.user_state is not None:
-                temp = self._dal.add(current.user_state, add_only=True)
-                if temp:
-                    current.user_state = temp
-                if current.user_state.user_name == name:
-                    return current.user_state
+        _, connected_user = self._get_connected_user_state_by_username(name)
+        if connected_user is not None:
+            return connected_user
         loaded_user: LoggedInUser = self._dal.get_user_by_name(name)
         temp = self._dal.add(loaded_user, add_only=True)
         if temp:
@@ -167,14 +268,9 @@ class DataHandler:
         :param name: (str) id of a user
         :return: SavedUser object if exists, None otherwise
         """
-        for user_id in self._users:
-            current: User = self._users[user_id]
-            if current.user_state is not None:
-                temp = self._dal.add(current.user_state, add_only=True)
-                if temp:
-                    current.user_state = temp
-                if current.user_state.user_name == name:
-                    return current.user_state, user_id
+        user_id, connected_user = self._get_connected_user_state_by_username(name)
+        if connected_user is not None:
+            return connected_user, user_id
         loaded_user: LoggedInUser = self._dal.get_user_by_name(name)
 
         if loaded_user is not None:
@@ -186,8 +282,14 @@ class DataHandler:
         return loaded_user, -1
 
     def add_or_update_user_state(self, state: LoggedInUser, user_id: int):
-        user: User = self._users[user_id]
-        user.user_state = state
+        with self._users_lock:
+            user: User = self._users[user_id]
+            if user.user_state is not None:
+                self._unindex_username(user.user_state.user_name, user_id)
+            user.user_state = state
+            if state is not None:
+                self._user_ids_by_name[state.user_name] = user_id
+                self._guests_seen.pop(user_id, None)
 
     def get_user_by_username_as_result(self, username: str) -> Result:
         u, user_id = self.get_user_by_username_login(username)
@@ -202,8 +304,20 @@ class DataHandler:
         :return: SavedUser object if exists, None otherwise
         """
 
-        if user_id in self._users:
-            return self._users[user_id]
+        user = self._users.get(user_id, None)
+        if user is not None:
+            if user_id in self._guests_seen:
+                with self._users_lock:
+                    if user_id in self._guests_seen:
+                        self._guests_seen[user_id] = self._clock()
+                        self._guests_seen.move_to_end(user_id)
+            return user
+        if user_id in self._spilled_guest_carts:
+            # an evicted guest with products in its cart returned
+            from src.domain.system.users_classes import User
+            user = User(user_id)
+            self.add_or_update_user(user_id, user)
+            return user
         # else:
         #     user: User = self._dal.get_user_by_id(user_id)
         #     if user is not None:
@@ -336,6 +450,7 @@ class DataHandler:
                 self._initialize = True
             new_user.user_state = None
             # self._dal.add(new_user)
+            self.add_or_update_user(new_user_id, new_user)
         else:
             if new_user_id == -1:
                 new_user: User = User.create_new_user_for_guest(-1)
@@ -348,8 +463,7 @@ class DataHandler:
                 self._initialize = True
             new_user.user_state = None
             # self._dal.add(new_user)
-            user_id = new_user.user_id
-            self.users[user_id] = new_user
+            self.add_or_update_user(new_user.user_id, new_user)
 
         return Result(True, new_user_id, "success", None)
 
@@ -364,7 +478,7 @@ class DataHandler:
         user: User = self.get_user_by_id(user_id)
         if user is None:
             return Result(False, user_id, "Something went wrong in login", None)
-        user.user_state = registered_user
+        self.add_or_update_user_state(registered_user, user_id)
         user.shopping_cart.baskets = registered_user.get_shopping_cart_of_user()
         user.login()
         return Result(True, user_id, "success login", None)
@@ -378,8 +492,12 @@ class DataHandler:
         if user_id in self.users:
             user: User = self.users[user_id]
             # todo if none check if exists exists in db
+            if user.user_state is not None:
+                with self._users_lock:
+                    self._unindex_username(user.user_state.user_name, user_id)
             if user.logout():
-                # del self._users[user_id]
+                # a guest again, that is evicted as one
+                self.add_or_update_user(user_id, user)
                 return Result(True, user_id, "success", None)
             else:
                 return Result(False, user_id, "user is not registered or user already not connected to the system",
@@ -417,12 +535,8 @@ class DataHandler:
                 #             user._permissions[s] = res
 
     def get_user_by_username_wrapper(self, name: str) -> User:
-        for user_id in self._users:
-            current: User = self._users[user_id]
-            if current.user_state is not None:
-                if current.user_state.user_name == name:
-                    return current
-        return None
+        _, current = self._get_connected_user_by_username(name)
+        return current
 
     def save_purchases(self, purchases: TypedList):
         """saving given purchases"""
@@ -0,0 +1,48 @@
+import threading
+
+DISCOUNTS = 'discounts'
+POLICIES = 'policies'
+
+
+class DescriptionCache:
+    """
+    process wide cache of the descriptions of the discounts and the shopping policies of the stores, for the management
+    and product views. the descriptions are kept by the version of the store, that is saved in its row and changed in
+    the transaction of every change of its discounts or policies (see Store._new_version), so the descriptions of a
+    version are built only from the trees of that version, in any process. a node is described once per version of
+    its store, and a complex node is described from the cached descriptions of its children. only the descriptions of
+    the last requested version of every store are kept
+    """
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        """ Static access method. """
+        if DescriptionCache.__instance is None:
+            DescriptionCache()
+        return DescriptionCache.__instance
+
+    def __init__(self):
+        # name of store -> (version, dict of kind -> dict of id -> description)
+        self._stores = dict()
+        self._lock = threading.Lock()
+        DescriptionCache.__instance = self
+
+    def descriptions_of(self, store_name: str, version: str, kind: str) -> dict:
+        """
+        :param store_name: (str) name of the store
+        :param version: (str) version of the store, see Store.version
+        :param kind: (str) DISCOUNTS or POLICIES
+        :return: dict of id -> description of the nodes of the given kind of the store that were described in the
+                 given version. the descriptions of nodes that are described later are added to it
+        """
+        with self._lock:
+            entry = self._stores.get(store_name)
+            if entry is None or entry[0] != version:
+                entry = (version, {DISCOUNTS: dict(), POLICIES: dict()})
+                self._stores[store_name] = entry
+            return entry[1][kind]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stores.clear()
@@ -0,0 +1,140 @@
+import heapq
+import os
+import threading
+import time
+from datetime import datetime
+
+from src.logger.log import Log
+
+# seconds between two checks for expired discounts of the background worker
+EXPIRY_TICK_SECONDS = float(os.environ.get('DISCOUNT_EXPIRY_TICK_SECONDS', 5))
+
+
+def _start_daemon_thread(target) -> None:
+    threading.Thread(target=target, name="discount_expiry", daemon=True).start()
+
+
+class DiscountExpiry:
+    """
+    process wide schedule of the end times of the discounts of the stores, kept in a heap ordered by the end time.
+    the stores schedule every discount they add or edit, and all the discounts of their tree when the tree is
+    compiled for the first basket. a background worker takes the discounts that their time passed and removes them
+    from the trees and the products of their stores (see Store.remove_expired_discounts), so an expired discount is
+    not checked on every basket forever.
+    a discount that was edited or removed before its time is left in the heap, and is ignored by its store when its
+    time comes
+    """
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        """ Static access method. """
+        if DiscountExpiry.__instance is None:
+            DiscountExpiry()
+        return DiscountExpiry.__instance
+
+    def __init__(self):
+        # heap of (end time, name of store, id of discount)
+        self._heap = []
+        # (name of store, id of discount) -> end time it is scheduled for, so a discount is pushed once
+        self._scheduled = dict()
+        self._lock = threading.Lock()
+        self._worker_started = False
+        DiscountExpiry.__instance = self
+
+    def schedule(self, store_name: str, discount_id: int, end_time: datetime) -> None:
+        """
+        remove the given discount from its store when its end time passes
+        :param store_name: (str) name of the store of the discount
+        :param discount_id: (int) id of the discount
+        :param end_time: (datetime) end time of the discount
+        :return: None
+        """
+        if end_time is None or discount_id is None:
+            return
+        key = (store_name, discount_id)
+        with self._lock:
+            if self._scheduled.get(key) == end_time:
+                return
+            self._scheduled[key] = end_time
+            heapq.heappush(self._heap, (end_time, store_name, discount_id))
+
+    def take_due(self, now: datetime = None) -> dict:
+        """
+        remove all the discounts that their end time passed from the schedule
+        :param now: (datetime) the current time by default
+        :return: dict of name of store -> list of ids of its discounts that their end time passed
+        """
+        now = datetime.now() if now is None else now
+        due = dict()
+        with self._lock:
+            while len(self._heap) > 0 and self._heap[0][0] <= now:
+                end_time, store_name, discount_id = heapq.heappop(self._heap)
+                # the discount was scheduled again for another time after this entry was pushed
+                if self._scheduled.get((store_name, discount_id)) != end_time:
+                    continue
+                del self._scheduled[(store_name, discount_id)]
+                due.setdefault(store_name, []).append(discount_id)
+        return due
+
+    def next_end_time(self):
+        """
+        :return: (datetime) the earliest end time in the schedule, None if it is empty
+        """
+        with self._lock:
+            return self._heap[0][0] if len(self._heap) > 0 else None
+
+    def remove_due(self, now: datetime = None) -> dict:
+        """
+        remove the discounts that their end time passed from their stores, every store in a transaction of its own
+        :param now: (datetime) the current time by default
+        :return: dict of name of store -> list of ids of the discounts that were removed from it
+        """
+        from src.domain.system.DAL import DAL
+        from src.domain.system.store_classes import Store
+        now = datetime.now() if now is None else now
+        dal: DAL = DAL.get_instance()
+        removed = dict()
+        for store_name, discount_ids in self.take_due(now).items():
+            try:
+                # the worker has a session of its own, the discounts of a store are removed with a single commit
+                dal.renew_session()
+                store: Store = dal.query(Store).filter_by(_name=store_name).first()
+                if store is not None:
+                    res = store.remove_expired_discounts(discount_ids, now)
+                    if res.succeed and len(res.data) > 0:
+                        removed[store_name] = res.data
+                dal.drop_session()
+            except Exception as e:
+                dal.discard_session()
+                Log.get_instance().get_logger().error(
+                    f"failed to remove the expired discounts of store {store_name}: {e}")
+        return removed
+
+    def start(self, start_worker=_start_daemon_thread, sleep=time.sleep, tick: float = EXPIRY_TICK_SECONDS) -> None:
+        """
+        start the background worker that removes the expired discounts, if it was not started yet
+        :param start_worker: function that runs the given function in the background (e.g
+                             SocketIO.start_background_task). a new thread by default
+        :param sleep: function that waits the given number of seconds, it has to fit start_worker (e.g
+                      SocketIO.sleep)
+        :param tick: (float) seconds between two checks
+        :return: None
+        """
+        with self._lock:
+            if self._worker_started:
+                return
+            self._worker_started = True
+        start_worker(lambda: self._run(sleep, tick))
+
+    def _run(self, sleep, tick: float) -> None:
+        while True:
+            sleep(tick)
+            next_end_time = self.next_end_time()
+            if next_end_time is not None and next_end_time <= datetime.now():
+                self.remove_due()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+            self._scheduled.clear()
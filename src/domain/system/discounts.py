@@ -3,20 +3,20 @@ from __future__ import annotations
 import enum
 import json
 import os
+from array import array
 from dataclasses import dataclass
 from typing import TYPE_CHECKING
 
 from datetime import datetime, timedelta
-from functools import reduce
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import event, orm
 from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.ext.mutable import MutableList
 
 from src.domain.system.DAL import DAL
+from src.domain.system.id_links import IdLinks
 from src.protocol_classes.classes_utils import TypeChecker, TypedDict
 
 if TYPE_CHECKING:
@@ -140,6 +140,69 @@ class ProductToNeededPrice:
         return f'{self.needed_price}$ worth of {self.product}'
 
 
+class BasketSnapshot:
+    """
+    the products of a basket as the discount conditions and strategies read them, built once for a pricing pass of the
+    basket instead of by every condition and strategy: the lines of the basket in a fixed order, their quantities in a
+    compact array, the lines of every category, and the quantity of every category and of the whole basket.
+    the quantities and categories of the lines don't change while the basket is priced, but their prices do (every
+    discount that is applied reduces them), so prices are read from the lines, through the lines of the category
+    """
+    __slots__ = ['lines', 'index_of', 'quantities', 'categories_of', 'lines_of_category', 'category_quantities',
+                 'total_quantity']
+
+    def __init__(self, basket: Basket):
+        """
+        :param basket: (Basket) basket to take the snapshot of
+        """
+        self.lines = tuple(basket.products.values())
+        self.index_of = {name: i for i, name in enumerate(basket.products.keys())}
+        # the quantities and categories are read from the item of the line, as the conditions always read them
+        items = [p.item for p in self.lines]
+        self.quantities = array('q', [item.quantity for item in items])
+        self.categories_of = dict()
+        lines_of_category = dict()
+        self.category_quantities = dict()
+        for name, i in self.index_of.items():
+            categories = frozenset(items[i].categories)
+            self.categories_of[name] = categories
+            for category in categories:
+                lines_of_category.setdefault(category, []).append(i)
+                self.category_quantities[category] = self.category_quantities.get(category, 0) + self.quantities[i]
+        self.lines_of_category = {category: tuple(lines) for category, lines in lines_of_category.items()}
+        self.total_quantity = sum(p._product_quantity for p in self.lines)
+
+    def line(self, product_name: str):
+        """
+        :param product_name: (str) name of a product
+        :return: the ProductInShoppingCart of the product, None if it is not in the basket
+        """
+        i = self.index_of.get(product_name)
+        return None if i is None else self.lines[i]
+
+    def quantity_of(self, product_name: str) -> int:
+        """
+        :param product_name: (str) name of a product
+        :return: quantity of the product in the basket, None if it is not in the basket
+        """
+        i = self.index_of.get(product_name)
+        return None if i is None else self.quantities[i]
+
+    def lines_of(self, category: str) -> list:
+        """
+        :param category: (str) name of a category
+        :return: list of the ProductInShoppingCart of the basket in the given category
+        """
+        return [self.lines[i] for i in self.lines_of_category.get(category, ())]
+
+    def category_price(self, category: str) -> float:
+        """
+        :param category: (str) name of a category
+        :return: current total price of the products of the basket in the given category
+        """
+        return sum(self.lines[i]._total_price for i in self.lines_of_category.get(category, ()))
+
+
 class _IDiscountCondition(db.Model):
     __tablename__ = 'discount_condition'
     condition_type = db.Column(db.VARCHAR(40))
@@ -170,7 +233,7 @@ class _IDiscountCondition(db.Model):
         """
         return self._end_time > datetime.now()
 
-    def check_condition(self, basket: Basket) -> bool:
+    def check_condition(self, basket: Basket, snapshot: BasketSnapshot = None) -> bool:
         return self.is_discount_time_valid()
 
     def get_description_condition(self):
@@ -215,23 +278,19 @@ class DiscountConditionCombo(_IDiscountCondition):
             base = f'{base}\n minimum size of basket: {self._size_of_basket_cond}\n'
 
         if self.over_all_price_product_cond is not None and len(self.over_all_price_product_cond) > 0:
-            all_p_descriptions = [str(p) for p in self.over_all_price_product_cond]
-            description = reduce((lambda acc, curr: f'{acc}, {curr}'), all_p_descriptions)
+            description = ', '.join(str(p) for p in self.over_all_price_product_cond)
             base = f'{base}\n minimum price for products: {description}'
 
         if self.over_all_price_category_cond is not None and len(self.over_all_price_category_cond) > 0:
-            all_p_descriptions = [str(p) for p in self.over_all_price_category_cond]
-            description = reduce((lambda acc, curr: f'{acc}, {curr}'), all_p_descriptions)
+            description = ', '.join(str(p) for p in self.over_all_price_category_cond)
             base = f'{base}\n minimum price for category: {description}'
 
         if self.product_list_cond is not None and len(self.product_list_cond) > 0:
-            all_p_descriptions = [str(p) for p in self.product_list_cond]
-            description = reduce((lambda acc, curr: f'{acc}, {curr}'), all_p_descriptions)
+            description = ', '.join(str(p) for p in self.product_list_cond)
             base = f'{base}\nminimum quantity for products: {description}\n'
 
         if self.overall_category_quantity is not None and len(self.overall_category_quantity) > 0:
-            all_p_descriptions = [str(p) for p in self.overall_category_quantity]
-            description = reduce((lambda acc, curr: f'{acc}, {curr}'), all_p_descriptions)
+            description = ', '.join(str(p) for p in self.overall_category_quantity)
             base = f'{base}\nminimum quantity for category: {description}'
         return base
 
@@ -362,91 +421,113 @@ class DiscountConditionCombo(_IDiscountCondition):
         else:
             raise TypeError(f"discount: expected list or None, got {type(new_overall_category_quantity)}")
 
-    def is_size_of_basket_cond_valid(self, basket: Basket) -> bool:
+    def _requirements(self) -> tuple:
+        """
+        :return: tuple of the category price, product price, product quantity and category quantity conditions, parsed
+                 once for every value of their columns
+        """
+        raw = (self._over_all_price_category_cond, self._over_all_price_product_cond, self._product_list_cond,
+               self._overall_category_quantity)
+        parsed = getattr(self, '_parsed_requirements', None)
+        if parsed is None or parsed[0] != raw:
+            parsed = (raw, (self.over_all_price_category_cond, self.over_all_price_product_cond, self.product_list_cond,
+                            self.overall_category_quantity))
+            self._parsed_requirements = parsed
+        return parsed[1]
+
+    def is_size_of_basket_cond_valid(self, basket: Basket, snapshot: BasketSnapshot = None) -> bool:
         """
         check if the basket answers the given size cond
         :param basket: (Basket) the basket to check
+        :param snapshot: (BasketSnapshot) snapshot of the basket, taken here if not given
         :return: True if the size of the basket is valid, False otherwise
         """
-        return self.size_of_basket_cond is None or sum(
-            [p._product_quantity for p in basket.products.values()]) >= self.size_of_basket_cond
-
+        if self.size_of_basket_cond is None:
+            return True
+        snapshot = snapshot if snapshot is not None else BasketSnapshot(basket)
+        return snapshot.total_quantity >= self.size_of_basket_cond
 
-    def is_over_all_price_category_cond_valid(self, basket: Basket) -> bool:
+    def is_over_all_price_category_cond_valid(self, basket: Basket, snapshot: BasketSnapshot = None) -> bool:
         """
         check if the basket answers the given categories having enough product to have the given price
         :param basket: (Basket) the basket to check
+        :param snapshot: (BasketSnapshot) snapshot of the basket, taken here if not given
         :return: True each category have the given price value with products, False otherwise
         """
-        if self.over_all_price_category_cond is None:
+        conditions = self._requirements()[0]
+        if len(conditions) == 0:
             return True
-        for category in self.over_all_price_category_cond:
-            category_to_price: CategoryToNeededPrice = category
-            filtered_by_category_items = [p._total_price for k, p in
-                                          basket.products.items()
-                                          if category_to_price.category in p.item.categories]
-            total = reduce((lambda acc, price: acc + price), filtered_by_category_items)
-            if total < category_to_price.needed_price:
+        snapshot = snapshot if snapshot is not None else BasketSnapshot(basket)
+        for category_to_price in conditions:
+            if snapshot.category_price(category_to_price.category) < category_to_price.needed_price:
                 return False
         return True
 
-    def is_overall_category_quantity_valid(self, basket):
+    def is_overall_category_quantity_valid(self, basket, snapshot: BasketSnapshot = None):
         """
         check if the basket have enough quantity of each category
         :param basket:  (Basket) the basket to check
+        :param snapshot: (BasketSnapshot) snapshot of the basket, taken here if not given
         :return: True each category have the given quantity , False otherwise
         """
-        if self.overall_category_quantity is None:
+        conditions = self._requirements()[3]
+        if len(conditions) == 0:
             return True
-        for category in self.overall_category_quantity:
-            category_to_quantity: CategoryToNeededItems = category
-            filtered_by_category_items = [p.item.quantity for k, p in basket.products.items() if
-                                          category_to_quantity.category in p.item.categories]
-            total = reduce((lambda acc, quantity: acc + quantity), filtered_by_category_items)
-            if total < category_to_quantity.needed_items:
+        snapshot = snapshot if snapshot is not None else BasketSnapshot(basket)
+        for category_to_quantity in conditions:
+            if snapshot.category_quantities.get(category_to_quantity.category, 0) < category_to_quantity.needed_items:
                 return False
         return True
 
-    def is_over_all_price_product_cond_valid(self, basket: Basket) -> bool:
+    def is_over_all_price_product_cond_valid(self, basket: Basket, snapshot: BasketSnapshot = None) -> bool:
         """
         check if the basket answers the given categories having enough product to have the given price
         :param basket: (Basket) the basket to check
+        :param snapshot: (BasketSnapshot) snapshot of the basket, taken here if not given
         :return: True each category have the given price value with products, False otherwise
         """
-        if self.over_all_price_product_cond is None:
+        conditions = self._requirements()[1]
+        if len(conditions) == 0:
             return True
-        for product in self.over_all_price_product_cond:
-            product_to_price: ProductToNeededPrice = product
-            if product_to_price.product in basket.products and basket.products[
-                product_to_price.product]._total_price < product_to_price.needed_price:
+        snapshot = snapshot if snapshot is not None else BasketSnapshot(basket)
+        for product_to_price in conditions:
+            line = snapshot.line(product_to_price.product)
+            if line is not None and line._total_price < product_to_price.needed_price:
                 return False
         return True
 
-    def is_overall_product_quantity_valid(self, basket):
+    def is_overall_product_quantity_valid(self, basket, snapshot: BasketSnapshot = None):
         """
         check if the basket have enough quantity of each product needed
         :param basket:  (Basket) the basket to check
+        :param snapshot: (BasketSnapshot) snapshot of the basket, taken here if not given
         :return: True each Product have the given quantity , False otherwise
         """
-        if self.product_list_cond is None:
+        conditions = self._requirements()[2]
+        if len(conditions) == 0:
             return True
-        for product in self.product_list_cond:
-            product_to_quantity: ProductToQuantity = product
-            if product_to_quantity.product in basket.products and basket.products[
-                product_to_quantity.product].item.quantity < product_to_quantity.needed_items:
+        snapshot = snapshot if snapshot is not None else BasketSnapshot(basket)
+        for product_to_quantity in conditions:
+            quantity = snapshot.quantity_of(product_to_quantity.product)
+            if quantity is not None and quantity < product_to_quantity.needed_items:
                 return False
         return True
 
-    def check_condition(self, basket: Basket) -> bool:
+    def check_condition(self, basket: Basket, snapshot: BasketSnapshot = None) -> bool:
         """
         checking the given baskets is answering all discount conditions
-        :param basket:
-        :return:
+        :param basket: (Basket) the basket to check
+        :param snapshot: (BasketSnapshot) snapshot of the basket, taken once for all the conditions if not given
+        :return: True if the basket answers all the conditions, False otherwise
         """
-        return self.is_discount_time_valid() and self.is_size_of_basket_cond_valid(
-            basket) and self.is_over_all_price_category_cond_valid(
-            basket) and self.is_over_all_price_product_cond_valid(basket) and self.is_overall_category_quantity_valid(
-            basket) and self.is_overall_product_quantity_valid(basket)
+        if not self.is_discount_time_valid():
+            return False
+        snapshot = snapshot if snapshot is not None else BasketSnapshot(basket)
+        return self.is_size_of_basket_cond_valid(basket, snapshot) and \
+               self.is_over_all_price_category_cond_valid(basket, snapshot) and \
+               self.is_over_all_price_product_cond_valid(basket, snapshot) and \
+               self.is_overall_category_quantity_valid(basket, snapshot) and \
+               self.is_overall_product_quantity_valid(basket, snapshot)
 
 
 class _IDiscountStrategy(db.Model):
@@ -455,13 +536,16 @@ class _IDiscountStrategy(db.Model):
     discount_type = db.Column(db.VARCHAR(length=40))
     __mapper_args__ = {
         'polymorphic_identity': 'discount_strategy',
-        'polymorphic_on': discount_type
+        'polymorphic_on': discount_type,
+        # the columns of all the strategies are in this table, select them with the discount instead of one by one
+        'with_polymorphic': '*'
     }
 
-    def activate_discount(self, basket: Basket) -> Basket:
+    def activate_discount(self, basket: Basket, snapshot: BasketSnapshot = None) -> Basket:
         """
         Activate the Discount strategy on the Basket, to reduce it's price if possible
         :param basket: (Basket) basket to activate the discount to
+        :param snapshot: (BasketSnapshot) snapshot of the basket, taken by the strategies that need it if not given
         :return: basket after discount was activated, or the same basket if the discount was not possible
         """
         return basket
@@ -508,7 +592,7 @@ class BasketDiscountStrategy(_IDiscountStrategy):
             raise TypeError(
                 f"discount: expected float from 0 to 1, got {type(new_discount_percent)}: {new_discount_percent}")
 
-    def activate_discount(self, basket: Basket) -> Basket:
+    def activate_discount(self, basket: Basket, snapshot: BasketSnapshot = None) -> Basket:
         """
         giving given percentage of discount on the given product
         :param basket:  (Basket) basket to activate the discount to
@@ -594,7 +678,7 @@ class ProductDiscountStrategy(_IDiscountStrategy):
             raise TypeError(
                 f"discount: expected float from 0 to 1, got {type(new_discount_percent)}: {new_discount_percent}")
 
-    def activate_discount(self, basket: Basket) -> Basket:
+    def activate_discount(self, basket: Basket, snapshot: BasketSnapshot = None) -> Basket:
         """
         giving given percentage of discount on the given product
         :param basket:  (Basket) basket to activate the discount to
@@ -668,15 +752,14 @@ class CategoryDiscountStrategy(_IDiscountStrategy):
     def is_product_affected_by_discount(self, product_name: str, categories: list) -> bool:
         return self.discounted_category in categories
 
-    def activate_discount(self, basket: Basket) -> Basket:
+    def activate_discount(self, basket: Basket, snapshot: BasketSnapshot = None) -> Basket:
         """
         giving given percentage of discount on the given category
         :param basket:  (Basket) basket to activate the discount to
         :return:  basket after discount was activated, or the same basket if the given category was not in the basket
         """
-        filtered_by_category_items = [p for k, p in basket.products.items() if
-                                      self.discounted_category in p.item.categories]
-        for p in filtered_by_category_items:
+        snapshot = snapshot if snapshot is not None else BasketSnapshot(basket)
+        for p in snapshot.lines_of(self.discounted_category):
             p._total_price = p._total_price * (1 - self.discount_percent)
         return basket
 
@@ -776,7 +859,7 @@ class FreePerXProductDiscountStrategy(_IDiscountStrategy):
             raise TypeError(
                 f"discount: expected bool, got {type(new_is_duplicate)}: {new_is_duplicate}")
 
-    def activate_discount(self, basket: Basket) -> Basket:
+    def activate_discount(self, basket: Basket, snapshot: BasketSnapshot = None) -> Basket:
         """
         reducing price on the given product if it's exists in baskets
         in the given quantity, else, returning the same basket without the discount
@@ -899,18 +982,15 @@ class FreePerXCategoryDiscountStrategy(_IDiscountStrategy):
             raise TypeError(
                 f"discount: expected bool, got {type(new_is_duplicate)}: {new_is_duplicate}")
 
-    def activate_discount(self, basket: Basket) -> Basket:
+    def activate_discount(self, basket: Basket, snapshot: BasketSnapshot = None) -> Basket:
         """
         reducing price on the given category if it's exists in baskets
         in the given quantity, else, returning the same basket without the discount
         :param basket: (Basket) basket to activate this discount to
         :return: basket with reduce price after discount, or the same discount if there is not enough of that category
         """
-        filtered_products_by_category = [p for k, p in basket.products.items() if
-                                         self.category in p.item.categories]
-        if len(filtered_products_by_category) == 0:
-            return basket
-        for p in filtered_products_by_category:
+        snapshot = snapshot if snapshot is not None else BasketSnapshot(basket)
+        for p in snapshot.lines_of(self.category):
             product: ProductInShoppingCart = p
             temp_base_price: float = float(float(product._total_price) / float(product.item.quantity))
             temp_quantity = product.item.quantity
@@ -975,8 +1055,8 @@ class _IDiscount(db.Model):
         return [self.discount_strategy, self.discount_condition, self]
 
     def delete_from_db(self):
-        self._dal.delete_all(self.give_all_stuff_to_delete(), del_only=True)
-        self._dal.flush()  # So we ill able to call .id
+        # the whole tree is deleted with a statement for each table, instead of a statement for each object in it
+        self._dal.delete_all_as_query([o for o in self.give_all_stuff_to_delete() if o is not None])
 
     def reset_flags(self):
         self.is_implemented = False
@@ -989,7 +1069,22 @@ class _IDiscount(db.Model):
         except:
             pass
 
-    def get_description(self):
+    def get_description(self, descriptions: dict = None):
+        """
+        :param descriptions: (dict) id -> description of discounts that were already described (see
+                             DescriptionCache). the descriptions of this discount and of the discounts under it are
+                             taken from it, or added to it. None to describe them all again
+        :return: (str) description of the discount
+        """
+        if descriptions is None or self.id is None:
+            return self._describe(descriptions)
+        description = descriptions.get(self.id)
+        if description is None:
+            description = self._describe(descriptions)
+            descriptions[self.id] = description
+        return description
+
+    def _describe(self, descriptions: dict = None):
         self.refresh_self()
         return f'{self.discount_strategy.get_description_strategy()}\n  condition: {self.discount_condition.get_description_condition()}\n'
 
@@ -1134,13 +1229,31 @@ class ComplexDiscountTypes(enum.Enum):
             return None
 
 
+class DiscountChildLink(db.Model):
+    """
+    association between a complex discount and one of its children
+    """
+    __tablename__ = 'complex_discount_child'
+    id = db.Column(db.Integer, primary_key=True)
+    _parent_fk = db.Column(db.Integer, db.ForeignKey('complex_discount.id', ondelete='CASCADE'), index=True)
+    _child_id = db.Column(db.Integer, index=True)
+
+    def __init__(self, child_id: int):
+        self._child_id = child_id
+
+
 class ComplexDiscount(_IDiscount):
     __tablename__ = 'complex_discount'
     id = db.Column(db.Integer, db.ForeignKey("discount.id"), primary_key=True)
     # _parent_id = db.Column(db.ForeignKey("discount.id"))
     # _dal = DAL.get_instance()
     # Relationship for inheritance
-    _children_discounts_ls = db.Column(MutableList.as_mutable(db.JSON))
+    # never read, the links that are added to it are inserted without loading it. the tree is loaded by
+    # _load_deferred_children
+    _children_links = db.relationship("DiscountChildLink", lazy="dynamic", cascade="all, delete-orphan",
+                                      passive_deletes=True)
+    # ids of the children, kept one row per id in complex_discount_child
+    _children_discounts_ls = IdLinks('_children_links', DiscountChildLink, '_parent_fk', '_child_id')
     _operator = db.Column(db.Integer)
     # SAWarning: Implicitly combining column discount.id with column complex_discount.id under attribute 'id'.  Please configure one or more attributes for these same-named columns explicitly.
     #   util.warn(msg)
@@ -1158,7 +1271,24 @@ class ComplexDiscount(_IDiscount):
 
     @orm.reconstructor
     def _init_on_load(self):
-        self._children_discounts_dict = self._dal.get_discount_map_with_id_keys(self._children_discounts_ls)
+        # children are loaded on first use, together with all the complex discounts loaded in the same session,
+        # so a whole tree level is loaded with a single query
+        self._children_discounts_dict = None
+        self._dal.defer_load('children_discounts', self)
+
+    def _load_deferred_children(self):
+        """
+        load the children of this discount, and of all the other complex discounts that were loaded in the same
+        session and did not load their children yet, with a single query
+        :return: None
+        """
+        discounts = [d for d in self._dal.take_deferred('children_discounts', self) if
+                     d._children_discounts_dict is None]
+        for d in discounts:
+            d._children_discounts_dict = TypedDict(int, _IDiscount)
+        by_id = {d.id: d for d in discounts}
+        for parent_id, child in self._dal.get_children_of_discounts(list(by_id.keys())):
+            by_id[parent_id]._children_discounts_dict[child.id] = child
 
     @property
     def children_discounts_ls(self):
@@ -1176,6 +1306,8 @@ class ComplexDiscount(_IDiscount):
 
     @property
     def children_discounts_dict(self):
+        if self._children_discounts_dict is None:
+            self._load_deferred_children()
         return self._children_discounts_dict
 
     @children_discounts_dict.setter
@@ -1198,8 +1330,8 @@ class ComplexDiscount(_IDiscount):
         return to_delete
 
     def delete_from_db(self):
-        self._dal.delete_all(self.give_all_stuff_to_delete(), del_only=True)
-        self._dal.flush()  # So we ill able to call .id
+        # the whole tree is deleted with a statement for each table, instead of a statement for each object in it
+        self._dal.delete_all_as_query([o for o in self.give_all_stuff_to_delete() if o is not None])
 
     def get_all_discounts(self):
         """
@@ -1238,7 +1370,8 @@ class ComplexDiscount(_IDiscount):
         :return: the Discount object that was removed. if it was not found, return none
         """
         if to_remove in self.children_discounts_dict:
-            self.children_discounts_ls.remove(to_remove)
+            # the ids of the children are not read to remove one
+            ComplexDiscount._children_discounts_ls.delete([self], [to_remove])
             output = self.children_discounts_dict.pop(to_remove)
             self._dal.add(self, add_only=True)
             self._dal.flush()  # So we ill able to call .id
@@ -1250,6 +1383,22 @@ class ComplexDiscount(_IDiscount):
                 return deleted
         return None
 
+    def remove_children_discounts(self, to_remove: list):
+        """
+        removing the given children of this complex discount together, with a single flush
+        :param to_remove:(list of int) ids of children of this discount
+        :return: list of the Discount objects that were removed
+        """
+        children_discounts = self.children_discounts_dict
+        to_remove = set(to_remove)
+        removed = [children_discounts.pop(discount_id) for discount_id in list(children_discounts.keys()) if
+                   discount_id in to_remove]
+        # only the links of the removed children are deleted, the rest of the links are kept as they are
+        ComplexDiscount._children_discounts_ls.delete([self], to_remove)
+        self._dal.add(self, add_only=True)
+        self._dal.flush()
+        return removed
+
     def edit_discount(self, to_edit: int, edited_discount: _IDiscount):
         """
         edit the discount of the given discount id to the given discount
@@ -1257,21 +1406,21 @@ class ComplexDiscount(_IDiscount):
         :param edited_discount: new discount to put instead
         :return: the edited discount. if it was not found, return None
         """
-        for k, discount in self.children_discounts_dict.items():
-            discount: _IDiscount = discount
-            if discount.id == to_edit:
-                if to_edit in self._children_discounts_ls:
-                    self._children_discounts_ls.remove(to_edit)
-                self._children_discounts_ls.append(edited_discount.id)
-                del self.children_discounts_dict[to_edit]
-                self._children_discounts_dict[edited_discount.id] = edited_discount
-                self._dal.add(self, add_only=True)
-                self._dal.flush()  # So we ill able to call .id
-                return edited_discount, discount
-            else:
-                is_edited = discount.edit_discount(to_edit, edited_discount)
-                if is_edited is not None:
-                    return is_edited
+        children_discounts = self.children_discounts_dict
+        if to_edit in children_discounts:
+            discount: _IDiscount = children_discounts[to_edit]
+            if to_edit in self._children_discounts_ls:
+                self._children_discounts_ls.remove(to_edit)
+            self._children_discounts_ls.append(edited_discount.id)
+            del children_discounts[to_edit]
+            children_discounts[edited_discount.id] = edited_discount
+            self._dal.add(self, add_only=True)
+            self._dal.flush()  # So we ill able to call .id
+            return edited_discount, discount
+        for k, discount in children_discounts.items():
+            is_edited = discount.edit_discount(to_edit, edited_discount)
+            if is_edited is not None:
+                return is_edited
         return None
 
     def search_for_discount(self, to_search: int):
@@ -1330,14 +1479,12 @@ class CompositeXorDiscount(ComplexDiscount):
         super().__init__(discount_condition, discount_strategy, children_discounts)
         self._operator = ComplexDiscountTypes.XOR.value
 
-    def get_description(self):
-        all_ids = ""
-        all_descriptions = ""
-        for discount_id, discount in self.children_discounts_dict.items():
-            discount: _IDiscount = discount
-            all_ids += f'{discount_id},'
-            all_descriptions += f' {discount.get_description()},\n '
-        return f'Only 1 discount of the following discount:{all_ids}\n{all_descriptions}\n the entire Discount properties:{super().get_description()}'
+    def _describe(self, descriptions: dict = None):
+        children_discounts = self.children_discounts_dict
+        all_ids = ''.join(f'{discount_id},' for discount_id in children_discounts)
+        all_descriptions = ''.join(f' {discount.get_description(descriptions)},\n ' for discount in
+                                   children_discounts.values())
+        return f'Only 1 discount of the following discount:{all_ids}\n{all_descriptions}\n the entire Discount properties:{super()._describe(descriptions)}'
 
     def apply(self, basket: Basket) -> Basket:
         """
@@ -1370,23 +1517,22 @@ class CompositeOrDiscount(ComplexDiscount):
         super().__init__(discount_condition, discount_strategy, children_discounts)
         self._operator = ComplexDiscountTypes.OR.value
 
-    def get_description(self):
-        all_ids = ""
-        all_descriptions = ""
-        for discount_id, discount in self.children_discounts_dict.items():
-            discount: _IDiscount = discount
-            all_ids += f'{discount_id},'
-            all_descriptions += f' {discount.get_description()},\n '
-        return f'Any one of the following discounts:{all_ids}\n{all_descriptions}\n the entire Discount properties:{super().get_description()}'
+    def _describe(self, descriptions: dict = None):
+        children_discounts = self.children_discounts_dict
+        all_ids = ''.join(f'{discount_id},' for discount_id in children_discounts)
+        all_descriptions = ''.join(f' {discount.get_description(descriptions)},\n ' for discount in
+                                   children_discounts.values())
+        return f'Any one of the following discounts:{all_ids}\n{all_descriptions}\n the entire Discount properties:{super()._describe(descriptions)}'
 
     def apply(self, basket: Basket) -> Basket:
         """
         apply all the possible discounts from the list
         """
         chosen_discounts: list = []
+        snapshot = BasketSnapshot(basket)
         for k, d in self.children_discounts_dict.items():
             d: _IDiscount = d
-            if d.discount_condition.check_condition(basket):
+            if d.discount_condition.check_condition(basket, snapshot):
                 chosen_discounts.append(d)
         if not len(chosen_discounts) == 0:
             for d in chosen_discounts:
@@ -1406,24 +1552,22 @@ class CompositeAndDiscount(ComplexDiscount):
         super().__init__(discount_condition, discount_strategy, children_discounts)
         self._operator = ComplexDiscountTypes.AND.value
 
-    def get_description(self):
-
-        all_ids = ""
-        all_descriptions = ""
-        for discount_id, discount in self.children_discounts_dict.items():
-            discount: _IDiscount = discount
-            all_ids += f'{discount_id},'
-            all_descriptions += f' {discount.get_description()},\n '
-        return f'ALL of the following discount conditions must be answered:{all_ids}\n{all_descriptions}\n the entire Discount properties:{super().get_description()}'
+    def _describe(self, descriptions: dict = None):
+        children_discounts = self.children_discounts_dict
+        all_ids = ''.join(f'{discount_id},' for discount_id in children_discounts)
+        all_descriptions = ''.join(f' {discount.get_description(descriptions)},\n ' for discount in
+                                   children_discounts.values())
+        return f'ALL of the following discount conditions must be answered:{all_ids}\n{all_descriptions}\n the entire Discount properties:{super()._describe(descriptions)}'
 
     def apply(self, basket: Basket) -> Basket:
         """
         apply all the possible discounts from the list
         """
         chosen_discounts: list = []
+        snapshot = BasketSnapshot(basket)
         for d in self.children_discounts_dict:
             d: _IDiscount = d
-            if d.discount_condition.check_condition(basket):
+            if d.discount_condition.check_condition(basket, snapshot):
                 chosen_discounts.append(d)
             else:
                 return basket
@@ -1433,6 +1577,232 @@ class CompositeAndDiscount(ComplexDiscount):
             self.basic_discount_application(basket)
         return basket
 
+
+class _PlanNode:
+    """
+    a single discount of a DiscountPlan.
+    products, categories and whole_basket describe what the strategies of the discount and of all the discounts
+    under it can change in a basket, and the condition_ fields describe what their conditions read from it.
+    complex discounts also map every product and category to the children that can change it
+    """
+    __slots__ = ['operator', 'condition', 'strategy', 'children', 'products', 'categories', 'whole_basket',
+                 'condition_products', 'condition_categories', 'condition_whole_basket',
+                 'children_by_product', 'children_by_category', 'whole_basket_children']
+
+    def __init__(self, operator: int = None, condition: _IDiscountCondition = None,
+                 strategy: _IDiscountStrategy = None):
+        self.operator = operator
+        self.condition = condition
+        self.strategy = strategy
+        self.children = []
+        self.products = frozenset()
+        self.categories = frozenset()
+        self.whole_basket = False
+        self.condition_products = frozenset()
+        self.condition_categories = frozenset()
+        self.condition_whole_basket = False
+        self.children_by_product = dict()
+        self.children_by_category = dict()
+        self.whole_basket_children = []
+
+
+class DiscountPlan:
+    """
+    flat evaluation plan of a discount tree, compiled once per version of the tree of a store and used for every
+    basket price calculation (see PlanCache). the discounts are kept in pre-order, and every node knows the products and categories
+    its subtree can change, so subtrees that can't change the given basket are skipped, and XOR alternatives are
+    tried on the prices of the products they touch instead of on copies of the basket.
+    combined discounts are created without a condition and a strategy of their own (see Store.combine_discounts),
+    so a complex discount is evaluated through its children:
+        1. OR - every child that its condition holds is applied
+        2. AND - the children are applied only if the conditions of all of them hold
+        3. XOR - only the child that reduces the price of the basket the most is applied
+    """
+
+    def __init__(self):
+        self._nodes = []
+        # the discounts that are applied independently of each other: the ones under the root that are reached
+        # only through OR discounts. AND and XOR discounts are kept whole, as their children decide together
+        self._units = []
+
+    @staticmethod
+    def compile(root: _IDiscount):
+        """
+        :param root: (_IDiscount) root of the discount tree of a store
+        :return: DiscountPlan of the given tree
+        """
+        plan = DiscountPlan()
+        plan._add(root)
+        plan._add_units(0)
+        return plan
+
+    def _add_units(self, index: int):
+        node = self._nodes[index]
+        if node.operator == ComplexDiscountTypes.OR.value:
+            for child in node.children:
+                self._add_units(child)
+        else:
+            self._units.append(index)
+
+    def _add(self, discount: _IDiscount) -> int:
+        index = len(self._nodes)
+        if isinstance(discount, ComplexDiscount):
+            operator = discount._operator if discount._operator is not None else ComplexDiscountTypes.OR.value
+            node = _PlanNode(operator=operator)
+            self._nodes.append(node)
+            node.children = [self._add(child) for child in discount.children_discounts_dict.values()]
+            children = [self._nodes[i] for i in node.children]
+            node.products = frozenset().union(*(child.products for child in children))
+            node.categories = frozenset().union(*(child.categories for child in children))
+            node.whole_basket = any(child.whole_basket for child in children)
+            node.condition_products = frozenset().union(*(child.condition_products for child in children))
+            node.condition_categories = frozenset().union(*(child.condition_categories for child in children))
+            node.condition_whole_basket = any(child.condition_whole_basket for child in children)
+            for i, child in zip(node.children, children):
+                for product in child.products:
+                    node.children_by_product.setdefault(product, []).append(i)
+                for category in child.categories:
+                    node.children_by_category.setdefault(category, []).append(i)
+                if child.whole_basket:
+                    node.whole_basket_children.append(i)
+        else:
+            # the plan is shared by the sessions of the process, so it keeps its own copies of the condition and the
+            # strategy
+            dal = DAL.get_instance()
+            condition, strategy = discount.discount_condition, discount.discount_strategy
+            node = _PlanNode(condition=None if condition is None else dal.detached_copy(condition),
+                             strategy=None if strategy is None else dal.detached_copy(strategy))
+            self._nodes.append(node)
+            if type(node.strategy) != _IDiscountStrategy:
+                products, categories = node.strategy.relevant_products_and_categories()
+                node.products = frozenset(products)
+                node.categories = frozenset(categories)
+                # strategies that are not bound to products or categories (e.g. BasketDiscountStrategy)
+                node.whole_basket = len(node.products) == 0 and len(node.categories) == 0
+            if isinstance(node.condition, DiscountConditionCombo):
+                condition: DiscountConditionCombo = node.condition
+                node.condition_products = frozenset(
+                    [p.product for p in condition.over_all_price_product_cond] +
+                    [p.product for p in condition.product_list_cond])
+                node.condition_categories = frozenset(
+                    [c.category for c in condition.over_all_price_category_cond] +
+                    [c.category for c in condition.overall_category_quantity])
+                node.condition_whole_basket = condition.size_of_basket_cond is not None and \
+                                              condition.size_of_basket_cond > 0
+        return index
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def apply(self, basket: Basket) -> Basket:
+        """
+        applying all the discounts of the plan on the given basket
+        :param basket: (Basket) basket with the total prices of its products before discounts
+        :return: the same basket, after the discounts
+        """
+        if len(self._nodes) > 0:
+            snapshot = BasketSnapshot(basket)
+            self._apply(0, basket, snapshot.categories_of, snapshot)
+        return basket
+
+    def apply_on_changed_products(self, basket: Basket, changed: dict) -> list:
+        """
+        applying the discounts of the plan again after some products of the basket were added, edited or removed.
+        only the products that the discounts affected by the change can reach are priced again: starting from the
+        changed products, every discount that can change one of them or that its condition reads one of them is
+        evaluated again, and the other products it can change are priced again with it, until no more discounts are
+        affected. the prices of the rest of the products are left as they were
+        :param basket: (Basket) basket that was priced by the plan before the change
+        :param changed: (dict of str to set of str) names of the changed products to their categories. removed
+                        products are given as well
+        :return: list of the ProductInShoppingCart of the basket that were priced again
+        """
+        snapshot = BasketSnapshot(basket)
+        categories_of = snapshot.categories_of
+        lines = dict(changed)
+        affected = set()
+        grown = True
+        while grown:
+            grown = False
+            for unit in self._units:
+                node = self._nodes[unit]
+                if unit in affected or not any(self._touches(node, name, categories) or
+                                                self._reads(node, name, categories)
+                                                for name, categories in lines.items()):
+                    continue
+                affected.add(unit)
+                for name, categories in categories_of.items():
+                    if name not in lines and self._touches(node, name, categories):
+                        lines[name] = categories
+                        grown = True
+        repriced = {name: categories_of[name] for name in lines if name in categories_of}
+        for name in repriced:
+            basket.products[name].update_total_price()
+        for unit in self._units:
+            if unit in affected:
+                self._apply(unit, basket, repriced, snapshot)
+        return [basket.products[name] for name in repriced]
+
+    def _touches(self, node: _PlanNode, name: str, categories: set) -> bool:
+        return node.whole_basket or name in node.products or not node.categories.isdisjoint(categories)
+
+    def _reads(self, node: _PlanNode, name: str, categories: set) -> bool:
+        return node.condition_whole_basket or name in node.condition_products or \
+               not node.condition_categories.isdisjoint(categories)
+
+    def _affects(self, node: _PlanNode, categories_of: dict) -> bool:
+        return any(self._touches(node, name, categories) for name, categories in categories_of.items())
+
+    def _children_affecting(self, node: _PlanNode, categories_of: dict) -> list:
+        """
+        :return: the children of the given complex node that can change the basket, in their order in the tree
+        """
+        found = set(node.whole_basket_children)
+        for name, categories in categories_of.items():
+            found.update(node.children_by_product.get(name, ()))
+            for category in categories:
+                found.update(node.children_by_category.get(category, ()))
+        return sorted(found)
+
+    def _holds(self, index: int, basket: Basket, snapshot: BasketSnapshot) -> bool:
+        node = self._nodes[index]
+        if node.operator is None:
+            return node.condition.check_condition(basket, snapshot)
+        elif node.operator == ComplexDiscountTypes.AND.value:
+            return len(node.children) > 0 and all(self._holds(child, basket, snapshot) for child in node.children)
+        return any(self._holds(child, basket, snapshot) for child in node.children)
+
+    def _apply(self, index: int, basket: Basket, categories_of: dict, snapshot: BasketSnapshot):
+        node = self._nodes[index]
+        if not self._affects(node, categories_of):
+            return
+        if node.operator is None:
+            if node.condition.check_condition(basket, snapshot):
+                node.strategy.activate_discount(basket, snapshot)
+        elif node.operator == ComplexDiscountTypes.OR.value:
+            for child in self._children_affecting(node, categories_of):
+                self._apply(child, basket, categories_of, snapshot)
+        elif node.operator == ComplexDiscountTypes.AND.value:
+            if self._holds(index, basket, snapshot):
+                for child in self._children_affecting(node, categories_of):
+                    self._apply(child, basket, categories_of, snapshot)
+        elif node.operator == ComplexDiscountTypes.XOR.value:
+            # every child is tried once, and the prices it led to are kept for the best one
+            best_prices, best_saving = [], 0
+            for child in self._children_affecting(node, categories_of):
+                touched = [basket.products[name] for name, categories in categories_of.items() if
+                           self._touches(self._nodes[child], name, categories)]
+                before = [p._total_price for p in touched]
+                self._apply(child, basket, categories_of, snapshot)
+                after = [p._total_price for p in touched]
+                saving = sum(before) - sum(after)
+                for p, price in zip(touched, before):
+                    p._total_price = price
+                if saving > best_saving:
+                    best_prices, best_saving = list(zip(touched, after)), saving
+            for p, price in best_prices:
+                p._total_price = price
+
 # print()
 # REGULAR_USER_ID = 4
 # STORE_MANAGER_USER_ID = 3
@@ -0,0 +1,240 @@
+from collections.abc import Sequence
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm.session import Session, object_session
+
+from src.domain.system.DAL import DAL
+
+# key in Session.info of the lists that were changed in the transaction of the session, (id of the model, cache
+# attribute) -> model. the models are kept by their ids since some of them compare by value
+_CHANGED = 'changed_id_links'
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back(session, previous_transaction):
+    """
+    the rows of the changed lists are back as they were before the transaction, so their ids are read again
+    """
+    for (_, cache_attr), owner in session.info.pop(_CHANGED, dict()).items():
+        owner.__dict__.pop(cache_attr, None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _keep_committed(session):
+    # a committed savepoint can still be rolled back with the transaction around it
+    if not session.transaction.nested:
+        session.info.pop(_CHANGED, None)
+
+
+class IdLinks:
+    """
+    list of ids of a model that is kept one row per id in an association table (e.g the discounts of a product).
+    the ids are read as plain values, for all the models of the same class in the session together, instead of
+    hydrating a link object for every row. a change of the list inserts or deletes only the rows of the changed ids,
+    so the list is not loaded to change it. the ids are read again after the model is expired or after a rollback of
+    a change of the list, so a rolled back change is not kept in memory
+    """
+    _dal: DAL = DAL.get_instance()
+
+    def __init__(self, links_attr: str, link_model, owner_column: str, id_column: str):
+        """
+        :param links_attr: (str) name of the relationship of the model to its links, with lazy="dynamic". new links
+                           are added to it without loading it, so they are inserted with the model even before it has
+                           a key
+        :param link_model: mapped class of the links
+        :param owner_column: (str) name of the column of the link with the key of the model
+        :param id_column: (str) name of the column of the link with the id
+        """
+        self._links_attr = links_attr
+        self._link_model = link_model
+        self._owner_column = owner_column
+        self._id_column = id_column
+        self._owner_cls = None
+        self._cache_attr = None
+        self._added_attr = None
+
+    def __set_name__(self, owner_cls, name):
+        self._owner_cls = owner_cls
+        self._cache_attr = f'_ids_of{name}'
+        self._added_attr = f'_links_added_to{name}'
+        event.listen(owner_cls, 'expire', self._forget, propagate=True, raw=True)
+
+    def __get__(self, owner, owner_cls=None):
+        if owner is None:
+            return self
+        ids = owner.__dict__.get(self._cache_attr)
+        if ids is None:
+            self._load(owner)
+            ids = owner.__dict__[self._cache_attr]
+        return ids
+
+    def __set__(self, owner, ids):
+        ids = list(ids)  # may be read from the list that is cleared
+        current = self.__get__(owner)
+        current.clear()
+        current.extend(ids)
+
+    def _forget(self, state, attrs):
+        state.dict.pop(self._cache_attr, None)
+
+    @staticmethod
+    def _key(owner):
+        identity = inspect(owner).identity
+        return None if identity is None else identity[0]
+
+    def _changed(self, owner) -> None:
+        """
+        records the model as changed in the transaction of its session, so its ids are read again after a rollback
+        """
+        session = object_session(owner)
+        if session is not None:
+            session.info.setdefault(_CHANGED, dict())[(id(owner), self._cache_attr)] = owner
+
+    def _load(self, owner) -> None:
+        """
+        reads the ids of the given model, and of all the other models of its class in its session that were not read
+        yet, with a single query
+        :param owner: model with this list
+        :return: None
+        """
+        if self._key(owner) is None:
+            # was never flushed - there are no rows in the database yet
+            owner.__dict__[self._cache_attr] = LinkedIds(self, owner)
+            return
+        session = object_session(owner)
+        owners = [owner] if session is None else \
+            [o for o in session.identity_map.values() if isinstance(o, self._owner_cls) and
+             self._cache_attr not in o.__dict__]
+        if not any(o is owner for o in owners):
+            owners.append(owner)
+        by_key = {self._key(o): o for o in owners}
+        loaded = self._dal.get_linked_ids(self._link_model, self._owner_column, self._id_column, by_key.keys())
+        for key, o in by_key.items():
+            o.__dict__[self._cache_attr] = LinkedIds(self, o, loaded[key])
+
+    def add(self, owner, ids) -> None:
+        """
+        adds the given ids to the end of the list of the model, without reading the list
+        :param owner: model with this list
+        :param ids: list of ids
+        :return: None
+        """
+        cached = owner.__dict__.get(self._cache_attr)
+        if cached is not None:
+            cached.remember(ids)
+        self.insert(owner, ids)
+
+    def insert(self, owner, ids) -> None:
+        """
+        adds the rows of the given ids of the model to the session
+        :param owner: model with this list
+        :param ids: list of ids
+        :return: None
+        """
+        self._changed(owner)
+        links = getattr(owner, self._links_attr)
+        # kept with their ids until they are deleted, so they can be removed from the session without looking for them
+        # or reading them again
+        added = owner.__dict__.setdefault(self._added_attr, [])
+        for i in ids:
+            link = self._link_model(i)
+            links.append(link)
+            added.append((i, link))
+
+    def delete(self, owners, ids=None) -> None:
+        """
+        deletes the rows of the given ids of the given models, with a single statement, and removes the ids from the
+        lists of the models that were read
+        :param owners: list of models with this list
+        :param ids: iterable of ids to delete. all the ids of the models if None
+        :return: None
+        """
+        ids = None if ids is None else set(ids)
+        if ids is not None and len(ids) == 0:
+            return
+        self._dal.flush()  # so the models and the links that were added in this transaction have keys
+        keys = [key for key in (self._key(o) for o in owners) if key is not None]
+        if len(keys) > 0:
+            self._dal.delete_linked_ids(self._link_model, self._owner_column, self._id_column, keys, ids)
+        for o in owners:
+            cached = o.__dict__.get(self._cache_attr)
+            if cached is not None:
+                cached.forget(ids)
+            self._changed(o)
+            # the links that were added through the model were deleted with the rest, their keys may be given to new
+            # rows
+            added = o.__dict__.get(self._added_attr)
+            if added:
+                session = object_session(o)
+                for i, link in added:
+                    if (ids is None or i in ids) and session is not None and link in session:
+                        session.expunge(link)
+                o.__dict__[self._added_attr] = [(i, link) for i, link in added if ids is not None and i not in ids]
+
+
+class LinkedIds(Sequence):
+    """
+    the ids of a model in their association table, in the order they were added. a read only sequence, that is changed
+    only through append, extend, remove and clear - each of them writes the change to the table
+    """
+
+    def __init__(self, links: IdLinks, owner, ids=()):
+        self._ids = list(ids)
+        self._links = links
+        self._owner = owner
+
+    def __getitem__(self, index):
+        return self._ids[index]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __contains__(self, item_id) -> bool:
+        return item_id in self._ids
+
+    def __repr__(self) -> str:
+        return repr(self._ids)
+
+    def append(self, item_id) -> None:
+        self._ids.append(item_id)
+        self._links.insert(self._owner, [item_id])
+
+    def extend(self, item_ids) -> None:
+        item_ids = list(item_ids)
+        self._ids.extend(item_ids)
+        self._links.insert(self._owner, item_ids)
+
+    def remove(self, item_id) -> None:
+        """
+        removes every occurrence of the given id, as all its rows are deleted
+        :param item_id: id in the list
+        :return: None
+        """
+        if item_id not in self._ids:
+            raise ValueError(f"{item_id} is not in the list")
+        self._links.delete([self._owner], [item_id])
+        self.forget({item_id})
+
+    def clear(self) -> None:
+        if len(self._ids) > 0:
+            self._links.delete([self._owner])
+        self.forget()
+
+    def remember(self, item_ids) -> None:
+        """
+        adds the given ids to the end of the list without changing the table, after their rows were added
+        :param item_ids: list of ids
+        :return: None
+        """
+        self._ids.extend(item_ids)
+
+    def forget(self, item_ids=None) -> None:
+        """
+        removes the given ids from the list without changing the table, after their rows were deleted
+        :param item_ids: set of ids. all the ids if None
+        :return: None
+        """
+        self._ids = [] if item_ids is None else [item_id for item_id in self._ids if item_id not in item_ids]
@@ -0,0 +1,66 @@
+"""
+adds the columns that are declared on the models and are missing from the tables of an existing database (e.g
+store._version). create_all only creates new tables, so the columns that were added to existing tables are added here.
+the columns are added empty, the models treat an empty value as the value of a row that was never changed.
+the migration runs in one transaction, and running it again on a migrated database does nothing.
+works on the sqlite and postgresql databases of db_config.
+
+run from the project root, on the database of the DB_PATH/chosen_db environment variables or on the given uri:
+    python -m src.domain.system.migrations.new_columns [database uri]
+"""
+import sys
+
+from sqlalchemy import create_engine, inspect, text
+
+# the models register their tables in the metadata of db
+import src.communication.notification_handler
+import src.domain.system.cart_purchase_classes
+import src.domain.system.discounts
+import src.domain.system.permission_classes
+import src.domain.system.products_classes
+import src.domain.system.shopping_policies
+import src.domain.system.store_classes
+import src.domain.system.users_classes
+from src.domain.system.db_config import database_uri, db
+
+
+def missing_columns(connection) -> list:
+    """
+    :param connection: connection to the database to check
+    :return: (list of Column) the columns declared on the models of the existing tables, that the database does not
+             have
+    """
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    output = []
+    for table in db.metadata.sorted_tables:
+        if table.name in tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            output += [column for column in table.columns if column.name not in existing]
+    return output
+
+
+def migrate(uri: str = None) -> list:
+    """
+    adds the missing columns to the tables of the database
+    :param uri: (str) uri of the database to migrate. the database of the environment if None
+    :return: (list of str) names of the added columns, as table.column
+    """
+    engine = create_engine(uri if uri is not None else database_uri())
+    try:
+        with engine.begin() as connection:
+            added = missing_columns(connection)
+            for column in added:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE "{column.table.name}" ADD COLUMN "{column.name}" {column_type}'))
+    finally:
+        engine.dispose()
+    return sorted(f'{column.table.name}.{column.name}' for column in added)
+
+
+if __name__ == '__main__':
+    result = migrate(sys.argv[1] if len(sys.argv) > 1 else None)
+    if len(result) == 0:
+        print("nothing to migrate")
+    for name in result:
+        print(f"added column {name}")
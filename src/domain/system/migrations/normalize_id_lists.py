@@ -0,0 +1,155 @@
+"""
+moves the id lists that were kept in json columns into their association tables. the json columns are not dropped,
+they are renamed to <column>_json and kept as they were, so the migration can be undone. the migration runs in one
+transaction, and running it again on a migrated database does nothing.
+
+the downgrade writes the ids of the association tables back into the json columns, in the order of the lists, so the
+changes that were made after the migration are kept. it renames the columns back (or adds them, on a database that
+was migrated when the columns were dropped) and drops the association tables. run it after stopping the servers and
+before starting the servers of the previous version.
+
+run from the project root, on the database of the DB_PATH/chosen_db environment variables or on the given uri:
+    python -m src.domain.system.migrations.normalize_id_lists [database uri]
+    python -m src.domain.system.migrations.normalize_id_lists --downgrade [database uri]
+"""
+import json
+import sys
+
+from sqlalchemy import create_engine, inspect, select, text
+
+from src.domain.system.db_config import database_uri
+from src.domain.system.discounts import DiscountChildLink
+from src.domain.system.products_classes import ProductDiscountLink, ProductPolicyLink
+from src.domain.system.shopping_policies import PolicyChildLink
+from src.domain.system.store_classes import StorePermissionLink
+from src.domain.system.users_classes import UserPermissionLink
+
+# (owner table, key of the owner, json column, link model, link column of the owner, link column of the list items)
+ID_LISTS = [
+    ('store', '_name', '_permissions_ls', StorePermissionLink, '_store_fk', '_user_name'),
+    ('loggedInUsers', '_user_name', '_permissions_list', UserPermissionLink, '_user_fk', '_store_name'),
+    ('product_in_inventory', 'id', '_discounts', ProductDiscountLink, '_product_in_inventory_fk', '_discount_id'),
+    ('product_in_inventory', 'id', '_policies', ProductPolicyLink, '_product_in_inventory_fk', '_policy_id'),
+    ('complex_discount', 'id', '_children_discounts_ls', DiscountChildLink, '_parent_fk', '_child_id'),
+    ('i_composite_policy', 'id', '_shop_policies_ls', PolicyChildLink, '_parent_fk', '_child_id'),
+]
+# json columns that duplicated a foreign key of another table, renamed without moving anything. the previous version
+# only appended to them, so they are renamed back as they are
+UNUSED_COLUMNS = [('basket', '_products_ls'), ('store', '_purchases_ls')]
+# suffix of the name the json columns are kept in
+BACKUP_SUFFIX = '_json'
+# the previous version encoded Store._permissions_ls to a json string before saving it in the json column
+ENCODED_TWICE = {('store', '_permissions_ls')}
+
+
+def _decode(value):
+    """
+    :param value: (str) content of a json column. Store._permissions_ls was encoded twice
+    :return: (list) the ids in the column
+    """
+    while isinstance(value, str):
+        value = json.loads(value)
+    return value if value is not None else []
+
+
+def _encode(table: str, column: str, ids: list) -> str:
+    """
+    :return: (str) content of the json column of the previous version for the given ids
+    """
+    value = json.dumps(ids)
+    return json.dumps(value) if (table, column) in ENCODED_TWICE else value
+
+
+def _columns(connection) -> dict:
+    """
+    :return: dictionary of {table name -> set of column names} of the database
+    """
+    inspector = inspect(connection)
+    return {table: {c['name'] for c in inspector.get_columns(table)} for table in inspector.get_table_names()}
+
+
+def _rename(connection, table: str, column: str, new_name: str) -> None:
+    connection.execute(text(f'ALTER TABLE "{table}" RENAME COLUMN "{column}" TO "{new_name}"'))
+
+
+def migrate(uri: str = None) -> dict:
+    """
+    moves the json id lists of the database into their association tables, and keeps the json columns under the
+    name <column>_json
+    :param uri: (str) uri of the database to migrate. the database of the environment if None
+    :return: (dict) "table.column" -> number of links moved, for every column that was migrated or renamed
+    """
+    engine = create_engine(uri if uri is not None else database_uri())
+    migrated = dict()
+    try:
+        with engine.begin() as connection:
+            columns = _columns(connection)
+            for owner_table, owner_key, column, link, owner_column, item_column in ID_LISTS:
+                if column not in columns.get(owner_table, ()):
+                    continue
+                link.__table__.create(bind=connection, checkfirst=True)
+                rows = connection.execute(
+                    text(f'SELECT "{owner_key}", "{column}" FROM "{owner_table}" WHERE "{column}" IS NOT NULL'))
+                # inserted in the order of the lists, the ids of the rows keep it
+                links = [{owner_column: key, item_column: item} for key, value in rows for item in _decode(value)]
+                if len(links) > 0:
+                    connection.execute(link.__table__.insert(), links)
+                migrated[f'{owner_table}.{column}'] = len(links)
+            for table, column in UNUSED_COLUMNS + [(t, c) for t, _, c, *_ in ID_LISTS]:
+                if column in columns.get(table, ()):
+                    _rename(connection, table, column, column + BACKUP_SUFFIX)
+                    migrated.setdefault(f'{table}.{column}', 0)
+    finally:
+        engine.dispose()
+    return migrated
+
+
+def downgrade(uri: str = None) -> dict:
+    """
+    moves the ids of the association tables of the database back into their json columns, and drops the tables
+    :param uri: (str) uri of the database to downgrade. the database of the environment if None
+    :return: (dict) "table.column" -> number of links moved, for every column that was restored
+    """
+    engine = create_engine(uri if uri is not None else database_uri())
+    restored = dict()
+    try:
+        with engine.begin() as connection:
+            columns = _columns(connection)
+            for table, column in UNUSED_COLUMNS + [(t, c) for t, _, c, *_ in ID_LISTS]:
+                if table not in columns or column in columns[table]:
+                    continue
+                if column + BACKUP_SUFFIX in columns[table]:
+                    _rename(connection, table, column + BACKUP_SUFFIX, column)
+                else:
+                    connection.execute(text(f'ALTER TABLE "{table}" ADD COLUMN "{column}" JSON'))
+                restored[f'{table}.{column}'] = 0
+            for owner_table, owner_key, column, link, owner_column, item_column in ID_LISTS:
+                # a column that was never migrated keeps its ids as they are
+                if f'{owner_table}.{column}' not in restored or link.__tablename__ not in columns:
+                    continue
+                link_columns = link.__table__.c
+                ids = dict()
+                for key, item in connection.execute(
+                        select([link_columns[owner_column], link_columns[item_column]]).order_by(link_columns.id)):
+                    ids.setdefault(key, []).append(item)
+                keys = [key for key, in connection.execute(text(f'SELECT "{owner_key}" FROM "{owner_table}"'))]
+                if len(keys) > 0:
+                    connection.execute(text(f'UPDATE "{owner_table}" SET "{column}" = :v WHERE "{owner_key}" = :k'),
+                                       [{'k': key, 'v': _encode(owner_table, column, ids.get(key, []))} for key in
+                                        keys])
+                link.__table__.drop(bind=connection)
+                restored[f'{owner_table}.{column}'] = sum(len(items) for items in ids.values())
+    finally:
+        engine.dispose()
+    return restored
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    down = '--downgrade' in arguments
+    arguments = [a for a in arguments if a != '--downgrade']
+    result = (downgrade if down else migrate)(arguments[0] if len(arguments) > 0 else None)
+    if len(result) == 0:
+        print("nothing to migrate")
+    for name, moved in result.items():
+        print(f"{name}: {moved} links moved")
@@ -0,0 +1,63 @@
+"""
+creates the indexes that are declared on the models and are missing from an existing database. create_all only
+creates the indexes of new tables, so the indexes that were added to existing tables are created here.
+the migration runs in one transaction, and running it again on a migrated database does nothing.
+works on the sqlite and postgresql databases of db_config.
+
+run from the project root, on the database of the DB_PATH/chosen_db environment variables or on the given uri:
+    python -m src.domain.system.migrations.secondary_indexes [database uri]
+"""
+import sys
+
+from sqlalchemy import create_engine, inspect
+
+# the models register their tables in the metadata of db
+import src.communication.notification_handler
+import src.domain.system.cart_purchase_classes
+import src.domain.system.discounts
+import src.domain.system.permission_classes
+import src.domain.system.products_classes
+import src.domain.system.shopping_policies
+import src.domain.system.store_classes
+import src.domain.system.users_classes
+from src.domain.system.db_config import database_uri, db
+
+
+def missing_indexes(connection) -> list:
+    """
+    :param connection: connection to the database to check
+    :return: (list of Index) the indexes declared on the models of the existing tables, that the database does not have
+    """
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    output = []
+    for table in db.metadata.sorted_tables:
+        if table.name in tables:
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            output += [index for index in table.indexes if index.name not in existing]
+    return output
+
+
+def migrate(uri: str = None) -> list:
+    """
+    creates the missing indexes of the database
+    :param uri: (str) uri of the database to migrate. the database of the environment if None
+    :return: (list of str) names of the created indexes
+    """
+    engine = create_engine(uri if uri is not None else database_uri())
+    try:
+        with engine.begin() as connection:
+            created = missing_indexes(connection)
+            for index in created:
+                index.create(bind=connection)
+    finally:
+        engine.dispose()
+    return sorted(index.name for index in created)
+
+
+if __name__ == '__main__':
+    result = migrate(sys.argv[1] if len(sys.argv) > 1 else None)
+    if len(result) == 0:
+        print("nothing to migrate")
+    for name in result:
+        print(f"created index {name}")
@@ -57,6 +57,8 @@ class Permission(db.Model):
     _watch_purchase_history = db.Column(db.Boolean)
     _open_and_close_store = db.Column(db.Boolean)
     _can_manage_discount = db.Column(db.Boolean)
+    # the primary key starts with the store, the permissions of a user are found through this index
+    __table_args__ = (db.Index('ix_permissions_user', '_user_fk'),)
     _managers_appointed_ls = db.Column(MutableList.as_mutable(db.JSON))
     _owners_appointed_ls = db.Column(MutableList.as_mutable(db.JSON))
 
@@ -0,0 +1,57 @@
+import threading
+
+DISCOUNT_PLAN = 'discount_plan'
+POLICY_PLAN = 'policy_plan'
+
+
+class PlanCache:
+    """
+    process wide cache of the compiled plans of the stores, keyed by the name and the version of the store.
+    the version is saved in the row of the store, and the Store methods that change its discounts or policies give it
+    a new value in the transaction of the change (see Store._new_version), so a store that every request loads again
+    finds the plan that an earlier request compiled for the same tree. the plans hold copies of the nodes of the tree
+    that are not bound to a session, and only the plan of the last compiled version of every store is kept
+    """
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        """ Static access method. """
+        if PlanCache.__instance is None:
+            PlanCache()
+        return PlanCache.__instance
+
+    def __init__(self):
+        # (name of store, kind) -> (version, plan)
+        self._entries = dict()
+        self._lock = threading.Lock()
+        PlanCache.__instance = self
+
+    def get(self, store_name: str, version: str, kind: str):
+        """
+        :param store_name: (str) name of the store
+        :param version: (str) current version of the store
+        :param kind: (str) kind of the plan, e.g DISCOUNT_PLAN
+        :return: the plan of the given kind that was compiled for the given version of the store, None if there is none
+        """
+        with self._lock:
+            entry = self._entries.get((store_name, kind))
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def put(self, store_name: str, version: str, kind: str, plan) -> None:
+        """
+        save the plan of the given version of the store, instead of the plan of its previous version
+        :param store_name: (str) name of the store
+        :param version: (str) version of the store the plan was compiled for
+        :param kind: (str) kind of the plan, e.g DISCOUNT_PLAN
+        :param plan: the compiled plan
+        :return: None
+        """
+        with self._lock:
+            self._entries[(store_name, kind)] = (version, plan)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
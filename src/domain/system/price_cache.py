@@ -0,0 +1,80 @@
+import threading
+from datetime import datetime
+
+
+class EffectivePriceCache:
+    """
+    process wide cache of the price after discount of the products in the inventories of the stores,
+    together with the descriptions of their discounts.
+    an entry is used only in the version of the store it was computed in, that is saved in the row of the store and
+    changed in the transaction of every change of its discounts or products (see Store._new_version), so changes that
+    another process saved are never priced from an older entry. an entry is also used only while the base price and
+    the discounts of the product are the ones it was computed with, and until the first of its discounts expires.
+    the Store methods that change discounts drop the entries of the store, so they do not wait to be replaced
+    """
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        """ Static access method. """
+        if EffectivePriceCache.__instance is None:
+            EffectivePriceCache()
+        return EffectivePriceCache.__instance
+
+    def __init__(self):
+        self._entries = dict()
+        self._ids_by_store = dict()
+        self._lock = threading.Lock()
+        EffectivePriceCache.__instance = self
+
+    def get(self, product_id: int, version: str, price: float, discount_ids: tuple):
+        """
+        :param product_id: (int) id of the ProductInInventory
+        :param version: (str) current version of the store of the product, see Store.version
+        :param price: (float) current base price of the product
+        :param discount_ids: (tuple of int) ids of the current discounts of the product
+        :return: tuple of (price after discount, list of discounts descriptions) if there is a valid entry,
+                None otherwise
+        """
+        with self._lock:
+            entry = self._entries.get(product_id)
+        if entry is None:
+            return None
+        entry_version, entry_price, entry_discount_ids, after_discount, descriptions, valid_until = entry
+        if entry_version != version or entry_price != price or entry_discount_ids != discount_ids or \
+                (valid_until is not None and valid_until <= datetime.now()):
+            return None
+        return after_discount, descriptions
+
+    def put(self, store_name: str, product_id: int, version: str, price: float, discount_ids: tuple,
+            after_discount: float, descriptions: list, valid_until: datetime = None):
+        """
+        save the price after discount of a product
+        :param store_name: (str) name of the store of the product
+        :param product_id: (int) id of the ProductInInventory
+        :param version: (str) version of the store the entry was computed in
+        :param price: (float) base price the entry was computed with
+        :param discount_ids: (tuple of int) ids of the discounts the entry was computed with
+        :param after_discount: (float) price after all the active discounts
+        :param descriptions: (list of str) descriptions of the discounts
+        :param valid_until: (datetime) end time of the first active discount to expire, None if there is none
+        :return: None
+        """
+        with self._lock:
+            self._entries[product_id] = (version, price, discount_ids, after_discount, descriptions, valid_until)
+            self._ids_by_store.setdefault(store_name, set()).add(product_id)
+
+    def invalidate_store(self, store_name: str):
+        """
+        drop the entries of all the products of the given store
+        :param store_name: (str) name of the store
+        :return: None
+        """
+        with self._lock:
+            for product_id in self._ids_by_store.pop(store_name, ()):
+                self._entries.pop(product_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._ids_by_store.clear()
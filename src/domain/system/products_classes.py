@@ -4,8 +4,13 @@ from src.domain.system.discounts import _IDiscount, _IDiscountStrategy
 from src.domain.system.shopping_policies import IShoppingPolicies
 from src.protocol_classes.classes_utils import TypedList, TypedDict
 from sqlalchemy.ext.mutable import MutableDict, MutableList
+from datetime import datetime
+
 from src.domain.system.DAL import DAL
+from src.domain.system.id_links import IdLinks
 from src.domain.system.db_config import db
+from src.domain.system.description_cache import DescriptionCache, DISCOUNTS, POLICIES
+from src.domain.system.price_cache import EffectivePriceCache
 
 
 class Product(db.Model):
@@ -101,10 +106,40 @@ class Product(db.Model):
         }
 
 
+class ProductDiscountLink(db.Model):
+    """
+    association between a product in an inventory and a discount that applies on it
+    """
+    __tablename__ = 'product_in_inventory_discount'
+    id = db.Column(db.Integer, primary_key=True)
+    _product_in_inventory_fk = db.Column(db.Integer, db.ForeignKey('product_in_inventory.id', ondelete='CASCADE'),
+                                         index=True)
+    _discount_id = db.Column(db.Integer, index=True)
+
+    def __init__(self, discount_id: int):
+        self._discount_id = discount_id
+
+
+class ProductPolicyLink(db.Model):
+    """
+    association between a product in an inventory and a shopping policy that applies on it
+    """
+    __tablename__ = 'product_in_inventory_policy'
+    id = db.Column(db.Integer, primary_key=True)
+    _product_in_inventory_fk = db.Column(db.Integer, db.ForeignKey('product_in_inventory.id', ondelete='CASCADE'),
+                                         index=True)
+    _policy_id = db.Column(db.Integer, index=True)
+
+    def __init__(self, policy_id: int):
+        self._policy_id = policy_id
+
+
 class ProductInInventory(db.Model):
     __tablename__ = 'product_in_inventory'
     id = db.Column(db.Integer, primary_key=True)
     _dal = DAL.get_instance()
+    _price_cache: EffectivePriceCache = EffectivePriceCache.get_instance()
+    _descriptions: DescriptionCache = DescriptionCache.get_instance()
     _product_pk = db.Column(db.Integer, db.ForeignKey('product.id'))
     _product = db.relationship("Product", lazy="joined")
     _store_fk = db.Column(db.String(50), db.ForeignKey("store._name"))
@@ -113,8 +148,17 @@ class ProductInInventory(db.Model):
 
     _price = db.Column(db.Float)
     _quantity = db.Column(db.Integer)
-    _policies = db.Column(MutableList.as_mutable(db.JSON))
-    _discounts = db.Column(MutableList.as_mutable(db.JSON))
+    # the inventory of a store is loaded by the store name
+    __table_args__ = (db.Index('ix_product_in_inventory_store', '_store_fk'),)
+    # never read, the links that are added to them are inserted without loading them
+    _policy_links = db.relationship("ProductPolicyLink", lazy="dynamic", cascade="all, delete-orphan",
+                                    passive_deletes=True)
+    _discount_links = db.relationship("ProductDiscountLink", lazy="dynamic", cascade="all, delete-orphan",
+                                      passive_deletes=True)
+    # lists of ids, kept one row per id in the association tables above. rows are only appended and removed,
+    # so ordering by their ids keeps the order of the list
+    _policies = IdLinks('_policy_links', ProductPolicyLink, '_product_in_inventory_fk', '_policy_id')
+    _discounts = IdLinks('_discount_links', ProductDiscountLink, '_product_in_inventory_fk', '_discount_id')
 
     def __hash__(self):
         return hash(f"{self._store_fk}-{self._product_pk}")
@@ -235,26 +279,91 @@ class ProductInInventory(db.Model):
         """
         return ProductInInventory(self.product.copy(), self.price, self.quantity, self.store_name)
 
-    def to_dictionary(self):
+    def _calc_price_after_discount(self):
         """
-        :return: dictionary representation of the Product
+        apply the strategies of all the discounts of the product that did not expire on its base price
+        :return: tuple of (price after discount, list of discounts descriptions,
+                end time of the first active discount to expire or None if there are no active discounts)
         """
+        now = datetime.now()
         price_after_discount: float = self.price
+        descriptions = []
+        valid_until = None
+        store_descriptions = self._store_descriptions(DISCOUNTS)
         for k, discount in self.discounts.items():
             discount: _IDiscount = discount
+            descriptions.append(discount.get_description(store_descriptions))
+            end_time = discount.discount_condition.end_time
+            if end_time is not None and end_time <= now:
+                continue
             strategy: _IDiscountStrategy = discount.discount_strategy
             price_after_discount = strategy.activate_discount_on_single_product(self, price_after_discount)
+            if end_time is not None and (valid_until is None or end_time < valid_until):
+                valid_until = end_time
+        return price_after_discount, descriptions, valid_until
+
+    def _price_after_discount_and_descriptions(self):
+        """
+        :return: tuple of (price after discount, list of discounts descriptions), from the cache when possible
+        """
+        if self.id is None or self._store is None:
+            # not saved yet or not in a store, there is no key to cache by
+            after_discount, descriptions, _ = self._calc_price_after_discount()
+            return after_discount, descriptions
+        version = self._store.version
+        discount_ids = tuple(self._discounts)
+        cached = self._price_cache.get(self.id, version, self.price, discount_ids)
+        if cached is not None:
+            return cached
+        after_discount, descriptions, valid_until = self._calc_price_after_discount()
+        self._price_cache.put(self.store_name, self.id, version, self.price, discount_ids, after_discount,
+                              descriptions, valid_until)
+        return after_discount, descriptions
+
+    def price_after_discount(self):
+        """
+        :return: (float) price of a single item after all the active discounts of the product, rounded to 2 digits
+        """
+        return round(self._price_after_discount_and_descriptions()[0], 2)
+
+    def to_dictionary(self):
+        """
+        :return: dictionary representation of the Product
+        """
+        price_after_discount, descriptions = self._price_after_discount_and_descriptions()
 
         return {
             "product": self.product.to_dictionary(),
             "price": round(self.price, 2),
             "quantity": self.quantity,
             "store_name": self.store_name,
-            "discounts": [d.get_description() for k, d in self.discounts.items()],
+            "discounts": list(descriptions),
             "after_discount": round(price_after_discount, 2),
-            "policies": [p.description() for k, p in self.policies.items()]
+            "policies": self._policies_descriptions()
         }
 
+    def _store_descriptions(self, kind: str) -> dict:
+        """
+        :param kind: (str) DISCOUNTS or POLICIES
+        :return: dict of id -> description of the nodes of the given kind that were described in the current version
+                 of the store of the product (see DescriptionCache), a new dict if the product is not in a store
+        """
+        if self._store is None:
+            return dict()
+        return self._descriptions.descriptions_of(self.store_name, self._store.version, kind)
+
+    def _policies_descriptions(self):
+        """
+        :return: list of the descriptions of the policies of the product, without loading the policies when all of
+                 them were described in the current version of the store
+        """
+        descriptions = self._store_descriptions(POLICIES)
+        if any(policy_id not in descriptions for policy_id in self._policies):
+            policies = self.policies
+            return [policies[policy_id].description(descriptions) for policy_id in self._policies if
+                    policy_id in policies]
+        return [descriptions[policy_id] for policy_id in self._policies]
+
     def check_quantity_of_category(self, category: str):
         """
 
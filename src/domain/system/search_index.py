@@ -0,0 +1,215 @@
+import threading
+from bisect import bisect_left, insort
+
+GRAM_SIZE = 3
+
+
+def _name_grams(name: str):
+    """
+    :param name: (str) product name
+    :return: set of all the substrings of length GRAM_SIZE of the name
+    """
+    return {name[i:i + GRAM_SIZE] for i in range(len(name) - GRAM_SIZE + 1)}
+
+
+class _StoreProductIndex:
+    """
+    search structures over the products of a single store:
+        1. name grams - every substring of length GRAM_SIZE of a product name -> names of the products that contain it
+        2. categories -> names of the products in the category
+        3. brands -> names of the products of the brand
+        4. list of (base price, product name) sorted by price
+    """
+
+    def __init__(self):
+        self._products = dict()
+        self._by_gram = dict()
+        self._by_category = dict()
+        self._by_brand = dict()
+        self._prices = []
+
+    def put(self, name: str, brand: str, categories: list, price: float):
+        """
+        add the given product to the index, replacing the former details of the product if it was already indexed
+        :param name: (str) name of the product
+        :param brand: (str) brand of the product
+        :param categories: (list of str) categories of the product
+        :param price: (float) base price of the product
+        :return: None
+        """
+        self.remove(name)
+        categories = frozenset(categories)
+        self._products[name] = (brand, categories, price)
+        for gram in _name_grams(name):
+            self._by_gram.setdefault(gram, set()).add(name)
+        for category in categories:
+            self._by_category.setdefault(category, set()).add(name)
+        self._by_brand.setdefault(brand, set()).add(name)
+        insort(self._prices, (price, name))
+
+    def remove(self, name: str):
+        """
+        remove the given product from the index, if it is indexed
+        :param name: (str) name of the product
+        :return: None
+        """
+        if name not in self._products:
+            return
+        brand, categories, price = self._products.pop(name)
+        for gram in _name_grams(name):
+            self._discard(self._by_gram, gram, name)
+        for category in categories:
+            self._discard(self._by_category, category, name)
+        self._discard(self._by_brand, brand, name)
+        del self._prices[bisect_left(self._prices, (price, name))]
+
+    @staticmethod
+    def _discard(postings: dict, key, name: str):
+        names = postings.get(key)
+        if names is not None:
+            names.discard(name)
+            if len(names) == 0:
+                del postings[key]
+
+    def find(self, product_name: str = None, categories: list = None, brands: list = None, min_price: float = None):
+        """
+        find the products that can answer the given search conditions. same conditions as Store._search_products
+        :param product_name: (str) part of the name of the products
+        :param categories: (list of str) names of categories the products need to belong to (at least on of them)
+        :param brands: (list of str) names of brands the product need to have (at least one)
+        :param min_price: (float) minimum price for the product. base prices are indexed, so every product with a
+                            base price that can be discounted to min_price is returned
+        :return: set of names of the matching products
+        """
+        candidates = []
+        if categories:
+            candidates.append(set().union(*(self._by_category.get(c, ()) for c in categories)))
+        if brands:
+            candidates.append(set().union(*(self._by_brand.get(b, ()) for b in brands)))
+        if min_price is not None and min_price >= 0:
+            # after_discount is rounded to 2 digits, so it can be slightly above the base price
+            start = bisect_left(self._prices, (min_price - 0.005,))
+            candidates.append({name for _, name in self._prices[start:]})
+        if product_name and len(product_name) >= GRAM_SIZE:
+            candidates += [self._by_gram.get(gram, set()) for gram in _name_grams(product_name)]
+        if len(candidates) == 0:
+            matched = set(self._products)
+        else:
+            candidates.sort(key=len)
+            matched = set(candidates[0]).intersection(*candidates[1:])
+        if product_name:
+            # grams only narrow the candidates, the name must still contain the whole searched text
+            matched = {name for name in matched if product_name in name}
+        return matched
+
+
+class ProductSearchIndex:
+    """
+    in memory index over the inventories of the stores, used to search products without serializing
+    every product in the inventory. the index of a store is kept by the version of the store it was built for, that is
+    saved in the row of the store and changed in the transaction of every change of its inventory (see
+    Store._new_version). a search in a version that the index was not built for, e.g after another process changed the
+    inventory, builds the index of the store again from its inventory. the Store methods that change the inventory
+    update the index in place, and move it to the new version
+    """
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        """ Static access method. """
+        if ProductSearchIndex.__instance is None:
+            ProductSearchIndex()
+        return ProductSearchIndex.__instance
+
+    def __init__(self):
+        # name of store -> (version, _StoreProductIndex)
+        self._stores = dict()
+        self._lock = threading.RLock()
+        ProductSearchIndex.__instance = self
+
+    def find_products(self, store, product_name: str = None, categories: list = None, brands: list = None,
+                      min_price: float = None):
+        """
+        find the products of the store that can answer the given search conditions
+        :param store: (Store) store to search in
+        :param product_name: (str) part of the name of the products
+        :param categories: (list of str) names of categories the products need to belong to (at least on of them)
+        :param brands: (list of str) names of brands the product need to have (at least one)
+        :param min_price: (float) minimum price for the product
+        :return: set of names of the matching products
+        """
+        with self._lock:
+            entry = self._stores.get(store.name)
+            if entry is None or entry[0] != store.version:
+                store_index = _StoreProductIndex()
+                for product in store.inventory.values():
+                    self._put(store_index, product)
+                entry = (store.version, store_index)
+                self._stores[store.name] = entry
+            return entry[1].find(product_name, categories, brands, min_price)
+
+    def put_product(self, store_name: str, previous_version: str, version: str, product):
+        """
+        add or update a product of the given store. does nothing if the store was not indexed in the version before
+        the change
+        :param store_name: (str) name of the store
+        :param previous_version: (str) version of the store before the change
+        :param version: (str) version of the store after the change
+        :param product: (ProductInInventory) the added or edited product
+        :return: None
+        """
+        with self._lock:
+            store_index = self._move(store_name, previous_version, version)
+            if store_index is not None:
+                self._put(store_index, product)
+
+    def remove_products(self, store_name: str, previous_version: str, version: str, product_names: list):
+        """
+        remove products of the given store from the index. does nothing if the store was not indexed in the version
+        before the change
+        :param store_name: (str) name of the store
+        :param previous_version: (str) version of the store before the change
+        :param version: (str) version of the store after the change
+        :param product_names: (list of str) names of the removed products
+        :return: None
+        """
+        with self._lock:
+            store_index = self._move(store_name, previous_version, version)
+            if store_index is not None:
+                for name in product_names:
+                    store_index.remove(name)
+
+    def drop_store(self, store_name: str):
+        """
+        forget the index of the given store. it will be built again on the next search in the store
+        :param store_name: (str) name of the store
+        :return: None
+        """
+        with self._lock:
+            self._stores.pop(store_name, None)
+
+    def clear(self):
+        with self._lock:
+            self._stores.clear()
+
+    def _move(self, store_name: str, previous_version: str, version: str):
+        """
+        move the index of the store to the version of a change of its inventory. an index that was built for another
+        version than the one before the change missed changes of the inventory, and is dropped
+        :param store_name: (str) name of the store
+        :param previous_version: (str) version of the store before the change
+        :param version: (str) version of the store after the change
+        :return: the index of the store to apply the change on, None if there is none
+        """
+        entry = self._stores.get(store_name)
+        if entry is None:
+            return None
+        if entry[0] != previous_version:
+            del self._stores[store_name]
+            return None
+        self._stores[store_name] = (version, entry[1])
+        return entry[1]
+
+    @staticmethod
+    def _put(store_index: _StoreProductIndex, product):
+        store_index.put(product.product_name, product.product.brand, product.product.categories, product.price)
@@ -15,9 +15,9 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import event, orm
 from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.ext.mutable import MutableDict, MutableList
 
 from src.domain.system.DAL import DAL
+from src.domain.system.id_links import IdLinks
 from src.protocol_classes.classes_utils import TypeChecker, TypedDict
 
 if TYPE_CHECKING:
@@ -88,7 +88,22 @@ class IShoppingPolicies(db.Model):
         #     pass
         pass
 
-    def description(self):
+    def description(self, descriptions: dict = None):
+        """
+        :param descriptions: (dict) id -> description of policies that were already described (see DescriptionCache).
+                             the descriptions of this policy and of the policies under it are taken from it, or added
+                             to it. None to describe them all again
+        :return: (str) description of the policy
+        """
+        if descriptions is None or self.id is None:
+            return self._describe(descriptions)
+        description = descriptions.get(self.id)
+        if description is None:
+            description = self._describe(descriptions)
+            descriptions[self.id] = description
+        return description
+
+    def _describe(self, descriptions: dict = None):
         pass
 
     def is_product_has_shopping_policies(self, product_name, categories):
@@ -172,7 +187,7 @@ class LeafBasketQuantity(LeafProductPolicy):
             max_answer = False
         return min_answer and max_answer
 
-    def description(self):
+    def _describe(self, descriptions: dict = None):
         self.refresh_self()
         if self.min_basket_quantity is not None and self.max_basket_quantity is not None:
             desc = "basket quantity is at least " + str(self.min_basket_quantity) + " and at most " + \
@@ -218,7 +233,7 @@ class LeafSpecificProductQuantity(LeafProductPolicy):
         else:
             return True
 
-    def description(self):
+    def _describe(self, descriptions: dict = None):
         self.refresh_self()
         if self.min_product_quantity is not None and self.max_product_quantity is not None:
             desc = "The product " + self.product_name + " quantity is at least " + str(self.min_product_quantity) \
@@ -266,7 +281,7 @@ class LeafSpecificCategoryQuantity(LeafProductPolicy):
         else:
             return True
 
-    def description(self):
+    def _describe(self, descriptions: dict = None):
         self.refresh_self()
         if self.min_category_quantity is not None and self.max_category_quantity is not None:
             desc = "The Category " + self.category + " quantity is at least " + str(self.min_category_quantity) \
@@ -305,7 +320,7 @@ class LeafShoppingDateTime(LeafProductPolicy):
         temp = calendar.day_name[date.today().weekday()]
         return temp != self.day
 
-    def description(self):
+    def _describe(self, descriptions: dict = None):
         self.refresh_self()
         return "Shopping is not allowed at " + self.day
 
@@ -344,11 +359,29 @@ class ComplexPolicyTypes(enum.Enum):
             return None
 
 
+class PolicyChildLink(db.Model):
+    """
+    association between a composite policy and one of its children
+    """
+    __tablename__ = 'composite_policy_child'
+    id = db.Column(db.Integer, primary_key=True)
+    _parent_fk = db.Column(db.Integer, db.ForeignKey('i_composite_policy.id', ondelete='CASCADE'), index=True)
+    _child_id = db.Column(db.Integer, index=True)
+
+    def __init__(self, child_id: int):
+        self._child_id = child_id
+
+
 class ICompositePolicy(IShoppingPolicies):
     __tablename__ = 'i_composite_policy'
     id = db.Column(db.Integer, db.ForeignKey('shopping_policy.id'), primary_key=True)
     # composite_type = db.Column(db.VARCHAR(length=40))
-    _shop_policies_ls = db.Column(MutableList.as_mutable(db.JSON))
+    # never read, the links that are added to it are inserted without loading it. the tree is loaded by
+    # _load_deferred_children
+    _children_links = db.relationship("PolicyChildLink", lazy="dynamic", cascade="all, delete-orphan",
+                                      passive_deletes=True)
+    # ids of the children, kept one row per id in composite_policy_child
+    _shop_policies_ls = IdLinks('_children_links', PolicyChildLink, '_parent_fk', '_child_id')
     _operator = db.Column(db.Integer)
     __mapper_args__ = {
         # 'polymorphic_on': composite_type,
@@ -362,21 +395,21 @@ class ICompositePolicy(IShoppingPolicies):
 
     def edit_policy(self, to_edit: int, edited_policy: IShoppingPolicies):
 
-        for k, policy in self.shop_policies_dict.items():
-            policy: IShoppingPolicies = policy
-            if policy.id == to_edit:
-                if to_edit in self._shop_policies_ls:
-                    self._shop_policies_ls.remove(to_edit)
-                self._shop_policies_ls.append(edited_policy.id)
-                del self.shop_policies_dict[to_edit]
-                self.shop_policies_dict[edited_policy.id] = edited_policy
-                self._dal.add(self, add_only=True)
-                self._dal.flush()  # So we ill able to call .id
-                return edited_policy, policy
-            else:
-                is_edited = policy.edit_policy(to_edit, edited_policy)
-                if is_edited is not None:
-                    return is_edited
+        shop_policies = self.shop_policies_dict
+        if to_edit in shop_policies:
+            policy: IShoppingPolicies = shop_policies[to_edit]
+            if to_edit in self._shop_policies_ls:
+                self._shop_policies_ls.remove(to_edit)
+            self._shop_policies_ls.append(edited_policy.id)
+            del shop_policies[to_edit]
+            shop_policies[edited_policy.id] = edited_policy
+            self._dal.add(self, add_only=True)
+            self._dal.flush()  # So we ill able to call .id
+            return edited_policy, policy
+        for k, policy in shop_policies.items():
+            is_edited = policy.edit_policy(to_edit, edited_policy)
+            if is_edited is not None:
+                return is_edited
         return None
 
     def give_stuff_to_delete(self):
@@ -389,7 +422,8 @@ class ICompositePolicy(IShoppingPolicies):
         return to_delete
 
     def delete_yourself(self):
-        self._dal.delete_all(self.give_stuff_to_delete(), del_only=True)
+        # the whole tree is deleted with a statement for each table, instead of a statement for each policy in it
+        self._dal.delete_all_as_query(self.give_stuff_to_delete())
 
     @property
     def shop_policies_ls(self):
@@ -407,6 +441,8 @@ class ICompositePolicy(IShoppingPolicies):
 
     @property
     def shop_policies_dict(self):
+        if self._shop_policies_dict is None:
+            self._load_deferred_children()
         return self._shop_policies_dict
 
     @shop_policies_dict.setter
@@ -421,7 +457,23 @@ class ICompositePolicy(IShoppingPolicies):
 
     @orm.reconstructor
     def _init_on_load(self):
-        self._shop_policies_dict = self._dal.get_policy_map_with_id_keys(self._shop_policies_ls)
+        # children are loaded on first use, together with all the composite policies loaded in the same session,
+        # so a whole tree level is loaded with a single query
+        self._shop_policies_dict = None
+        self._dal.defer_load('children_policies', self)
+
+    def _load_deferred_children(self):
+        """
+        load the children of this policy, and of all the other composite policies that were loaded in the same
+        session and did not load their children yet, with a single query
+        :return: None
+        """
+        policies = [p for p in self._dal.take_deferred('children_policies', self) if p._shop_policies_dict is None]
+        for p in policies:
+            p._shop_policies_dict = TypedDict(int, IShoppingPolicies)
+        by_id = {p.id: p for p in policies}
+        for parent_id, child in self._dal.get_children_of_policies(list(by_id.keys())):
+            by_id[parent_id]._shop_policies_dict[child.id] = child
 
     def apply(self, basket: Basket) -> bool:
         pass
@@ -533,15 +585,11 @@ class CompositeAndShoppingPolicy(ICompositePolicy):
         return valid
         # return reduce(lambda a, b: a and b.apply(basket), self.shop_policies_dict.values(), True)
 
-    def description(self):
+    def _describe(self, descriptions: dict = None):
         self.refresh_self()
-
-        ids = ""
-        desc = ""
-        for p_id, policy in self.shop_policies_dict.items():
-            policy: IShoppingPolicies = policy
-            ids += f'{policy.id},'
-            desc += f'{policy.description()},\n '
+        children = self.shop_policies_dict.values()
+        ids = ''.join(f'{policy.id},' for policy in children)
+        desc = ''.join(f'{policy.description(descriptions)},\n ' for policy in children)
         return f'ALL of the following policies must be answered:{ids}\n{desc}\n'
 
 
@@ -566,15 +614,11 @@ class CompositeOrShoppingPolicy(ICompositePolicy):
         return valid
         # return reduce(lambda a, b: a or b.apply(basket), self.shop_policies_dict.values(), False)
 
-    def description(self):
+    def _describe(self, descriptions: dict = None):
         self.refresh_self()
-
-        ids = ""
-        desc = ""
-        for p_id, policy in self.shop_policies_dict.items():
-            policy: IShoppingPolicies = policy
-            ids += f'{policy.id},'
-            desc += f'{policy.description()},\n '
+        children = self.shop_policies_dict.values()
+        ids = ''.join(f'{policy.id},' for policy in children)
+        desc = ''.join(f'{policy.description(descriptions)},\n ' for policy in children)
         return f'At least one of the following policies must be answered:{ids}\n{desc}\n'
 
 
@@ -598,13 +642,167 @@ class CompositeXORShoppingPolicy(ICompositePolicy):
                 temp = res or temp
         return temp
 
-    def description(self):
+    def _describe(self, descriptions: dict = None):
         self.refresh_self()
-
-        ids = ""
-        desc = ""
-        for p_id, policy in self.shop_policies_dict.items():
-            policy: IShoppingPolicies = policy
-            ids += f'{policy.id},'
-            desc += f'{policy.description()},\n '
+        children = self.shop_policies_dict.values()
+        ids = ''.join(f'{policy.id},' for policy in children)
+        desc = ''.join(f'{policy.description(descriptions)},\n ' for policy in children)
         return f'Only one of the following policies must be answered:{ids}\n{desc}\n '
+
+
+class BasketAggregate:
+    """
+    the quantities of a basket that the shopping policies read, summed once for a check of all the policies of a store
+    instead of by every leaf policy
+    """
+    __slots__ = ['product_quantities', 'category_quantities', 'total_quantity']
+
+    def __init__(self, basket: Basket):
+        self.product_quantities = dict()
+        self.category_quantities = dict()
+        self.total_quantity = 0
+        for name, product in basket.products.items():
+            quantity = product._product_quantity
+            self.product_quantities[name] = quantity
+            self.total_quantity += quantity
+            # a product is counted once for every category it is in
+            for category in set(product._product_data.get('categories', [])):
+                self.category_quantities[category] = self.category_quantities.get(category, 0) + quantity
+
+
+def _in_range(value: int, min_value: int, max_value: int) -> bool:
+    return (min_value is None or value >= min_value) and (max_value is None or value <= max_value)
+
+
+def _merge_ranges(ranges: list) -> tuple:
+    """
+    :param ranges: list of tuples of (min, max), None for no bound
+    :return: tuple of (min, max) of the values that are in all the given ranges
+    """
+    mins = [r[0] for r in ranges if r[0] is not None]
+    maxes = [r[1] for r in ranges if r[1] is not None]
+    return max(mins) if len(mins) > 0 else None, min(maxes) if len(maxes) > 0 else None
+
+
+class PolicyPlan:
+    """
+    evaluation program of the policy tree of a store, compiled once per version of the tree and used for every check
+    of a basket (see PlanCache). every policy is compiled into a function of a BasketAggregate (and of the basket, for policies of
+    unknown types), so the quantities of the basket are summed once for the whole tree:
+        1. AND, OR and XOR policies stop evaluating their children as soon as their result is decided
+        2. quantity leaves under the same AND policy that bound the same product, the same category or the whole
+           basket are merged into a single range check, and its day leaves into a single check of the day
+    """
+
+    def __init__(self, check):
+        self._check = check
+
+    @staticmethod
+    def compile(root: IShoppingPolicies):
+        """
+        :param root: (IShoppingPolicies) root of the policy tree of a store
+        :return: PolicyPlan of the given tree
+        """
+        return PolicyPlan(PolicyPlan._compile(root))
+
+    def apply(self, basket: Basket) -> bool:
+        """
+        :param basket: (Basket) basket to check
+        :return: True if the basket answers the policies of the tree, False otherwise
+        """
+        return self._check(BasketAggregate(basket), basket)
+
+    @staticmethod
+    def _compile(policy: IShoppingPolicies):
+        if isinstance(policy, CompositeAndShoppingPolicy):
+            checks = PolicyPlan._compile_and_children(list(policy.shop_policies_dict.values()))
+            return lambda aggregate, basket: all(check(aggregate, basket) for check in checks)
+        if isinstance(policy, CompositeOrShoppingPolicy):
+            checks = [PolicyPlan._compile(child) for child in policy.shop_policies_dict.values()]
+            return lambda aggregate, basket: any(check(aggregate, basket) for check in checks)
+        if isinstance(policy, CompositeXORShoppingPolicy):
+            checks = [PolicyPlan._compile(child) for child in policy.shop_policies_dict.values()]
+
+            def exactly_one(aggregate, basket):
+                found = False
+                for check in checks:
+                    if check(aggregate, basket):
+                        if found:
+                            return False
+                        found = True
+                return found
+
+            return exactly_one
+        leaf = PolicyPlan._compile_leaf_group([policy])
+        if leaf is not None:
+            return leaf
+        # the plan is shared by the sessions of the process, so it keeps its own copy of the policy
+        copy = DAL.get_instance().detached_copy(policy)
+        return lambda aggregate, basket: copy.apply(basket)
+
+    @staticmethod
+    def _compile_and_children(children: list) -> list:
+        """
+        :param children: list of the children of an AND policy
+        :return: list of checks that all of them hold exactly when all the children hold
+        """
+        groups = dict()
+        checks = []
+        for child in children:
+            key = PolicyPlan._leaf_key(child)
+            if key is None:
+                checks.append(PolicyPlan._compile(child))
+            else:
+                groups.setdefault(key, []).append(child)
+        # the merged leaves are cheap, they are checked before the composite children
+        return [PolicyPlan._compile_leaf_group(group) for group in groups.values()] + checks
+
+    @staticmethod
+    def _leaf_key(policy: IShoppingPolicies):
+        """
+        :return: key of the leaves that can be merged with the given policy under an AND policy, None if it is not
+                 such a leaf
+        """
+        if isinstance(policy, LeafBasketQuantity):
+            return LeafBasketQuantity, None
+        if isinstance(policy, LeafSpecificProductQuantity):
+            return LeafSpecificProductQuantity, policy.product_name
+        if isinstance(policy, LeafSpecificCategoryQuantity):
+            return LeafSpecificCategoryQuantity, policy.category
+        if isinstance(policy, LeafShoppingDateTime):
+            return LeafShoppingDateTime, None
+        return None
+
+    @staticmethod
+    def _compile_leaf_group(leaves: list):
+        """
+        :param leaves: list of leaves with the same _leaf_key
+        :return: check that holds exactly when all the given leaves hold, None if they are not known leaves
+        """
+        key = PolicyPlan._leaf_key(leaves[0])
+        if key is None:
+            return None
+        leaf_type, name = key
+        if leaf_type is LeafBasketQuantity:
+            min_value, max_value = _merge_ranges([(p.min_basket_quantity, p.max_basket_quantity) for p in leaves])
+            return lambda aggregate, basket: _in_range(aggregate.total_quantity, min_value, max_value)
+        if leaf_type is LeafSpecificProductQuantity:
+            min_value, max_value = _merge_ranges([(p.min_product_quantity, p.max_product_quantity) for p in leaves])
+
+            def product_in_range(aggregate, basket):
+                quantity = aggregate.product_quantities.get(name)
+                # a product that is not in the basket answers the policy
+                return quantity is None or _in_range(quantity, min_value, max_value)
+
+            return product_in_range
+        if leaf_type is LeafSpecificCategoryQuantity:
+            min_value, max_value = _merge_ranges([(p.min_category_quantity, p.max_category_quantity) for p in leaves])
+
+            def category_in_range(aggregate, basket):
+                quantity = aggregate.category_quantities.get(name, 0)
+                return quantity <= 0 or _in_range(quantity, min_value, max_value)
+
+            return category_in_range
+        forbidden_days = frozenset(p.day for p in leaves)
+        # the day is read on every check, a plan is used for longer than a day
+        return lambda aggregate, basket: calendar.day_name[date.today().weekday()] not in forbidden_days
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+from src.domain.system.DAL import DAL
+from src.domain.system.db_config import db
+
+
+class StockReservation(db.Model):
+    """
+    products that were taken out of the inventories of the stores for a purchase that is waiting for the payment and
+    shipping systems. saved in the same transaction as the products were taken, so a server that stops in the middle
+    of a purchase does not lose them
+    """
+    __tablename__ = 'stock_reservation'
+    id = db.Column(db.Integer, primary_key=True)
+    # the expired reservations are found through its index
+    _expires_at = db.Column(db.DateTime, index=True)
+
+    def __init__(self, expires_at: datetime):
+        self._expires_at = expires_at
+
+
+class StockReservationLine(db.Model):
+    __tablename__ = 'stock_reservation_line'
+    _reservation_fk = db.Column(db.Integer, db.ForeignKey('stock_reservation.id', ondelete='CASCADE'),
+                                primary_key=True)
+    _store_name = db.Column(db.String(50), primary_key=True)
+    _product_name = db.Column(db.String(50), primary_key=True)
+    _quantity = db.Column(db.Integer)
+    # the reserved products of a store are found through its index, see DAL.get_reserved_product_names
+    __table_args__ = (db.Index('ix_stock_reservation_line_product', '_store_name', '_product_name'),)
+
+    def __init__(self, reservation_id: int, store_name: str, product_name: str, quantity: int):
+        self._reservation_fk = reservation_id
+        self._store_name = store_name
+        self._product_name = product_name
+        self._quantity = quantity
+
+
+class StockReservations:
+    """
+    registry of the products that were taken out of the inventories of the stores for purchases that are still
+    waiting for the payment and shipping systems. the reservations are kept in the database, in the transaction of the
+    caller, so they are shared by all the processes of the server and survive a restart.
+    every reservation is kept until it is confirmed or released, or until its time to live passes. the stock of an
+    expired reservation is given back to the stores by whoever releases it first (see expired), so a purchase that
+    never came back from the external systems does not hold the products forever
+    """
+    __instance = None
+    _dal: DAL = DAL.get_instance()
+
+    @staticmethod
+    def get_instance():
+        """ Static access method. """
+        if StockReservations.__instance is None:
+            StockReservations()
+        return StockReservations.__instance
+
+    def __init__(self):
+        StockReservations.__instance = self
+
+    def reserve(self, quantities: dict, ttl: timedelta) -> int:
+        """
+        save a reservation of products that were already taken out of the inventories of the stores, in the current
+        transaction
+        :param quantities: (dict) name of store -> (dict) name of product -> reserved quantity
+        :param ttl: (timedelta) how long the reservation is kept before its products are given back
+        :return: (int) id of the reservation
+        """
+        return self._dal.add_stock_reservation(quantities, datetime.now() + ttl)
+
+    def confirm(self, reservation_id: int) -> bool:
+        """
+        turn the reservation into a purchase, in the current transaction. the reservation is removed only if it did
+        not expire
+        :param reservation_id: (int) id of the reservation
+        :return: True if the reservation was confirmed, False if it expired or was already released
+        """
+        return self._dal.delete_stock_reservation(reservation_id, datetime.now())
+
+    def quantities_of(self, reservation_id: int):
+        """
+        :param reservation_id: (int) id of the reservation
+        :return: (dict) name of store -> (dict) name of product -> reserved quantity, None if there is no such
+                 reservation
+        """
+        return self._dal.get_stock_reservation_quantities(reservation_id)
+
+    def release(self, reservation_id: int) -> bool:
+        """
+        remove the reservation without a purchase, in the current transaction
+        :param reservation_id: (int) id of the reservation
+        :return: True if the reservation was removed, False if it was already released (e.g by another process)
+        """
+        return self._dal.delete_stock_reservation(reservation_id)
+
+    def expired(self) -> list:
+        """
+        :return: list of the ids of the reservations that their time to live passed
+        """
+        return self._dal.get_expired_stock_reservation_ids(datetime.now())
+
+    def __len__(self):
+        return self._dal.count_stock_reservations()
@@ -1,15 +1,18 @@
 from __future__ import annotations
 
 import threading
+import uuid
 from typing import TYPE_CHECKING
 
 from sqlalchemy import orm
 
 from src.communication.notification_handler import StatManager, Category
 from src.domain.system.discounts import CompositeOrDiscount, _IDiscount, _IDiscountCondition, _IDiscountStrategy, \
-    ComplexDiscount, DiscountConditionCombo, ProductDiscountStrategy, CategoryDiscountStrategy, \
-    FreePerXProductDiscountStrategy, FreePerXCategoryDiscountStrategy, BasketDiscountStrategy
-from src.domain.system.shopping_policies import CompositeAndShoppingPolicy, IShoppingPolicies, ICompositePolicy
+    ComplexDiscount, ComplexDiscountTypes, DiscountChildLink, DiscountConditionCombo, DiscountPlan, \
+    ProductDiscountStrategy, CategoryDiscountStrategy, FreePerXProductDiscountStrategy, \
+    FreePerXCategoryDiscountStrategy, BasketDiscountStrategy
+from src.domain.system.shopping_policies import CompositeAndShoppingPolicy, IShoppingPolicies, ICompositePolicy, \
+    PolicyChildLink, PolicyPlan
 from src.domain.system.shopping_policies import LeafProductPolicy, LeafBasketQuantity
 from src.domain.system.store_managers_classes import AppointmentAgreement
 from src.external.publisher import Publisher
@@ -29,25 +32,83 @@ import src.domain.system.products_classes as pc
 from datetime import datetime
 
 from src.domain.system.DAL import DAL
+from src.domain.system.description_cache import DescriptionCache, DISCOUNTS, POLICIES
+from src.domain.system.discount_expiry import DiscountExpiry
+from src.domain.system.id_links import IdLinks
+from src.domain.system.plan_cache import PlanCache, DISCOUNT_PLAN, POLICY_PLAN
+from src.domain.system.price_cache import EffectivePriceCache
+from src.domain.system.search_index import ProductSearchIndex
+from src.domain.system.tree_index import TreeIndex
 from src.protocol_classes.classes_utils import TypeChecker, TypedDict
 
 from src.domain.system.db_config import db
-import json
+import base64
+
+PURCHASE_HISTORY_PAGE_SIZE = 50
+
+
+def _encode_purchases_cursor(purchase: Purchase) -> str:
+    """
+    build the cursor that points right after the given purchase in the purchase history of its store
+    :param purchase: (Purchase) last purchase of the current page
+    :return: (str) url safe cursor
+    """
+    raw = f"{purchase.at_date_time.isoformat()}|{purchase.purchase_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_purchases_cursor(cursor: str):
+    """
+    reverse of _encode_purchases_cursor
+    :param cursor: (str) cursor that was returned with a previous page
+    :return: tuple of (datetime, str) with the date and id of the last purchase of the previous page,
+            None if the cursor is not valid
+    """
+    try:
+        raw_date, purchase_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(raw_date), purchase_id
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+class StorePermissionLink(db.Model):
+    """
+    association between a store and a user that has a permission in it
+    """
+    __tablename__ = 'store_permission_user'
+    id = db.Column(db.Integer, primary_key=True)
+    _store_fk = db.Column(db.String(50), db.ForeignKey('store._name', ondelete='CASCADE'), index=True)
+    _user_name = db.Column(db.String(50), index=True)
+
+    def __init__(self, user_name: str):
+        self._user_name = user_name
 
 
 class Store(db.Model):
     __tablename__ = 'store'
     _dal: DAL = DAL.get_instance()
+    _search_index: ProductSearchIndex = ProductSearchIndex.get_instance()
+    _price_cache: EffectivePriceCache = EffectivePriceCache.get_instance()
+    _discount_expiry: DiscountExpiry = DiscountExpiry.get_instance()
+    _descriptions: DescriptionCache = DescriptionCache.get_instance()
+    _plans: PlanCache = PlanCache.get_instance()
     _name = db.Column(db.String(50), primary_key=True)
+    # changed with every change of the discounts, the policies or the products of the store, see _new_version
+    _version = db.Column(db.String(32))
     _initial_owner_fk = db.Column(db.String(50), db.ForeignKey('loggedInUsers._user_name'))
     _initial_owner = db.relationship("LoggedInUser", lazy="select")  # TODO1
     _opened = db.Column(db.Boolean)
     _creation_date = db.Column(db.DateTime)
 
-    _inventory_ls = db.relationship("ProductInInventory", lazy="select",
+    _inventory_ls = db.relationship("ProductInInventory", lazy="selectin",
                                     foreign_keys=[pc.ProductInInventory._store_fk])
-    _purchases_ls = db.Column(db.JSON)  # db.relationship("Purchase", lazy="select")
-    _permissions_ls = db.Column(db.JSON)  # db.relationship("Permission", lazy="select")
+    # purchases are queried by Purchase._store_name
+    # never read, the links that are added to it are inserted without loading it. the permissions are loaded by
+    # _load_deferred_permissions
+    _permission_links = db.relationship("StorePermissionLink", lazy="dynamic", cascade="all, delete-orphan",
+                                        passive_deletes=True)
+    # names of the users with a permission in the store, kept one row per name in store_permission_user
+    _permissions_ls = IdLinks('_permission_links', StorePermissionLink, '_store_fk', '_user_name')
     _pending_ownership_proposes_ls = db.relationship("AppointmentAgreement", lazy="subquery")  # WAS subquery,#TODO1
     _discount_fk = db.Column(db.Integer, db.ForeignKey("complex_discount.id"))
     _discount = db.relationship("ComplexDiscount", lazy="joined")
@@ -63,8 +124,7 @@ class Store(db.Model):
         if purchases is None:
             purchases = TypedList(Purchase)
         self._inventory_ls = []
-        self._permissions_ls = json.dumps([])
-        self._purchases_ls = json.dumps([])
+        self._permissions_ls = []
         self._pending_ownership_proposes_ls = []
         self.name: str = name
         self._owner_init = False
@@ -78,26 +138,26 @@ class Store(db.Model):
         self.purchases = purchases
         self._permissions = TypedDict(str, Permission)
         self._discount = CompositeOrDiscount(_IDiscountCondition(datetime.now()), _IDiscountStrategy())
+        self._version = uuid.uuid4().hex
         self._shopping_policies = CompositeAndShoppingPolicy()
         self._pending_ownership_proposes = TypedDict(str, AppointmentAgreement)
 
     @orm.reconstructor
     def loaded(self):
         from src.domain.system.permission_classes import Permission
-        self._inventory = TypedDict(str, ProductInInventory)
+        # built on first use, after the inventories of all the loaded stores were loaded together
+        self._inventory = None
         self._inventory_lock = threading.Lock()
 
-        for p in self._inventory_ls:
-            self._inventory[p.product_name] = p
-
-        self._permissions = self._dal.get_permission_with_id_keys_for_store(json.loads(self._permissions_ls),
-                                                                            self._name)
-        self._dal.add_all(list(self._permissions.values()), add_only=True)
+        # permissions are loaded on first use, together with all the stores loaded in the same session
+        self._permissions = None
+        self._dal.defer_load('store_permissions', self)
         # self._dal.add_all(self._permissions_ls, add_only=True)
         # for perm in self._permissions_ls:
         #     self._permissions[perm.user.user_name] = perm
 
-        self._purchases = self._dal.get_purchases_with_id_keys_for_store(json.loads(self._purchases_ls))
+        # purchase history is never loaded with the store, see watch_purchase_history
+        self._purchases = None
 
         self._pending_ownership_proposes = TypedDict(str, AppointmentAgreement)
         for prop in self._pending_ownership_proposes_ls:
@@ -105,12 +165,26 @@ class Store(db.Model):
             self._pending_ownership_proposes[prop._candidate_fk] = prop
         # self._dal.add(self._initial_owner, add_only=True)
 
+    def _load_deferred_permissions(self):
+        """
+        load the permissions of this store, and of all the other stores that were loaded in the same session
+        and did not load their permissions yet, with a single query
+        :return: None
+        """
+        stores = [s for s in self._dal.take_deferred('store_permissions', self) if s._permissions is None]
+        loaded = self._dal.get_permission_with_id_keys_for_stores([s._name for s in stores])
+        for s in stores:
+            s._permissions = loaded[s._name]
+            self._dal.add_all(list(s._permissions.values()), add_only=True)
+
     def add_appointement_agreement(self, ag: AppointmentAgreement):
         self._pending_ownership_proposes_ls.append(ag)
         self._pending_ownership_proposes[ag._candidate_fk] = ag
 
     @property
     def purchases(self):
+        if self._purchases is None:
+            self._purchases = TypedList(Purchase, self._dal.get_purchases_of_store(self._name))
         return self._purchases
 
     @purchases.setter
@@ -155,6 +229,18 @@ class Store(db.Model):
     def shopping_policies(self):
         return self._shopping_policies
 
+    @property
+    def version(self) -> str:
+        return self._version
+
+    @property
+    def discount_index(self) -> TreeIndex:
+        return TreeIndex(self.discount_root, _IDiscount, DiscountChildLink)
+
+    @property
+    def policy_index(self) -> TreeIndex:
+        return TreeIndex(self.shopping_policies, IShoppingPolicies, PolicyChildLink)
+
     @property
     def open(self):
         return self._opened
@@ -168,12 +254,17 @@ class Store(db.Model):
 
     @property
     def inventory(self):
+        if self._inventory is None:
+            self._inventory = TypedDict(str, ProductInInventory)
+            for p in self._inventory_ls:
+                self._inventory[p.product_name] = p
         return self._inventory
 
     @inventory.setter
     def inventory(self, inv: TypedDict):
         if isinstance(inv, TypedDict) and inv.check_types(str, ProductInInventory):
             self._inventory = inv
+            self._search_index.drop_store(self._name)
         else:
             raise TypeError("not a valid inventory")
 
@@ -203,6 +294,8 @@ class Store(db.Model):
                      self.inventory, self.purchases)
 
     def get_permissions(self):
+        if self._permissions is None:
+            self._load_deferred_permissions()
         return self._permissions
 
     def to_dictionary(self, with_permissions=False):
@@ -228,42 +321,50 @@ class Store(db.Model):
         if not isinstance(purchases, TypedList) or not purchases.check_types(Purchase):
             raise TypeError(f"expected Purchase got {type(purchases)}")
         else:
+            # only the names of the staff are needed, the permissions themselves are not loaded for them
+            staff = list(self._permissions) if self._permissions is not None else list(self._permissions_ls)
             for purchase in purchases:
                 num_items: int = len(purchase.basket.products)
-                for perm in self._permissions.values():
-                    self._dal.add(perm, add_only=True)
-                    if num_items == 1:
-                        msg = f"One item was purchased from store {self.name}. Purchase ID: {purchase.purchase_id}"
-                    else:
-                        msg = f"{str(num_items)} items were purchased from store {self.name}. Purchase ID: {purchase.purchase_id}"
-                    Publisher.get_instance().publish('store_update', f"Date: {datetime.today()}: {msg}", perm._user_fk)
-            # self._purchases_ls.append(purchases)
-            temp = json.loads(self._purchases_ls)
+                if num_items == 1:
+                    msg = f"One item was purchased from store {self.name}. Purchase ID: {purchase.purchase_id}"
+                else:
+                    msg = f"{str(num_items)} items were purchased from store {self.name}. Purchase ID: {purchase.purchase_id}"
+                msg = f"Date: {datetime.today()}: {msg}"
+                Publisher.get_instance().publish_to_store('store_update', msg, self.name, staff)
             for purchase in purchases:
                 self._dal.add(purchase, add_only=True)
-                temp.append(purchase.purchase_id)
-            self._purchases_ls = json.dumps(temp)
-            self.purchases.extend(purchases)
+            if self._purchases is not None:
+                self._purchases.extend(purchases)
 
-    def watch_purchase_history(self, requesting_user: User):
+    def watch_purchase_history(self, requesting_user: User, cursor: str = None,
+                               limit: int = PURCHASE_HISTORY_PAGE_SIZE):
         """
-        view all purchases that was done in this store, if possible
+        view one page of the purchases that was done in this store, newest first, if possible
         :param requesting_user: (User) the user who request to see the purchases
-        :return: List of all purchases done in the store. None if don't have the right permission
+        :param cursor: (str) next_cursor of the previous page, None for the first page
+        :param limit: (int) maximum number of purchases in the page
+        :return: Result with dictionary of {"purchases": list of purchases dictionaries,
+                "next_cursor": cursor of the next page or None if this is the last page}.
+                None if don't have the right permission
         """
         if requesting_user.user_state is None:
             return Result(False, requesting_user.user_id, "Must be Registered User for this kind of action", None)
         elif not requesting_user.user_state.is_connected:
             return Result(False, requesting_user.user_id, "Must be logged in for such action", None)
-        if requesting_user.is_admin():
-            return Result(True, requesting_user.user_id, "Purchases result in data field",
-                          [p.to_dictionary() for p in self.purchases])
-
-        if self._is_permitted_to_watch_history(requesting_user):
-            return Result(True, requesting_user.user_id, "Purchases result in data field",
-                          [p.to_dictionary() for p in self.purchases])
-        else:
+        if not requesting_user.is_admin() and not self._is_permitted_to_watch_history(requesting_user):
             return Result(False, requesting_user.user_id, "Don't have permission for such action", None)
+        if type(limit) != int or limit <= 0:
+            return Result(False, requesting_user.user_id, "page limit must be a positive number", None)
+        after = None
+        if cursor is not None:
+            after = _decode_purchases_cursor(cursor)
+            if after is None:
+                return Result(False, requesting_user.user_id, "invalid purchases cursor", None)
+        # one extra row tells if there is a next page
+        page = self._dal.get_purchases_page_of_store(self._name, limit + 1, after)
+        next_cursor = _encode_purchases_cursor(page[limit - 1]) if len(page) > limit else None
+        return Result(True, requesting_user.user_id, "Purchases result in data field",
+                      {"purchases": [p.to_dictionary() for p in page[:limit]], "next_cursor": next_cursor})
 
     def open_store(self):
         self._opened = True
@@ -275,18 +376,18 @@ class Store(db.Model):
 
     def add_store_member(self, perm: Permission):
         from src.domain.system.users_classes import User
-        if perm._user_fk in self._permissions:
+        if perm._user_fk in self.get_permissions():
             return Result(False, -1, "User is Already in store management", None)
         else:
-            self._permissions[perm._user_fk] = perm
-            temp = json.loads(self._permissions_ls)
-            temp.append(perm._user_fk)
-            self._permissions_ls = json.dumps(temp)
+            self.get_permissions()[perm._user_fk] = perm
+            # the names are not read to add one
+            Store._permissions_ls.add(self, [perm._user_fk])
             return Result(True, -1, "User added successfully to management of the store", None)
 
     def fetch_all_discounts(self):
         all_discounts = self.get_all_discounts()
-        data = [{"discount_id": dis.id, "description": dis.get_description()} for dis in all_discounts]
+        descriptions = self._descriptions.descriptions_of(self._name, self._version, DISCOUNTS)
+        data = [{"discount_id": dis.id, "description": dis.get_description(descriptions)} for dis in all_discounts]
         return Result(True, -1, "all discounts:", data)
 
     def get_all_discounts(self):
@@ -305,8 +406,8 @@ class Store(db.Model):
         # removed_permission: Permission = self._permissions[to_remove]
         # self._dal.add(removed_permission, add_only=True)
         for name in to_remove:
-            if name in self._permissions:
-                del self._permissions[name]
+            if name in self.get_permissions():
+                del self.get_permissions()[name]
                 msg: str = f"{name} was removed from staff of store: {self.name}"
                 Publisher.get_instance().publish('store_update', f"Date: {datetime.today()}: {msg}", name)
         return True
@@ -554,6 +655,8 @@ class Store(db.Model):
         self._dal.add(new_discount, add_only=True)
         self._dal.flush()  # So we ill able to call .id
         self.discount_root.add_discount(new_discount)
+        self._new_version()
+        self._schedule_expiry(new_discount)
 
         relevant_products, relevant_categories = new_discount.relevant_products_and_categories()
         all_relevant_products_by_name = [k for k, p in self.inventory.items() if k in relevant_products]
@@ -569,6 +672,7 @@ class Store(db.Model):
                 p.add_discount(new_discount)
                 to_update.append(p)
         self._dal.add_all(to_update, add_only=True)
+        self._price_cache.invalidate_store(self._name)
 
         return Result(True, -1, "given discount was added successfully", new_discount.id)
 
@@ -580,6 +684,8 @@ class Store(db.Model):
         self._dal.add(new_discount, add_only=True)
         self._dal.flush()  # So we ill able to call .id
         self.discount_root.add_discount(new_discount)
+        self._new_version()
+        self._schedule_expiry(new_discount)
 
         return Result(True, -1, "given discount was added successfully", new_discount.id)
 
@@ -605,11 +711,13 @@ class Store(db.Model):
         # Begin transaction here
         self._dal.begin_nested()  # Init transaction
         try:
-            output = self.discount_root.remove_discount(to_remove)
+            parent = self.discount_index.parent_of(to_remove)
+            output = None if parent is None else parent.remove_discount(to_remove)
             if output is None:
                 self._dal.rollback()
                 return Result(False, -1, "Discount was not found", None)
             else:
+                self._new_version()
                 self.remove_discount_from_product(to_remove, output)
                 self._dal.commit()  # Commit transaction
                 return Result(True, -1, "Removed successfully", output)
@@ -625,7 +733,9 @@ class Store(db.Model):
         try:
             children_discounts = []
             for id in discounts_id_list:
-                current_discount: _IDiscount = self.discount_root.remove_discount(id)
+                parent = self.discount_index.parent_of(id)
+                current_discount: _IDiscount = None if parent is None else parent.remove_discount(id)
+                self._new_version()
                 if current_discount is None:
                     self._dal.rollback()
                     return Result(False, -1, f"given discount id {id} was not found in store", None)
@@ -650,34 +760,129 @@ class Store(db.Model):
         """
         self._dal.add(edited_discount, add_only=True)
         self._dal.flush()  # So we ill able to call .id
-        dis_tuple = self.discount_root.edit_discount(discount_id, edited_discount)
+        parent = self.discount_index.parent_of(discount_id)
+        dis_tuple = None if parent is None else parent.edit_discount(discount_id, edited_discount)
         if dis_tuple is None:
             self._dal.delete(edited_discount, del_only=True)
             return Result(False, -1, "Didn't found discount to edit", None)
         else:
             edited, removed = dis_tuple
+            self._new_version()
+            self._schedule_expiry(edited)
+            self._price_cache.invalidate_store(self._name)
             self._dal.add(edited, add_only=True)
             self._dal.flush()  # So we ill able to call .id
             self.remove_discount_from_product(discount_id, removed)
             return Result(True, -1, "discount was edited", edited.id)
 
     def remove_discount_from_product(self, discount_id, removed):
-        all_ids = [dis.id for dis in removed.get_all_discounts()]
-        all_ids.append(discount_id)
-        to_update = []
-        for i in all_ids:
-            all_relevant_products = [p for k, p in self.inventory.items() if i in p._discounts]
-            for p in all_relevant_products:
-                p: ProductInInventory = p
-                p.clear_discounts()
-                self._checking_for_discount_for_product(p)
-                to_update.append(p)
-        removed.delete_from_db()
+        self._remove_discounts_from_products([removed])
+
+    def _remove_discounts_from_products(self, removed: list):
+        """
+        removing the given discounts, that were removed from the discount tree, and all the discounts under them from
+        the products of the store and from the db
+        :param removed: (list of _IDiscount) the removed discounts
+        :return: None
+        """
+        all_ids = [dis.id for discount in removed for dis in discount.get_all_discounts()]
+        all_ids.extend(discount.id for discount in removed)
+        self._dal.flush()  # so the query sees the discounts of new products
+        relevant_ids = self._dal.get_products_in_inventory_ids_with_discounts(self._name, all_ids)
+        to_update = [p for p in self.inventory.values() if p.id in relevant_ids]
+        ProductInInventory._discounts.delete(to_update, all_ids)
+        for p in to_update:
+            self._checking_for_discount_for_product(p)
+        # the removed trees are deleted with a statement for each table
+        self._dal.delete_all_as_query([o for discount in removed for o in discount.give_all_stuff_to_delete() if
+                                       o is not None])
         self._dal.add_all(to_update, add_only=True)
+        self._price_cache.invalidate_store(self._name)
+
+    def _schedule_expiry(self, discount: _IDiscount):
+        """
+        scheduling the removal of the given discount when its end time passes. complex discounts expire through
+        their children (see remove_expired_discounts)
+        :param discount: (_IDiscount) discount of the store
+        :return: None
+        """
+        if not isinstance(discount, ComplexDiscount) and discount.discount_condition is not None:
+            self._discount_expiry.schedule(self._name, discount.id, discount.discount_condition.end_time)
+
+    @staticmethod
+    def _is_discount_expired(discount: _IDiscount, now: datetime) -> bool:
+        """
+        :param discount: (_IDiscount) discount of the store
+        :param now: (datetime) time to check the discount against
+        :return: True if the discount can't change any basket from the given time on: a simple discount that its end
+                 time passed, an AND discount that one of its children expired (or that has no children), or an OR
+                 or XOR discount that all its children expired
+        """
+        if isinstance(discount, ComplexDiscount):
+            children = discount.children_discounts_dict.values()
+            if discount._operator == ComplexDiscountTypes.AND.value:
+                return len(children) == 0 or any(Store._is_discount_expired(c, now) for c in children)
+            return all(Store._is_discount_expired(c, now) for c in children)
+        end_time = discount.discount_condition.end_time
+        return end_time is not None and end_time <= now
+
+    def remove_expired_discounts(self, discount_ids: list, now: datetime = None):
+        """
+        removing the given discounts, that their end time passed, from the discount tree and the products of the store
+        with a single commit, and notifying the staff of the store. the highest discount above each of them that
+        expired with it is the one removed (e.g the AND discount it is a child of). discounts that were edited or
+        removed since they were scheduled are ignored
+        :param discount_ids: (list of int) ids of the simple discounts to remove
+        :param now: (datetime) time to check the discounts against, the current time by default
+        :return: Result with list of ids of the removed discounts
+        """
+        now = datetime.now() if now is None else now
+        self._dal.begin_nested()
+        try:
+            index = self.discount_index
+            # id of the highest expired discount above each of the given discounts -> the discount it is a child of
+            highest = dict()
+            for discount_id in discount_ids:
+                discount = index.find(discount_id)
+                if discount is None or not self._is_discount_expired(discount, now):
+                    continue
+                parent = index.parent_of(discount_id)
+                while parent is not self.discount_root and self._is_discount_expired(parent, now):
+                    discount, parent = parent, index.parent_of(parent.id)
+                highest[discount.id] = parent
+            # the children of every parent are removed together, a discount under another removed one goes with it
+            by_parent = dict()
+            for discount_id, parent in highest.items():
+                ancestor = parent
+                while ancestor is not self.discount_root and ancestor.id not in highest:
+                    ancestor = index.parent_of(ancestor.id)
+                if ancestor is self.discount_root:
+                    by_parent.setdefault(parent.id, (parent, []))[1].append(discount_id)
+            removed = []
+            for parent, children in by_parent.values():
+                removed.extend(parent.remove_children_discounts(children))
+            if len(removed) == 0:
+                self._dal.rollback()
+                return Result(True, -1, "No discount expired", [])
+            self._new_version()
+            self._remove_discounts_from_products(removed)
+            self._dal.commit()
+        except Exception as e:
+            self._dal.rollback()
+            return Result(False, -1,
+                          f"Failed to remove expired discounts from Store({self._name}), Rollback performed({str(e)})",
+                          None)
+        removed_ids = [discount.id for discount in removed]
+        staff = list(self._permissions) if self._permissions is not None else list(self._permissions_ls)
+        msg = f"Date: {datetime.today()}: discounts {', '.join(str(i) for i in removed_ids)} of store {self.name} " \
+              f"expired and were removed"
+        Publisher.get_instance().publish_to_store('store_update', msg, self.name, staff)
+        return Result(True, -1, "Expired discounts were removed", removed_ids)
 
     def _edit_existing_policy(self, children, policy_id):
         self._dal.add(children)
-        pol_tuple = self.shopping_policies.edit_policy(policy_id, children)
+        parent = self.policy_index.parent_of(policy_id)
+        pol_tuple = None if parent is None else parent.edit_policy(policy_id, children)
         if pol_tuple is None:
             self._dal.delete(children)
             return Result(False, -1, "Didn't found discount to edit", None)
@@ -691,15 +896,12 @@ class Store(db.Model):
     def remove_policy_from_productsss(self, policy_id, removed):
         all_ids = [pol.id for pol in removed.fetch_policies()]
         all_ids.append(policy_id)
-        to_update = []
-        for i in all_ids:
-            all_relevant_products = [p for k, p in self.inventory.items() if i in p._policies]
-            for p in all_relevant_products:
-                p: ProductInInventory = p
-                p.clear_policies()
-                self._checking_for_policies_for_product(p)
-                if p not in to_update:
-                    to_update.append(p)
+        self._dal.flush()  # so the query sees the policies of new products
+        relevant_ids = self._dal.get_products_in_inventory_ids_with_policies(self._name, all_ids)
+        to_update = [p for p in self.inventory.values() if p.id in relevant_ids]
+        ProductInInventory._policies.delete(to_update, all_ids)
+        for p in to_update:
+            self._checking_for_policies_for_product(p)
         removed.delete_yourself()
         self._dal.add_all(to_update, add_only=True)
 
@@ -711,6 +913,7 @@ class Store(db.Model):
         # Begin transaction here
         self._dal.begin_nested()  # Init transaction
         try:
+            self._new_version()
             children = IShoppingPolicies.create_specific_leaf(min_basket_quantity, max_basket_quantity, product_name,
                                                               min_product_quantity, max_product_quantity, category,
                                                               min_category_quantity, max_category_quantity, day)
@@ -767,7 +970,9 @@ class Store(db.Model):
         # Begin transaction here
         self._dal.begin_nested()  # Init transaction
         try:
-            ret_val: IShoppingPolicies = self._shopping_policies.remove_policy(to_remove)
+            self._new_version()
+            parent = self.policy_index.parent_of(to_remove)
+            ret_val: IShoppingPolicies = None if parent is None else parent.remove_policy(to_remove)
             if ret_val is None:
                 self._dal.rollback()
                 return Result(False, -1, "Policy was not found", None)
@@ -784,9 +989,11 @@ class Store(db.Model):
         # Begin transaction here
         self._dal.begin_nested()  # Init transaction
         try:
+            self._new_version()
             children_policies = []
             for policy_id in policies_id_list:
-                current_policy = self._shopping_policies.remove_policy(policy_id)
+                parent = self.policy_index.parent_of(policy_id)
+                current_policy = None if parent is None else parent.remove_policy(policy_id)
                 if current_policy is None:
                     self._dal.rollback()
                     return Result(False, -1, f"given policy id {policy_id} was not found in store", None)
@@ -805,7 +1012,8 @@ class Store(db.Model):
 
     def fetch_shopping_policies(self):
         policies = self.shopping_policies.fetch_policies()
-        data = [{"policy_id": p.id, "description": p.description()} for p in policies]
+        descriptions = self._descriptions.descriptions_of(self._name, self._version, POLICIES)
+        data = [{"policy_id": p.id, "description": p.description(descriptions)} for p in policies]
         return Result(True, -1, "fetch policies succeeded", data)
 
     def add_product(self, product_name: str, base_price: float,
@@ -877,18 +1085,59 @@ class Store(db.Model):
             self._checking_for_policies_for_product(new_product)
             self._inventory_ls.append(new_product)
             self.inventory[new_product.product.name] = new_product
+            previous_version = self._new_version()
+            self._search_index.put_product(self._name, previous_version, self._version, new_product)
 
             self._dal.add_all([self, new_product])
             return True
 
+    def _new_version(self) -> str:
+        """
+        giving the store a new version after a change of its discounts, its policies or its products. the version is
+        saved in the transaction of the change, so the other sessions see it together with the changed tree or
+        inventory, and the plans and the search index that were cached for the previous version are not used by any
+        of them
+        :return: (str) the previous version of the store
+        """
+        previous_version = self._version
+        self._version = uuid.uuid4().hex
+        return previous_version
+
+    def _compiled_discount_plan(self) -> DiscountPlan:
+        """
+        :return: the discount plan of the current version of the store, compiled if no session of the process compiled
+                 it yet. the discounts of the tree are scheduled to be removed when they expire, as the discounts of a
+                 loaded store were not scheduled by this process
+        """
+        plan = self._plans.get(self._name, self._version, DISCOUNT_PLAN)
+        if plan is None:
+            plan = DiscountPlan.compile(self.discount_root)
+            for discount in self.discount_root.get_all_discounts():
+                self._schedule_expiry(discount)
+            self._plans.put(self._name, self._version, DISCOUNT_PLAN, plan)
+        return plan
+
     def apply_discount_on_basket(self, basket: Basket):
         """
         applying discount policy of the store on the given basket
         :param basket: (Basket) basket of user to check if there are some valid discount the store can deduce from it
         :return: deduced basket price, according to the
         """
-        self.discount_root.reset_flags()
-        return self.discount_root.apply(basket)
+        self._compiled_discount_plan().apply(basket)
+        basket.invalidate_total_value()
+        return basket
+
+    def apply_discount_on_changed_products(self, basket: Basket, changed: dict):
+        """
+        applying the discount policy of the store again on the products of the given basket that a change of some
+        of its products can affect
+        :param basket: (Basket) basket of user that was priced by the store before the change
+        :param changed: (dict of str to set of str) names of the changed products to their categories
+        :return: list of the ProductInShoppingCart of the basket that were priced again
+        """
+        repriced = self._compiled_discount_plan().apply_on_changed_products(basket, changed)
+        basket.invalidate_total_value()
+        return repriced
 
     def apply_policies_on_basket(self, basket: Basket):
         """
@@ -896,76 +1145,41 @@ class Store(db.Model):
                 :param basket: (Basket) basket of user to check if there are some valid discount the store can deduce from it
                 :return: deduced basket price, according to the
                 """
-        return self.shopping_policies.apply(basket)
+        plan = self._plans.get(self._name, self._version, POLICY_PLAN)
+        if plan is None:
+            plan = PolicyPlan.compile(self.shopping_policies)
+            self._plans.put(self._name, self._version, POLICY_PLAN, plan)
+        return plan.apply(basket)
 
-    def add_product_after_product_cancellation(self, product: ProductInShoppingCart):
+    def inventory_lines(self, quantities: dict):
         """
-        adding a new product if possible to the store
-        :param product: ProductInInventory to add back to store
-        :return: True if successful, Raise Exceptions otherwise
+        match quantities of products with the products in the inventory
+        :param quantities: (dict) name of product -> quantity
+        :return: list of tuples of (ProductInInventory, quantity), of the products that are still in the inventory
         """
-        item: ProductInInventory = product._item
-        if item.product_name in self.inventory:
-            # if exists -> adding quantity
-            existing_product: ProductInInventory = self.inventory[item.product_name]
-            existing_product.quantity = existing_product.quantity + product._product_quantity
-            self.inventory[item.product_name] = existing_product
-            # self._dal.add_all([existing_product, self])
-            self._dal.update_quantity_of_item(existing_product.id, self._name, existing_product.quantity)
-            self._dal.add(existing_product, add_only=True)
-            self._dal.add(self, add_only=True)
-            return True
-
-        elif product._product_quantity == 0:
-            # dont add to inventory item with 0 quantity
-            return True
-        else:
-            # adding discounts to product
-            self._dal.add(item)
-            self._checking_for_discount_for_product(item)
-            self._checking_for_policies_for_product(item)
-            self._inventory_ls.append(item)
-            self.inventory[item.product_name] = item
-
-            self._dal.add_all([self, item])
-            return True
-
-    def pre_purchase_from_store(self, product_name: str, quantity_to_purchase: int):
-        """
-        removing items from inventory before purchasing
-        :param product_name: (str) name of the product to buy
-        :param quantity_to_purchase: (int) quantity to buy
-        :return: int represent amount bought from store
-        """
-        if not (isinstance(product_name, str) and isinstance(quantity_to_purchase, int)) or quantity_to_purchase < 0:
-            raise TypeError(" invalid arguments: expected str and positive int")
-        elif quantity_to_purchase == 0:
-            return 0
-        if product_name not in self.inventory:
-            return 0
-        else:
-            product: ProductInInventory = self.inventory[product_name]
-            if product.quantity <= quantity_to_purchase:
-                quantity_to_purchase = product.quantity
-                product.quantity = 0
-            else:
-                product.quantity -= quantity_to_purchase
-            # self._dal.add(product, add_only=True)
-            self._dal.update_quantity_of_item(product.id, self._name, product.quantity)
-            return quantity_to_purchase
+        # products that were removed from the store meanwhile are left out
+        return [(self.inventory[product_name], quantity) for product_name, quantity in quantities.items() if
+                product_name in self.inventory]
 
     def clear_empty_products_from_inventory(self):
-        to_delete_in_inventory = []
-        to_delete_products = []
-        for p_name in list(self.inventory.keys()):
-            p: ProductInInventory = self.inventory[p_name]
-            if p.quantity == 0:
-                self.inventory.pop(p_name)
-                self._inventory_ls.remove(p)
-                to_delete_in_inventory.append(p.id)
-                to_delete_products.append(p.id)
-
-        self._dal.delete_all_products(to_delete_in_inventory, to_delete_in_inventory)
+        empty_names = [p_name for p_name, p in self.inventory.items() if p.quantity == 0]
+        if not empty_names:
+            return
+        # the products of purchases that are still waiting for the payment and shipping systems are kept, so they can
+        # be given back if the purchase fails
+        reserved = self._dal.get_reserved_product_names(self._name, empty_names)
+        empty_names = [p_name for p_name in empty_names if p_name not in reserved]
+        if not empty_names:
+            return
+        empty = [self.inventory.pop(p_name) for p_name in empty_names]
+        self._dal.delete_all_products([p.id for p in empty], [p._product_pk for p in empty])
+        # the rows are already deleted, so the collection is replaced without history instead of flushing a change
+        # for every removed product
+        removed_ids = {p.id for p in empty}
+        orm.attributes.set_committed_value(self, '_inventory_ls',
+                                           [p for p in self._inventory_ls if p.id not in removed_ids])
+        previous_version = self._new_version()
+        self._search_index.remove_products(self._name, previous_version, self._version, empty_names)
 
     def remove_product_from_store(self, product_name: str):
         """
@@ -982,6 +1196,8 @@ class Store(db.Model):
         if product_name in self.inventory:
             with self._inventory_lock:
                 popped: ProductInInventory = self.inventory.pop(product_name)
+                previous_version = self._new_version()
+                self._search_index.remove_products(self._name, previous_version, self._version, [product_name])
                 self._dal.delete_all([popped, popped.product])
                 self._dal.commit()
                 return True
@@ -1018,7 +1234,9 @@ class Store(db.Model):
             # editing discounts again
             product_to_edit.clear_discounts()
             self._checking_for_discount_for_product(product_to_edit)
-            self._dal.add_all([edited_product, product_to_edit])
+            previous_version = self._new_version()
+            self._search_index.put_product(self._name, previous_version, self._version, product_to_edit)
+            self._dal.add_all([edited_product, product_to_edit, self])
             return True
         else:
             return False
@@ -1042,19 +1260,23 @@ class Store(db.Model):
             lambda p: not (set(p["product"]["categories"]).isdisjoint(set(categories)))) if categories else no_filter
         brands_filter = (lambda p: p["product"]["brand"] in brands) if brands else no_filter
 
-        if max_price is not None and max_price > 0:
-            max_price_filter = (lambda p: p["after_discount"] <= max_price)
-        else:
-            max_price_filter = no_filter
-        if min_price is not None and min_price >= 0:
-            min_price_filter = (lambda p: p["after_discount"] >= min_price)
-        else:
-            min_price_filter = no_filter
+        check_max_price = max_price is not None and max_price > 0
+        check_min_price = min_price is not None and min_price >= 0
+
+        # only the products found by the index, with a cached price after discount in the price range, are serialized.
+        # the filters below guard against an index that missed a change of the inventory
+        found = self._search_index.find_products(self, product_name, categories, brands, min_price)
         temp = []
-        for product in self.inventory.values():
+        for name in sorted(found):
+            if name not in self.inventory:
+                continue
+            product: ProductInInventory = self.inventory[name]
+            if check_max_price or check_min_price:
+                price = product.price_after_discount()
+                if (check_max_price and price > max_price) or (check_min_price and price < min_price):
+                    continue
             temp.append(product.to_dictionary())
-        matched = filter((lambda p: product_filter(p) and categories_filter(p) and brands_filter(p)
-                                    and min_price_filter(p) and max_price_filter(p)), temp)
+        matched = filter((lambda p: product_filter(p) and categories_filter(p) and brands_filter(p)), temp)
         return matched
 
     def search_product(self, product_name: str, categories: list = None,
@@ -1085,12 +1307,13 @@ class Store(db.Model):
         """
         if admin_user.is_admin():
             self.open = False
-            initial_owner_permission: Permission = self._permissions[self.initial_owner]
+            initial_owner_permission: Permission = self.get_permissions()[self.initial_owner]
             initial_owner_permission.remove_all_sub_members(admin_user.user_state.user_name)
             if self.name in initial_owner_permission.user.user_state.permissions:
                 del initial_owner_permission.user.user_state.permissions[self.name]
-            self._permissions.clear()
+            self.get_permissions().clear()
             self.inventory.clear()
+            self._search_index.drop_store(self._name)
             return True
         else:
             return False  # not an admin
@@ -1102,8 +1325,8 @@ class Store(db.Model):
         :return: True if the user can wahtch this store purchase history False otherwise
         """
 
-        if to_check.user_state.user_name in self._permissions:
-            perm: Permission = self._permissions[to_check.user_state.user_name]
+        if to_check.user_state.user_name in self.get_permissions():
+            perm: Permission = self.get_permissions()[to_check.user_state.user_name]
             self._dal.add(perm)
             return perm.watch_purchase_history
         return False  # not in store staff
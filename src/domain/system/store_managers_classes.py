@@ -10,12 +10,14 @@ if TYPE_CHECKING:
     from src.domain.system.store_classes import Store
 
 import enum
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
 from logging import Logger
 
 from src.domain.system.cart_purchase_classes import ShoppingCart, PurchaseReport
 from src.domain.system.permission_classes import Permission, Role
 from src.domain.system.products_classes import ProductInInventory
+from src.domain.system.stock_reservations import StockReservations
 from src.domain.system.users_classes import User, LoggedInUser
 from src.external.payment_interface.payment_system import _PaymentSystem
 from src.external.publisher import Publisher
@@ -25,6 +27,70 @@ from src.protocol_classes.classes_utils import TypeChecker, Result, TypedList, T
 from src.domain.system.DAL import DAL
 from src.domain.system.db_config import db
 
+# the payment and shipping systems are waited for at most EXTERNAL_SYSTEM_TIMEOUT_SEC seconds each, and the products
+# of a purchase are kept reserved for it for RESERVATION_TTL
+EXTERNAL_SYSTEM_TIMEOUT_SEC = 10
+EXTERNAL_SYSTEM_WORKERS = 16
+RESERVATION_TTL = timedelta(minutes=1)
+
+
+class _GreenFuture:
+    """
+    the result of a call that runs in a greenlet, with the part of concurrent.futures.Future that ShoppingHandler uses
+    """
+
+    def __init__(self, green_thread):
+        self._green_thread = green_thread
+
+    def result(self, timeout: float = None):
+        """
+        wait for the call, only the calling greenlet waits
+        :param timeout: (float) most seconds to wait, None to wait until the call ends
+        :return: the result of the call, raises concurrent.futures.TimeoutError if it did not end in time
+        """
+        import eventlet
+        timer = eventlet.Timeout(timeout)
+        try:
+            return self._green_thread.wait()
+        except eventlet.Timeout as e:
+            if e is not timer:
+                raise
+            raise FutureTimeoutError()
+        finally:
+            timer.cancel()
+
+    def add_done_callback(self, callback) -> None:
+        self._green_thread.link(lambda _: callback(self))
+
+
+class GreenExecutor:
+    """
+    the executor of the calls to the external systems for a server that runs on eventlet. the call runs on a native
+    thread of eventlet.tpool, and is waited for in a greenlet with a green timeout, so the hub keeps serving the other
+    requests while a purchase waits for the payment and shipping systems
+    """
+
+    def __init__(self, workers: int = EXTERNAL_SYSTEM_WORKERS):
+        """
+        :param workers: (int) most calls that run at once
+        """
+        import eventlet.semaphore
+        self._slots = eventlet.semaphore.Semaphore(workers)
+
+    def _execute(self, fn, *args):
+        import eventlet.tpool
+        with self._slots:
+            return eventlet.tpool.execute(fn, *args)
+
+    def submit(self, fn, *args) -> _GreenFuture:
+        """
+        :param fn: function to call
+        :param args: arguments of the call
+        :return: (_GreenFuture) the result of the call
+        """
+        import eventlet
+        return _GreenFuture(eventlet.spawn(self._execute, fn, *args))
+
 
 class StoreAdministration:
     """
@@ -345,9 +411,9 @@ class StoreAdministration:
                 #                                                        store_name)
                 store: Store = perm.store
                 store.remove_member(to_delete_from_store)
-                temp = json.loads(store._permissions_ls)
-                self._dal.update_store_permissions_ls(store_name, json.dumps([name for name in temp if
-                                                                              name not in to_delete_from_store or name == store._initial_owner_fk]))
+                for name in to_delete_from_store:
+                    if name in store._permissions_ls and name != store._initial_owner_fk:
+                        store._permissions_ls.remove(name)
                 self._dal.add(perm, add_only=True)
 
                 # self._dal._db_session.commit()
@@ -621,12 +687,15 @@ class StoreAdministration:
                           f"User({user_id}) got all sub staff from store({store_name}), total of {len(output)}" if len(
                               output) > 0 else f"User({user_id}) has no sub-staff from store({store_name})", output)
 
-    def watch_store_purchase_history(self, requesting_user_id: int, store_name: str):
+    def watch_store_purchase_history(self, requesting_user_id: int, store_name: str, cursor: str = None,
+                                     limit: int = None):
         """
-        watch all the purchases made in the given store
+        watch one page of the purchases made in the given store, newest first
         :param requesting_user_id: (int) username of the user who want to watch to purchase history
         :param store_name:(str) store name to watch purchase history of
-        :return: Result object containing a list of requested purchases
+        :param cursor: (str) next_cursor of the previous page, None for the first page
+        :param limit: (int) maximum number of purchases in the page, None for the default page size
+        :return: Result object containing dictionary with the requested purchases and the cursor of the next page
         """
         if type(requesting_user_id) != int or requesting_user_id < 0 or not TypeChecker.check_for_non_empty_strings(
                 [store_name]):
@@ -644,7 +713,9 @@ class StoreAdministration:
                 return res
             else:
                 store: Store = res.data
-                return store.watch_purchase_history(user)
+                if limit is None:
+                    return store.watch_purchase_history(user, cursor)
+                return store.watch_purchase_history(user, cursor, limit)
 
             # return self._data_handler.watch_all_purchases_from_store(requesting_user_id, store_name)
 
@@ -1097,11 +1168,28 @@ class ShoppingHandler:
         """
 
     _dal: DAL = DAL.get_instance()
+    _reservations: StockReservations = StockReservations.get_instance()
+    # calls to the payment and shipping systems are made on these threads, so they can be waited for with a timeout.
+    # a server that runs on eventlet uses a GreenExecutor instead (see set_external_calls_executor)
+    _external_calls = ThreadPoolExecutor(max_workers=EXTERNAL_SYSTEM_WORKERS, thread_name_prefix="external_system")
+
+    @staticmethod
+    def set_external_calls_executor(executor) -> None:
+        """
+        :param executor: executor of the calls to the payment and shipping systems, with the submit method of
+                         concurrent.futures.Executor (e.g a GreenExecutor for a server that runs on eventlet)
+        :return: None
+        """
+        ShoppingHandler._external_calls = executor
 
-    def __init__(self, data_handler: DataHandler, payment_system: _PaymentSystem, shipping_system: _ShippingSystem):
+    def __init__(self, data_handler: DataHandler, payment_system: _PaymentSystem, shipping_system: _ShippingSystem,
+                 external_system_timeout: float = EXTERNAL_SYSTEM_TIMEOUT_SEC,
+                 reservation_ttl: timedelta = RESERVATION_TTL):
         self._data_handler: DataHandler = data_handler
         self._payment_system = payment_system
         self._shipping_system = shipping_system
+        self._external_system_timeout = external_system_timeout
+        self._reservation_ttl = reservation_ttl
         # self._log: Logger = Log.get_instance().get_logger()
         if not self._payment_system.check_connection():
             # doesn't have connection toto supply system - close system immidiatly
@@ -1341,17 +1429,50 @@ class ShoppingHandler:
         if user.shopping_cart.is_empty():
             return Result(False, user.user_id, "Shopping cart is empty", None)
 
-        self._dal.begin_nested()
-        try:
-            res: Result = user.shopping_cart.pre_purchase()
-            if not res.succeed:
+        self.release_expired_reservations()
+        store_names = list(user.shopping_cart.baskets.keys())
+
+        # 1. taking the products out of the inventories and committing, so the stores are not locked while paying.
+        # only purchases from the same stores compete on the same inventory
+        with self._dal.lock_for(*store_names):
+            self._dal.begin_nested()
+            try:
+                res: Result = user.shopping_cart.pre_purchase()
+                if not res.succeed:
+                    self._dal.rollback()
+                    return Result(False, user.user_id, res.msg, res.data)
+                reserved = user.shopping_cart.reserved_quantities()
+                reservation_id = self._reservations.reserve(reserved, self._reservation_ttl)
+                self._dal.commit()  # releasing the savepoint
+                self._dal.commit()  # and the transaction, so the database is not held while paying
+            except Exception as e:
                 self._dal.rollback()
-                return Result(False, user.user_id, res.msg, res.data)
-            else:
-                month_and_year = expiry_date.split('/')
-                if self._payment_system.pay(str(credit_card_number), month_and_year[0], month_and_year[1], ccv, holder,
-                                            holder_id):
-                    self._shipping_system.ship(country, city, street, house_number, apartment, floor)
+                return Result(False, user.user_id, f"Purchase failed, Rollback made ({str(e)})")
+
+        # 2. payment and shipping, outside of any lock or transaction
+        month_and_year = expiry_date.split('/')
+        transaction_id = self._call_external_system(self._payment_system.pay, self._payment_system.cancel_pay,
+                                                    str(credit_card_number), month_and_year[0], month_and_year[1],
+                                                    ccv, holder, holder_id)
+        if not transaction_id:
+            self._release_reservation(reservation_id)
+            return Result(False, user.user_id, "Payment failed", None)
+        supply_id = self._call_external_system(self._shipping_system.ship, self._shipping_system.cancel_supply,
+                                               country, city, street, house_number, apartment, floor)
+        if not self._shipping_system.is_shipped(supply_id):
+            self._release_reservation(reservation_id)
+            self._cancel_external_call(self._payment_system.cancel_pay, transaction_id)
+            return Result(False, user.user_id, "Shipping failed", None)
+
+        # 3. confirming the reservation and saving the purchase, or cancelling the payment and the shipping
+        with self._dal.lock_for(*store_names):
+            # the reservation is removed in the same transaction as the purchase is saved
+            self._dal.begin_nested()
+            try:
+                if not self._reservations.confirm(reservation_id):
+                    self._dal.rollback()
+                    failure = "Purchase took too long, payment and shipping were cancelled"
+                else:
                     shopping_cart = user.shopping_cart
                     if user.user_state is not None:
                         self._dal.add(user.user_state, add_only=True)
@@ -1365,17 +1486,109 @@ class ShoppingHandler:
                         ret = Result(True, user.user_id, "Purchase was successful", purchase_report.to_dictionary())
                     else:
                         ret = Result(True, user.user_id, "Purchase was successful", None)
-                    self._dal.commit()
+                    self._dal.commit()  # releasing the savepoint
+                    self._dal.commit()  # and the transaction, before the stores are unlocked
                     user._shopping_cart = shopping_cart
                     for s in stores_to_check:
                         s.clear_empty_products_from_inventory()
                     return ret
-                else:
-                    self._dal.rollback()
-                    return Result(False, user.user_id, "Payment failed", None)
+            except Exception as e:
+                self._dal.rollback()
+                failure = f"Purchase failed, Rollback made ({str(e)})"
+        # the products are given back first, the external systems may be slow to cancel
+        self._release_reservation(reservation_id)
+        self._cancel_external_call(self._payment_system.cancel_pay, transaction_id)
+        self._cancel_external_call(self._shipping_system.cancel_supply, supply_id)
+        return Result(False, user.user_id, failure, None)
+
+    def _call_external_system(self, call, cancel, *args):
+        """
+        calling the payment or the shipping system, waiting for it at most the timeout of the handler.
+        if the call ends after the timeout, what it did is cancelled with the given cancel function when it ends
+        :param call: function of the external system to call
+        :param cancel: function of the external system that cancels the result of the call (e.g cancel_pay)
+        :param args: arguments of the call
+        :return: the result of the call, False if the call failed, raised an error or timed out
+        """
+        future = self._external_calls.submit(call, *args)
+        try:
+            return future.result(timeout=self._external_system_timeout)
+        except FutureTimeoutError:
+            future.add_done_callback(lambda done: self._cancel_late_result(done, cancel))
+            return False
+        except Exception:
+            return False
+
+    def _cancel_external_call(self, cancel, result) -> None:
+        """
+        cancelling what a call to the payment or the shipping system did (e.g the payment of a purchase that failed),
+        waiting for it at most the timeout of the handler. a cancel that fails or does not end in time is logged
+        :param cancel: function of the external system that cancels the result of the call (e.g cancel_pay)
+        :param result: the result of the call to cancel
+        :return: None
+        """
+        future = self._external_calls.submit(cancel, result)
+        try:
+            future.result(timeout=self._external_system_timeout)
         except Exception as e:
-            self._dal.rollback()
-            return Result(False, user.user_id, f"Purchase failed, Rollback made ({str(e)})")
+            try:
+                Log.get_instance().get_logger().error(f"failed to cancel {result} of an external system: {e!r}")
+            except Exception:
+                pass
+
+    @staticmethod
+    def _cancel_late_result(done, cancel) -> None:
+        """
+        :param done: the future of a call that ended after its timeout
+        :param cancel: function of the external system that cancels the result of the call
+        :return: None
+        """
+        try:
+            result = done.result()
+        except Exception:
+            return
+        if result:
+            cancel(result)
+
+    @staticmethod
+    def _release_reservation(reservation_id: int):
+        """
+        giving back the products of a reservation to the stores, unless they were already given back. the reservation
+        is removed in the same transaction as the products are given back
+        :param reservation_id: (int) id of the reservation
+        :return: None
+        """
+        dal: DAL = ShoppingHandler._dal
+        reservations: StockReservations = ShoppingHandler._reservations
+        reserved = reservations.quantities_of(reservation_id)
+        if reserved is None:
+            return
+        with dal.lock_for(*reserved.keys()):
+            dal.begin_nested()
+            try:
+                if reservations.release(reservation_id):
+                    lines = []
+                    for store_name, quantities in reserved.items():
+                        store: Store = dal.get_store_by_name(store_name)
+                        if store is not None:
+                            lines += store.inventory_lines(quantities)
+                    dal.release_quantities(lines)
+                dal.commit()  # releasing the savepoint
+                dal.commit()  # and the transaction, the products can be bought again right away
+            except Exception as e:
+                dal.rollback()
+                # the reservation is kept, and given back again when it expires
+                Log.get_instance().get_logger().error(f"failed to give back reserved products {reserved}: {str(e)}")
+
+    @staticmethod
+    def release_expired_reservations():
+        """
+        giving back to the stores the products of the purchases that did not complete in time, e.g because the server
+        stopped while they waited for the external systems. called by every purchase, and when the server starts
+        :return: None
+        """
+        for reservation_id in ShoppingHandler._reservations.expired():
+            ShoppingHandler._release_reservation(reservation_id)
 
     def watch_user_purchases(self, requesting_user_id: int, requested_user: str = None):
         """
@@ -621,14 +621,16 @@ class SystemFacade:
     def is_admin(self, username: str):
         return
 
-    def watch_store_purchase(self, requesting_user_id: int, store_name: str):
+    def watch_store_purchase(self, requesting_user_id: int, store_name: str, cursor: str = None, limit: int = None):
         """
-        Returns specific store purchases history
+        Returns one page of specific store purchases history, newest first
         :param requesting_user_id:(int) Should be a manager / store owner or someone else with valid permissions
         :param store_name: The user, that his/she purchases is requested
-        :return: Result object containing a list of requested purchases
+        :param cursor: (str) next_cursor of the previous page, None for the first page
+        :param limit: (int) maximum number of purchases in the page, None for the default page size
+        :return: Result object containing dictionary with the requested purchases and the cursor of the next page
         """
-        return self._store_administrator.watch_store_purchase_history(requesting_user_id, store_name)
+        return self._store_administrator.watch_store_purchase_history(requesting_user_id, store_name, cursor, limit)
 
     def watch_all_purchases(self, requesting_user: int):
         """
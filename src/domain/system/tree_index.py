@@ -0,0 +1,54 @@
+from src.domain.system.DAL import DAL
+
+
+class TreeIndex:
+    """
+    lookup of the nodes of a discount or a policy tree of a store by their ids. the parent of every node is saved in
+    the link table of the tree, that is indexed by the id of the child, so a node and the complex node it is a child
+    of are found with one query of the ids above it, that also tells if the node is in the tree of the store. nothing
+    is built from the tree, so a store that is loaded again by every request finds its nodes as fast as the first
+    time. the root itself is not found
+    """
+    _dal: DAL = DAL.get_instance()
+
+    def __init__(self, root, node_model, link_model):
+        """
+        :param root: root of the tree
+        :param node_model: model of the nodes of the tree (e.g _IDiscount)
+        :param link_model: model of the links between the nodes and their parents (e.g DiscountChildLink)
+        """
+        self._root = root
+        self._node_model = node_model
+        self._link_model = link_model
+
+    def _ancestor_ids(self, node_id: int) -> list:
+        """
+        :return: list of the ids above the node with the given id, from its parent to the root. empty if it is not in
+                 the tree
+        """
+        ancestor_ids = self._dal.get_ancestor_ids(self._link_model, node_id)
+        if len(ancestor_ids) == 0 or ancestor_ids[-1] != self._root.id:
+            return []
+        return ancestor_ids
+
+    def find(self, node_id: int):
+        """
+        :param node_id: (int) id of a node
+        :return: the node with the given id, None if it is not in the tree
+        """
+        if len(self._ancestor_ids(node_id)) == 0:
+            return None
+        return self._dal.query(self._node_model).get(node_id)
+
+    def parent_of(self, node_id: int):
+        """
+        :param node_id: (int) id of a node
+        :return: the node that the node with the given id is a child of, None if it is not in the tree
+        """
+        ancestor_ids = self._ancestor_ids(node_id)
+        if len(ancestor_ids) == 0:
+            return None
+        return self._dal.query(self._node_model).get(ancestor_ids[0])
+
+    def __contains__(self, node_id: int) -> bool:
+        return len(self._ancestor_ids(node_id)) > 0
@@ -1,9 +1,9 @@
 from sqlalchemy import orm
-from sqlalchemy.ext.mutable import MutableList
 
 import src.domain.system.permission_classes as pc
 from src.communication.notification_handler import Category
 from src.domain.system.DAL import DAL
+from src.domain.system.id_links import IdLinks
 from src.domain.system.cart_purchase_classes import ShoppingCart, Purchase
 from typing import TYPE_CHECKING
 
@@ -34,6 +34,19 @@ def generate_id():
     return id_counter
 
 
+class UserPermissionLink(db.Model):
+    """
+    association between a registered user and a store the user has a permission in ('' for the system manager)
+    """
+    __tablename__ = 'user_permission_store'
+    id = db.Column(db.Integer, primary_key=True)
+    _user_fk = db.Column(db.String(250), db.ForeignKey('loggedInUsers._user_name', ondelete='CASCADE'), index=True)
+    _store_name = db.Column(db.String(50), index=True)
+
+    def __init__(self, store_name: str):
+        self._store_name = store_name
+
+
 class LoggedInUser(db.Model):
     __tablename__ = 'loggedInUsers'
     _dal: DAL = DAL.get_instance()
@@ -41,7 +54,12 @@ class LoggedInUser(db.Model):
     _password = db.Column(db.VARCHAR(256))
     # _shopping_cart_fk = db.Column(db.Integer, db.ForeignKey("shopping_cart.id"))
     _email = db.Column(db.VARCHAR(240))  # todo enforce email length somewhere
-    _permissions_list = db.Column(MutableList.as_mutable(db.JSON))
+    # never read, the links that are added to it are inserted without loading it. the permissions are loaded by
+    # _load_deferred_permissions
+    _permission_links = db.relationship("UserPermissionLink", lazy="dynamic", cascade="all, delete-orphan",
+                                        passive_deletes=True)
+    # names of the stores the user has a permission in, kept one row per name in user_permission_store
+    _permissions_list = IdLinks('_permission_links', UserPermissionLink, '_user_fk', '_store_name')
     _manager_counter = db.Column(db.Integer)
     _owner_counter = db.Column(db.Integer)
     _admin_counter = db.Column(db.Integer)
@@ -65,7 +83,20 @@ class LoggedInUser(db.Model):
     @orm.reconstructor
     def _init_on_load(self):
         self._purchases = TypedList(Purchase)
-        self._permissions = self._dal.get_permission_with_id_keys_for_user(self._permissions_list, self._user_name)
+        # permissions are loaded on first use, together with all the users loaded in the same session
+        self._permissions = None
+        self._dal.defer_load('user_permissions', self)
+
+    def _load_deferred_permissions(self):
+        """
+        load the permissions of this user, and of all the other users that were loaded in the same session
+        and did not load their permissions yet, with a single query
+        :return: None
+        """
+        users = [u for u in self._dal.take_deferred('user_permissions', self) if u._permissions is None]
+        loaded = self._dal.get_permission_with_id_keys_for_users([u._user_name for u in users])
+        for u in users:
+            u._permissions = loaded[u._user_name]
 
     def get_shopping_cart_of_user(self):
         res = self._dal.get_baskets_by_user(self._user_name)
@@ -120,6 +151,8 @@ class LoggedInUser(db.Model):
 
     @property
     def permissions(self):
+        if self._permissions is None:
+            self._load_deferred_permissions()
         return self._permissions
 
     def add_permission(self, new_permission: pc.Permission):
@@ -131,16 +164,17 @@ class LoggedInUser(db.Model):
         if new_permission._role == pc.Role.system_manager.value:
             self.adding_permission(new_permission, '')
             return True
-        elif new_permission._store_fk in self._permissions:
+        elif new_permission._store_fk in self.permissions:
             return False  # permission to this store already exists
         else:
             self.adding_permission(new_permission, new_permission._store_fk)
             return True
 
     def adding_permission(self, new_permission, name):
-        self._permissions_list.append(name)
+        # the names are not read to add one
+        LoggedInUser._permissions_list.add(self, [name])
         self._dal.add(self, add_only=True)
-        self._permissions[name] = new_permission
+        self.permissions[name] = new_permission
 
     def remove_permission(self, store_name: str):
         """
@@ -151,7 +185,7 @@ class LoggedInUser(db.Model):
 
         if store_name in self._permissions_list:
             self._permissions_list.remove(store_name)
-        perm_to_remove = self._permissions.pop(store_name)
+        perm_to_remove = self.permissions.pop(store_name)
         self._dal.add(perm_to_remove, add_only=True)
 
     def view_all_purchases(self):
@@ -188,14 +222,15 @@ class LoggedInUser(db.Model):
 
 
 class User:
-    _user_id = None
+    # a user is kept in memory for every visitor, even one that only opened the site - no __dict__ for each of them
+    __slots__ = ('_user_id', '_shopping_cart', '_state')
     _dal: DAL = DAL.get_instance()
 
     def __init__(self, guest_id):
-        shopping_cart = ShoppingCart()
         # self._dal.add(shopping_cart, add_only=True)
         self._user_id = guest_id
-        self._shopping_cart: ShoppingCart = shopping_cart
+        # created on first use, most guests never add a product
+        self._shopping_cart: ShoppingCart = None
         self._state = None
 
     # class User:
@@ -221,8 +256,16 @@ class User:
     def shopping_cart(self):
         # if LIU == null --> return shopping cart
         # else go to dal and get shopping cart
+        if self._shopping_cart is None:
+            self._shopping_cart = ShoppingCart()
         return self._shopping_cart
 
+    def has_products_in_cart(self):
+        """
+        :return: True if the cart of the user has a basket, False otherwise. does not create the cart
+        """
+        return self._shopping_cart is not None and not self._shopping_cart.is_empty()
+
     @property
     def user_id(self):
         return self._user_id
@@ -1,3 +1,5 @@
+import time
+
 import requests
 
 
@@ -155,3 +157,22 @@ class MockPaymentSystem(_PaymentSystem):
             print("Account already exist!")
         else:
             self.accounts[card_number] = amount
+
+
+class DelayedMockPaymentSystem(MockPaymentSystem):
+    """
+    MockPaymentSystem that answers only after a delay, like a remote payment system does.
+    used for measuring how slow payments affect the rest of the system
+    """
+
+    def __init__(self, delay_sec: float):
+        self.delay_sec = delay_sec
+
+    def pay(self, card_number: str, month: str, year: str, holder: str, ccv: str, holder_id: str):
+        """
+        Attempt to pay with parameters, after the delay of the system.
+        :param: card_number, amount
+        :return: Whether card holder has enough to pay amount.
+        """
+        time.sleep(self.delay_sec)
+        return super().pay(card_number, month, year, holder, ccv, holder_id)
@@ -19,3 +19,14 @@ class Publisher:
     def publish(self, msg_type: str, msg, user_name: str = None) -> None:
         # print(f"should send message {msg}")
         self._notification_handler.send_to_client(msg_type, msg, user_name)
+
+    def publish_to_store(self, msg_type: str, msg, store_name: str, user_names: list) -> None:
+        """
+        publish a message to the staff of a store, that is sent to the room of the store instead of to each member
+        :param msg_type: (str) type of the message
+        :param msg: the message
+        :param store_name: (str) name of the store
+        :param user_names: list of names of the staff members
+        :return: None
+        """
+        self._notification_handler.send_to_store(msg_type, msg, store_name, user_names)
@@ -27,6 +27,14 @@ class _ShippingSystem:
         """
         pass
 
+    def is_shipped(self, result) -> bool:
+        """
+        check if the result of shipping a purchase means that it was shipped
+        :param result: what the system returned for the shipping
+        :return: True if the purchase was shipped, False otherwise
+        """
+        return bool(result)
+
     def check_connection(self):
         """
         check that there is a connection with the supply system
@@ -97,6 +105,9 @@ class RealShippingSystem(_ShippingSystem):
 
 class MockShippingSystem(_ShippingSystem):
     VALID_COUNTRIES = {"USA", "China", "Israel", "Russia"}
+    # the answer of ship when the purchase was shipped (the address is OK), otherwise it answers what is wrong with
+    # the address
+    SHIPPED = "OK"
 
     def ship(self, country: str, city: str, street: str, house_number: int, apartment: str = "0",
              floor: int = 0):
@@ -113,6 +124,14 @@ class MockShippingSystem(_ShippingSystem):
         output: str = self.check_address_details(country, city, street, house_number, apartment, floor)
         return output
 
+    def is_shipped(self, result) -> bool:
+        """
+        check if the result of shipping a purchase means that it was shipped
+        :param result: what ship returned
+        :return: True if the purchase was shipped, False otherwise
+        """
+        return result == self.SHIPPED
+
     def check_connection(self):
         """
         check that there is a connection with the supply system
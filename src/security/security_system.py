@@ -1,9 +1,45 @@
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 
+from passlib.context import CryptContext
 from passlib.hash import pbkdf2_sha256
 
 from src.protocol_classes.classes_utils import TypeChecker
 
+# most passwords that are hashed or verified at once, the rest wait for a free worker
+PASSWORD_POOL_SIZE = int(os.environ.get('PASSWORD_POOL_SIZE', 4))
+# rounds of pbkdf2_sha256 of new hashes, a hash with other rounds is replaced when its user logs in
+PASSWORD_HASH_ROUNDS = int(os.environ.get('PASSWORD_HASH_ROUNDS', pbkdf2_sha256.default_rounds))
+
+
+def thread_pool_executor(pool_size: int = PASSWORD_POOL_SIZE):
+    """
+    :param pool_size: (int) number of worker threads
+    :return: function that runs the given function with the given arguments on a worker thread, and returns its
+             result. only the calling thread waits
+    """
+    executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="password_pool")
+    return lambda fn, *args: executor.submit(fn, *args).result()
+
+
+def green_pool_executor(pool_size: int = PASSWORD_POOL_SIZE):
+    """
+    the executor for a server that runs on eventlet - the function runs on a native thread of eventlet.tpool, so only
+    the calling greenlet waits, and the hub keeps serving the other requests
+    :param pool_size: (int) most functions that run at once
+    :return: function that runs the given function with the given arguments on a native thread, and returns its result
+    """
+    import eventlet.semaphore
+    import eventlet.tpool
+    slots = eventlet.semaphore.Semaphore(pool_size)
+
+    def execute(fn, *args):
+        with slots:
+            return eventlet.tpool.execute(fn, *args)
+
+    return execute
+
 
 # The following class uses the pbkdf2_sha256 class
 
@@ -77,3 +113,42 @@ class Encrypter:
                 'lowercase_error': lowercase_error,
                 'symbol_error': symbol_error,
             }
+
+
+class PasswordPool:
+    """
+    hashes and verifies passwords on a bounded pool of workers, instead of on the thread (or greenlet) of the request.
+    pbkdf2 is cpu bound, so a burst of logins would otherwise stall all the other requests of the server
+    """
+
+    def __init__(self, execute=None, rounds: int = PASSWORD_HASH_ROUNDS):
+        """
+        :param execute: function that runs a function on the pool and returns its result (see thread_pool_executor and
+                        green_pool_executor), a pool of PASSWORD_POOL_SIZE threads by default
+        :param rounds: (int) rounds of pbkdf2_sha256 of new hashes
+        """
+        self._execute = execute if execute is not None else thread_pool_executor()
+        self._context = CryptContext(schemes=["pbkdf2_sha256"], pbkdf2_sha256__default_rounds=rounds,
+                                     pbkdf2_sha256__min_rounds=rounds, pbkdf2_sha256__max_rounds=rounds)
+
+    def hash_password(self, password) -> str:
+        """
+        the same as Encrypter.hash_password, on the pool
+        :param password: given password that need to be hashed.
+        :return: hashed password.
+        """
+        if TypeChecker.check_for_non_empty_strings([password]):
+            return self._execute(self._context.hash, password)
+        raise TypeError(f"expected string, instead got {type(password)}")
+
+    def verify_password(self, provided_password, stored_password) -> tuple:
+        """
+        the same as Encrypter.verify_password, on the pool. a matching hash with other rounds than the configured ones
+        is hashed again, so it can be replaced
+        :param provided_password: password of user.
+        :param stored_password: an existing hash password.
+        :return: tuple of (True if the password matches the hash, the new hash to store or None)
+        """
+        if TypeChecker.check_for_non_empty_strings([provided_password, stored_password]):
+            return self._execute(self._context.verify_and_update, provided_password, stored_password)
+        return False, None
@@ -8,16 +8,19 @@ class SysAdminHandler:
         self.logger = Log.get_instance().get_logger()
         self.sys = SystemFacade.get_instance()
 
-    def watch_store_purchase(self, requesting_user_id: int, store_name: str):
+    def watch_store_purchase(self, requesting_user_id: int, store_name: str, cursor: str = None, limit: int = None):
         """
-        Returns specific store purchases history
+        Returns one page of specific store purchases history, newest first
         :param requesting_user_id:(int) Should be a manager / store owner or someone else with valid permissions
         :param store_name: The user, that his/she purchases is requested
-        :return: List of Purchases a store had, empty list if there was an error or there were no purchases at all
+        :param cursor: (str) next_cursor of the previous page, None for the first page
+        :param limit: (int) maximum number of purchases in the page, None for the default page size
+        :return: Result with dictionary of {"purchases": list of Purchases in the page, "next_cursor": cursor of the
+                next page or None if there are no more purchases}
         """
         try:
             self.sys.renew_session()
-            res: Result = self.sys.watch_store_purchase(requesting_user_id, store_name)
+            res: Result = self.sys.watch_store_purchase(requesting_user_id, store_name, cursor, limit)
             self.sys.drop_session()
             if res.succeed:
                 self.logger.info(
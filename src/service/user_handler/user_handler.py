@@ -8,7 +8,7 @@ from src.domain.system.system_facade import SystemFacade
 from src.domain.system.users_classes import User, LoggedInUser
 from src.logger.log import Log
 from src.protocol_classes.classes_utils import Result, TypeChecker
-from src.security.security_system import Encrypter
+from src.security.security_system import Encrypter, PasswordPool
 
 
 class RegistrationErrors(enum.Enum):
@@ -20,10 +20,15 @@ class RegistrationErrors(enum.Enum):
 
 
 class UserHandler:
-    def __init__(self, notification_handler: NotificationHandler):
+    def __init__(self, notification_handler: NotificationHandler, password_pool: PasswordPool = None):
+        """
+        :param notification_handler: (NotificationHandler) handler of the notifications of the users
+        :param password_pool: (PasswordPool) pool that hashes and verifies the passwords, a pool of threads by default
+        """
         self.logger = Log.get_instance().get_logger()
         self.sys: SystemFacade = SystemFacade.get_instance()
         self.notification_handler = notification_handler
+        self.password_pool = password_pool if password_pool is not None else PasswordPool()
 
     def user_state_is_none(self, user_id: int):
         self.sys.renew_session()
@@ -32,6 +37,14 @@ class UserHandler:
         self.sys.drop_session()
         return res
 
+    def is_logged_in(self, user_id: int) -> bool:
+        """
+        the check of every request of a logged in user - only the users in memory are read, so it takes no session
+        :param user_id: (int) id of the user
+        :return: True if the user is logged in, False otherwise
+        """
+        return self.sys.user_state_is_none(user_id).data is not None
+
     def get_store_by_name(self, storename: str):
         self.sys.renew_session()
 
@@ -95,7 +108,7 @@ class UserHandler:
                 is_valid = False
                 registration_errors[RegistrationErrors.user_already_exist] = True
             if is_valid:
-                password = Encrypter.hash_password(password)  # hash password
+                password = self.password_pool.hash_password(password)  # hash password
                 try:
                     res: Result = self.sys.register(user_id, username, password, email)
                     if res.succeed:
@@ -148,7 +161,12 @@ class UserHandler:
                 self.sys.drop_session()
                 return Result(False, -1, "Login Failed", None)
             user: LoggedInUser = result.data
-            if result.succeed and Encrypter.verify_password(password, user.password):
+            verified, new_hash = self.password_pool.verify_password(password, user.password) if result.succeed \
+                else (False, None)
+            if verified:
+                if new_hash is not None:
+                    # the hash has other rounds than the configured ones, it is committed with the login
+                    user.password = new_hash
                 final_user_id = user_id if result.requesting_id == -1 else result.requesting_id
                 res: Result = self.sys.login(final_user_id, user)
                 if res.succeed:
@@ -92,7 +92,7 @@ class RealBridge(ProxyBridge):
                 raise AcceptanceTestError("View Store Purchases failed:\n "
                                           f"Parameter- User_id: {user_id}, store_name {store_name}")
             else:
-                return res.data
+                return res.data['purchases']
 
     # -------------------------------Shopping interface-----------------------------------
 
@@ -491,7 +491,7 @@ class RealBridge(ProxyBridge):
                 raise AcceptanceTestError("View System Purchases failed\n:"
                                           f"Parameters user_id {user_id}")
             else:
-                return res.data
+                return res.data['purchases']
 
     # -------------------------------------SETUP FUNCTIONS---------------------------
 
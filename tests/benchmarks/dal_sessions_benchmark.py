@@ -0,0 +1,69 @@
+"""
+Concurrency benchmark for the request scoped DAL sessions.
+
+Every simulated request opens its own session (renew_session), reads a registered user, waits a few milliseconds
+to stand for the time a real request spends outside the database (serialization, sockets, external systems)
+and drops its session. With one global session lock the throughput stays flat no matter how many clients there
+are; with a session per greenlet / thread it should grow with the number of concurrent clients.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.dal_sessions_benchmark
+"""
+import os
+import threading
+import time
+
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, reset_db
+
+NUM_OF_USERS = 50
+REQUESTS_PER_CLIENT = 40
+CLIENTS = [1, 2, 4, 8, 16]
+OUTSIDE_DB_WORK_SEC = 0.005
+
+
+def set_up(dal: DAL):
+    dal.renew_session()
+    dal.add_all([LoggedInUser(f"user{i}", "password", f"user{i}@mail.com") for i in range(NUM_OF_USERS)],
+                add_only=True)
+    dal.drop_session()
+
+
+def simulated_request(dal: DAL, i: int):
+    dal.renew_session()
+    dal.get_user_by_name(f"user{i % NUM_OF_USERS}")
+    time.sleep(OUTSIDE_DB_WORK_SEC)
+    dal.drop_session()
+
+
+def run_clients(dal: DAL, num_of_clients: int):
+    def client(client_id):
+        for i in range(REQUESTS_PER_CLIENT):
+            simulated_request(dal, client_id + i)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(num_of_clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return num_of_clients * REQUESTS_PER_CLIENT / (time.perf_counter() - start)
+
+
+def main():
+    reset_db()
+    with test_flask.app_context():
+        data_handler = DataHandler.get_instance()
+        data_handler.create_all(lambda dbi: dbi.init_app(test_flask))
+        dal = DAL.get_instance()
+        set_up(dal)
+        print(f"{'clients':>8} | {'requests/sec':>12}")
+        for num_of_clients in CLIENTS:
+            print(f"{num_of_clients:>8} | {run_clients(dal, num_of_clients):>12.1f}")
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark for the management views of the discounts and the policies of a store with deep trees.
+
+The discount tree and the policy tree of a store are built in LEVELS levels: every level combines the previous level
+with NODES_PER_LEVEL new leaves, so every complex node holds the description of the whole tree under it. the views are
+then fetched REPEATS times without changes to the store, and the average time of the first fetch and of the next ones
+is printed. before the cache, every fetch described every node again, and the description of a complex node described
+all the nodes under it again.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.descriptions_benchmark
+"""
+import time
+from datetime import datetime, timedelta
+
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from src.protocol_classes.classes_utils import TypedList
+from tests.db_config_tests import test_flask, reset_db
+
+LEVELS = 30
+NODES_PER_LEVEL = 5
+PRODUCTS = 20
+REPEATS = 20
+END_TIME = datetime.now() + timedelta(days=1)
+
+dal = DAL.get_instance()
+
+
+def build_store(owner: LoggedInUser):
+    store = Store("described", owner.user_name, True, datetime.now(), None, None, owner)
+    dal.add(store)
+    for i in range(PRODUCTS):
+        store.add_product(f"p{i}", 10.0, 1000, "brand", TypedList(str, [f"c{i % 5}"]))
+    discount_subtree, policy_subtree = None, None
+    for level in range(LEVELS):
+        discounts = [store.add_simple_product_discount(END_TIME, 0.01, f"p{(level + i) % PRODUCTS}").data
+                     for i in range(NODES_PER_LEVEL)]
+        policies = [store.add_policy(None, None, f"p{(level + i) % PRODUCTS}", None, 100 + i, None, None, None, "")
+                    .data for i in range(NODES_PER_LEVEL)]
+        if discount_subtree is not None:
+            discounts.append(discount_subtree)
+            policies.append(policy_subtree)
+        discount_subtree = store.combine_discounts(discounts, "or").data
+        store.combine_policies(policies, "and")
+        policy_subtree = list(store.shopping_policies.shop_policies_dict.keys())[-1]
+    return store
+
+
+def time_view(view) -> tuple:
+    """
+    :return: tuple of (ms of the first call, average ms of the next calls)
+    """
+    start = time.perf_counter()
+    view()
+    first = (time.perf_counter() - start) * 1_000
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        view()
+    return first, (time.perf_counter() - start) / REPEATS * 1_000
+
+
+def main():
+    reset_db()
+    with test_flask.app_context():
+        DataHandler.get_instance().create_all(lambda dbi: dbi.init_app(test_flask))
+        owner = LoggedInUser("bench_owner", "password", "bench@mail.com")
+        dal.add(owner)
+        store = build_store(owner)
+        nodes = LEVELS * (NODES_PER_LEVEL + 1)
+        print(f"{nodes} discounts and {nodes} policies in {LEVELS} levels, {PRODUCTS} products:")
+        views = [("discounts", store.fetch_all_discounts), ("policies", store.fetch_shopping_policies),
+                 ("products", lambda: [p.to_dictionary() for p in store.inventory.values()])]
+        for name, view in views:
+            first, next_calls = time_view(view)
+            print(f"    {name}: first fetch {first:.1f} ms, next fetches {next_calls:.2f} ms")
+        dal.discard_session()
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
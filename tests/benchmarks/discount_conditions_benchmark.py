@@ -0,0 +1,81 @@
+"""
+Microbenchmark for checking the conditions of the discounts of a store while pricing a basket.
+
+The store root holds DISCOUNTS product discounts, every one of them with a condition on the size of the basket, on the
+price and quantity of a few categories and on the price and quantity of a few products, all of them answered by the
+basket, so every condition is checked to its end. a basket with a line for every one of BASKET_PRODUCTS products is
+priced again and again through the compiled discount plan of the store, and the average time of a pricing is printed.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.discount_conditions_benchmark
+"""
+import time
+from datetime import datetime, timedelta
+
+from src.domain.system.DAL import DAL
+from src.domain.system.cart_purchase_classes import Basket
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from src.protocol_classes.classes_utils import TypedList
+from tests.db_config_tests import test_flask, reset_db
+
+DISCOUNTS = 200
+BASKET_PRODUCTS = 100
+CATEGORIES = 10
+CONDITIONS_PER_KIND = 3
+REPEATS = 20
+END_TIME = datetime.now() + timedelta(days=1)
+
+dal = DAL.get_instance()
+
+
+def build_store(owner: LoggedInUser):
+    store = Store("conditions", owner.user_name, True, datetime.now(), None, None, owner)
+    dal.add(store)
+    for i in range(BASKET_PRODUCTS):
+        store.add_product(f"p{i}", 10.0, 1000, "brand", TypedList(str, [f"c{i % CATEGORIES}"]))
+    for i in range(DISCOUNTS):
+        categories = [f"c{(i + j) % CATEGORIES}" for j in range(CONDITIONS_PER_KIND)]
+        products = [f"p{(i + j) % BASKET_PRODUCTS}" for j in range(CONDITIONS_PER_KIND)]
+        store.add_simple_product_discount(END_TIME, 0.01, f"p{i % BASKET_PRODUCTS}", BASKET_PRODUCTS,
+                                          [{"category_name": c, "needed_price": 1} for c in categories],
+                                          [{"product_name": p, "needed_price": 1} for p in products],
+                                          [{"product_name": p, "needed_items": 1} for p in products],
+                                          [{"category_name": c, "needed_items": 1} for c in categories])
+    return store
+
+
+def make_basket(store: Store):
+    basket = Basket(store.name, None, "bench_owner")
+    dal.add(basket)
+    for i in range(BASKET_PRODUCTS):
+        basket.add_product_to_basket(f"p{i}", 2)
+    return basket
+
+
+def main():
+    reset_db()
+    with test_flask.app_context():
+        DataHandler.get_instance().create_all(lambda dbi: dbi.init_app(test_flask))
+        owner = LoggedInUser("bench_owner", "password", "bench@mail.com")
+        dal.add(owner)
+        store = build_store(owner)
+        basket = make_basket(store)
+        store.apply_discount_on_basket(basket)
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            for p in basket.products.values():
+                p.update_total_price()
+            store.apply_discount_on_basket(basket)
+        elapsed = (time.perf_counter() - start) / REPEATS * 1_000
+        # the size of the basket, and the price and quantity of the categories and the products
+        conditions = 1 + 4 * CONDITIONS_PER_KIND
+        print(f"{DISCOUNTS} discounts with {conditions} conditions each, {BASKET_PRODUCTS} lines: "
+              f"{elapsed:.2f} ms per pricing")
+        dal.discard_session()
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
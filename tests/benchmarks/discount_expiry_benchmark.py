@@ -0,0 +1,95 @@
+"""
+Benchmark for pricing baskets of a store that most of its discounts expired.
+
+The store holds EXPIRED product discounts that their end time passed and VALID ones that are still valid, on
+BASKET_PRODUCTS products. a basket with a line for every product is priced again and again before and after the
+expired discounts are removed by the discount expiry schedule, and the average time of a pricing is printed with the
+time it took to remove all the expired discounts of the store in a single batch. before the schedule, the expired
+discounts stayed in the tree, and their conditions were checked on every pricing.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.discount_expiry_benchmark
+"""
+import time
+from datetime import datetime, timedelta
+
+from src.domain.system.DAL import DAL
+from src.domain.system.cart_purchase_classes import Basket
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.discount_expiry import DiscountExpiry
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from src.external.publisher import Publisher
+from src.protocol_classes.classes_utils import TypedList
+from tests.db_config_tests import test_flask, reset_db
+
+EXPIRED = 1_000
+VALID = 50
+BASKET_PRODUCTS = 100
+REPEATS = 50
+STORE_NAME = "expiring"
+
+dal = DAL.get_instance()
+
+
+class SilentNotifications:
+    def send_to_client(self, msg_type, msg, user_name=None):
+        pass
+
+    def send_to_store(self, msg_type, msg, store_name, user_names):
+        pass
+
+
+def build_store(owner: LoggedInUser):
+    store = Store(STORE_NAME, owner.user_name, True, datetime.now(), None, None, owner)
+    dal.add(store)
+    for i in range(BASKET_PRODUCTS):
+        store.add_product(f"p{i}", 10.0, 1000, "brand", TypedList(str, [f"c{i % 10}"]))
+    expired_at = datetime.now() - timedelta(days=1)
+    valid_until = datetime.now() + timedelta(days=1)
+    for i in range(EXPIRED + VALID):
+        end_time = expired_at if i < EXPIRED else valid_until
+        store.add_simple_product_discount(end_time, 0.01, f"p{i % BASKET_PRODUCTS}", None, [], [],
+                                          [{"product_name": f"p{i % BASKET_PRODUCTS}", "needed_items": 1}], [])
+
+
+def time_pricing() -> float:
+    dal.renew_session()
+    store = dal.query(Store).filter_by(_name=STORE_NAME).one()
+    basket = Basket(STORE_NAME, None, "bench_owner")
+    for i in range(BASKET_PRODUCTS):
+        basket.add_product_to_basket(f"p{i}", 2)
+    store.apply_discount_on_basket(basket)
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        for p in basket.products.values():
+            p.update_total_price()
+        store.apply_discount_on_basket(basket)
+    elapsed = (time.perf_counter() - start) / REPEATS * 1_000
+    dal.discard_session()
+    return elapsed
+
+
+def main():
+    reset_db()
+    with test_flask.app_context():
+        DataHandler.get_instance().create_all(lambda dbi: dbi.init_app(test_flask))
+        Publisher.get_instance().set_communication_handler(SilentNotifications())
+        owner = LoggedInUser("bench_owner", "password", "bench@mail.com")
+        dal.add(owner)
+        build_store(owner)
+        dal.drop_session()
+        before = time_pricing()
+        start = time.perf_counter()
+        removed = DiscountExpiry.get_instance().remove_due()
+        pruned = (time.perf_counter() - start) * 1_000
+        assert len(removed[STORE_NAME]) == EXPIRED
+        after = time_pricing()
+        print(f"{EXPIRED} expired and {VALID} valid discounts, {BASKET_PRODUCTS} lines:")
+        print(f"    pricing with the expired discounts {before:.2f} ms, after they were removed {after:.2f} ms")
+        print(f"    removing the expired discounts in one batch: {pruned:.1f} ms")
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark for editing and removing discounts and policies of a store with deep trees.
+
+The discount tree and the policy tree of a store are built in LEVELS levels: every level combines the previous level
+with NODES_PER_LEVEL new leaves, so most of the nodes are deep in the tree. EDITS random discounts and policies are then
+edited (replaced by a new leaf) and removed, and the average time of an operation is printed. before the index, every
+operation searched the tree from its root; after it, the node and its parent are found in the index of the store.
+the time of finding a discount alone, by a search of the tree and by the index, is printed as well, and the time of
+finding a node in a store that was just loaded again, as every request loads it.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.discount_index_benchmark
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from src.protocol_classes.classes_utils import TypedList
+from tests.db_config_tests import test_flask, reset_db
+
+LEVELS = 60
+NODES_PER_LEVEL = 5
+PRODUCTS = 20
+EDITS = 100
+LOADED_LOOKUPS = 20
+STORE_NAME = "deep_trees"
+END_TIME = datetime.now() + timedelta(days=1)
+
+dal = DAL.get_instance()
+
+
+def build_store(owner: LoggedInUser):
+    store = Store(STORE_NAME, owner.user_name, True, datetime.now(), None, None, owner)
+    dal.add(store)
+    for i in range(PRODUCTS):
+        store.add_product(f"p{i}", 10.0, 1000, "brand", TypedList(str, [f"c{i % 5}"]))
+    discount_leaves, policy_leaves = [], []
+    discount_subtree, policy_subtree = None, None
+    for level in range(LEVELS):
+        discounts = [store.add_simple_product_discount(END_TIME, 0.01, f"p{(level + i) % PRODUCTS}").data
+                     for i in range(NODES_PER_LEVEL)]
+        policies = [store.add_policy(None, None, f"p{(level + i) % PRODUCTS}", None, 100 + i, None, None, None, "")
+                    .data for i in range(NODES_PER_LEVEL)]
+        discount_leaves += discounts
+        policy_leaves += policies
+        if discount_subtree is not None:
+            discounts.append(discount_subtree)
+            policies.append(policy_subtree)
+        discount_subtree = store.combine_discounts(discounts, "or").data
+        store.combine_policies(policies, "and")
+        policy_subtree = list(store.shopping_policies.shop_policies_dict.keys())[-1]
+    return store, discount_leaves, policy_leaves
+
+
+def time_operations(ids: list, operation) -> float:
+    start = time.perf_counter()
+    for node_id in ids:
+        result = operation(node_id)
+        assert result.succeed, result.msg
+    return (time.perf_counter() - start) / len(ids) * 1_000
+
+
+def main():
+    reset_db()
+    rng = random.Random(0)
+    with test_flask.app_context():
+        DataHandler.get_instance().create_all(lambda dbi: dbi.init_app(test_flask))
+        owner = LoggedInUser("bench_owner", "password", "bench@mail.com")
+        dal.add(owner)
+        store, discount_leaves, policy_leaves = build_store(owner)
+        discounts = rng.sample(discount_leaves, 2 * EDITS)
+        policies = rng.sample(policy_leaves, 2 * EDITS)
+        nodes = LEVELS * (NODES_PER_LEVEL + 1)
+        start = time.perf_counter()
+        for node_id in discount_leaves:
+            store.discount_root.search_for_discount(node_id)
+        searched = (time.perf_counter() - start) / len(discount_leaves) * 1_000_000
+        start = time.perf_counter()
+        for node_id in discount_leaves:
+            store.discount_index.parent_of(node_id)
+        looked_up = (time.perf_counter() - start) / len(discount_leaves) * 1_000_000
+        print(f"finding a discount: search of the tree {searched:.1f} us, index {looked_up:.1f} us")
+        dal.drop_session()
+        for name, leaves, index_name in [("discount", discount_leaves, "discount_index"),
+                                         ("policy", policy_leaves, "policy_index")]:
+            start = time.perf_counter()
+            for node_id in rng.sample(leaves, LOADED_LOOKUPS):
+                dal.renew_session()
+                loaded = dal.query(Store).get(STORE_NAME)
+                getattr(loaded, index_name).parent_of(node_id)
+                dal.discard_session()
+            loaded_ms = (time.perf_counter() - start) / LOADED_LOOKUPS * 1_000
+            print(f"finding a {name} in a loaded store (load included): {loaded_ms:.2f} ms")
+        dal.renew_session()
+        store = dal.query(Store).get(STORE_NAME)
+        print(f"{nodes} discounts and {nodes} policies in {LEVELS} levels, average of {EDITS} operations:")
+        edit = time_operations(discounts[:EDITS], lambda i: store.add_simple_product_discount(END_TIME, 0.02, "p0",
+                                                                                    discount_id=i))
+        remove = time_operations(discounts[EDITS:], store.remove_discount_from_store)
+        print(f"    discounts: edit {edit:.2f} ms, remove {remove:.2f} ms")
+        edit = time_operations(policies[:EDITS], lambda i: store.add_policy(None, None, "p0", None, 50, None, None,
+                                                                            None, "", policy_id=i))
+        remove = time_operations(policies[EDITS:], store.remove_policy_from_store)
+        print(f"    policies: edit {edit:.2f} ms, remove {remove:.2f} ms")
+        dal.discard_session()
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Microbenchmark for pricing a basket through the compiled discount plan of a store.
+
+Two discount trees are built:
+    1. wide - the store root holds a product discount for every product in a large inventory
+    2. deep - every level combines the previous level with a few product and category discounts, alternating
+        XOR, OR and AND
+and a basket with a handful of products is priced again and again. the compiled plan is timed against compiling
+a new plan on every calculation, and, for the wide tree (the only shape the tree apply() handles), against
+walking the discount tree itself.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.discount_plan_benchmark
+"""
+import time
+from datetime import datetime, timedelta
+
+from src.domain.system.DAL import DAL
+from src.domain.system.cart_purchase_classes import Basket
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.discounts import DiscountPlan
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, reset_db, make_store
+
+WIDE_PRODUCTS = 500
+DEEP_LEVELS = 12
+DISCOUNTS_PER_LEVEL = 4
+BASKET_PRODUCTS = 5
+REPEATS = 200
+OPERATORS = ["xor", "or", "and"]
+END_TIME = datetime.now() + timedelta(days=1)
+
+dal = DAL.get_instance()
+
+
+def stock(num_of_products: int):
+    return {f"p{i}": (10.0, 1000, [f"c{i % 10}"]) for i in range(num_of_products)}
+
+
+def build_wide(owner: LoggedInUser):
+    store = make_store("wide", stock(WIDE_PRODUCTS), owner)
+    for i in range(WIDE_PRODUCTS):
+        store.add_simple_product_discount(END_TIME, 0.1, f"p{i}")
+    return store
+
+
+def build_deep(owner: LoggedInUser):
+    store = make_store("deep", stock(DEEP_LEVELS * DISCOUNTS_PER_LEVEL), owner)
+    subtree = None
+    for level in range(DEEP_LEVELS):
+        ids = [store.add_simple_product_discount(END_TIME, 0.05, f"p{level * DISCOUNTS_PER_LEVEL + i}").data
+               for i in range(DISCOUNTS_PER_LEVEL - 1)]
+        ids.append(store.add_simple_category_discount(END_TIME, 0.05, f"c{level % 10}").data)
+        if subtree is not None:
+            ids.append(subtree)
+        subtree = store.combine_discounts(ids, OPERATORS[level % len(OPERATORS)]).data
+    return store
+
+
+def make_basket(store: Store):
+    basket = Basket(store.name, None, "bench_owner")
+    dal.add(basket)
+    for i in range(BASKET_PRODUCTS):
+        basket.add_product_to_basket(f"p{i}", 4)
+    return basket
+
+
+def time_pricing(basket: Basket, price):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        for p in basket.products.values():
+            p.update_total_price()
+        price(basket)
+    return (time.perf_counter() - start) / REPEATS * 1_000
+
+
+def main():
+    reset_db()
+    with test_flask.app_context():
+        DataHandler.get_instance().create_all(lambda dbi: dbi.init_app(test_flask))
+        owner = LoggedInUser("bench_owner", "password", "bench@mail.com")
+        dal.add(owner)
+        print(f"{'tree':>5} | {'discounts':>9} | {'tree apply (ms)':>15} | {'compile each time (ms)':>22} | "
+              f"{'compiled plan (ms)':>18}")
+        for shape, build in [("wide", build_wide), ("deep", build_deep)]:
+            store = build(owner)
+            basket = make_basket(store)
+            num_of_discounts = len(store.get_all_discounts())
+            if shape == "wide":
+                tree = f"{time_pricing(basket, store.discount_root.apply):>15.3f}"
+            else:
+                tree = f"{'-':>15}"
+            recompiled = time_pricing(basket, lambda b: DiscountPlan.compile(store.discount_root).apply(b))
+            compiled = time_pricing(basket, store.apply_discount_on_basket)
+            print(f"{shape:>5} | {num_of_discounts:>9} | {tree} | {recompiled:>22.3f} | {compiled:>18.3f}")
+        dal.discard_session()
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+Throughput benchmark for the SQLAlchemy engine configuration, under the Locust scenario of
+src/communication/client/src/locustfile.py.
+
+The HTTP routes are skipped: every simulated Locust user calls the service handlers the routes call, running the
+weighted tasks of StartUser back to back (no wait time) for DURATION_SEC. Two engine configurations are compared:
+    1. before - SingletonThreadPool, echo on (logged to /dev/null here) and the default rollback journal of sqlite
+    2. after - the engine of db_config.get_engine: a queue pool, echo off, WAL mode and a busy timeout
+Each configuration starts from an empty database.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.engine_pool_benchmark
+"""
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import SingletonThreadPool
+
+from src.domain.system import DAL as dal_module
+from src.domain.system import db_config
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.db_config import db
+from src.service.shopping_interface.shopping_handler import ShoppingHandler
+from src.service.store_inventory_interface.inventory_handler import InventoryHandler
+from src.service.user_handler.user_handler import UserHandler
+from src.communication.notification_handler import NotificationHandler, TestEmitter
+from src.external.publisher import Publisher
+from src.logger.log import Log
+from tests.db_config_tests import test_flask, reset_db
+
+CLIENTS = [1, 4, 8]
+DURATION_SEC = 10
+PASSWORD = "Parker51!"
+PRODUCTS = ['apple', 'banana', 'chocolate', 'candy', 'tomato', 'carrot']
+
+notification_handler = NotificationHandler(TestEmitter())
+Publisher.get_instance().set_communication_handler(notification_handler)
+user_handler = None
+shopping_handler = None
+inventory_handler = None
+
+
+class LocustUser:
+    """
+    the tasks of StartUser in the locustfile that only use the shopping and inventory routes, with their weights
+    """
+
+    def __init__(self, prefix: str, stores: list):
+        self.prefix = prefix
+        self.stores = stores
+        self.requests = 0
+        self.failed = 0
+        self.counter = 0
+        self.tasks = [(self.open_store_and_add_products, 5), (self.search_products_and_stores, 5),
+                      (self.add_item_to_cart_and_purchase, 10), (self.search_store_and_fetch_guest, 3)]
+
+    def run_task(self):
+        task = random.choices([t for t, _ in self.tasks], [w for _, w in self.tasks])[0]
+        task()
+
+    def call(self, handler_function, *args):
+        self.requests += 1
+        res = handler_function(*args)
+        if not res.succeed:
+            self.failed += 1
+        return res
+
+    def register_and_login(self):
+        self.counter += 1
+        user_name = f"{self.prefix}-{self.counter}"
+        user_id = self.call(user_handler.get_user_by_id_if_guest_create_one, -1).data
+        self.call(user_handler.register, user_id, user_name, PASSWORD, f"{user_name}@mail.com")
+        self.call(user_handler.login, user_id, user_name, PASSWORD)
+        return user_id, user_name
+
+    def open_store_and_add_products(self):
+        user_id, user_name = self.register_and_login()
+        store_name = f"store-{user_name}"
+        self.call(inventory_handler.opening_a_new_store, user_id, store_name)
+        self.stores.append(store_name)
+        self.call(inventory_handler.add_product_to_store, user_id, store_name, random.choice(PRODUCTS), 10.0, 100,
+                  "brand", ["food"])
+        self.call(user_handler.logout, user_id)
+
+    def search_products_and_stores(self):
+        user_id, _ = self.register_and_login()
+        if len(self.stores) > 0:
+            self.call(shopping_handler.search_stores, user_id, random.choice(self.stores))
+        self.search_product(user_id)
+        self.call(user_handler.logout, user_id)
+
+    def add_item_to_cart_and_purchase(self):
+        user_id, _ = self.register_and_login()
+        found = self.search_product(user_id)
+        if found is not None:
+            product_name, store_name = found
+            self.call(shopping_handler.saving_product_to_shopping_cart, product_name, store_name, user_id, 5)
+            self.call(shopping_handler.purchase_items, user_id, 4444444444444444, "Israel", "Eilat", "Ella", 5,
+                      "08/30", "123", "holder", "236564123")
+        self.call(user_handler.logout, user_id)
+
+    def search_store_and_fetch_guest(self):
+        if len(self.stores) > 0:
+            store_name = random.choice(self.stores)
+            self.call(shopping_handler.search_stores, -1, store_name)
+            self.call(shopping_handler.watch_info_on_store, "", store_name)
+
+    def search_product(self, user_id: int):
+        res = self.call(shopping_handler.search_products, user_id, random.choice(PRODUCTS), None, None, None, 0, 50)
+        if res.succeed and res.data:
+            found = res.data[0]
+            return found['product']['product']['name'], found['store_name']
+        return None
+
+
+def before_engine(uri: str):
+    devnull = open(os.devnull, 'w')
+    stdout, sys.stdout = sys.stdout, devnull  # the echo handler writes to the stdout of its creation time
+    try:
+        return create_engine(uri, poolclass=SingletonThreadPool, echo=True)
+    finally:
+        sys.stdout = stdout
+
+
+def foreign_keys_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+@contextmanager
+def pragmas(configuration: str):
+    """
+    the WAL pragmas of db_config are replaced with the foreign keys pragma alone for the "before" configuration
+    """
+    if configuration == "after":
+        yield
+        return
+    event.remove(Engine, "connect", db_config.set_sqlite_pragma)
+    event.listen(Engine, "connect", foreign_keys_only)
+    try:
+        yield
+    finally:
+        event.remove(Engine, "connect", foreign_keys_only)
+        event.listen(Engine, "connect", db_config.set_sqlite_pragma)
+
+
+def run_clients(configuration: str, num_of_clients: int):
+    stores = []
+    stop_at = time.perf_counter() + DURATION_SEC
+    users = [LocustUser(f"{configuration}{num_of_clients}-{c}", stores) for c in range(num_of_clients)]
+    errors = []
+
+    def client(user: LocustUser):
+        with test_flask.app_context():
+            try:
+                while time.perf_counter() < stop_at:
+                    user.run_task()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=client, args=(u,)) for u in users]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    requests = sum(u.requests for u in users)
+    failed = sum(u.failed for u in users)
+    return requests / (time.perf_counter() - start), failed / max(requests, 1) * 100, len(errors)
+
+
+def main():
+    global user_handler, shopping_handler, inventory_handler
+    uri = db_config.database_uri()
+    shared_engine = db_config.get_engine(uri)
+    with test_flask.app_context():
+        DataHandler.get_instance().create_all(lambda dbi: dbi.init_app(test_flask))
+    user_handler = UserHandler(notification_handler)
+    shopping_handler = ShoppingHandler()
+    inventory_handler = InventoryHandler()
+    Log.get_instance().disable_logger()
+    print(f"{'engine':>7} | {'clients':>7} | {'requests/sec':>12} | {'failed requests (%)':>19} | "
+          f"{'crashed clients':>15}")
+    for configuration, make_engine in [("before", before_engine), ("after", db_config._create_engine)]:
+        for num_of_clients in CLIENTS:
+            shared_engine.dispose()
+            reset_db()
+            with pragmas(configuration):
+                engine = make_engine(uri)
+                dal_module.Session.configure(bind=engine)
+                dal_module.ScopedSession.remove()
+                db.metadata.create_all(bind=engine)
+                throughput, failed, crashed = run_clients(configuration, num_of_clients)
+                engine.dispose()
+            print(f"{configuration:>7} | {num_of_clients:>7} | {throughput:>12.1f} | {failed:>19.1f} | "
+                  f"{crashed:>15}")
+    dal_module.Session.configure(bind=shared_engine)
+    shared_engine.dispose()
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Soak benchmark for the memory of the guest users.
+
+VISITS guests open the site, as a crawler or a load test does - each visit creates a guest user, as /is_logged does
+for a client without a user id. The resident memory of the process is printed every CHECKPOINT visits, with the guest
+users evicted (the default GUEST_USERS_LIMIT) and with all the guests kept in memory, as before. Each mode runs in a
+process of its own.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.guest_soak_benchmark
+"""
+import multiprocessing
+
+from src.domain.system.data_handler import DataHandler, GUEST_USERS_LIMIT
+from src.domain.system.users_classes import UserSystemHandler
+
+VISITS = 1_000_000
+CHECKPOINT = 250_000
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def soak(guest_users_limit: int):
+    data_handler = DataHandler.get_instance()
+    data_handler._guest_users_limit = guest_users_limit
+    users_handler = UserSystemHandler(data_handler)
+    start_rss = rss_mb()
+    report = []
+    for visit in range(1, VISITS + 1):
+        users_handler.get_user_by_id_if_guest_create_one(-1)
+        if visit % CHECKPOINT == 0:
+            report.append(f"{visit}: +{rss_mb() - start_rss:.0f} MB ({len(data_handler.users)} users)")
+    print(f"guest users limit {guest_users_limit}: " + ", ".join(report))
+
+
+def main():
+    for guest_users_limit in [GUEST_USERS_LIMIT, VISITS]:
+        process = multiprocessing.Process(target=soak, args=(guest_users_limit,))
+        process.start()
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark for the id lists of stores, users, products and composite discounts/policies, that are kept in indexed
+association tables instead of json columns.
+
+A store with a large inventory, a product discount on every product and a large staff is built, and four
+operations are timed:
+    1. load - a store and its inventory are loaded in a new session
+    2. purchase - a cart with a few products of the store is bought and committed
+    3. remove discount - a discount is removed from the store, which looks up the products it applied on to re-check
+        their discounts
+    4. add member - a new staff member is added to the store and committed
+The benchmark only uses the store API, so it can be copied to an older tree to compare.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.id_lists_benchmark
+"""
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.permission_classes import Permission, Role
+from src.domain.system.store_classes import Store
+from src.domain.system.store_managers_classes import ShoppingHandler
+from src.domain.system.users_classes import LoggedInUser, User
+from src.external.payment_interface.payment_system import MockPaymentSystem
+from src.external.publisher import Publisher
+from src.external.supply_interface.supply_system import MockShippingSystem
+from src.protocol_classes.classes_utils import TypedList
+from tests.db_config_tests import test_flask, reset_db
+
+PRODUCTS = 500
+STAFF = 200
+CART_PRODUCTS = 5
+REPEATS = 20
+STORE_NAME = "id_lists_store"
+END_TIME = datetime.now() + timedelta(days=1)
+
+dal = DAL.get_instance()
+
+
+class SilentNotifications:
+    def send_to_client(self, msg_type, msg, user_name=None):
+        pass
+
+    def send_to_store(self, msg_type, msg, store_name, user_names):
+        pass
+
+
+def add_member(store: Store, owner: LoggedInUser, user_name: str):
+    user = LoggedInUser(user_name, "password", f"{user_name}@mail.com")
+    dal.add(user)
+    store.add_store_member(Permission(store.name, user_name, owner.user_name, Role.store_manager, user_obj=user,
+                                      store_obj=store))
+
+
+def build_store():
+    owner = LoggedInUser("id_lists_owner", "password", "owner@mail.com")
+    store = Store(STORE_NAME, owner.user_name, True, datetime.now(), None, None, owner)
+    dal.add_all([owner, store])
+    for i in range(PRODUCTS):
+        store.add_product(f"p{i}", 10.0, 1000, "brand", TypedList(str, ["food"]))
+    discount_ids = [store.add_simple_product_discount(END_TIME, 0.1, f"p{i}").data for i in range(PRODUCTS)]
+    for i in range(STAFF):
+        add_member(store, owner, f"staff{i}")
+    dal.commit()
+    return discount_ids
+
+
+def purchase(handler: ShoppingHandler, user_id: int):
+    handler._data_handler.add_or_update_user(user_id, User(user_id))
+    for i in range(CART_PRODUCTS):
+        assert handler.saving_product_to_shopping_cart(f"p{i}", STORE_NAME, user_id, 1).succeed
+    dal.commit()
+    res = handler.make_purchase_of_all_shopping_cart(user_id, 1234123412341234, "Israel", "Beer Sheva", "Rager", 1,
+                                                     "12/30", "123", "holder", "1")
+    assert res.succeed, res.msg
+
+
+def remove_discount(store: Store, discount_id: int):
+    res = store.remove_discount_from_store(discount_id)
+    assert res.succeed, res.msg
+
+
+def time_ms(action) -> float:
+    start = time.perf_counter()
+    action()
+    return (time.perf_counter() - start) * 1_000
+
+
+def load_store():
+    # the store of a permission, as the store administration gets it
+    dal.renew_session()
+    return dal.query(Store).filter(Store._name == STORE_NAME).one()
+
+
+def load():
+    store = load_store()
+    # the discounts of a product are a part of its price, the staff is not needed to show the store
+    return [list(p._discounts) for p in store.inventory.values()]
+
+
+def main():
+    reset_db()
+    with test_flask.app_context():
+        data_handler = DataHandler.get_instance()
+        data_handler.create_all(lambda dbi: dbi.init_app(test_flask))
+        Publisher.get_instance().set_communication_handler(SilentNotifications())
+        discount_ids = build_store()
+        loads = [time_ms(load) for _ in range(REPEATS)]
+        handler = ShoppingHandler(data_handler, MockPaymentSystem(), MockShippingSystem())
+        purchases = []
+        for i in range(REPEATS):
+            dal.renew_session()
+            purchases.append(time_ms(lambda: purchase(handler, 1000 + i)))
+        store = load_store()
+        removals = [time_ms(lambda: remove_discount(store, discount_ids[i])) for i in range(REPEATS)]
+        owner = dal.get_user_by_name("id_lists_owner")
+        additions = [time_ms(lambda: (add_member(store, owner, f"new_staff{i}"), dal.commit())) for i in
+                     range(REPEATS)]
+        dal.drop_session()
+    print(f"{PRODUCTS} products with a discount each, {STAFF} staff members, median of {REPEATS} runs")
+    print(f"{'operation':>15} | {'ms':>8}")
+    for name, times in [("load", loads), ("purchase", purchases), ("remove discount", removals), ("add member", additions)]:
+        print(f"{name:>15} | {statistics.median(times):>8.2f}")
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
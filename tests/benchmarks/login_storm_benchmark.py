@@ -0,0 +1,67 @@
+"""
+Benchmark for the latency of cheap requests during a burst of logins, on eventlet as the server runs.
+
+LOGINS greenlets verify a password at once - as before, on the greenlet of the request (Encrypter.verify_password),
+and on the pool of the server (PasswordPool with green_pool_executor). Meanwhile another greenlet serves cheap
+requests (a search in a list of products) one after the other, and the p50 / p99 / max latency of the requests during
+the logins is printed, with the time until all the logins end. PASSWORD_POOL_SIZE sets the size of the pool.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.login_storm_benchmark
+"""
+import time
+
+import eventlet
+
+from src.security.security_system import Encrypter, PasswordPool, green_pool_executor
+
+LOGINS = 200
+PRODUCTS = [f"product {i}" for i in range(1_000)]
+
+
+def search() -> list:
+    # the request waits for its turn on the hub, as a request that reads from a socket does
+    eventlet.sleep(0)
+    return [name for name in PRODUCTS if name.endswith("7")]
+
+
+def percentile(latencies: list, fraction: float) -> float:
+    return sorted(latencies)[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def storm(verify) -> tuple:
+    stored = Encrypter.hash_password("!,fldmAd12s")
+    latencies = []
+    logins = []
+
+    def serve():
+        while len(logins) == 0 or not all(login.dead for login in logins):
+            request_start = time.perf_counter()
+            search()
+            if len(logins) > 0:
+                latencies.append((time.perf_counter() - request_start) * 1_000)
+
+    server = eventlet.spawn(serve)
+    # the server is busy when the logins arrive
+    eventlet.sleep(0.05)
+    start = time.perf_counter()
+    logins.extend(eventlet.spawn(verify, "!,fldmAd12s", stored) for _ in range(LOGINS))
+    for login in logins:
+        login.wait()
+    logins_ms = (time.perf_counter() - start) * 1_000
+    server.wait()
+    return latencies, logins_ms
+
+
+def main():
+    pool = PasswordPool(green_pool_executor())
+    for name, verify in [("on the request greenlet", Encrypter.verify_password),
+                         ("on the password pool", pool.verify_password)]:
+        latencies, logins_ms = storm(verify)
+        print(f"{LOGINS} logins {name}: {logins_ms:.0f} ms, {len(latencies)} searches meanwhile, latency p50 "
+              f"{percentile(latencies, 0.5):.2f} ms, p99 {percentile(latencies, 0.99):.2f} ms, "
+              f"max {max(latencies):.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
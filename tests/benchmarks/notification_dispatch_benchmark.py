@@ -0,0 +1,98 @@
+"""
+Benchmark for the notifications of a purchase to the staff of the store.
+
+A purchase notifies every staff member of the store. The staff members are not connected, so each notification is
+saved as a pending message. The purchases are timed once with the notification handler called by the purchase
+itself, and once with the NotificationDispatcher, that sends the notifications from a background worker (the worker
+is drained after each purchase, outside of the timing).
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.notification_dispatch_benchmark
+"""
+import statistics
+import time
+from datetime import datetime
+
+from src.communication.notification_dispatcher import NotificationDispatcher
+from src.communication.notification_handler import NotificationHandler, TestEmitter
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.permission_classes import Permission, Role
+from src.domain.system.store_classes import Store
+from src.domain.system.store_managers_classes import ShoppingHandler
+from src.domain.system.users_classes import LoggedInUser, User
+from src.external.payment_interface.payment_system import MockPaymentSystem
+from src.external.publisher import Publisher
+from src.external.supply_interface.supply_system import MockShippingSystem
+from src.protocol_classes.classes_utils import TypedList
+from tests.db_config_tests import test_flask, reset_db
+
+STAFF_SIZES = [10, 100, 400]
+REPEATS = 10
+
+dal = DAL.get_instance()
+
+
+def build_store(store_name: str, staff: int, notification_handler: NotificationHandler):
+    owner = LoggedInUser(f"{store_name}_owner", "password", "owner@mail.com")
+    store = Store(store_name, owner.user_name, True, datetime.now(), None, None, owner)
+    dal.add_all([owner, store])
+    store.add_product("milk", 10.0, 1_000_000, "brand", TypedList(str, ["dairy"]))
+    for i in range(staff):
+        user_name = f"{store_name}_staff{i}"
+        user = LoggedInUser(user_name, "password", f"{user_name}@mail.com")
+        perm = Permission(store.name, user_name, owner.user_name, Role.store_manager, user_obj=user, store_obj=store)
+        store.add_store_member(perm)
+        dal.add_all([user, perm], add_only=True)
+        notification_handler.add_observer(user_name)
+    dal.commit()
+
+
+def purchase(handler: ShoppingHandler, store_name: str, user_id: int):
+    handler._data_handler.add_or_update_user(user_id, User(user_id))
+    assert handler.saving_product_to_shopping_cart("milk", store_name, user_id, 1).succeed
+    dal.commit()
+    start = time.perf_counter()
+    res = handler.make_purchase_of_all_shopping_cart(user_id, 1234123412341234, "Israel", "Beer Sheva", "Rager", 1,
+                                                     "12/30", "123", "holder", "1")
+    dal.commit()
+    elapsed = (time.perf_counter() - start) * 1_000
+    assert res.succeed, res.msg
+    return elapsed
+
+
+def main():
+    reset_db()
+    notification_handler = NotificationHandler(TestEmitter())
+    dispatcher = NotificationDispatcher(notification_handler)
+    rows = []
+    with test_flask.app_context():
+        data_handler = DataHandler.get_instance()
+        data_handler.create_all(lambda dbi: dbi.init_app(test_flask))
+        handler = ShoppingHandler(data_handler, MockPaymentSystem(), MockShippingSystem())
+        user_id = 1000
+        for staff in STAFF_SIZES:
+            row = [staff]
+            for name, publisher_handler in [("sync", notification_handler), ("dispatcher", dispatcher)]:
+                store_name = f"{name}_store_{staff}"
+                dal.renew_session()
+                build_store(store_name, staff, notification_handler)
+                Publisher.get_instance().set_communication_handler(publisher_handler)
+                times = []
+                for _ in range(REPEATS):
+                    user_id += 1
+                    dal.renew_session()
+                    times.append(purchase(handler, store_name, user_id))
+                    dal.drop_session()
+                    dispatcher.flush()
+                row.append(statistics.median(times))
+            rows.append(row)
+    print(f"purchase latency by staff size, median of {REPEATS} runs")
+    print(f"{'staff':>6} | {'sync ms':>9} | {'dispatcher ms':>13}")
+    for staff, sync_ms, dispatcher_ms in rows:
+        print(f"{staff:>6} | {sync_ms:>9.2f} | {dispatcher_ms:>13.2f}")
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
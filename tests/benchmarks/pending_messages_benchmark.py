@@ -0,0 +1,72 @@
+"""
+Benchmark for the startup of the notification handler with many pending messages.
+
+USERS registered users with PENDING_MESSAGES pending messages between them are written to the database, then the
+notification handler is started as after a restart (init_notification_handler), and one of the users connects and
+gets its pending messages. The startup time, the growth of the peak memory (max RSS) of the process during the
+startup, and the time of the connection are printed.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.pending_messages_benchmark
+"""
+import resource
+import time
+from datetime import datetime, timedelta
+
+from src.communication.notification_handler import NotificationHandler, PendingMessage, TestEmitter
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, reset_db
+
+USERS = 10_000
+PENDING_MESSAGES = 1_000_000
+INSERT_CHUNK = 50_000
+
+dal = DAL.get_instance()
+
+
+def fill_database():
+    dal.renew_session()
+    dal._db_session.execute(LoggedInUser.__table__.insert(), [
+        {'_user_name': f"user{i}", '_password': "password", '_email': f"user{i}@mail.com"} for i in range(USERS)])
+    start = datetime(2021, 1, 1)
+    for chunk in range(0, PENDING_MESSAGES, INSERT_CHUNK):
+        dal._db_session.execute(PendingMessage.__table__.insert(), [
+            {'_username': f"user{i % USERS}", '_message': f"Date: {start}: purchase {i}", '_msg_type': "store_update",
+             '_time': start + timedelta(microseconds=i)} for i in range(chunk, min(chunk + INSERT_CHUNK,
+                                                                                    PENDING_MESSAGES))])
+    dal.drop_session()
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    reset_db()
+    with test_flask.app_context():
+        data_handler = DataHandler.get_instance()
+        data_handler.create_all(lambda dbi: dbi.init_app(test_flask))
+        fill_database()
+        handler = NotificationHandler(TestEmitter())
+        rss_before = max_rss_mb()
+        start = time.perf_counter()
+        dal.renew_session()
+        handler.init_notification_handler()
+        dal.drop_session()
+        startup_ms = (time.perf_counter() - start) * 1_000
+        rss_growth = max_rss_mb() - rss_before
+        start = time.perf_counter()
+        dal.renew_session()
+        handler.connect("user0")
+        dal.drop_session()
+        connect_ms = (time.perf_counter() - start) * 1_000
+    print(f"{USERS} users, {PENDING_MESSAGES} pending messages ({PENDING_MESSAGES // USERS} for each user)")
+    print(f"startup: {startup_ms:.1f} ms, peak memory growth: {rss_growth:.1f} MB")
+    print(f"connect of a user: {connect_ms:.1f} ms")
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Microbenchmark for checking a basket against the compiled policy plan of a store.
+
+Two policy trees of POLICIES leaves are built over an inventory of BASKET_PRODUCTS products:
+    1. wide - the store root holds every leaf, product and category quantity leaves, a few of each product and
+        category, and a few basket quantity and day leaves
+    2. nested - the same leaves, grouped by LEAVES_PER_GROUP under OR and XOR policies, under the AND root
+and a basket with a line for every product is checked again and again. the compiled plan is timed against compiling
+a new plan on every check, and against walking the policy tree itself (which sums the quantities of the basket in
+every leaf).
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.policy_plan_benchmark
+"""
+import calendar
+import time
+from datetime import date
+
+from src.domain.system.DAL import DAL
+from src.domain.system.cart_purchase_classes import Basket
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.shopping_policies import PolicyPlan
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+
+from tests.db_config_tests import test_flask, reset_db, make_store
+
+POLICIES = 1_000
+BASKET_PRODUCTS = 100
+CATEGORIES = 10
+LEAVES_PER_GROUP = 5
+REPEATS = 100
+OTHER_DAY = "Friday" if calendar.day_name[date.today().weekday()] != "Friday" else "Sunday"
+OPERATORS = ["or", "xor"]
+STOCK = {f"p{i}": (10.0, 1000, [f"c{i % CATEGORIES}"]) for i in range(BASKET_PRODUCTS)}
+
+dal = DAL.get_instance()
+
+
+def add_leaf(store: Store, i: int):
+    """
+    :return: id of the i'th leaf, a leaf that every basket of make_basket answers
+    """
+    kind = i % 10
+    if kind < 6:
+        args = (None, None, f"p{i % BASKET_PRODUCTS}", 1, 100 + i, None, None, None, "")
+    elif kind < 9:
+        args = (None, None, None, None, None, f"c{i % CATEGORIES}", 1, 1000 + i, "")
+    elif i % 20 == 9:
+        args = (1, 10_000 + i, None, None, None, None, None, None, "")
+    else:
+        args = (None, None, None, None, None, None, None, None, OTHER_DAY)
+    return store.add_policy(*args).data
+
+
+def build_wide(owner: LoggedInUser):
+    store = make_store("wide", STOCK, owner)
+    for i in range(POLICIES):
+        add_leaf(store, i)
+    return store
+
+
+def build_nested(owner: LoggedInUser):
+    store = make_store("nested", STOCK, owner)
+    for group in range(POLICIES // LEAVES_PER_GROUP):
+        ids = [add_leaf(store, group * LEAVES_PER_GROUP + i) for i in range(LEAVES_PER_GROUP)]
+        store.combine_policies(ids, OPERATORS[group % len(OPERATORS)])
+    return store
+
+
+def make_basket(store: Store):
+    basket = Basket(store.name, None, "bench_owner")
+    dal.add(basket)
+    for i in range(BASKET_PRODUCTS):
+        basket.add_product_to_basket(f"p{i}", 2)
+    return basket
+
+
+def time_check(basket: Basket, check):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        check(basket)
+    return (time.perf_counter() - start) / REPEATS * 1_000
+
+
+def main():
+    reset_db()
+    with test_flask.app_context():
+        DataHandler.get_instance().create_all(lambda dbi: dbi.init_app(test_flask))
+        owner = LoggedInUser("bench_owner", "password", "bench@mail.com")
+        dal.add(owner)
+        print(f"{'tree':>6} | {'leaves':>6} | {'tree apply (ms)':>15} | {'compile each time (ms)':>22} | "
+              f"{'compiled plan (ms)':>18}")
+        for shape, build in [("wide", build_wide), ("nested", build_nested)]:
+            store = build(owner)
+            basket = make_basket(store)
+            tree_answer = store.shopping_policies.apply(basket)
+            assert tree_answer == store.apply_policies_on_basket(basket)
+            tree = time_check(basket, store.shopping_policies.apply)
+            recompiled = time_check(basket, lambda b: PolicyPlan.compile(store.shopping_policies).apply(b))
+            compiled = time_check(basket, store.apply_policies_on_basket)
+            print(f"{shape:>6} | {POLICIES:>6} | {tree:>15.3f} | {recompiled:>22.3f} | {compiled:>18.3f}")
+        dal.discard_session()
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Latency benchmark for purchasing with a slow payment system.
+
+Every client adds a product of the same store to its cart and buys it, while the payment system answers only after
+PAYMENT_DELAY_SEC (DelayedMockPaymentSystem). All the clients start purchasing together, and a round ends with the
+slowest purchase. When the payment is made while the store is locked, the purchases of the store are served one
+after the other and a round takes at least the "serialized" column. With the products reserved before paying, the
+payments of the clients overlap.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.purchase_latency_benchmark
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.store_classes import Store
+from src.domain.system.store_managers_classes import ShoppingHandler
+from src.domain.system.users_classes import LoggedInUser, User
+from src.external.payment_interface.payment_system import DelayedMockPaymentSystem
+from src.external.publisher import Publisher
+from src.external.supply_interface.supply_system import MockShippingSystem
+from src.protocol_classes.classes_utils import TypedList
+from tests.db_config_tests import test_flask, reset_db
+
+STORE_NAME = "bench_store"
+PAYMENT_DELAY_SEC = 0.2
+# at most 4 client threads, besides the main one, as the DAL engine keeps 5 sqlite connections (SingletonThreadPool)
+CLIENTS = [1, 2, 4]
+CARD = 1234123412341234
+
+
+class SilentNotifications:
+    def send_to_client(self, msg_type, msg, user_name=None):
+        pass
+
+    def send_to_store(self, msg_type, msg, store_name, user_names):
+        pass
+
+
+def set_up(dal: DAL):
+    dal.renew_session()
+    owner = LoggedInUser("bench_owner", "password", "bench@mail.com")
+    store = Store(STORE_NAME, owner.user_name, True, datetime.now(), None, None, owner)
+    dal.add_all([owner, store])
+    store.add_product("milk", 10.0, 1_000_000, "brand", TypedList(str, ["dairy"]))
+    dal.drop_session()
+
+
+def buy(handler: ShoppingHandler, data_handler: DataHandler, dal: DAL, user_id: int, carts_lock: threading.Lock,
+        ready: threading.Barrier, latencies: list):
+    with test_flask.app_context():
+        # the carts are filled one at a time, only the purchases are concurrent
+        with carts_lock:
+            dal.renew_session()
+            data_handler.add_or_update_user(user_id, User(user_id))
+            handler.saving_product_to_shopping_cart("milk", STORE_NAME, user_id, 1)
+            dal.drop_session()
+        ready.wait()
+        dal.renew_session()
+        start = time.perf_counter()
+        res = handler.make_purchase_of_all_shopping_cart(user_id, CARD, "Israel", "Beer Sheva", "Rager", 1, "12/30",
+                                                         "123", "holder", "1")
+        latencies.append(time.perf_counter() - start)
+        dal.drop_session()
+        assert res.succeed, res.msg
+
+
+def run_clients(clients: ThreadPoolExecutor, handler: ShoppingHandler, data_handler: DataHandler, dal: DAL,
+                num_of_clients: int, first_id: int):
+    latencies = []
+    carts_lock, ready = threading.Lock(), threading.Barrier(num_of_clients)
+    futures = [clients.submit(buy, handler, data_handler, dal, first_id + c, carts_lock, ready, latencies) for c in
+               range(num_of_clients)]
+    for future in futures:
+        future.result()
+    return max(latencies), sum(latencies) / len(latencies)
+
+
+def main():
+    reset_db()
+    with test_flask.app_context():
+        data_handler = DataHandler.get_instance()
+        data_handler.create_all(lambda dbi: dbi.init_app(test_flask))
+        Publisher.get_instance().set_communication_handler(SilentNotifications())
+        dal = DAL.get_instance()
+        set_up(dal)
+        handler = ShoppingHandler(data_handler, DelayedMockPaymentSystem(PAYMENT_DELAY_SEC), MockShippingSystem())
+        print(f"{'clients':>8} | {'round (sec)':>11} | {'mean latency (sec)':>18} | {'serialized (sec)':>16}")
+        first_id = 1000
+        # the same threads serve all the rounds, the sqlite connections are kept per thread
+        clients = ThreadPoolExecutor(max_workers=max(CLIENTS))
+        for num_of_clients in CLIENTS:
+            total, latency = run_clients(clients, handler, data_handler, dal, num_of_clients, first_id)
+            first_id += num_of_clients
+            print(f"{num_of_clients:>8} | {total:>11.3f} | {latency:>18.3f} | "
+                  f"{num_of_clients * PAYMENT_DELAY_SEC:>16.3f}")
+        clients.shutdown()
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark for the overhead that the session adds to every request.
+
+A logged in client sends REQUESTS requests to a route that reads its session as /is_logged does, and to a static file,
+through the test client of flask. Before: the session was in a database table (flask_sessionstore read the row when
+the request started, and wrote and committed it when it ended - the stand-in below does the same on the same
+database), every getter of the Sess helper entered app.app_context() again, and the check of a logged in user in
+before_request took a DAL session, even for the static files. After: CachedCookieSessionInterface, plain getters, and
+the check of the logged in user reads only the users in memory, and is skipped for the static files. The average time
+of a request is printed.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.session_overhead_benchmark
+"""
+import os
+import pickle
+import time
+import uuid
+
+from flask import Flask, session, request, jsonify
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import create_engine, Table, Column, MetaData, String, LargeBinary, select
+from werkzeug.datastructures import CallbackDict
+
+from src.communication.session_store import CachedCookieSessionInterface
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from tests.db_config_tests import test_flask, reset_db, db_path
+
+REQUESTS = 2_000
+STATIC_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+dal = DAL.get_instance()
+
+
+class SqlSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.modified = False
+
+
+class SqlSessionInterface(SessionInterface):
+    """
+    stand-in for flask_sessionstore.SqlAlchemySessionInterface: a row for every session, that is read on every
+    request, and written and committed at its end
+    """
+
+    def __init__(self):
+        self._engine = create_engine('sqlite:///' + db_path)
+        metadata = MetaData()
+        self._table = Table("sessions", metadata, Column("session_id", String(255), primary_key=True),
+                            Column("data", LargeBinary))
+        metadata.create_all(self._engine)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+        if sid:
+            with self._engine.connect() as connection:
+                row = connection.execute(select([self._table.c.data]).where(self._table.c.session_id == sid)).first()
+            if row is not None:
+                return SqlSession(pickle.loads(row[0]), sid)
+        return SqlSession(sid=str(uuid.uuid4()))
+
+    def save_session(self, app, session, response):
+        data = pickle.dumps(dict(session))
+        with self._engine.begin() as connection:
+            row = connection.execute(select([self._table.c.session_id])
+                                     .where(self._table.c.session_id == session.sid)).first()
+            if row is None:
+                connection.execute(self._table.insert(), {"session_id": session.sid, "data": data})
+            else:
+                connection.execute(self._table.update().where(self._table.c.session_id == session.sid),
+                                   {"data": data})
+        response.set_cookie(app.session_cookie_name, session.sid)
+
+
+def make_app(old: bool) -> Flask:
+    app = Flask(__name__, static_folder=STATIC_DIRECTORY)
+    app.config['SECRET_KEY'] = 'benchmark secret key'
+    app.session_interface = SqlSessionInterface() if old else CachedCookieSessionInterface()
+    users_in_memory = {1: "user"}
+
+    def get(key, default):
+        if old:
+            with app.app_context():
+                return session.get(key, default)
+        return session.get(key, default)
+
+    @app.before_request
+    def before_request_func():
+        if not old and request.endpoint == 'static':
+            return
+        if get('logged', False):
+            if old:
+                dal.renew_session()
+                users_in_memory.get(get('user_id', -1))
+                dal.drop_session()
+            else:
+                users_in_memory.get(get('user_id', -1))
+
+    @app.route('/login')
+    def login():
+        session.update({'user_id': 1, 'logged': True, 'username': "user", 'is_admin': False})
+        return ""
+
+    @app.route('/is_logged')
+    def is_logged():
+        return jsonify({'user_id': get('user_id', -1), 'logged': get('logged', False),
+                        'username': get('username', ""), 'is_admin': get('is_admin', False)})
+
+    return app
+
+
+def average_request_us(old: bool, path: str) -> float:
+    client = make_app(old).test_client()
+    client.get('/login')
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        client.get(path).close()
+    return (time.perf_counter() - start) * 1_000_000 / REQUESTS
+
+
+def main():
+    reset_db()
+    with test_flask.app_context():
+        DataHandler.get_instance().create_all(lambda dbi: dbi.init_app(test_flask))
+        static_file = f"/static/{os.path.basename(__file__)}"
+        for name, old in [("database session, app context per getter, DAL session per request", True),
+                          ("cached signed cookie", False)]:
+            print(f"{name}: /is_logged {average_request_us(old, '/is_logged'):.0f} us, "
+                  f"static file {average_request_us(old, static_file):.0f} us")
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark for the delivery of one store update to the staff of a store with many connected sockets.
+
+SOCKETS staff members are connected, each with one socket. The update is delivered as before the rooms - one emit to
+the namespace of every staff member - and through the room of the store (SocketEmitter.emit_to_store), the first
+time (when the sockets are entered to the room) and after that. The packets are not written to the sockets, so only
+the work of the server is measured.
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.socket_rooms_benchmark
+"""
+import time
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from src.communication.notification_handler import SocketEmitter, NOTIFICATIONS_NAMESPACE, user_room
+
+SOCKETS = 10_000
+REPEATS = 5
+
+
+def make_socket_io() -> SocketIO:
+    socket_io = SocketIO(Flask(__name__), async_mode='threading')
+    socket_io.server.eio.send = lambda sid, data, binary=None: None
+    return socket_io
+
+
+def per_user_namespaces_ms(user_names: list) -> float:
+    socket_io = make_socket_io()
+    for user_name in user_names:
+        socket_io.server.manager.connect(f"sid_{user_name}", f"/{user_name}")
+    start = time.perf_counter()
+    for user_name in user_names:
+        socket_io.emit("store_update", {'data': "sold"}, namespace=f"/{user_name}")
+    return (time.perf_counter() - start) * 1_000
+
+
+def store_room_ms(user_names: list) -> tuple:
+    socket_io = make_socket_io()
+    for user_name in user_names:
+        sid = f"sid_{user_name}"
+        socket_io.server.manager.connect(sid, NOTIFICATIONS_NAMESPACE)
+        socket_io.server.enter_room(sid, user_room(user_name), namespace=NOTIFICATIONS_NAMESPACE)
+    emitter = SocketEmitter(socket_io)
+    start = time.perf_counter()
+    emitter.emit_to_store("shop", user_names, "store_update", "sold")
+    first_ms = (time.perf_counter() - start) * 1_000
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        emitter.emit_to_store("shop", user_names, "store_update", "sold")
+    return first_ms, (time.perf_counter() - start) * 1_000 / REPEATS
+
+
+def main():
+    user_names = [f"staff{i}" for i in range(SOCKETS)]
+    namespaces_ms = per_user_namespaces_ms(user_names)
+    first_ms, room_ms = store_room_ms(user_names)
+    print(f"one store update to {SOCKETS} connected sockets")
+    print(f"namespace of every user: {namespaces_ms:.1f} ms")
+    print(f"room of the store: first {first_ms:.1f} ms (entering the room), then {room_ms:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
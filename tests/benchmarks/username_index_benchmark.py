@@ -0,0 +1,66 @@
+"""
+Microbenchmark for looking up connected users by username in the DataHandler.
+
+The data handler is filled with connected guests and a handful of logged in users, and the lookups used by
+login, permission checks and update_stats_counter_for_user are timed against a linear scan over all the
+connected users (the lookup before the username index).
+
+run from the project root:
+    DB_PATH=db_bench python -m tests.benchmarks.username_index_benchmark
+"""
+import time
+
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.users_classes import User, LoggedInUser
+from tests.db_config_tests import test_flask, reset_db
+
+NUM_OF_GUESTS = [10_000, 100_000]
+NUM_OF_LOGGED_IN = 100
+LOOKUPS = 1_000
+
+
+def linear_scan(data_handler: DataHandler, name: str):
+    for user_id, current in data_handler.users.items():
+        if current.user_state is not None and current.user_state.user_name == name:
+            return current.user_state, user_id
+    return None, -1
+
+
+def fill(data_handler: DataHandler, num_of_guests: int):
+    data_handler.users.clear()
+    for user_id in range(1, num_of_guests + 1):
+        data_handler.add_or_update_user(user_id, User(user_id))
+    for i in range(NUM_OF_LOGGED_IN):
+        user_id = num_of_guests + i + 1
+        user = User(user_id)
+        user.user_state = LoggedInUser(f"user{i}", "password", f"user{i}@mail.com")
+        data_handler.add_or_update_user(user_id, user)
+
+
+def time_lookups(lookup):
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        lookup(f"user{i % NUM_OF_LOGGED_IN}")
+    return (time.perf_counter() - start) / LOOKUPS * 1_000_000
+
+
+def main():
+    reset_db()
+    with test_flask.app_context():
+        data_handler = DataHandler.get_instance()
+        data_handler.create_all(lambda dbi: dbi.init_app(test_flask))
+        dal = DAL.get_instance()
+        print(f"{'guests':>8} | {'linear scan (us)':>16} | {'index (us)':>10}")
+        for num_of_guests in NUM_OF_GUESTS:
+            dal.renew_session()
+            fill(data_handler, num_of_guests)
+            scan = time_lookups(lambda name: linear_scan(data_handler, name))
+            indexed = time_lookups(data_handler.get_user_by_username_login)
+            dal.discard_session()
+            print(f"{num_of_guests:>8} | {scan:>16.1f} | {indexed:>10.1f}")
+    reset_db()
+
+
+if __name__ == '__main__':
+    main()
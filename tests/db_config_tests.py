@@ -1,6 +1,12 @@
 import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
 
+import pytest
 from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 
 test_flask = Flask(__name__)
@@ -19,3 +25,76 @@ def reset_db():
         print("=============Removed db successfully")
     except Exception as e:
         print("=============Removed db failed: " + str(e))
+    # leftovers of WAL mode, that would be applied to the next database with the same name
+    for suffix in ['-wal', '-shm']:
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_test(request):
+    """
+    create all the tables on a new test database, and keep an application context for the tests of the module
+    :return: the data handler that created the tables
+    """
+    from src.domain.system.data_handler import DataHandler
+    with test_flask.app_context():
+        reset_db()
+        data_handler = DataHandler()
+        data_handler.create_all(lambda dbi: dbi.init_app(test_flask))
+        yield data_handler
+
+
+def make_store(name: str, products: dict, owner=None):
+    """
+    create a store with the given products, and save it with its owner
+    :param name: (str) name of the store
+    :param products: (dict) {product name -> (price, quantity, categories) or (price, quantity, categories, brand)}
+    :param owner: (LoggedInUser) owner of the store, None to create a new owner that is named after the store
+    :return: the new store
+    """
+    from src.domain.system.DAL import DAL
+    from src.domain.system.store_classes import Store
+    from src.domain.system.users_classes import LoggedInUser
+    from src.protocol_classes.classes_utils import TypedList
+    dal = DAL.get_instance()
+    if owner is None:
+        owner = LoggedInUser(f"{name}_owner", "password", f"{name}@mail.com")
+    dal.add(owner, add_only=True)
+    store = Store(name, owner.user_name, True, datetime.now(), None, None, owner)
+    dal.add(store)
+    for product_name, product in products.items():
+        price, quantity, categories = product[:3]
+        brand = product[3] if len(product) > 3 else "brand"
+        store.add_product(product_name, price, quantity, brand, TypedList(str, categories))
+    return store
+
+
+@contextmanager
+def count_queries():
+    """
+    count the sql statements that are executed inside the with block, on every engine
+    :return: list that holds the executed statements when the block ends
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def queried_tables(statements):
+    """
+    :param statements: list of sql statements
+    :return: dictionary of {table name -> number of statements that select rows of it}
+    """
+    output = dict()
+    for statement in statements:
+        table = re.search(r"SELECT (?:DISTINCT )?(\w+)\.", statement).group(1)
+        output[table] = output.get(table, 0) + 1
+    return output
@@ -0,0 +1,178 @@
+import threading
+
+from src.communication.notification_dispatcher import NotificationDispatcher
+from src.communication.notification_handler import Emitter, NotificationHandler, PendingMessage
+from src.domain.system.DAL import DAL
+from src.logger.log import Log
+from tests.db_config_tests import test_flask, count_queries, set_up_test
+
+dal: DAL = DAL.get_instance()
+
+
+class RecordingEmitter(Emitter):
+    def __init__(self):
+        self.emitted = dict()
+        self.group = []
+
+    def emit(self, user_name: str, msg_type: str, msg) -> None:
+        self.emitted.setdefault(user_name, []).append((msg_type, msg))
+
+    def emit_group(self, msg_type: str, msg) -> None:
+        self.group.append((msg_type, msg))
+
+
+class FailingOnceHandler:
+    def __init__(self, handler: NotificationHandler):
+        self._handler = handler
+        self.failed = False
+
+    def send_batch(self, messages):
+        if not self.failed:
+            self.failed = True
+            raise RuntimeError("emitter is down")
+        self._handler.send_batch(messages)
+
+
+class PoisonedHandler:
+    """
+    fails every batch that holds the poison message
+    """
+
+    def __init__(self, handler: NotificationHandler, poison: str):
+        self._handler = handler
+        self._poison = poison
+
+    def send_batch(self, messages):
+        if any(msg == self._poison for _, _, msg, _, _ in messages):
+            raise RuntimeError("can not send the poison")
+        self._handler.send_batch(messages)
+
+
+def make_handler(online: list, offline: list):
+    emitter = RecordingEmitter()
+    handler = NotificationHandler(emitter)
+    for user_name in online + offline:
+        handler.add_observer(user_name)
+    for user_name in online:
+        handler.connect(user_name)
+    return handler, emitter
+
+
+def pending_of(user_names: list):
+    dal.renew_session()
+    messages = dal.query(PendingMessage).filter(PendingMessage._username.in_(user_names)).all()
+    output = sorted((m._username, m._message) for m in messages)
+    dal.drop_session()
+    return output
+
+
+def started_later(workers: list):
+    # the worker is started by the test, after all the messages of the test were queued
+    return lambda run: workers.append(threading.Thread(target=run, daemon=True))
+
+
+def test_batch_is_emitted_per_user_and_saved_with_one_insert():
+    with test_flask.app_context():
+        online = ["online0", "online1"]
+        offline = [f"offline{i}" for i in range(30)]
+        handler, emitter = make_handler(online, offline)
+        workers = []
+        dispatcher = NotificationDispatcher(handler, started_later(workers))
+        for i in range(3):
+            for user_name in online + offline:
+                dispatcher.send_to_client("store_update", f"purchase {i}", user_name)
+        dispatcher.send_to_client("stats", "daily stats")
+        with count_queries() as statements:
+            workers[0].start()
+            assert dispatcher.flush(timeout=5)
+        assert len([s for s in statements if s.startswith('INSERT INTO "PendingMessages"')]) == 1
+        for user_name in online:
+            assert emitter.emitted[user_name] == [("store_update", f"purchase {i}") for i in range(3)]
+        assert emitter.group == [("stats", "daily stats")]
+        assert pending_of(offline) == sorted((u, f"purchase {i}") for u in offline for i in range(3))
+
+        # the pending messages are emitted when their user connects
+        dal.renew_session()
+        handler.connect("offline0")
+        dal.drop_session()  # as the service layer does at the end of every request
+        assert emitter.emitted["offline0"] == [("store_update", f"purchase {i}") for i in range(3)]
+        assert pending_of(["offline0"]) == []
+
+
+def test_failed_batch_is_sent_again():
+    with test_flask.app_context():
+        handler, emitter = make_handler(["survivor"], [])
+        workers, delays = [], []
+        dispatcher = NotificationDispatcher(FailingOnceHandler(handler), started_later(workers), sleep=delays.append,
+                                            retry_delay=0.5)
+        dispatcher.send_to_client("store_update", "retried", "survivor")
+        workers[0].start()
+        assert dispatcher.flush(timeout=5)
+        dispatcher.send_to_client("store_update", "delivered", "survivor")
+        assert dispatcher.flush(timeout=5)
+        assert emitter.emitted["survivor"] == [("store_update", "retried"), ("store_update", "delivered")]
+        assert delays == [0.5]
+
+
+def test_only_the_message_that_keeps_failing_is_dropped():
+    with test_flask.app_context():
+        handler, emitter = make_handler(["online_member"], ["offline_member"])
+        workers, delays = [], []
+        dispatcher = NotificationDispatcher(PoisonedHandler(handler, "poison"), started_later(workers),
+                                            sleep=delays.append, retries=3, retry_delay=0.5)
+        dispatcher.send_to_client("store_update", "before", "online_member")
+        dispatcher.send_to_client("store_update", "poison", "online_member")
+        dispatcher.send_to_store("store_update", "after", "a_store", ["online_member", "offline_member"])
+        workers[0].start()
+        assert dispatcher.flush(timeout=5)
+        assert delays == [0.5, 1.0, 2.0]
+        assert emitter.emitted["online_member"] == [("store_update", "before"), ("store_update", "after")]
+        assert pending_of(["offline_member"]) == [("offline_member", "after")]
+
+
+def test_worker_is_started_once():
+    with test_flask.app_context():
+        handler, emitter = make_handler(["single"], [])
+        workers = []
+        dispatcher = NotificationDispatcher(handler, started_later(workers), batch_size=2)
+        for i in range(5):
+            dispatcher.send_to_client("store_update", f"message {i}", "single")
+        assert len(workers) == 1
+        workers[0].start()
+        assert dispatcher.flush(timeout=5)
+        assert emitter.emitted["single"] == [("store_update", f"message {i}") for i in range(5)]
+
+
+class BrokenLog:
+    """
+    log that fails on every call, as the log does when the logs directory is missing
+    """
+
+    def get_logger(self):
+        raise FileNotFoundError("logs/errors.log")
+
+
+def test_worker_keeps_running_when_a_batch_fails_outside_the_send(monkeypatch):
+    with test_flask.app_context():
+        handler, emitter = make_handler(["steady"], [])
+        workers = []
+
+        def failing_sleep(seconds):
+            raise RuntimeError("interrupted")
+
+        monkeypatch.setattr(Log, "get_instance", staticmethod(lambda: BrokenLog()))
+        dispatcher = NotificationDispatcher(FailingOnceHandler(handler), started_later(workers), sleep=failing_sleep)
+        dispatcher.send_to_client("store_update", "lost", "steady")
+        workers[0].start()
+        assert dispatcher.flush(timeout=5)
+        dispatcher.send_to_client("store_update", "delivered", "steady")
+        assert dispatcher.flush(timeout=5)
+        assert emitter.emitted["steady"] == [("store_update", "delivered")]
+
+
+def test_flush_gives_up_after_the_timeout():
+    with test_flask.app_context():
+        handler, emitter = make_handler(["waiting"], [])
+        dispatcher = NotificationDispatcher(handler, started_later([]))
+        dispatcher.send_to_client("store_update", "never sent", "waiting")
+        assert not dispatcher.flush(timeout=0.1)
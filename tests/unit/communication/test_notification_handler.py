@@ -0,0 +1,130 @@
+import threading
+
+import src.communication.notification_handler as notification_handler_module
+from src.communication.notification_handler import Emitter, NotificationHandler, PendingMessage, PENDING_OUTBOX_SIZE
+from src.domain.system.DAL import DAL
+from tests.db_config_tests import test_flask, count_queries, set_up_test
+
+dal: DAL = DAL.get_instance()
+
+
+class RecordingEmitter(Emitter):
+    def __init__(self):
+        self.emitted = dict()
+
+    def emit(self, user_name: str, msg_type: str, msg) -> None:
+        self.emitted.setdefault(user_name, []).append((msg_type, msg))
+
+    def emit_group(self, msg_type: str, msg) -> None:
+        pass
+
+
+def send(handler: NotificationHandler, user_name: str, messages: list):
+    dal.renew_session()
+    for msg in messages:
+        handler.send_to_client("store_update", msg, user_name)
+    dal.drop_session()
+
+
+def connect(handler: NotificationHandler, user_name: str):
+    dal.renew_session()
+    with count_queries() as statements:
+        handler.connect(user_name)
+    dal.drop_session()
+    return [s for s in statements if 'FROM "PendingMessages"' in s and s.startswith("SELECT")]
+
+
+def pending_count(user_name: str):
+    dal.renew_session()
+    count = dal.query(PendingMessage).filter(PendingMessage._username == user_name).count()
+    dal.drop_session()
+    return count
+
+
+def expected(messages: list):
+    return [("store_update", msg) for msg in messages]
+
+
+def test_messages_of_unknown_users_are_only_saved_in_the_database():
+    with test_flask.app_context():
+        handler = NotificationHandler(RecordingEmitter())
+        send(handler, "stranger", ["hello"])
+        assert "stranger" not in handler._observers
+        assert pending_count("stranger") == 1
+
+
+def test_complete_outbox_is_emitted_without_reading_the_database():
+    with test_flask.app_context():
+        emitter = RecordingEmitter()
+        handler = NotificationHandler(emitter)
+        handler.add_observer("registered")
+        messages = [f"message {i}" for i in range(PENDING_OUTBOX_SIZE)]
+        send(handler, "registered", messages)
+        assert connect(handler, "registered") == []
+        assert emitter.emitted["registered"] == expected(messages)
+        assert pending_count("registered") == 0
+
+
+def test_overflowed_outbox_is_read_from_the_database_in_pages(monkeypatch):
+    monkeypatch.setattr(notification_handler_module, "PENDING_PAGE_SIZE", 7)
+    with test_flask.app_context():
+        emitter = RecordingEmitter()
+        handler = NotificationHandler(emitter)
+        handler.add_observer("busy")
+        messages = [f"message {i:03}" for i in range(PENDING_OUTBOX_SIZE + 10)]
+        send(handler, "busy", messages)
+        assert handler._observers["busy"]["pending_messages"] == []
+        # 60 messages in pages of 7, and the empty page that ends the reading
+        assert len(connect(handler, "busy")) == 10
+        assert emitter.emitted["busy"] == expected(messages)
+        assert pending_count("busy") == 0
+
+
+def test_messages_from_before_a_restart_are_read_on_connect():
+    with test_flask.app_context():
+        send(NotificationHandler(RecordingEmitter()), "returning", ["before restart"])
+        emitter = RecordingEmitter()
+        restarted = NotificationHandler(emitter)
+        restarted.init_notification_handler()
+        assert restarted._observers == {}
+        connect(restarted, "returning")
+        assert emitter.emitted["returning"] == expected(["before restart"])
+        # the outbox is complete from now on
+        restarted.disconnect("returning")
+        send(restarted, "returning", ["after restart"])
+        assert connect(restarted, "returning") == []
+        assert emitter.emitted["returning"] == expected(["before restart", "after restart"])
+
+
+def test_pending_messages_are_emitted_outside_the_lock():
+    with test_flask.app_context():
+        handler = None
+        lock_was_free = []
+
+        class ReconnectingEmitter(RecordingEmitter):
+            def emit_many(self, user_name: str, messages: list) -> None:
+                super().emit_many(user_name, messages)
+                # another thread can take the lock while the pending messages are emitted
+                def take_lock():
+                    lock_was_free.append(handler._observers_lock.acquire(timeout=1))
+                    if lock_was_free[-1]:
+                        handler._observers_lock.release()
+
+                free = threading.Thread(target=take_lock)
+                free.start()
+                free.join()
+                # the user left again, a message that is saved meanwhile stays pending
+                handler.disconnect(user_name)
+                handler.send_to_client("store_update", "while emitting", user_name)
+
+        emitter = ReconnectingEmitter()
+        handler = NotificationHandler(emitter)
+        send(handler, "flaky", ["from the database"])
+        connect(handler, "flaky")
+        handler.add_observer("flaky_outbox")
+        send(handler, "flaky_outbox", ["from the outbox"])
+        connect(handler, "flaky_outbox")
+        assert lock_was_free == [True, True]
+        assert emitter.emitted["flaky"] == expected(["from the database"])
+        assert emitter.emitted["flaky_outbox"] == expected(["from the outbox"])
+        assert pending_count("flaky") == 1 and pending_count("flaky_outbox") == 1
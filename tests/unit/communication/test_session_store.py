@@ -0,0 +1,100 @@
+import pytest
+from flask import Flask, session, jsonify
+
+from src.communication.session_store import CachedCookieSessionInterface, secret_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_app(session_interface: CachedCookieSessionInterface):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test secret key'
+    app.session_interface = session_interface
+
+    @app.route('/login/<user_name>')
+    def login(user_name):
+        session['logged'] = True
+        session['username'] = user_name
+        return ""
+
+    @app.route('/who')
+    def who():
+        return jsonify(session.get('username', ''))
+
+    return app
+
+
+def count_decodes(session_interface: CachedCookieSessionInterface):
+    decodes = []
+    get_signing_serializer = session_interface.get_signing_serializer
+
+    def counting_serializer(app):
+        serializer = get_signing_serializer(app)
+        loads = serializer.loads
+
+        def counting_loads(*args, **kwargs):
+            decodes.append(args[0])
+            return loads(*args, **kwargs)
+
+        serializer.loads = counting_loads
+        return serializer
+
+    session_interface.get_signing_serializer = counting_serializer
+    return decodes
+
+
+def session_cookie(client) -> str:
+    return next(cookie.value for cookie in client.cookie_jar if cookie.name == 'session')
+
+
+def test_session_of_a_known_cookie_is_read_from_memory():
+    session_interface = CachedCookieSessionInterface()
+    decodes = count_decodes(session_interface)
+    client = make_app(session_interface).test_client()
+    client.get('/login/alice')
+    for _ in range(3):
+        assert client.get('/who').get_json() == "alice"
+    assert decodes == []
+
+
+def test_evicted_session_is_read_from_the_signed_cookie():
+    session_interface = CachedCookieSessionInterface(cache_size=1)
+    decodes = count_decodes(session_interface)
+    app = make_app(session_interface)
+    alice, bob = app.test_client(), app.test_client()
+    alice.get('/login/alice')
+    bob.get('/login/bob')
+    # the session of alice was evicted, and is cached again after its cookie is verified
+    assert alice.get('/who').get_json() == "alice"
+    assert alice.get('/who').get_json() == "alice"
+    assert len(decodes) == 1
+    # another process, with nothing in memory, reads the same cookie
+    other_process = make_app(CachedCookieSessionInterface()).test_client()
+    other_process.set_cookie('localhost', 'session', session_cookie(alice))
+    assert other_process.get('/who').get_json() == "alice"
+
+
+def test_expired_and_forged_cookies_give_an_empty_session():
+    clock = Clock()
+    session_interface = CachedCookieSessionInterface(clock=clock)
+    app = make_app(session_interface)
+    client = app.test_client()
+    client.get('/login/alice')
+    cookie = session_cookie(client)
+    client.set_cookie('localhost', 'session', cookie[:-2] + "xx")
+    assert client.get('/who').get_json() == ""
+    clock.now += app.permanent_session_lifetime.total_seconds()
+    assert session_interface._cached(cookie) is None
+
+
+def test_secret_key_has_to_be_set():
+    assert secret_key("from the environment") == "from the environment"
+    for missing in [None, ""]:
+        with pytest.raises(RuntimeError):
+            secret_key(missing)
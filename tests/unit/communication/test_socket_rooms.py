@@ -0,0 +1,139 @@
+import time
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from src.communication.message_queue import socket_io_options, LOCAL_MESSAGE_QUEUE, LocalPubSubManager
+from src.communication.notification_handler import SocketEmitter, NotificationHandler, Emitter, PendingMessage, \
+    NOTIFICATIONS_NAMESPACE, ADMINS_ROOM, user_room, store_room
+from src.domain.system.DAL import DAL
+from tests.db_config_tests import test_flask, set_up_test
+
+dal: DAL = DAL.get_instance()
+
+
+class StoreRecordingEmitter(Emitter):
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, user_name: str, msg_type: str, msg) -> None:
+        self.emitted.append((user_name, msg_type, msg))
+
+    def emit_group(self, msg_type: str, msg) -> None:
+        pass
+
+    def emit_to_store(self, store_name: str, user_names: list, msg_type: str, msg) -> None:
+        self.emitted.append((store_name, sorted(user_names), msg_type, msg))
+
+
+def make_socket_io(**options):
+    socket_io = SocketIO(Flask(__name__), async_mode='threading', **options)
+    delivered = []
+    # the packets are recorded instead of being sent to the clients
+    socket_io.server._emit_internal = lambda sid, event, data, namespace=None, id=None: \
+        delivered.append((sid, event, data['data']))
+    return socket_io, delivered
+
+
+def connect_socket(socket_io: SocketIO, sid: str, rooms: list):
+    socket_io.server.manager.connect(sid, NOTIFICATIONS_NAMESPACE)
+    for room in rooms:
+        socket_io.server.enter_room(sid, room, namespace=NOTIFICATIONS_NAMESPACE)
+
+
+def members_of(socket_io: SocketIO, room: str):
+    return set(socket_io.server.manager.rooms[NOTIFICATIONS_NAMESPACE].get(room, {}))
+
+
+def test_store_update_is_sent_once_to_the_room_of_the_store():
+    socket_io, delivered = make_socket_io()
+    emitter = SocketEmitter(socket_io)
+    # a user may have a few sockets (e.g a few tabs)
+    connect_socket(socket_io, "sid_a1", [user_room("a")])
+    connect_socket(socket_io, "sid_a2", [user_room("a")])
+    connect_socket(socket_io, "sid_b", [user_room("b"), store_room("shop")])
+    connect_socket(socket_io, "sid_c", [user_room("c"), store_room("shop")])
+    # c was removed from the staff of the store, a was appointed
+    emitter.emit_to_store("shop", ["a", "b"], "store_update", "sold")
+    assert sorted(delivered) == [("sid_a1", "store_update", "sold"), ("sid_a2", "store_update", "sold"),
+                                 ("sid_b", "store_update", "sold")]
+    assert members_of(socket_io, store_room("shop")) == {"sid_a1", "sid_a2", "sid_b"}
+
+
+def test_user_and_group_messages_are_sent_to_their_rooms():
+    socket_io, delivered = make_socket_io()
+    emitter = SocketEmitter(socket_io)
+    connect_socket(socket_io, "sid_admin", [user_room("admin"), ADMINS_ROOM])
+    connect_socket(socket_io, "sid_user", [user_room("user")])
+    emitter.emit("user", "store_update", "hello")
+    emitter.emit_group("stats", {"date": "01/01/2021"})
+    assert delivered == [("sid_user", "store_update", "hello"), ("sid_admin", "stats", {"date": "01/01/2021"})]
+
+
+def test_local_message_queue_delivers_through_publish_and_listen():
+    socket_io, delivered = make_socket_io(**socket_io_options(LOCAL_MESSAGE_QUEUE))
+    assert isinstance(socket_io.server.manager, LocalPubSubManager)
+    # started by the server on the first connection
+    socket_io.server.manager.initialize()
+    connect_socket(socket_io, "sid_b", [user_room("b"), store_room("shop")])
+    SocketEmitter(socket_io).emit_to_store("shop", ["b"], "store_update", "through the queue")
+    deadline = time.time() + 5
+    while len(delivered) == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    socket_io.server.manager.close()
+    assert delivered == [("sid_b", "store_update", "through the queue")]
+
+
+def test_connected_staff_get_one_store_emit_and_the_rest_pending_messages():
+    with test_flask.app_context():
+        emitter = StoreRecordingEmitter()
+        handler = NotificationHandler(emitter)
+        for user_name in ["online_a", "online_b", "offline_c"]:
+            handler.add_observer(user_name)
+        handler.connect("online_a")
+        handler.connect("online_b")
+        dal.renew_session()
+        handler.send_to_store("store_update", "sold", "rooms_store", ["online_a", "online_b", "offline_c"])
+        dal.drop_session()
+        assert emitter.emitted == [("rooms_store", ["online_a", "online_b"], "store_update", "sold")]
+        dal.renew_session()
+        pending = [(m._username, m._message) for m in dal.query(PendingMessage).all()]
+        dal.drop_session()
+        assert pending == [("offline_c", "sold")]
+
+
+def test_servers_with_shared_presence_emit_to_users_connected_elsewhere():
+    with test_flask.app_context():
+        emitter_a, emitter_b = StoreRecordingEmitter(), StoreRecordingEmitter()
+        server_a = NotificationHandler(emitter_a, shared_presence=True, server_id="server_a")
+        server_b = NotificationHandler(emitter_b, shared_presence=True, server_id="server_b")
+
+        def on(server: NotificationHandler, action):
+            dal.renew_session()
+            action(server)
+            dal.drop_session()
+
+        def pending_of(user_name: str):
+            dal.renew_session()
+            messages = [m._message for m in dal.query(PendingMessage).filter_by(_username=user_name).all()]
+            dal.drop_session()
+            return messages
+
+        on(server_b, lambda s: s.connect("elsewhere"))
+        on(server_a, lambda s: s.connect("here"))
+        assert server_b.rooms_of("elsewhere") == [user_room("elsewhere")]
+        on(server_a, lambda s: s.send_to_store("store_update", "sold", "shared_store",
+                                               ["here", "elsewhere", "nowhere"]))
+        # the sockets of the other server are not in the room of the store, every member gets it in its own room
+        assert emitter_a.emitted == [("here", "store_update", "sold"), ("elsewhere", "store_update", "sold")]
+        assert pending_of("elsewhere") == [] and pending_of("nowhere") == ["sold"]
+
+        on(server_b, lambda s: s.disconnect("elsewhere"))
+        on(server_a, lambda s: s.send_to_client("store_update", "after logout", "elsewhere"))
+        assert pending_of("elsewhere") == ["after logout"]
+
+        # the users of a server that restarted are not connected anymore
+        on(server_b, lambda s: s.connect("restarted"))
+        server_b.init_notification_handler()
+        on(server_a, lambda s: s.send_to_client("store_update", "after restart", "restarted"))
+        assert pending_of("restarted") == ["after restart"]
@@ -1,7 +1,7 @@
 import pytest
 
 # hash_password
-from src.security.security_system import Encrypter
+from src.security.security_system import Encrypter, PasswordPool
 
 
 @pytest.mark.parametrize("password_to_hash, output", [("password", True)])
@@ -58,3 +58,26 @@ def test_password_no_symbol(password, is_pass_ok, symbol_case):
 def test_password_correct(password, is_pass_ok):
     dict_pass = Encrypter.password_check(password)
     assert dict_pass['password_ok'] == is_pass_ok, "test failed"
+
+
+# password pool
+def test_password_pool_hashes_and_verifies_on_its_workers():
+    calls = []
+
+    def execute(fn, *args):
+        calls.append(fn)
+        return fn(*args)
+
+    pool = PasswordPool(execute, rounds=1000)
+    stored = pool.hash_password("password")
+    assert pool.verify_password("password", stored) == (True, None)
+    assert pool.verify_password("pass", stored) == (False, None)
+    assert len(calls) == 3, "test failed"
+
+
+@pytest.mark.parametrize("old_rounds, new_rounds", [(1000, 2000), (2000, 1000)])
+def test_password_pool_rehashes_when_the_rounds_change(old_rounds, new_rounds):
+    stored = PasswordPool(rounds=old_rounds).hash_password("password")
+    verified, new_hash = PasswordPool(rounds=new_rounds).verify_password("password", stored)
+    assert verified and new_hash.startswith(f"$pbkdf2-sha256${new_rounds}$"), "test failed"
+    assert Encrypter.verify_password("password", new_hash), "test failed"
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.cart_purchase_classes import ShoppingCart, Basket, ProductInShoppingCart
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+OWNER_NAME = "reprice_owner"
+VALID = datetime.now() + timedelta(days=1)
+STOCK = {"milk": (10.0, 100, ["dairy"]), "cheese": (30.0, 100, ["dairy"]), "bread": (20.0, 100, ["bakery"]),
+         "jam": (15.0, 100, ["spreads"])}
+
+dal: DAL = DAL.get_instance()
+owner: LoggedInUser = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_owner(set_up_test):
+    global owner
+    owner = LoggedInUser(OWNER_NAME, "password", "reprice@mail.com")
+    dal.add(owner)
+
+
+def line_prices(cart: ShoppingCart, store: Store):
+    return {name: round(p._total_price, 2) for name, p in cart.baskets[store.name].products.items()}
+
+
+def assert_same_as_full_pricing(cart: ShoppingCart, store: Store):
+    incremental = line_prices(cart, store)
+    total = round(cart.baskets[store.name].get_total_value_of_basket(), 2)
+    cart.calc_update_price_of_basket(store.name)
+    assert line_prices(cart, store) == incremental
+    assert round(cart.baskets[store.name].get_total_value_of_basket(), 2) == total
+
+
+def test_changes_price_like_the_whole_basket():
+    with test_flask.app_context():
+        store = make_store("reprice_same", STOCK, owner)
+        store.add_simple_category_discount(VALID, 0.1, "dairy")
+        cheese = store.add_simple_product_discount(VALID, 0.5, "cheese").data
+        bread = store.add_simple_product_discount(VALID, 0.2, "bread").data
+        store.combine_discounts([cheese, bread], "xor")
+        # jam is discounted only while there are at least 2 breads in the basket
+        store.add_simple_product_discount(VALID, 0.3, "jam", over_all_price_category_cond=[],
+                                          over_all_price_product_cond=[], overall_category_quantity=[],
+                                          product_list_cond=[{"product_name": "bread", "needed_items": 2}])
+        cart = ShoppingCart()
+        for name in ["milk", "cheese", "bread", "jam"]:
+            assert cart.add_product(store, name, 1, OWNER_NAME).succeed
+            assert_same_as_full_pricing(cart, store)
+        assert cart.edit_product(store.name, "bread", 3).succeed
+        assert line_prices(cart, store)["jam"] == 10.5
+        assert_same_as_full_pricing(cart, store)
+        assert cart.edit_product(store.name, "bread", 1).succeed
+        assert line_prices(cart, store)["jam"] == 15
+        assert_same_as_full_pricing(cart, store)
+        assert cart.remove_product(store.name, "cheese").succeed
+        assert_same_as_full_pricing(cart, store)
+
+
+def test_only_products_reached_by_the_change_are_priced_again(monkeypatch):
+    with test_flask.app_context():
+        store = make_store("reprice_reach", STOCK, owner)
+        store.add_simple_category_discount(VALID, 0.1, "dairy")
+        store.add_simple_product_discount(VALID, 0.5, "jam")
+        cart = ShoppingCart()
+        for name in ["milk", "cheese", "jam"]:
+            cart.add_product(store, name, 1, OWNER_NAME)
+        priced = []
+        update_total_price = ProductInShoppingCart.update_total_price
+
+        def recording_update_total_price(p, new_price=None):
+            priced.append(p._product_name)
+            return update_total_price(p, new_price)
+
+        monkeypatch.setattr(ProductInShoppingCart, "update_total_price", recording_update_total_price)
+        cart.add_product(store, "bread", 2, OWNER_NAME)
+        assert priced == ["bread"]
+        priced.clear()
+        cart.edit_product(store.name, "milk", 3)
+        assert sorted(priced) == ["cheese", "milk"]
+        assert line_prices(cart, store) == {"milk": 27, "cheese": 27, "jam": 7.5, "bread": 40}
+
+
+def test_total_of_basket_is_kept_until_it_changes(monkeypatch):
+    with test_flask.app_context():
+        store = make_store("reprice_total", STOCK, owner)
+        store.add_simple_product_discount(VALID, 0.5, "milk")
+        cart = ShoppingCart()
+        cart.add_product(store, "milk", 2, OWNER_NAME)
+        cart.add_product(store, "bread", 1, OWNER_NAME)
+        basket: Basket = cart.baskets[store.name]
+        assert basket.get_total_value_of_basket() == 30
+
+        monkeypatch.setattr(Basket, "get_total_price_of_product", lambda b, name: pytest.fail("total was summed"))
+        assert basket.to_dictionary()["total_price"] == 30
+        assert cart.get_total_value_of_shopping_cart() == 30
+
+        monkeypatch.undo()
+        cart.edit_product(store.name, "milk", 4)
+        assert basket.get_total_value_of_basket() == 40
+        cart.remove_product(store.name, "bread")
+        assert basket.to_dictionary()["total_price"] == 20
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.cart_purchase_classes import Basket
+from src.domain.system.db_config import db
+from src.domain.system.permission_classes import Permission, Role
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, count_queries, queried_tables, set_up_test, make_store
+
+NUM_OF_STORES = 4
+STORE_NAME = "batch_store"
+OWNER_NAME = "batch_owner"
+
+dal: DAL = DAL.get_instance()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up(set_up_test):
+    end_time = datetime.now() + timedelta(days=1)
+    for i in range(NUM_OF_STORES):
+        owner = LoggedInUser(f"{OWNER_NAME}{i}", "password", "batch@mail.com")
+        store = make_store(f"{STORE_NAME}{i}", {f"p{p}": (10.0, 10, ["cat"]) for p in range(4)}, owner)
+        perm = Permission.define_permissions_for_init(Role.store_initial_owner, owner.user_name, store.name, None,
+                                                      owner, store, None)
+        store.add_store_member(perm)
+        owner.add_permission(perm)
+        dal.add(perm)
+        basket = Basket(store.name, None, owner.user_name)
+        dal.add(basket)
+        basket.add_product_to_basket("p0", 1)
+        basket.add_product_to_basket("p1", 1)
+        # discount tree of 3 levels: root -> 2 complex discounts -> 2 simple discounts each
+        ids = [store.add_simple_product_discount(end_time, 0.1, f"p{p}").data for p in range(4)]
+        store.combine_discounts(ids[:2], "or")
+        store.combine_discounts(ids[2:], "or")
+        # policy tree of 3 levels: root -> complex policy -> 2 simple policies
+        policy_ids = [store.add_policy(None, None, f"p{p}", 1, 5, None, None, None, None).data for p in range(2)]
+        store.combine_policies(policy_ids, "and")
+    dal.commit()
+    reload_sessions()
+
+
+def reload_sessions():
+    dal.discard_session()
+    db.session.remove()
+
+
+def test_store_permissions_loaded_with_one_query():
+    with test_flask.app_context():
+        stores = dal.query(Store).all()
+        with count_queries() as statements:
+            all_permissions = [s.get_permissions() for s in stores]
+        assert queried_tables(statements)["permissions"] == 1
+        assert all(len(perms) == 1 for perms in all_permissions)
+        reload_sessions()
+
+        # the eager relationships of the permissions are loaded once for all the stores as well
+        store = dal.query(Store).filter_by(_name=f"{STORE_NAME}0").one()
+        with count_queries() as single_store_statements:
+            store.get_permissions()
+        assert len(single_store_statements) == len(statements)
+        reload_sessions()
+
+
+def test_user_permissions_loaded_with_one_query():
+    with test_flask.app_context():
+        users = dal.query(LoggedInUser).all()
+        with count_queries() as statements:
+            all_permissions = [u.permissions for u in users]
+        assert queried_tables(statements)["permissions"] == 1
+        assert all(len(perms) == 1 for perms in all_permissions)
+        reload_sessions()
+
+        user = dal.get_user_by_name(f"{OWNER_NAME}0")
+        with count_queries() as single_user_statements:
+            _ = user.permissions
+        assert len(single_user_statements) == len(statements)
+        reload_sessions()
+
+
+def test_basket_products_loaded_with_one_query():
+    with test_flask.app_context():
+        baskets = dal.query(Basket).all()
+        with count_queries() as statements:
+            all_products = [b.products for b in baskets]
+        assert len(statements) == 1
+        assert all(len(products) == 2 for products in all_products)
+        reload_sessions()
+
+
+def test_discount_trees_loaded_with_one_query_per_level():
+    with test_flask.app_context():
+        stores = dal.query(Store).all()
+        with count_queries() as statements:
+            all_discounts = [s.get_all_discounts() for s in stores]
+        # one query for the children of the roots and one for their children, for all the stores together
+        assert len(statements) == 2
+        assert all(len(discounts) == 6 for discounts in all_discounts)
+        reload_sessions()
+
+
+def test_policy_trees_loaded_with_one_query_per_level():
+    with test_flask.app_context():
+        stores = dal.query(Store).all()
+        with count_queries() as statements:
+            all_policies = [s.shopping_policies.fetch_policies() for s in stores]
+        assert len(statements) == 2
+        assert all(len(policies) == 3 for policies in all_policies)
+        reload_sessions()
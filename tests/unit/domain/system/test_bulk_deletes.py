@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+from src.domain.system.DAL import DAL
+from src.domain.system.discounts import _IDiscount
+from src.domain.system.permission_classes import Permission, Role
+from src.domain.system.products_classes import Product, ProductInInventory
+from src.domain.system.shopping_policies import IShoppingPolicies
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, count_queries, set_up_test, make_store
+
+END_TIME = datetime.now() + timedelta(days=1)
+
+dal: DAL = DAL.get_instance()
+
+
+def stock(num_of_products: int):
+    return {f"p{i}": (10.0, 10, ["food"]) for i in range(num_of_products)}
+
+
+def deletes(statements):
+    return [s for s in statements if s.startswith("DELETE")]
+
+
+def clear_empty_products(name: str, num_of_products: int):
+    store = make_store(name, stock(num_of_products))
+    product_ids = [p._product_pk for p in store.inventory.values()]
+    for p in store.inventory.values():
+        p.quantity = 0
+    with count_queries() as statements:
+        store.clear_empty_products_from_inventory()
+        dal.commit()
+    assert len(store.inventory) == 0
+    assert dal.query(ProductInInventory).filter(ProductInInventory._store_fk == name).count() == 0
+    assert dal.query(Product).filter(Product.id.in_(product_ids)).count() == 0
+    return statements
+
+
+def remove_discount_tree(name: str, num_of_children: int):
+    store = make_store(name, stock(num_of_children))
+    ids = [store.add_simple_product_discount(END_TIME, 0.1, f"p{i}").data for i in range(num_of_children)]
+    root_id = store.combine_discounts(ids, "or").data
+    dal.commit()
+    with count_queries() as statements:
+        assert store.remove_discount_from_store(root_id).succeed
+    assert dal.query(_IDiscount).filter(_IDiscount.id.in_(ids + [root_id])).count() == 0
+    return statements
+
+
+def remove_policy_tree(name: str, num_of_children: int):
+    store = make_store(name, stock(num_of_children))
+    ids = [store.add_policy(None, None, f"p{i}", 1, 5, None, None, None, None).data for i in range(num_of_children)]
+    assert store.combine_policies(ids, "and").succeed
+    root_id = store.shopping_policies.fetch_policies()[0].id
+    dal.commit()
+    with count_queries() as statements:
+        assert store.remove_policy_from_store(root_id).succeed
+    assert dal.query(IShoppingPolicies).filter(IShoppingPolicies.id.in_(ids + [root_id])).count() == 0
+    return statements
+
+
+def remove_staff(name: str, num_of_members: int):
+    store = make_store(name, stock(0))
+    names = [f"{name}_staff{i}" for i in range(num_of_members)]
+    for user_name in names:
+        user = LoggedInUser(user_name, "password", f"{user_name}@mail.com")
+        dal.add(user, add_only=True)
+        store.add_store_member(Permission(store.name, user_name, f"{name}_owner", Role.store_manager, user_obj=user,
+                                          store_obj=store))
+    dal.commit()
+    with count_queries() as statements:
+        dal.delete_permissions_as_query([(user_name, store.name) for user_name in names])
+        dal.commit()
+    assert dal.query(Permission).filter(Permission._store_fk == name, Permission._user_fk.in_(names)).count() == 0
+    return statements
+
+
+def test_clearing_empty_products_deletes_with_constant_statements():
+    with test_flask.app_context():
+        few = clear_empty_products("few_empty", 3)
+        many = clear_empty_products("many_empty", 30)
+        # one for the inventory rows and one for their products
+        assert len(deletes(few)) == len(deletes(many)) == 2
+        assert len(few) == len(many)
+
+
+def test_removing_discount_tree_deletes_with_constant_statements():
+    with test_flask.app_context():
+        small = remove_discount_tree("small_discount_tree", 2)
+        large = remove_discount_tree("large_discount_tree", 12)
+        assert len(deletes(small)) == len(deletes(large))
+
+
+def test_removing_policy_tree_deletes_with_constant_statements():
+    with test_flask.app_context():
+        small = remove_policy_tree("small_policy_tree", 2)
+        large = remove_policy_tree("large_policy_tree", 12)
+        assert len(deletes(small)) == len(deletes(large))
+
+
+def test_removing_staff_deletes_with_one_statement():
+    with test_flask.app_context():
+        assert len(deletes(remove_staff("small_staff", 2))) == 1
+        assert len(deletes(remove_staff("large_staff", 20))) == 1
@@ -22,4 +22,126 @@
 # # check what is called and whats not
 # def test_b():
 #     data_handler.insert_some_fun()
-#     assert True
\ No newline at end of file
+#     assert True
+
+import threading
+
+import pytest
+
+from src.domain.system.DAL import DAL, green_rlock
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask
+
+dal: DAL = DAL.get_instance()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_test(request):
+    with test_flask.app_context():
+        DataHandler.get_instance().create_all(lambda dbi: dbi.init_app(test_flask))
+
+
+def test_session_per_thread():
+    dal.renew_session()
+    main_session = dal._db_session
+    other_sessions = []
+    t = threading.Thread(target=lambda: other_sessions.append(dal._db_session))
+    t.start()
+    t.join()
+    assert other_sessions[0] is not main_session
+    assert dal._db_session is main_session
+    dal.drop_session()
+    dal.renew_session()
+    assert dal._db_session is not main_session
+    dal.drop_session()
+
+
+def test_renew_session_does_not_block_other_threads():
+    dal.renew_session()
+    finished = threading.Event()
+
+    def other_use_case():
+        dal.renew_session()
+        dal.drop_session()
+        finished.set()
+
+    threading.Thread(target=other_use_case).start()
+    assert finished.wait(timeout=5)
+    dal.drop_session()
+
+
+def test_lock_for_serializes_same_keys_only():
+    other_store = threading.Event()
+    same_store = threading.Event()
+
+    def lock_and_set(key, event):
+        with dal.lock_for(key):
+            event.set()
+
+    with dal.lock_for("store_a", "store_b"):
+        threading.Thread(target=lock_and_set, args=("store_c", other_store)).start()
+        assert other_store.wait(timeout=5)
+        threading.Thread(target=lock_and_set, args=("store_b", same_store)).start()
+        assert not same_store.wait(timeout=0.2)
+    assert same_store.wait(timeout=5)
+
+
+def test_lock_for_excludes_greenlets_on_eventlet():
+    eventlet = pytest.importorskip("eventlet")
+    dal.set_lock_factory(green_rlock)
+    try:
+        events = []
+
+        def purchase(name, store_names):
+            with dal.lock_for(*store_names):
+                # the purchase gives back the stock of the same stores inside the critical section
+                with dal.lock_for(store_names[0]):
+                    events.append(f"{name} in")
+                    eventlet.sleep(0.05)
+                    events.append(f"{name} out")
+
+        first = eventlet.spawn(purchase, "first", ["store_a", "store_b"])
+        eventlet.sleep(0)
+        second = eventlet.spawn(purchase, "second", ["store_b"])
+        other = eventlet.spawn(purchase, "other", ["store_c"])
+        first.wait()
+        second.wait()
+        other.wait()
+        assert events.index("first out") < events.index("second in")
+        # a critical section of other stores is not blocked by them
+        assert events.index("other in") < events.index("first out")
+    finally:
+        dal.set_lock_factory(threading.RLock)
+
+
+def test_adding_an_object_of_another_use_case_keeps_its_work():
+    greenlet = pytest.importorskip("greenlet")
+    dal.renew_session()
+    dal.add(LoggedInUser("shared_user", "password", "shared@mail.com"))
+    dal.drop_session()
+    main = greenlet.getcurrent()
+
+    def first_use_case():
+        dal.renew_session()
+        shared = dal.query(LoggedInUser).get("shared_user")
+        dal.add(LoggedInUser("first_user", "password", "first@mail.com"), add_only=True)
+        # yields in the middle of the use case, e.g while a password is hashed
+        main.switch(shared)
+        dal.drop_session()
+
+    def second_use_case(shared):
+        dal.renew_session()
+        shared.email = "changed@mail.com"
+        dal.add(shared)
+        dal.drop_session()
+
+    first = greenlet.greenlet(first_use_case)
+    shared_user = first.switch()
+    greenlet.greenlet(second_use_case).switch(shared_user)
+    first.switch()
+    assert first.dead
+    dal.renew_session()
+    assert dal.query(LoggedInUser).get("first_user") is not None
+    assert dal.query(LoggedInUser).get("shared_user").email == "changed@mail.com"
+    dal.drop_session()
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.users_classes import User, LoggedInUser
+from tests.db_config_tests import test_flask
+
+data_handler: DataHandler = None
+
+USER_ID = 1
+OTHER_USER_ID = 2
+USERNAME = "indexed_user"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_test(request):
+    global data_handler
+    with test_flask.app_context():
+        try:
+            os.remove('db_test.db')
+            print("Removed DB")
+        except:
+            print("Removed db failed")
+        data_handler = DataHandler()
+        data_handler.create_all(lambda dbi: dbi.init_app(test_flask))
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clean_users():
+    data_handler.users.clear()
+    yield
+    data_handler.users.clear()
+    DAL.get_instance().discard_session()
+
+
+def _connected_user(user_id: int, username: str):
+    user = User(user_id)
+    user.user_state = LoggedInUser(username, "password", "indexed@mail.com")
+    return user
+
+
+def test_username_index_after_add_or_update_user():
+    user = _connected_user(USER_ID, USERNAME)
+    data_handler.add_or_update_user(USER_ID, user)
+    assert data_handler.get_user_by_username_wrapper(USERNAME) is user
+    state, user_id = data_handler.get_user_by_username_login(USERNAME)
+    assert state is user.user_state and user_id == USER_ID
+
+
+def test_username_index_after_login_and_logout():
+    data_handler.add_or_update_user(USER_ID, User(USER_ID))
+    state = LoggedInUser(USERNAME, "password", "indexed@mail.com")
+    assert data_handler.login(USER_ID, state).succeed
+    assert data_handler.get_user_by_username_login(USERNAME) == (state, USER_ID)
+    assert data_handler.logout(USER_ID).succeed
+    assert data_handler.get_user_by_username_wrapper(USERNAME) is None
+    _, user_id = data_handler.get_user_by_username_login(USERNAME)
+    assert user_id == -1
+
+
+def test_username_index_after_replacing_state():
+    data_handler.add_or_update_user(USER_ID, _connected_user(USER_ID, USERNAME))
+    data_handler.add_or_update_user_state(LoggedInUser("renamed_user", "password", "indexed@mail.com"), USER_ID)
+    assert data_handler.get_user_by_username_wrapper(USERNAME) is None
+    assert data_handler.get_user_by_username_wrapper("renamed_user").user_id == USER_ID
+
+
+def test_username_index_ignores_stale_entries():
+    data_handler.add_or_update_user(USER_ID, _connected_user(USER_ID, USERNAME))
+    data_handler.users.clear()
+    assert data_handler.get_user_by_username_wrapper(USERNAME) is None
+    data_handler.add_or_update_user(OTHER_USER_ID, _connected_user(OTHER_USER_ID, USERNAME))
+    assert data_handler.get_user_by_username_wrapper(USERNAME).user_id == OTHER_USER_ID
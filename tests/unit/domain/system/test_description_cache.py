@@ -0,0 +1,115 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.discounts import _IDiscount
+from src.domain.system.shopping_policies import IShoppingPolicies
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+OWNER_NAME = "descriptions_owner"
+VALID = datetime.now() + timedelta(days=1)
+PRODUCTS = ["milk", "bread", "cheese"]
+STOCK = {product: (10.0, 100, [f"{product}_category"]) for product in PRODUCTS}
+
+dal: DAL = DAL.get_instance()
+owner: LoggedInUser = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_owner(set_up_test):
+    global owner
+    owner = LoggedInUser(OWNER_NAME, "password", "descriptions@mail.com")
+    dal.add(owner)
+
+
+def subclasses(cls) -> list:
+    return [cls] + [s for sub in cls.__subclasses__() for s in subclasses(sub)]
+
+
+def not_described_again(monkeypatch):
+    def fail(self, descriptions=None):
+        raise AssertionError(f"{self.id} was described again")
+
+    for cls in subclasses(_IDiscount) + subclasses(IShoppingPolicies):
+        if "_describe" in vars(cls):
+            monkeypatch.setattr(cls, "_describe", fail)
+
+
+def test_cached_descriptions_are_the_descriptions_of_the_tree(monkeypatch):
+    with test_flask.app_context():
+        store = make_store("descriptions_tree", STOCK, owner)
+        first = store.add_simple_product_discount(VALID, 0.1, "milk", 2, [], [], [], []).data
+        second = store.add_simple_category_discount(VALID, 0.2, "bread_category").data
+        combined = store.combine_discounts([first, second], "xor").data
+        store.add_discount_on_entire_store(VALID, 0.05)
+        policies = [store.add_policy(None, None, p, 1, 5, None, None, None, "").data for p in PRODUCTS]
+        store.combine_policies(policies[:2], "or")
+
+        expected_discounts = [{"discount_id": d.id, "description": d.get_description()} for d in
+                              store.get_all_discounts()]
+        expected_policies = [{"policy_id": p.id, "description": p.description()} for p in
+                             store.shopping_policies.fetch_policies()]
+        expected_product = store.inventory["milk"].to_dictionary()
+        assert store.fetch_all_discounts().data == expected_discounts
+        assert store.fetch_shopping_policies().data == expected_policies
+        assert any(d["discount_id"] == combined for d in expected_discounts)
+
+        # the same version of the store is served from the cache
+        with monkeypatch.context() as m:
+            not_described_again(m)
+            assert store.fetch_all_discounts().data == expected_discounts
+            assert store.fetch_shopping_policies().data == expected_policies
+            assert store.inventory["milk"].to_dictionary()["policies"] == expected_product["policies"]
+
+
+def test_changes_start_a_new_version_of_the_store():
+    with test_flask.app_context():
+        store = make_store("descriptions_versions", STOCK, owner)
+        first = store.add_simple_product_discount(VALID, 0.1, "milk").data
+        second = store.add_simple_product_discount(VALID, 0.1, "bread").data
+        combined = store.combine_discounts([first, second], "or").data
+        before = {d["discount_id"]: d["description"] for d in store.fetch_all_discounts().data}
+        version = store.version
+
+        edited = store.add_simple_product_discount(VALID, 0.3, "cheese", discount_id=second).data
+        assert store.version != version
+        after = {d["discount_id"]: d["description"] for d in store.fetch_all_discounts().data}
+        assert set(after.keys()) == {combined, first, edited}
+        assert after[combined] != before[combined] and "cheese" in after[combined]
+
+        policy = store.add_policy(None, None, "milk", 1, 5, None, None, None, "").data
+        assert [p["policy_id"] for p in store.fetch_shopping_policies().data] == [policy]
+        assert store.remove_policy_from_store(policy).succeed
+        assert store.fetch_shopping_policies().data == []
+
+
+def test_descriptions_read_during_a_change_are_not_served_after_it(monkeypatch):
+    with test_flask.app_context():
+        store = make_store("descriptions_concurrent", STOCK, owner)
+        first = store.add_simple_product_discount(VALID, 0.1, "milk").data
+        second = store.add_simple_product_discount(VALID, 0.1, "bread").data
+        combined = store.combine_discounts([first, second], "or").data
+        read_during_change = []
+
+        def read():
+            with test_flask.app_context():
+                dal.renew_session()
+                other = dal.query(Store).get("descriptions_concurrent")
+                read_during_change.extend(other.fetch_all_discounts().data)
+                dal.discard_session()
+
+        def schedule_expiry_and_read(self, discount):
+            # another request reads the store after the tree changed, before the change is committed
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join()
+
+        monkeypatch.setattr(Store, "_schedule_expiry", schedule_expiry_and_read)
+        assert store.add_simple_product_discount(VALID, 0.3, "cheese", discount_id=second).succeed
+        assert any(d["discount_id"] == combined and "cheese" not in d["description"] for d in read_during_change)
+        after = {d["discount_id"]: d["description"] for d in store.fetch_all_discounts().data}
+        assert "cheese" in after[combined]
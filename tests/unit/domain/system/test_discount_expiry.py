@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.cart_purchase_classes import Basket
+from src.domain.system.discount_expiry import DiscountExpiry
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from src.external.publisher import Publisher
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+OWNER_NAME = "expiry_owner"
+NOW = datetime.now()
+SOON = NOW + timedelta(hours=1)
+LATER = NOW + timedelta(hours=2)
+PRODUCTS = ["milk", "bread", "cheese"]
+STOCK = {product: (10.0, 100, [f"{product}_category"]) for product in PRODUCTS}
+
+dal: DAL = DAL.get_instance()
+expiry: DiscountExpiry = DiscountExpiry.get_instance()
+owner: LoggedInUser = None
+
+
+class RecordedNotifications:
+    def __init__(self):
+        self.to_stores = []
+
+    def send_to_client(self, msg_type, msg, user_name=None):
+        pass
+
+    def send_to_store(self, msg_type, msg, store_name, user_names):
+        self.to_stores.append((store_name, msg))
+
+
+notifications = RecordedNotifications()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_owner(set_up_test):
+    global owner
+    Publisher.get_instance().set_communication_handler(notifications)
+    owner = LoggedInUser(OWNER_NAME, "password", "expiry@mail.com")
+    dal.add(owner)
+    dal.drop_session()
+
+
+def load_store(name: str) -> Store:
+    dal.renew_session()
+    return dal.query(Store).filter_by(_name=name).one()
+
+
+def test_expired_discounts_are_removed_from_the_tree_and_the_products():
+    with test_flask.app_context():
+        expiry.clear()
+        dal.renew_session()
+        store = make_store("expiry_simple", STOCK, owner)
+        soon = store.add_simple_product_discount(SOON, 0.1, "milk").data
+        later = store.add_simple_category_discount(LATER, 0.2, "milk_category").data
+        dal.drop_session()
+
+        assert expiry.remove_due(NOW) == dict()
+        assert expiry.remove_due(SOON) == {"expiry_simple": [soon]}
+        assert notifications.to_stores[-1][0] == "expiry_simple" and str(soon) in notifications.to_stores[-1][1]
+        # the discount was taken from the schedule
+        assert expiry.remove_due(SOON) == dict()
+
+        store = load_store("expiry_simple")
+        assert [d.id for d in store.get_all_discounts()] == [later]
+        assert list(store.inventory["milk"].discounts.keys()) == [later]
+        dal.drop_session()
+        assert expiry.remove_due(LATER) == {"expiry_simple": [later]}
+
+
+def test_the_highest_expired_discount_is_removed():
+    with test_flask.app_context():
+        expiry.clear()
+        dal.renew_session()
+        store = make_store("expiry_complex", STOCK, owner)
+        expired_in_and = store.add_simple_product_discount(SOON, 0.1, "milk").data
+        valid_in_and = store.add_simple_product_discount(LATER, 0.1, "bread").data
+        combined_and = store.combine_discounts([expired_in_and, valid_in_and], "and").data
+        expired_in_or = store.add_simple_product_discount(SOON, 0.1, "cheese").data
+        valid_in_or = store.add_simple_product_discount(LATER, 0.1, "cheese").data
+        combined_or = store.combine_discounts([expired_in_or, valid_in_or], "or").data
+        dal.drop_session()
+
+        # the AND discount can't hold without its expired child, the OR discount still has a valid one
+        assert sorted(expiry.remove_due(SOON)["expiry_complex"]) == sorted([combined_and, expired_in_or])
+        store = load_store("expiry_complex")
+        assert sorted(d.id for d in store.get_all_discounts()) == sorted([combined_or, valid_in_or])
+        assert len(store.inventory["bread"].discounts) == 0
+        dal.drop_session()
+
+
+def test_edited_discounts_expire_at_their_new_end_time():
+    with test_flask.app_context():
+        expiry.clear()
+        dal.renew_session()
+        store = make_store("expiry_edited", STOCK, owner)
+        first = store.add_simple_product_discount(SOON, 0.1, "milk").data
+        edited = store.add_simple_product_discount(LATER, 0.3, "milk", discount_id=first).data
+        dal.drop_session()
+
+        assert expiry.remove_due(SOON) == dict()
+        expiry.clear()
+        # the discounts of a loaded store are scheduled when its discount plan is compiled
+        store = load_store("expiry_edited")
+        store.apply_discount_on_basket(Basket("expiry_edited", None, OWNER_NAME))
+        dal.drop_session()
+        assert expiry.next_end_time() == LATER
+        assert expiry.remove_due(LATER) == {"expiry_edited": [edited]}
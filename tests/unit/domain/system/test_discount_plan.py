@@ -0,0 +1,181 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.cart_purchase_classes import Basket
+from src.domain.system.discounts import ProductDiscountStrategy, BasketSnapshot, DiscountPlan
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+OWNER_NAME = "plan_owner"
+VALID = datetime.now() + timedelta(days=1)
+EXPIRED = datetime.now() - timedelta(days=1)
+STOCK = {"milk": (10.0, 100, ["dairy"]), "bread": (20.0, 100, ["bakery"]), "cheese": (30.0, 100, ["dairy"])}
+
+dal: DAL = DAL.get_instance()
+owner: LoggedInUser = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_owner(set_up_test):
+    global owner
+    owner = LoggedInUser(OWNER_NAME, "password", "plan@mail.com")
+    dal.add(owner)
+
+
+def basket_price(store: Store, products: dict):
+    basket = Basket(store.name, None, OWNER_NAME)
+    dal.add(basket)
+    for name, quantity in products.items():
+        basket.add_product_to_basket(name, quantity)
+    for p in basket.products.values():
+        p.update_total_price()
+    return round(store.apply_discount_on_basket(basket).get_total_value_of_basket(), 2)
+
+
+def test_or_applies_every_discount_in_nested_trees():
+    with test_flask.app_context():
+        store = make_store("plan_or", STOCK, owner)
+        milk = store.add_simple_product_discount(VALID, 0.5, "milk").data
+        bread = store.add_simple_product_discount(VALID, 0.5, "bread").data
+        dairy = store.add_simple_category_discount(VALID, 0.1, "dairy").data
+        store.combine_discounts([milk, bread], "or")
+        # milk: 10 * 0.5 * 0.9, bread: 20 * 0.5
+        assert basket_price(store, {"milk": 1, "bread": 1}) == 14.5
+        assert store.discount_root.search_for_discount(dairy) is not None
+
+
+def test_xor_applies_only_the_best_child_without_copying_basket(monkeypatch):
+    with test_flask.app_context():
+        store = make_store("plan_xor", STOCK, owner)
+        small = store.add_simple_product_discount(VALID, 0.1, "cheese").data
+        big = store.add_simple_category_discount(VALID, 0.3, "dairy").data
+        store.combine_discounts([small, big], "xor")
+        monkeypatch.setattr(Basket, "copy", lambda b: pytest.fail("basket was copied"))
+        # cheese: 30 * 0.7, milk: 10 * 0.7
+        assert basket_price(store, {"cheese": 1, "milk": 1}) == 28
+        assert basket_price(store, {"cheese": 1}) == 21
+
+
+def test_and_applies_only_when_all_conditions_hold():
+    with test_flask.app_context():
+        store = make_store("plan_and", STOCK, owner)
+        milk = store.add_simple_product_discount(VALID, 0.5, "milk").data
+        bread = store.add_simple_product_discount(EXPIRED, 0.5, "bread").data
+        store.combine_discounts([milk, bread], "and")
+        assert basket_price(store, {"milk": 1, "bread": 1}) == 30
+
+        cheese = store.add_simple_product_discount(VALID, 0.5, "cheese").data
+        dairy = store.add_simple_category_discount(VALID, 0.5, "dairy").data
+        store.combine_discounts([cheese, dairy], "and")
+        # the plan is compiled again after the tree changed. cheese: 30 * 0.5 * 0.5, milk: 10 * 0.5
+        assert basket_price(store, {"cheese": 1, "milk": 1}) == 12.5
+
+
+def test_subtrees_that_do_not_touch_the_basket_are_skipped(monkeypatch):
+    with test_flask.app_context():
+        store = make_store("plan_skip", STOCK, owner)
+        cheese = store.add_simple_product_discount(VALID, 0.5, "cheese").data
+        bread = store.add_simple_product_discount(VALID, 0.5, "bread").data
+        store.combine_discounts([cheese, bread], "xor")
+        store.add_simple_product_discount(VALID, 0.5, "milk")
+        activated = []
+        activate_discount = ProductDiscountStrategy.activate_discount
+
+        def counting_activate_discount(strategy, basket, snapshot=None):
+            activated.append(strategy.discounted_product)
+            return activate_discount(strategy, basket, snapshot)
+
+        monkeypatch.setattr(ProductDiscountStrategy, "activate_discount", counting_activate_discount)
+        assert basket_price(store, {"milk": 2}) == 10
+        assert activated == ["milk"]
+
+
+def test_conditions_read_one_snapshot_per_pricing(monkeypatch):
+    with test_flask.app_context():
+        store = make_store("plan_snapshot", STOCK, owner)
+        dairy = [{"category_name": "dairy", "needed_items": 3}]
+        store.add_simple_product_discount(VALID, 0.5, "milk", 3, [], [], [], dairy)
+        store.add_simple_product_discount(VALID, 0.5, "bread", 1, [], [], [], dairy)
+        store.add_simple_category_discount(VALID, 0.1, "dairy", 1, [], [], [], dairy)
+        snapshots = []
+        init = BasketSnapshot.__init__
+
+        def counting_init(snapshot, basket):
+            snapshots.append(basket)
+            init(snapshot, basket)
+
+        monkeypatch.setattr(BasketSnapshot, "__init__", counting_init)
+        # milk: 10 * 2 * 0.5 * 0.9, bread: 20 * 0.5, cheese: 30 * 0.9
+        assert basket_price(store, {"milk": 2, "bread": 1, "cheese": 1}) == 46
+        assert len(snapshots) == 1
+        # not enough dairy products
+        assert basket_price(store, {"milk": 2, "bread": 1}) == 40
+
+
+def test_condition_on_a_category_that_is_not_in_the_basket_does_not_hold():
+    with test_flask.app_context():
+        store = make_store("plan_missing_category", STOCK, owner)
+        store.add_simple_product_discount(VALID, 0.5, "milk", None, [{"category_name": "bakery", "needed_price": 5}],
+                                          [], [], [{"category_name": "bakery", "needed_items": 1}])
+        assert basket_price(store, {"milk": 1}) == 10
+        assert basket_price(store, {"milk": 1, "bread": 1}) == 25
+
+
+def test_quantities_and_categories_are_read_from_the_items_of_the_basket():
+    with test_flask.app_context():
+        store = make_store("plan_item_quantities", STOCK, owner)
+        # the stock of every product is 100, the conditions count what is in the basket
+        bread = [{"product_name": "bread", "needed_items": 3}]
+        store.add_simple_product_discount(VALID, 0.5, "milk", None, [], [], bread, [])
+        assert basket_price(store, {"milk": 1, "bread": 2}) == 50
+        assert basket_price(store, {"milk": 1, "bread": 3}) == 65
+        basket = Basket(store.name, None, OWNER_NAME)
+        dal.add(basket)
+        basket.add_product_to_basket("milk", 2)
+        basket.add_product_to_basket("cheese", 4)
+        snapshot = BasketSnapshot(basket)
+        for name, line in basket.products.items():
+            assert snapshot.quantity_of(name) == line.item.quantity
+            assert snapshot.categories_of[name] == set(line.item.categories)
+        assert snapshot.category_quantities["dairy"] == 6
+        assert snapshot.total_quantity == 6
+
+
+def test_free_per_x_counts_the_quantity_in_the_basket():
+    with test_flask.app_context():
+        store = make_store("plan_free_per_x", STOCK, owner)
+        store.add_free_per_x_product_discount_discount(VALID, "milk", 1, 2)
+        assert basket_price(store, {"milk": 2}) == 20
+        assert basket_price(store, {"milk": 3}) == 20
+        assert basket_price(store, {"milk": 6}) == 40
+
+
+def test_plan_is_compiled_once_per_version_of_the_store(monkeypatch):
+    with test_flask.app_context():
+        store = make_store("plan_versions", STOCK, owner)
+        store.add_simple_product_discount(VALID, 0.5, "milk")
+        store.add_simple_category_discount(VALID, 0.1, "dairy", 1, [], [], [], [])
+        # milk: 10 * 0.5 * 0.9, cheese: 30 * 0.9
+        assert basket_price(store, {"milk": 1, "cheese": 1}) == 31.5
+        version = store.version
+        dal.drop_session()
+
+        # the next request loads the store again, its plan was compiled by the previous one
+        dal.renew_session()
+        with monkeypatch.context() as m:
+            m.setattr(DiscountPlan, "compile", lambda root: pytest.fail("plan was compiled again"))
+            store = dal.query(Store).get("plan_versions")
+            assert store.version == version
+            assert basket_price(store, {"milk": 1, "cheese": 1}) == 31.5
+
+        bread = store.add_simple_product_discount(VALID, 0.5, "bread").data
+        assert store.version != version
+        dal.drop_session()
+        dal.renew_session()
+        store = dal.query(Store).get("plan_versions")
+        assert basket_price(store, {"bread": 1, "milk": 1}) == 14.5
+        assert store.remove_discount_from_store(bread).succeed
+        assert basket_price(store, {"bread": 1, "milk": 1}) == 24.5
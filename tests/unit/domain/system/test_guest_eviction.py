@@ -0,0 +1,122 @@
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.cart_purchase_classes import Basket
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.users_classes import User, LoggedInUser
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+STORE_NAME = "eviction_store"
+
+data_handler: DataHandler = None
+dal: DAL = DAL.get_instance()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_store(set_up_test):
+    global data_handler
+    data_handler = set_up_test
+    owner = LoggedInUser("eviction_owner", "password", "eviction_owner@mail.com")
+    make_store(STORE_NAME, {}, owner)
+    dal.drop_session()
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(data_handler, "_clock", clock)
+    monkeypatch.setattr(data_handler, "_guest_users_limit", 3)
+    monkeypatch.setattr(data_handler, "_guest_idle_ttl", 60)
+    data_handler.users.clear()
+    data_handler._guests_seen.clear()
+    data_handler._spilled_guest_carts.clear()
+    yield clock
+    data_handler.users.clear()
+    data_handler._guests_seen.clear()
+    data_handler._spilled_guest_carts.clear()
+
+
+def add_guests(user_ids: list):
+    for user_id in user_ids:
+        data_handler.add_or_update_user(user_id, User(user_id))
+
+
+def test_least_recently_seen_guests_are_evicted_over_the_limit(clock):
+    add_guests([1, 2, 3])
+    # a request of guest 1 makes guest 2 the least recently seen
+    assert data_handler.get_user_by_id(1) is not None
+    add_guests([4])
+    assert set(data_handler.users.keys()) == {1, 3, 4}
+
+
+def test_idle_guests_are_evicted_and_logged_in_users_are_kept(clock):
+    add_guests([1, 2])
+    state = LoggedInUser("eviction_user", "password", "eviction@mail.com")
+    data_handler.add_or_update_user_state(state, 2)
+    clock.now += 61
+    add_guests([3])
+    assert set(data_handler.users.keys()) == {2, 3}
+    assert data_handler.get_user_by_id(2).user_state is state
+
+
+@pytest.mark.parametrize("spill, kept_in_memory", [(True, False), (False, True)])
+def test_guest_cart_is_spilled_and_loaded_when_the_guest_returns(clock, monkeypatch, spill, kept_in_memory):
+    monkeypatch.setattr(data_handler, "_spill_guest_carts", spill)
+    with test_flask.app_context():
+        dal.renew_session()
+        basket = Basket(STORE_NAME, user="1")
+        dal.add(basket, add_only=True)
+        dal.flush()
+        add_guests([1])
+        data_handler.get_user_by_id(1).shopping_cart.baskets = {STORE_NAME: basket}
+        dal.drop_session()
+        clock.now += 61
+        add_guests([2])
+        assert (1 in data_handler.users) == kept_in_memory
+        dal.renew_session()
+        returned: User = data_handler.get_user_by_id(1)
+        assert list(returned.shopping_cart.baskets.keys()) == [STORE_NAME]
+        dal.drop_session()
+
+
+def test_guests_are_compact():
+    guest = User(1)
+    assert not hasattr(guest, "__dict__")
+    assert not guest.has_products_in_cart() and guest._shopping_cart is None
+    assert guest.shopping_cart.is_empty() and not hasattr(guest.shopping_cart, "__dict__")
+
+
+def test_registered_and_logged_out_users_are_evicted_as_guests(clock):
+    with test_flask.app_context():
+        dal.renew_session()
+        assert data_handler.register(1, "evicted_registered", "password", "evicted_registered@mail.com").succeed
+        state = LoggedInUser("evicted_logged_out", "password", "evicted_logged_out@mail.com")
+        add_guests([2])
+        data_handler.add_or_update_user_state(state, 2)
+        assert data_handler.logout(2).succeed
+        dal.drop_session()
+        assert list(data_handler._guests_seen.keys()) == [1, 2]
+        assert data_handler._get_connected_user_by_username("evicted_logged_out") == (-1, None)
+        clock.now += 61
+        add_guests([3])
+        assert set(data_handler.users.keys()) == {3}
+
+
+def test_spilled_guest_carts_are_capped(clock, monkeypatch):
+    monkeypatch.setattr(data_handler, "_guest_users_limit", 1)
+    monkeypatch.setattr(data_handler, "_spilled_guest_carts_limit", 2)
+    for user_id in range(1, 6):
+        guest = User(user_id)
+        data_handler.add_or_update_user(user_id, guest)
+        guest.shopping_cart.baskets = {STORE_NAME: Basket(STORE_NAME, user=str(user_id))}
+    # the carts of the guests that were evicted first are forgotten
+    assert list(data_handler._spilled_guest_carts.keys()) == [3, 4]
+    assert data_handler.get_user_by_id(1) is None
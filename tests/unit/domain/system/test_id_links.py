@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from src.domain.system.DAL import DAL
+from src.domain.system.db_config import db
+from src.domain.system.products_classes import Product, ProductDiscountLink, ProductInInventory
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from src.protocol_classes.classes_utils import TypedList
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+OWNER_NAME = "links_owner"
+STORE_NAME = "links_store"
+VALID = datetime.now() + timedelta(days=1)
+PRODUCTS = ["milk", "bread", "cheese", "eggs"]
+
+dal: DAL = DAL.get_instance()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_store(set_up_test):
+    owner = LoggedInUser(OWNER_NAME, "password", "links@mail.com")
+    store = make_store(STORE_NAME, {product: (10.0, 100, ["food"]) for product in PRODUCTS}, owner)
+    for product in PRODUCTS:
+        assert store.add_simple_product_discount(VALID, 0.1, product).succeed
+    dal.commit()
+
+
+def load_store() -> Store:
+    dal.renew_session()
+    return dal.query(Store).get(STORE_NAME)
+
+
+def discount_ids_in_db(product: ProductInInventory) -> list:
+    return [link._discount_id for link in dal.query(ProductDiscountLink).filter(
+        ProductDiscountLink._product_in_inventory_fk == product.id).order_by(ProductDiscountLink.id)]
+
+
+def test_the_ids_of_all_the_loaded_products_are_read_with_one_query():
+    store = load_store()
+    products = list(store.inventory.values())
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db.get_engine(test_flask)
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        ids = [list(p._discounts) for p in products]
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert len(statements) == 1
+    assert all(len(product_ids) == 1 for product_ids in ids)
+    assert ids == [discount_ids_in_db(p) for p in products]
+
+
+def test_a_change_writes_only_the_changed_ids():
+    store = load_store()
+    product = store.inventory["milk"]
+    first = product._discounts[0]
+    product._discounts.append(1000)
+    product._discounts.append(1001)
+    product._discounts.remove(first)
+    dal.commit()
+    store = load_store()
+    product = store.inventory["milk"]
+    assert list(product._discounts) == [1000, 1001]
+    assert discount_ids_in_db(product) == [1000, 1001]
+    product._discounts.clear()
+    product._discounts.append(first)
+    dal.commit()
+    assert discount_ids_in_db(load_store().inventory["milk"]) == [first]
+
+
+def test_removing_a_repeated_id_removes_all_its_rows():
+    store = load_store()
+    product = store.inventory["cheese"]
+    before = list(product._discounts)
+    product._discounts.extend([4000, 4001, 4000])
+    product._discounts.remove(4000)
+    assert list(product._discounts) == before + [4001]
+    dal.commit()
+    assert discount_ids_in_db(load_store().inventory["cheese"]) == before + [4001]
+    with pytest.raises(ValueError):
+        product._discounts.remove(4000)
+
+
+def test_the_ids_are_changed_only_through_the_methods_that_write_them():
+    ids = load_store().inventory["eggs"]._discounts
+    assert not isinstance(ids, list)
+    assert not any(hasattr(ids, name) for name in ["pop", "insert", "sort", "reverse", "__setitem__", "__delitem__"])
+
+
+def test_a_rolled_back_change_is_read_again():
+    store = load_store()
+    product = store.inventory["bread"]
+    before = list(product._discounts)
+    dal.begin_nested()
+    product._discounts.append(2000)
+    product._discounts.remove(before[0])
+    dal.flush()
+    dal.rollback()
+    assert list(product._discounts) == before
+    assert discount_ids_in_db(product) == before
+
+
+def test_the_ids_of_a_new_product_are_inserted_with_it():
+    dal.renew_session()
+    product = ProductInInventory(Product("water", "brand", TypedList(str, ["drinks"])), 5.0, 10, STORE_NAME)
+    product._discounts.append(3000)
+    dal.add(product)
+    assert discount_ids_in_db(product) == [3000]
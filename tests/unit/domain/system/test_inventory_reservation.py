@@ -0,0 +1,123 @@
+import random
+import threading
+
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.store_managers_classes import ShoppingHandler
+from src.domain.system.users_classes import User
+from src.external.payment_interface.payment_system import MockPaymentSystem
+from src.external.publisher import Publisher
+from src.external.supply_interface.supply_system import MockShippingSystem
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+CARD = 1234123412341234
+ADDRESS = ("Israel", "Beer Sheva", "Rager", 1)
+THREADS = 8
+ATTEMPTS_PER_THREAD = 25
+
+dal: DAL = DAL.get_instance()
+data_handler: DataHandler = None
+
+
+class SilentNotifications:
+    def send_to_client(self, msg_type, msg, user_name=None):
+        pass
+
+    def send_to_store(self, msg_type, msg, store_name, user_names):
+        pass
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_publisher(set_up_test):
+    global data_handler
+    data_handler = set_up_test
+    Publisher.get_instance().set_communication_handler(SilentNotifications())
+
+
+def in_stock(quantities: dict):
+    return {name: (10.0, quantity, ["food"]) for name, quantity in quantities.items()}
+
+
+def take(store_name: str, quantities: dict):
+    with test_flask.app_context():
+        dal.renew_session()
+        inventory = dal.get_store_by_name(store_name).inventory
+        left = dal.reserve_quantities([(inventory[name], q) for name, q in quantities.items()])
+        dal.drop_session()
+        return left
+
+
+def stock_of(store_name: str):
+    dal.renew_session()
+    stock = {name: p.quantity for name, p in dal.get_store_by_name(store_name).inventory.items()}
+    dal.drop_session()
+    return stock
+
+
+def test_reservation_takes_all_the_products_or_none_of_them():
+    with test_flask.app_context():
+        make_store("all_or_none", in_stock({"milk": 5, "bread": 1}))
+        dal.drop_session()
+        dal.renew_session()
+        inventory = dal.get_store_by_name("all_or_none").inventory
+        assert dal.reserve_quantities([(inventory["milk"], 3), (inventory["bread"], 2)]) == \
+               {inventory["bread"].id: 1}
+        assert dal.reserve_quantities([(inventory["milk"], 3), (inventory["bread"], 1)]) == {}
+        dal.drop_session()
+        assert stock_of("all_or_none") == {"milk": 2, "bread": 0}
+
+
+def test_missing_products_leave_the_stock_untouched():
+    with test_flask.app_context():
+        make_store("missing_store", in_stock({"milk": 5, "bread": 1}))
+        dal.drop_session()
+        handler = ShoppingHandler(data_handler, MockPaymentSystem(), MockShippingSystem())
+        data_handler.add_or_update_user(201, User(201))
+        assert handler.saving_product_to_shopping_cart("milk", "missing_store", 201, 4).succeed
+        assert handler.saving_product_to_shopping_cart("bread", "missing_store", 201, 1).succeed
+        dal.commit()  # as the service layer does at the end of every request
+        # someone else buys the bread meanwhile
+        other_buyer = threading.Thread(target=take, args=("missing_store", {"bread": 1}))
+        other_buyer.start()
+        other_buyer.join()
+        res = handler.make_purchase_of_all_shopping_cart(201, CARD, *ADDRESS, "12/30", "123", "holder", "1")
+        assert not res.succeed
+        assert res.data == [{"store_name": "missing_store", "problems": [("bread", "there are only 0 left")]}]
+        assert stock_of("missing_store") == {"milk": 5, "bread": 0}
+
+
+def test_concurrent_reservations_never_oversell():
+    with test_flask.app_context():
+        initial = {"milk": 60, "bread": 40}
+        make_store("contended_store", in_stock(initial))
+        dal.drop_session()
+        taken = []
+        errors = []
+        start = threading.Barrier(THREADS)
+
+        def buyer(seed: int):
+            rnd = random.Random(seed)
+            start.wait()
+            try:
+                for _ in range(ATTEMPTS_PER_THREAD):
+                    wanted = {"milk": rnd.randint(1, 3), "bread": rnd.randint(0, 2)}
+                    if not take("contended_store", wanted):
+                        taken.append(wanted)
+            except Exception as e:
+                errors.append(e)
+
+        # no store locks are taken: the conditional updates alone must keep the stock from going negative
+        threads = [threading.Thread(target=buyer, args=(i,)) for i in range(THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == []
+        stock = stock_of("contended_store")
+        assert all(quantity >= 0 for quantity in stock.values())
+        for name in initial:
+            assert initial[name] - stock[name] == sum(t[name] for t in taken)
+        # more was asked for than the stock, so some reservations had to fail
+        assert len(taken) < THREADS * ATTEMPTS_PER_THREAD
@@ -0,0 +1,30 @@
+import os
+
+from sqlalchemy import create_engine, inspect, text
+
+from src.domain.system.db_config import db
+from src.domain.system.migrations.new_columns import migrate
+
+MIGRATION_DB_FILE = 'db_columns_migration_test.db'
+
+
+def test_migration_adds_the_missing_columns_once():
+    if os.path.exists(MIGRATION_DB_FILE):
+        os.remove(MIGRATION_DB_FILE)
+    uri = f'sqlite:///{MIGRATION_DB_FILE}'
+    engine = create_engine(uri)
+    db.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(text('INSERT INTO store (_name, _opened) VALUES (\'old_store\', 1)'))
+        connection.execute(text('ALTER TABLE store DROP COLUMN _version'))
+    engine.dispose()
+    try:
+        assert migrate(uri) == ['store._version']
+        assert migrate(uri) == []
+        engine = create_engine(uri)
+        assert '_version' in {column['name'] for column in inspect(engine).get_columns('store')}
+        with engine.connect() as connection:
+            assert connection.execute(text('SELECT _name, _version FROM store')).fetchall() == [('old_store', None)]
+        engine.dispose()
+    finally:
+        os.remove(MIGRATION_DB_FILE)
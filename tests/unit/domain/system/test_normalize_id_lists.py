@@ -0,0 +1,106 @@
+import json
+import os
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from src.domain.system.db_config import db
+from src.domain.system.migrations.normalize_id_lists import downgrade, migrate
+
+DB_FILE = 'db_migration_test.db'
+URI = f'sqlite:///{DB_FILE}'
+
+# the json columns as the old schema kept them
+OLD_ROWS = [
+    ('INSERT INTO "loggedInUsers" (_user_name, _permissions_list) VALUES (:k, :v)', 'owner', ['s1', 's2']),
+    ('INSERT INTO store (_name, _permissions_ls, _purchases_ls) VALUES (:k, :v, \'"[]"\')', 's1',
+     json.dumps(['owner', 'manager'])),
+    ('INSERT INTO product_in_inventory (id, _discounts, _policies) VALUES (:k, :v, \'[7]\')', 1, [3, 5]),
+    ('INSERT INTO discount (id) VALUES (:k)', 3, None),
+    ('INSERT INTO complex_discount (id, _children_discounts_ls) VALUES (:k, :v)', 3, [4, 2]),
+    ('INSERT INTO shopping_policy (id) VALUES (:k)', 7, None),
+    ('INSERT INTO i_composite_policy (id, _shop_policies_ls) VALUES (:k, :v)', 7, None),
+]
+OLD_COLUMNS = [('"loggedInUsers"', '_permissions_list'), ('store', '_permissions_ls'), ('store', '_purchases_ls'),
+               ('product_in_inventory', '_discounts'), ('product_in_inventory', '_policies'),
+               ('complex_discount', '_children_discounts_ls'), ('i_composite_policy', '_shop_policies_ls'),
+               ('basket', '_products_ls')]
+
+
+@pytest.fixture(autouse=True)
+def old_database():
+    if os.path.exists(DB_FILE):
+        os.remove(DB_FILE)
+    engine = create_engine(URI)
+    db.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for table, column in OLD_COLUMNS:
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} JSON'))
+        for statement, key, value in OLD_ROWS:
+            connection.execute(text(statement), k=key, v=json.dumps(value) if value is not None else None)
+    engine.dispose()
+    yield
+    os.remove(DB_FILE)
+
+
+def links(engine, query: str):
+    with engine.connect() as connection:
+        return connection.execute(text(query)).fetchall()
+
+
+def columns_of(engine, table: str) -> set:
+    return {c['name'] for c in inspect(engine).get_columns(table.strip('"'))}
+
+
+def test_id_lists_are_moved_in_order_and_the_json_columns_are_kept_aside():
+    assert migrate(URI) == {'store._permissions_ls': 2, 'loggedInUsers._permissions_list': 2,
+                            'product_in_inventory._discounts': 2, 'product_in_inventory._policies': 1,
+                            'complex_discount._children_discounts_ls': 2, 'i_composite_policy._shop_policies_ls': 0,
+                            'basket._products_ls': 0, 'store._purchases_ls': 0}
+    engine = create_engine(URI)
+    assert links(engine, 'SELECT _store_fk, _user_name FROM store_permission_user ORDER BY id') == \
+           [('s1', 'owner'), ('s1', 'manager')]
+    assert links(engine, 'SELECT _user_fk, _store_name FROM user_permission_store ORDER BY id') == \
+           [('owner', 's1'), ('owner', 's2')]
+    assert links(engine, 'SELECT _discount_id FROM product_in_inventory_discount ORDER BY id') == [(3,), (5,)]
+    assert links(engine, 'SELECT _policy_id FROM product_in_inventory_policy') == [(7,)]
+    assert links(engine, 'SELECT _child_id FROM complex_discount_child ORDER BY id') == [(4,), (2,)]
+    assert links(engine, 'SELECT _child_id FROM composite_policy_child') == []
+    for table, column in OLD_COLUMNS:
+        assert column not in columns_of(engine, table)
+        assert f'{column}_json' in columns_of(engine, table)
+    assert links(engine, 'SELECT _discounts_json FROM product_in_inventory') == [(json.dumps([3, 5]),)]
+    engine.dispose()
+
+
+def test_migrating_twice_changes_nothing():
+    migrate(URI)
+    assert migrate(URI) == {}
+    engine = create_engine(URI)
+    assert len(links(engine, 'SELECT * FROM store_permission_user')) == 2
+    engine.dispose()
+
+
+def test_downgrade_moves_the_current_links_back_into_the_json_columns():
+    migrate(URI)
+    engine = create_engine(URI)
+    with engine.begin() as connection:
+        connection.execute(text('INSERT INTO store_permission_user (_store_fk, _user_name) VALUES (\'s1\', \'new\')'))
+        connection.execute(text('DELETE FROM product_in_inventory_discount WHERE _discount_id = 3'))
+    engine.dispose()
+    assert downgrade(URI) == {'basket._products_ls': 0, 'store._purchases_ls': 0, 'store._permissions_ls': 3,
+                              'loggedInUsers._permissions_list': 2, 'product_in_inventory._discounts': 1,
+                              'product_in_inventory._policies': 1, 'complex_discount._children_discounts_ls': 2,
+                              'i_composite_policy._shop_policies_ls': 0}
+    engine = create_engine(URI)
+    # as the previous version saved them
+    assert links(engine, 'SELECT _permissions_ls, _purchases_ls FROM store') == \
+           [(json.dumps(json.dumps(['owner', 'manager', 'new'])), '"[]"')]
+    assert links(engine, 'SELECT _permissions_list FROM "loggedInUsers"') == [(json.dumps(['s1', 's2']),)]
+    assert links(engine, 'SELECT _discounts, _policies FROM product_in_inventory') == [('[5]', '[7]')]
+    assert links(engine, 'SELECT _children_discounts_ls FROM complex_discount') == [('[4, 2]',)]
+    assert links(engine, 'SELECT _shop_policies_ls FROM i_composite_policy') == [('[]',)]
+    assert 'store_permission_user' not in inspect(engine).get_table_names()
+    engine.dispose()
+    assert downgrade(URI) == {}
+    assert migrate(URI)['store._permissions_ls'] == 3
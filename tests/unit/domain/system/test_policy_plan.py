@@ -0,0 +1,134 @@
+import calendar
+from datetime import date
+
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.cart_purchase_classes import Basket
+from src.domain.system.shopping_policies import LeafSpecificProductQuantity, PolicyPlan
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+OWNER_NAME = "policy_plan_owner"
+TODAY = calendar.day_name[date.today().weekday()]
+OTHER_DAY = "Friday" if TODAY != "Friday" else "Sunday"
+STOCK = {"milk": (10.0, 100, ["dairy"]), "bread": (20.0, 100, ["bakery"]),
+         "cheese": (30.0, 100, ["dairy", "deli"])}
+
+dal: DAL = DAL.get_instance()
+owner: LoggedInUser = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_owner(set_up_test):
+    global owner
+    owner = LoggedInUser(OWNER_NAME, "password", "policy_plan@mail.com")
+    dal.add(owner)
+
+
+def make_basket(store: Store, products: dict):
+    basket = Basket(store.name, None, OWNER_NAME)
+    dal.add(basket)
+    for name, quantity in products.items():
+        basket.add_product_to_basket(name, quantity)
+    return basket
+
+
+def add_policy(store: Store, min_basket=None, max_basket=None, product=None, min_product=None, max_product=None,
+               category=None, min_category=None, max_category=None, day=""):
+    return store.add_policy(min_basket, max_basket, product, min_product, max_product, category, min_category,
+                            max_category, day).data
+
+
+def combine(store: Store, policy_ids: list, operator: str):
+    assert store.combine_policies(policy_ids, operator).succeed
+    # the combined policy is the last child of the root
+    return list(store.shopping_policies.shop_policies_dict.keys())[-1]
+
+
+def check(store: Store, products: dict):
+    basket = make_basket(store, products)
+    answer = store.apply_policies_on_basket(basket)
+    assert answer == store.shopping_policies.apply(basket)
+    return answer
+
+
+def test_leaves_under_the_same_and_are_merged():
+    with test_flask.app_context():
+        store = make_store("policy_plan_and", STOCK, owner)
+        add_policy(store, product="milk", min_product=2)
+        add_policy(store, product="milk", max_product=4)
+        add_policy(store, category="dairy", max_category=5)
+        add_policy(store, min_basket=3)
+        add_policy(store, day=OTHER_DAY)
+        assert check(store, {"milk": 3})
+        assert not check(store, {"milk": 5})
+        # milk is in the range, but milk and cheese are too many dairy products
+        assert not check(store, {"milk": 3, "cheese": 3})
+        assert not check(store, {"bread": 2})
+        # a product that is not in the basket answers its policy
+        assert check(store, {"bread": 3})
+        add_policy(store, day=TODAY)
+        # the plan is compiled again after the tree changed
+        assert not check(store, {"milk": 3})
+
+
+def test_or_and_xor_of_nested_policies():
+    with test_flask.app_context():
+        store = make_store("policy_plan_xor", STOCK, owner)
+        many_milk = add_policy(store, product="milk", min_product=3)
+        deli = add_policy(store, category="deli", min_category=2)
+        or_id = combine(store, [many_milk, deli], "or")
+        big_basket = add_policy(store, min_basket=10)
+        not_today = add_policy(store, day=TODAY)
+        xor_id = combine(store, [or_id, big_basket, not_today], "xor")
+        assert store.shopping_policies.search_for_policy(xor_id)
+        # only the or policy holds
+        assert check(store, {"milk": 3})
+        # the or policy and the basket quantity hold
+        assert not check(store, {"milk": 10})
+        # none of them hold
+        assert not check(store, {"milk": 2, "cheese": 1})
+        # a category that is not in the basket answers its policy
+        assert check(store, {"bread": 1})
+
+
+def test_basket_quantities_are_summed_once_per_check(monkeypatch):
+    with test_flask.app_context():
+        store = make_store("policy_plan_once", STOCK, owner)
+        for _ in range(5):
+            add_policy(store, category="dairy", max_category=10)
+            add_policy(store, product="milk", max_product=10)
+        basket = make_basket(store, {"milk": 1, "cheese": 1})
+        monkeypatch.setattr(Basket, "get_total_quantity_of_category",
+                            lambda b, category: pytest.fail("category summed by a leaf"))
+        monkeypatch.setattr(LeafSpecificProductQuantity, "apply", lambda p, b: pytest.fail("leaf applied"))
+        assert store.apply_policies_on_basket(basket)
+
+
+def test_plan_is_compiled_once_per_version_of_the_store(monkeypatch):
+    with test_flask.app_context():
+        store = make_store("policy_plan_versions", STOCK, owner)
+        add_policy(store, product="milk", max_product=4)
+        assert check(store, {"milk": 3})
+        version = store.version
+        dal.drop_session()
+
+        # the next request loads the store again, its plan was compiled by the previous one
+        dal.renew_session()
+        with monkeypatch.context() as m:
+            m.setattr(PolicyPlan, "compile", lambda root: pytest.fail("plan was compiled again"))
+            store = dal.query(Store).get("policy_plan_versions")
+            assert store.version == version
+            assert check(store, {"milk": 3})
+            assert not check(store, {"milk": 5})
+
+        too_many = add_policy(store, min_basket=4)
+        assert store.version != version
+        dal.drop_session()
+        dal.renew_session()
+        store = dal.query(Store).get("policy_plan_versions")
+        assert not check(store, {"milk": 3})
+        assert store.remove_policy_from_store(too_many).succeed
+        assert check(store, {"milk": 3})
@@ -0,0 +1,82 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from src.domain.system.DAL import DAL
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, count_queries, queried_tables, set_up_test, make_store
+
+STORE_NAME = "price_store"
+OWNER_NAME = "price_owner"
+
+dal: DAL = DAL.get_instance()
+store: Store = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_store(set_up_test):
+    global store
+    owner = LoggedInUser(OWNER_NAME, "password", "price@mail.com")
+    store = make_store(STORE_NAME, {"cheap": (10.0, 10, ["food"]), "expensive": (100.0, 10, ["food"])}, owner)
+
+
+def after_discount(product_name: str):
+    return store.inventory[product_name].to_dictionary()["after_discount"]
+
+
+def test_cached_price_does_not_query_discounts():
+    with test_flask.app_context():
+        discount_id = store.add_simple_product_discount(datetime.now() + timedelta(days=1), 0.5, "expensive").data
+        assert after_discount("expensive") == 50
+        store.search_product("e", max_price=60)
+        with count_queries() as statements:
+            assert after_discount("expensive") == 50
+            found = store.search_product("e", max_price=60)
+        assert [p["product"]["product"]["name"] for p in found] == ["cheap", "expensive"]
+        assert "discount" not in queried_tables(statements)
+        assert store.remove_discount_from_store(discount_id).succeed
+
+
+def test_discount_changes_invalidate_price():
+    with test_flask.app_context():
+        assert after_discount("cheap") == 10
+        discount_id = store.add_simple_category_discount(datetime.now() + timedelta(days=1), 0.5, "food").data
+        assert after_discount("cheap") == 5
+        edited_id = store.add_simple_category_discount(datetime.now() + timedelta(days=1), 0.2, "food",
+                                                       discount_id=discount_id).data
+        assert after_discount("cheap") == 8
+        assert store.remove_discount_from_store(edited_id).succeed
+        assert after_discount("cheap") == 10
+
+
+def test_expired_discount_stops_applying():
+    with test_flask.app_context():
+        discount_id = store.add_simple_product_discount(datetime.now() + timedelta(seconds=1), 0.5, "cheap").data
+        assert after_discount("cheap") == 5
+        time.sleep(1.1)
+        assert after_discount("cheap") == 10
+        assert store.remove_discount_from_store(discount_id).succeed
+
+
+def test_changes_saved_by_another_process_are_priced_again():
+    global store
+    with test_flask.app_context():
+        discount_id = store.add_simple_product_discount(datetime.now() + timedelta(days=1), 0.5, "expensive").data
+        assert after_discount("expensive") == 50
+        dal.commit()
+        # another process changes the discount, in the same transaction as the new version of its store
+        engine = create_engine(test_flask.config['SQLALCHEMY_DATABASE_URI'])
+        with engine.begin() as connection:
+            connection.execute(text("UPDATE discount_strategy SET _discount_percent = 0.2 WHERE id = "
+                                    "(SELECT _discount_strategy_fk FROM discount WHERE id = :id)"), id=discount_id)
+            connection.execute(text("UPDATE store SET _version = 'other_process' WHERE _name = :name"),
+                               name=STORE_NAME)
+        engine.dispose()
+        dal.drop_session()
+        dal.renew_session()
+        store = dal.query(Store).filter_by(_name=STORE_NAME).one()
+        assert after_discount("expensive") == 80
+        assert store.remove_discount_from_store(discount_id).succeed
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.cart_purchase_classes import Basket, Purchase, PurchaseType
+from src.domain.system.db_config import db
+from src.domain.system.permission_classes import Permission, Role
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser, User
+from tests.db_config_tests import test_flask, count_queries, queried_tables, set_up_test, make_store
+
+STORE_NAME = "history_store"
+OWNER_NAME = "history_owner"
+NUM_OF_PURCHASES = 8
+START_DATE = datetime(2020, 1, 1)
+
+dal: DAL = DAL.get_instance()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up(set_up_test):
+    owner = LoggedInUser(OWNER_NAME, "password", "history@mail.com")
+    store = make_store(STORE_NAME, {}, owner)
+    perm = Permission.define_permissions_for_init(Role.store_initial_owner, owner.user_name, store.name, None,
+                                                  owner, store, None)
+    store.add_store_member(perm)
+    owner.add_permission(perm)
+    dal.add(perm)
+    basket = Basket(store.name, None, owner.user_name)
+    dal.add(basket)
+    # two purchases on each date, to check the order of purchases made at the same time
+    dal.add_all([Purchase(PurchaseType.Immediate.value, f"buyer{i}", basket.id, store.name,
+                          START_DATE + timedelta(days=i // 2), basket) for i in range(NUM_OF_PURCHASES)],
+                add_only=True)
+    dal.commit()
+    reload_sessions()
+
+
+def reload_sessions():
+    dal.discard_session()
+    db.session.remove()
+
+
+def get_owner() -> User:
+    user = User(1)
+    user.user_state = dal.get_user_by_name(OWNER_NAME)
+    user.user_state.is_connected = True
+    return user
+
+
+def test_store_load_does_not_query_purchases():
+    with test_flask.app_context():
+        with count_queries() as statements:
+            store = dal.query(Store).filter_by(_name=STORE_NAME).one()
+            store.to_dictionary()
+        assert "purchase" not in queried_tables(statements)
+        reload_sessions()
+
+
+def test_purchase_history_pages():
+    with test_flask.app_context():
+        store = dal.query(Store).filter_by(_name=STORE_NAME).one()
+        owner = get_owner()
+        seen = []
+        cursor = None
+        while True:
+            res = store.watch_purchase_history(owner, cursor, 3)
+            assert res.succeed
+            assert len(res.data["purchases"]) <= 3
+            seen += res.data["purchases"]
+            cursor = res.data["next_cursor"]
+            if cursor is None:
+                break
+        assert len(seen) == NUM_OF_PURCHASES
+        # newest first, purchases made at the same time are ordered by id
+        keys = [(p["time_of_purchase"], p["purchase_id"]) for p in seen]
+        assert keys == sorted(keys, reverse=True)
+        assert len(set(p["purchase_id"] for p in seen)) == NUM_OF_PURCHASES
+        reload_sessions()
+
+
+def test_purchase_history_exact_page_has_no_next_cursor():
+    with test_flask.app_context():
+        store = dal.query(Store).filter_by(_name=STORE_NAME).one()
+        res = store.watch_purchase_history(get_owner(), None, NUM_OF_PURCHASES)
+        assert res.succeed
+        assert len(res.data["purchases"]) == NUM_OF_PURCHASES
+        assert res.data["next_cursor"] is None
+        reload_sessions()
+
+
+def test_purchase_history_bad_input():
+    with test_flask.app_context():
+        store = dal.query(Store).filter_by(_name=STORE_NAME).one()
+        owner = get_owner()
+        assert not store.watch_purchase_history(owner, "not a cursor").succeed
+        assert not store.watch_purchase_history(owner, None, 0).succeed
+        assert not store.watch_purchase_history(User(2)).succeed
+        reload_sessions()
@@ -0,0 +1,245 @@
+import time
+from datetime import timedelta
+
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.data_handler import DataHandler
+from src.domain.system.products_classes import ProductInInventory
+from src.domain.system.stock_reservations import StockReservations
+from src.domain.system.store_classes import Store
+from src.domain.system.store_managers_classes import ShoppingHandler, GreenExecutor
+from src.domain.system.users_classes import LoggedInUser, User
+from src.external.payment_interface.payment_system import DelayedMockPaymentSystem, MockPaymentSystem
+from src.external.publisher import Publisher
+from src.external.supply_interface.supply_system import MockShippingSystem
+from src.protocol_classes.classes_utils import TypedList
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+STORE_NAME = "reserve_store"
+OWNER_NAME = "reserve_owner"
+CARD = 1234123412341234
+ADDRESS = ("Israel", "Beer Sheva", "Rager", 1)
+
+dal: DAL = DAL.get_instance()
+data_handler: DataHandler = None
+store: Store = None
+
+
+class SilentNotifications:
+    def send_to_client(self, msg_type, msg, user_name=None):
+        pass
+
+    def send_to_store(self, msg_type, msg, store_name, user_names):
+        pass
+
+
+class RecordingPaymentSystem(DelayedMockPaymentSystem):
+    def __init__(self, delay_sec: float = 0, on_pay=None):
+        super().__init__(delay_sec)
+        self.on_pay = on_pay
+        self.cancelled = []
+
+    def pay(self, card_number: str, month: str, year: str, holder: str, ccv: str, holder_id: str):
+        if self.on_pay is not None:
+            self.on_pay()
+        return super().pay(card_number, month, year, holder, ccv, holder_id)
+
+    def cancel_pay(self, transaction_id: str):
+        self.cancelled.append(transaction_id)
+
+
+class RecordingShippingSystem(MockShippingSystem):
+    def __init__(self):
+        self.cancelled = []
+
+    def cancel_supply(self, transaction_id: str):
+        self.cancelled.append(transaction_id)
+
+
+class FailingShippingSystem(MockShippingSystem):
+    """
+    accepts the address, and then answers that it can not ship to it
+    """
+
+    def ship(self, country: str, city: str, street: str, house_number: int, apartment: str = "0", floor: int = 0):
+        return "Cannot ship to Country"
+
+
+class StuckCancelPaymentSystem(RecordingPaymentSystem):
+    def cancel_pay(self, transaction_id: str):
+        time.sleep(1)
+        super().cancel_pay(transaction_id)
+
+
+class FailingCancelShippingSystem(MockShippingSystem):
+    def cancel_supply(self, transaction_id: str):
+        raise ConnectionError("shipping system is down")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_store(set_up_test):
+    global data_handler, store
+    data_handler = set_up_test
+    Publisher.get_instance().set_communication_handler(SilentNotifications())
+    owner = LoggedInUser(OWNER_NAME, "password", "reserve@mail.com")
+    store = make_store(STORE_NAME, {"milk": (10.0, 10, ["dairy"])}, owner)
+
+
+def purchase(handler: ShoppingHandler, user_id: int, quantity: int = 2, card: int = CARD):
+    data_handler.add_or_update_user(user_id, User(user_id))
+    assert handler.saving_product_to_shopping_cart("milk", STORE_NAME, user_id, quantity).succeed
+    return handler.make_purchase_of_all_shopping_cart(user_id, card, *ADDRESS, "12/30", "123", "holder", "1")
+
+
+def milk_in_stock():
+    # read from the database, purchases take the products with bulk updates
+    return dal.query(ProductInInventory._quantity).filter_by(id=store.inventory["milk"].id).scalar()
+
+
+def test_store_is_not_locked_while_paying():
+    with test_flask.app_context():
+        lock_was_free = []
+
+        def try_store_lock():
+            lock = dal._named_locks[STORE_NAME]
+            lock_was_free.append(lock.acquire(blocking=False))
+            if lock_was_free[-1]:
+                lock.release()
+
+        handler = ShoppingHandler(data_handler, RecordingPaymentSystem(on_pay=try_store_lock), MockShippingSystem())
+        before = milk_in_stock()
+        assert purchase(handler, 101).succeed
+        assert lock_was_free == [True]
+        assert milk_in_stock() == before - 2
+        assert len(StockReservations.get_instance()) == 0
+
+
+def test_declined_payment_gives_the_products_back():
+    with test_flask.app_context():
+        handler = ShoppingHandler(data_handler, MockPaymentSystem(), MockShippingSystem())
+        before = milk_in_stock()
+        res = purchase(handler, 102, card=1234)
+        assert not res.succeed and res.msg == "Payment failed"
+        assert milk_in_stock() == before
+        assert len(StockReservations.get_instance()) == 0
+
+
+def test_late_payment_is_cancelled_after_the_timeout():
+    with test_flask.app_context():
+        payment = RecordingPaymentSystem(delay_sec=0.3)
+        handler = ShoppingHandler(data_handler, payment, MockShippingSystem(), external_system_timeout=0.05)
+        before = milk_in_stock()
+        res = purchase(handler, 103)
+        assert not res.succeed and res.msg == "Payment failed"
+        assert milk_in_stock() == before
+        time.sleep(0.5)
+        assert payment.cancelled == [True]
+
+
+def test_expired_reservation_cancels_payment_and_shipping():
+    with test_flask.app_context():
+        payment, shipping = RecordingPaymentSystem(delay_sec=0.05), RecordingShippingSystem()
+        handler = ShoppingHandler(data_handler, payment, shipping, reservation_ttl=timedelta(milliseconds=10))
+        before = milk_in_stock()
+        res = purchase(handler, 104)
+        assert not res.succeed
+        assert payment.cancelled == [True] and shipping.cancelled == ["OK"]
+        assert milk_in_stock() == before
+        assert len(StockReservations.get_instance()) == 0
+
+
+def test_failed_shipping_cancels_the_payment_and_gives_the_products_back():
+    with test_flask.app_context():
+        payment = RecordingPaymentSystem()
+        handler = ShoppingHandler(data_handler, payment, FailingShippingSystem())
+        before = milk_in_stock()
+        res = purchase(handler, 105)
+        assert not res.succeed and res.msg == "Shipping failed"
+        assert payment.cancelled == [True]
+        assert milk_in_stock() == before
+        assert len(StockReservations.get_instance()) == 0
+
+
+def test_stuck_or_failing_cancels_do_not_hold_the_purchase_or_the_products():
+    with test_flask.app_context():
+        handler = ShoppingHandler(data_handler, StuckCancelPaymentSystem(delay_sec=0.05), FailingCancelShippingSystem(),
+                                  reservation_ttl=timedelta(milliseconds=10), external_system_timeout=0.2)
+        before = milk_in_stock()
+        start = time.time()
+        res = purchase(handler, 106)
+        assert not res.succeed and res.msg == "Purchase took too long, payment and shipping were cancelled"
+        assert time.time() - start < 0.9
+        assert milk_in_stock() == before
+        assert len(StockReservations.get_instance()) == 0
+
+
+def test_external_systems_are_waited_for_without_blocking_eventlet():
+    eventlet = pytest.importorskip("eventlet")
+    thread_pool = ShoppingHandler._external_calls
+    ShoppingHandler.set_external_calls_executor(GreenExecutor())
+    try:
+        handler = ShoppingHandler(data_handler, MockPaymentSystem(), MockShippingSystem(), external_system_timeout=0.1)
+        ticks, cancelled = [], []
+
+        def ticking():
+            while len(ticks) < 1_000:
+                ticks.append(time.time())
+                eventlet.sleep(0.01)
+
+        def slow_pay(delay: float):
+            # blocks the native thread it runs on
+            time.sleep(delay)
+            return "transaction"
+
+        ticker = eventlet.spawn(ticking)
+        eventlet.sleep(0)
+        assert handler._call_external_system(slow_pay, cancelled.append, 0.05) == "transaction"
+        waited = len(ticks)
+        assert handler._call_external_system(slow_pay, cancelled.append, 0.3) is False
+        # the other greenlets ran while the calls were waited for
+        assert waited > 2 and len(ticks) - waited > 5
+        assert cancelled == []
+        eventlet.sleep(0.4)
+        assert cancelled == ["transaction"]
+        ticker.kill()
+    finally:
+        ShoppingHandler.set_external_calls_executor(thread_pool)
+
+
+def in_stock(product_name: str):
+    return dal.query(ProductInInventory._quantity).filter_by(id=store.inventory[product_name].id).scalar()
+
+
+def reserve_all(product_name: str, ttl: timedelta) -> int:
+    # step 1 of a purchase that takes the whole stock of the product
+    quantity = in_stock(product_name)
+    assert dal.reserve_quantities([(store.inventory[product_name], quantity)]) == {}
+    reservation_id = StockReservations.get_instance().reserve({STORE_NAME: {product_name: quantity}}, ttl)
+    dal.commit()
+    return reservation_id
+
+
+def test_reserved_products_are_not_cleared_from_the_inventory():
+    with test_flask.app_context():
+        store.add_product("rare", 10.0, 2, "brand", TypedList(str, ["dairy"]))
+        reservation_id = reserve_all("rare", timedelta(minutes=1))
+        # another purchase from the store ends meanwhile
+        store.clear_empty_products_from_inventory()
+        assert "rare" in store.inventory
+        ShoppingHandler._release_reservation(reservation_id)
+        assert in_stock("rare") == 2
+        assert len(StockReservations.get_instance()) == 0
+
+
+def test_reservations_of_a_stopped_server_are_given_back_at_start():
+    with test_flask.app_context():
+        store.add_product("interrupted", 10.0, 3, "brand", TypedList(str, ["dairy"]))
+        product_id = store.inventory["interrupted"].id
+        reserve_all("interrupted", timedelta(0))
+        # the server stopped while the purchase waited for the external systems, the reservation is in the database
+        dal.drop_session()
+        ShoppingHandler.release_expired_reservations()
+        dal.renew_session()
+        assert dal.query(ProductInInventory._quantity).filter_by(id=product_id).scalar() == 3
+        assert len(StockReservations.get_instance()) == 0
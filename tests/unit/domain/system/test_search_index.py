@@ -0,0 +1,121 @@
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import src.domain.system.search_index as search_index_module
+from src.domain.system.DAL import DAL
+from src.domain.system.products_classes import ProductInInventory
+from src.domain.system.search_index import ProductSearchIndex
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from src.protocol_classes.classes_utils import TypedList
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+STORE_NAME = "search_store"
+OWNER_NAME = "search_owner"
+
+dal: DAL = DAL.get_instance()
+search_index: ProductSearchIndex = ProductSearchIndex.get_instance()
+store: Store = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_store(set_up_test):
+    global store
+    owner = LoggedInUser(OWNER_NAME, "password", "search@mail.com")
+    store = make_store(STORE_NAME, {"red apple": (5.0, 10, ["fruit"], "farm"),
+                                    "green apple": (7.0, 10, ["fruit"], "orchard"),
+                                    "apple juice": (12.0, 10, ["drink"], "farm"),
+                                    "tea": (3.0, 10, ["drink", "hot"], "leaf")}, owner)
+
+
+def found(**conditions):
+    return search_index.find_products(store, conditions.get("name"), conditions.get("categories"),
+                                      conditions.get("brands"), conditions.get("min_price"))
+
+
+def searched_names(**conditions):
+    return sorted(p["product"]["name"] for p in store._search_products(
+        conditions.get("name"), conditions.get("categories"), conditions.get("brands"),
+        conditions.get("min_price"), conditions.get("max_price")))
+
+
+def test_find_by_each_condition():
+    with test_flask.app_context():
+        assert found(name="apple") == {"red apple", "green apple", "apple juice"}
+        # shorter than a gram and text that is spread over grams of different products
+        assert found(name="ea") == {"tea"}
+        assert found(name="apple tea") == set()
+        assert found(categories=["drink", "missing"]) == {"apple juice", "tea"}
+        assert found(brands=["farm"]) == {"red apple", "apple juice"}
+        assert found(min_price=7) == {"green apple", "apple juice"}
+        assert found(name="apple", categories=["fruit"], brands=["orchard"]) == {"green apple"}
+        assert found() == {"red apple", "green apple", "apple juice", "tea"}
+
+
+def test_search_serializes_only_hits(monkeypatch):
+    with test_flask.app_context():
+        serialized = []
+        to_dictionary = ProductInInventory.to_dictionary
+
+        def counting_to_dictionary(product):
+            serialized.append(product.product_name)
+            return to_dictionary(product)
+
+        monkeypatch.setattr(ProductInInventory, "to_dictionary", counting_to_dictionary)
+        assert searched_names(name="apple", categories=["drink"]) == ["apple juice"]
+        assert serialized == ["apple juice"]
+        # the max price is checked on the price after discount
+        assert searched_names(name="apple", max_price=6) == ["red apple"]
+
+
+def test_index_follows_inventory_changes():
+    with test_flask.app_context():
+        found()
+        store.add_product("apple pie", 20.0, 5, "bakery", TypedList(str, ["food"]))
+        assert searched_names(name="apple", min_price=15) == ["apple pie"]
+
+        store.edit_product_in_store("apple pie", "farm", 9.0, 5, ["fruit"], "")
+        assert searched_names(name="apple", min_price=15) == []
+        assert searched_names(brands=["bakery"]) == []
+        assert searched_names(categories=["fruit"], brands=["farm"]) == ["apple pie", "red apple"]
+
+        store.remove_product_from_store("apple pie")
+        assert "apple pie" not in found(name="apple")
+
+        store.inventory["tea"].quantity = 0
+        store.clear_empty_products_from_inventory()
+        assert found(categories=["hot"]) == set()
+
+
+def test_changes_of_this_process_update_the_index_without_building_it_again(monkeypatch):
+    with test_flask.app_context():
+        found()
+
+        def not_built_again():
+            raise AssertionError("the index of the store was built again")
+
+        monkeypatch.setattr(search_index_module, "_StoreProductIndex", not_built_again)
+        store.add_product("apple cake", 15.0, 5, "bakery", TypedList(str, ["food"]))
+        store.edit_product_in_store("green apple", "farm", 7.0, 10, ["fruit"], "")
+        assert found(brands=["bakery"]) == {"apple cake"}
+        assert found(name="apple", brands=["farm"]) == {"red apple", "green apple", "apple juice"}
+
+
+def test_changes_saved_by_another_process_build_the_index_again():
+    with test_flask.app_context():
+        assert found(brands=["farm"]) == {"red apple", "green apple", "apple juice"}
+        dal.commit()
+        # another process edits the brand of a product, in the same transaction as the new version of its store
+        engine = create_engine(test_flask.config['SQLALCHEMY_DATABASE_URI'])
+        with engine.begin() as connection:
+            connection.execute(text("UPDATE product SET _brand = 'cider house' WHERE _name = 'apple juice'"))
+            connection.execute(text("UPDATE store SET _version = 'other_process' WHERE _name = :name"),
+                               name=STORE_NAME)
+        engine.dispose()
+        dal.drop_session()
+        dal.renew_session()
+        loaded = dal.query(Store).filter_by(_name=STORE_NAME).one()
+        assert loaded.version == 'other_process'
+        assert search_index.find_products(loaded, brands=["farm"]) == {"red apple", "green apple"}
+        assert search_index.find_products(loaded, brands=["cider house"]) == {"apple juice"}
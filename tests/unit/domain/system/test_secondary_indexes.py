@@ -0,0 +1,106 @@
+import os
+import re
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+
+from src.domain.system.DAL import DAL
+from src.domain.system.db_config import db
+from src.domain.system.migrations.secondary_indexes import migrate
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+STORE_NAME = "index_store"
+OWNER_NAME = "index_owner"
+MIGRATION_DB_FILE = 'db_index_migration_test.db'
+# the tables of the hot lookup columns, a query that scans one of them fails the test
+HOT_TABLES = {'purchase', 'basket', 'product_in_shopping_cart', 'PendingMessages', 'permissions',
+              'product_in_inventory'}
+HOT_INDEXES = ['ix_basket_user_used', 'ix_permissions_user', 'ix_product_in_inventory_store',
+               'ix_product_in_shopping_cart_basket', 'ix_purchase_user']
+
+dal: DAL = DAL.get_instance()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_store(set_up_test):
+    owner = LoggedInUser(OWNER_NAME, "password", "index@mail.com")
+    make_store(STORE_NAME, {"milk": (10.0, 10, ["dairy"])}, owner)
+    dal.drop_session()
+
+
+@contextmanager
+def executed_statements():
+    """
+    :return: list that holds the (statement, parameters) that were executed inside the with block
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def scanned_hot_tables(statements):
+    """
+    :param statements: list of (statement, parameters)
+    :return: set of the hot tables that sqlite reads from start to end in one of the statements
+    """
+    output = set()
+    connection = db.get_engine(test_flask).raw_connection()
+    try:
+        for statement, parameters in statements:
+            if statement.startswith(('SELECT', 'DELETE', 'UPDATE')):
+                for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall():
+                    scan = re.match(r"SCAN (?:TABLE )?(\w+)", row[-1])
+                    if scan is not None and scan.group(1) in HOT_TABLES:
+                        output.add(scan.group(1))
+    finally:
+        connection.close()
+    return output
+
+
+@pytest.mark.parametrize("dal_query", [
+    lambda: dal.get_purchases_of_user(OWNER_NAME),
+    lambda: dal.get_purchases_of_store(STORE_NAME),
+    lambda: dal.get_purchases_page_of_store(STORE_NAME, 10),
+    lambda: dal.get_baskets_by_user(OWNER_NAME),
+    lambda: dal.get_all_products_of_basket(1),
+    lambda: dal.get_all_products_of_baskets([1, 2]),
+    lambda: dal.clear_pending_messages_for_user(OWNER_NAME),
+    lambda: dal.get_permission_with_id_keys_for_users([OWNER_NAME]),
+    lambda: dal.get_store_by_name(STORE_NAME).inventory,
+    lambda: dal.get_products_in_inventory_ids_with_discounts(STORE_NAME, [1]),
+])
+def test_hot_queries_use_an_index(dal_query):
+    with test_flask.app_context():
+        dal.renew_session()
+        with executed_statements() as statements:
+            dal_query()
+        dal.drop_session()
+        assert len(statements) > 0
+        assert scanned_hot_tables(statements) == set()
+
+
+def test_migration_creates_the_missing_indexes_once():
+    if os.path.exists(MIGRATION_DB_FILE):
+        os.remove(MIGRATION_DB_FILE)
+    uri = f'sqlite:///{MIGRATION_DB_FILE}'
+    engine = create_engine(uri)
+    db.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for index in HOT_INDEXES:
+            connection.execute(text(f'DROP INDEX {index}'))
+    engine.dispose()
+    try:
+        assert migrate(uri) == HOT_INDEXES
+        assert migrate(uri) == []
+    finally:
+        os.remove(MIGRATION_DB_FILE)
@@ -192,17 +192,6 @@ def test_add_product_after_product_cancellation():
     assert product.price == 100 and product.quantity == 1 and product.product.name == 'new_product_new_product'
 
 
-def test_pre_purchase_from_store():
-    global s
-    with pytest.raises(TypeError):
-        s.pre_purchase_from_store(1, '1')
-    with pytest.raises(TypeError):
-        s.pre_purchase_from_store('p1', '1')
-    with pytest.raises(TypeError):
-        s.pre_purchase_from_store(1, 1)
-    s.pre_purchase_from_store('p1', 1)
-
-
 def test_remove_product_from_store():
     global s
     with pytest.raises(TypeError):
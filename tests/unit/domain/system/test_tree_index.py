@@ -0,0 +1,181 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.domain.system.DAL import DAL
+from src.domain.system.discounts import ComplexDiscount, _IDiscount
+from src.domain.system.shopping_policies import ICompositePolicy, IShoppingPolicies
+from src.domain.system.store_classes import Store
+from src.domain.system.users_classes import LoggedInUser
+from tests.db_config_tests import test_flask, set_up_test, make_store
+
+OWNER_NAME = "index_owner"
+VALID = datetime.now() + timedelta(days=1)
+PRODUCTS = ["milk", "bread", "cheese", "eggs"]
+OPERATORS = ["or", "and", "xor"]
+STEPS = 40
+STOCK = {product: (10.0, 100, [f"{product}_category"]) for product in PRODUCTS}
+
+dal: DAL = DAL.get_instance()
+owner: LoggedInUser = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_up_owner(set_up_test):
+    global owner
+    owner = LoggedInUser(OWNER_NAME, "password", "index@mail.com")
+    dal.add(owner)
+
+
+def discount_children(discount):
+    return discount.children_discounts_dict if isinstance(discount, ComplexDiscount) else {}
+
+
+def policy_children(policy):
+    return policy.shop_policies_dict if isinstance(policy, ICompositePolicy) else {}
+
+
+def walk(root, children_of) -> dict:
+    """
+    :return: dict of id -> (id of the node, id of its parent) of all the nodes under the given root
+    """
+    entries = dict()
+
+    def visit(parent):
+        for node_id, child in children_of(parent).items():
+            entries[node_id] = (child.id, parent.id)
+            visit(child)
+
+    visit(root)
+    return entries
+
+
+def indexed(store: Store, index_name: str, node_model) -> dict:
+    """
+    :return: dict of id -> (id of the node, id of its parent) of all the nodes in the db that the index finds
+    """
+    index = getattr(store, index_name)
+    node_ids = [node_id for (node_id,) in dal.query(node_model.id)]
+    return {node_id: (index.find(node_id).id, index.parent_of(node_id).id) for node_id in node_ids
+            if node_id in index}
+
+
+def assert_consistent(store: Store):
+    assert indexed(store, "discount_index", _IDiscount) == walk(store.discount_root, discount_children)
+    assert indexed(store, "policy_index", IShoppingPolicies) == walk(store.shopping_policies, policy_children)
+
+
+def pick_unrelated(rng: random.Random, store: Store, ids: list, index_name: str) -> list:
+    """
+    :return: a few of the given ids, without ids that are under another one of them
+    """
+    index = getattr(store, index_name)
+    picked = rng.sample(ids, min(len(ids), rng.randint(2, 3)))
+
+    def ancestors(node_id):
+        parent = index.parent_of(node_id)
+        while parent is not None and parent.id in index:
+            yield parent.id
+            parent = index.parent_of(parent.id)
+
+    return [i for i in picked if not any(a in picked for a in ancestors(i))]
+
+
+def random_discount_edit(rng: random.Random, store: Store):
+    ids = list(walk(store.discount_root, discount_children).keys())
+    action = rng.choice(["add", "add", "combine", "edit", "remove"]) if len(ids) > 1 else "add"
+    product = rng.choice(PRODUCTS)
+    if action == "add":
+        assert store.add_simple_product_discount(VALID, 0.1, product).succeed
+    elif action == "combine":
+        to_combine = pick_unrelated(rng, store, ids, "discount_index")
+        assert store.combine_discounts(to_combine, rng.choice(OPERATORS)).succeed
+    elif action == "edit":
+        assert store.add_simple_category_discount(VALID, 0.2, f"{product}_category", discount_id=rng.choice(ids)) \
+            .succeed
+    else:
+        assert store.remove_discount_from_store(rng.choice(ids)).succeed
+
+
+def random_policy_edit(rng: random.Random, store: Store):
+    ids = list(walk(store.shopping_policies, policy_children).keys())
+    action = rng.choice(["add", "add", "combine", "edit", "remove"]) if len(ids) > 1 else "add"
+    product = rng.choice(PRODUCTS)
+    if action == "add":
+        assert store.add_policy(None, None, product, None, rng.randint(5, 50), None, None, None, "").succeed
+    elif action == "combine":
+        to_combine = pick_unrelated(rng, store, ids, "policy_index")
+        assert store.combine_policies(to_combine, rng.choice(OPERATORS)).succeed
+    elif action == "edit":
+        assert store.add_policy(rng.randint(1, 3), None, None, None, None, None, None, None, "",
+                                policy_id=rng.choice(ids)).succeed
+    else:
+        assert store.remove_policy_from_store(rng.choice(ids)).succeed
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_index_stays_consistent_under_random_edits(seed):
+    with test_flask.app_context():
+        rng = random.Random(seed)
+        store = make_store(f"index_random_{seed}", STOCK, owner)
+        for _ in range(STEPS):
+            random_discount_edit(rng, store)
+            random_policy_edit(rng, store)
+            assert_consistent(store)
+
+
+def test_nested_nodes_are_removed_and_edited_through_their_parent():
+    with test_flask.app_context():
+        store = make_store("index_nested", STOCK, owner)
+        first = store.add_simple_product_discount(VALID, 0.1, "milk").data
+        second = store.add_simple_product_discount(VALID, 0.1, "bread").data
+        combined = store.combine_discounts([first, second], "or").data
+        assert store.discount_index.parent_of(second).id == combined
+        edited = store.add_simple_product_discount(VALID, 0.3, "eggs", discount_id=second).data
+        assert store.discount_index.parent_of(edited).id == combined and second not in store.discount_index
+        assert store.remove_discount_from_store(first).succeed
+        assert list(store.discount_root.search_for_discount(combined).children_discounts_dict.keys()) == [edited]
+        assert not store.remove_discount_from_store(first).succeed
+
+        policies = [store.add_policy(None, None, p, 1, None, None, None, None, "").data for p in PRODUCTS[:3]]
+        store.combine_policies(policies[:2], "or")
+        # the policy is the second child of the combined policy
+        assert store.remove_policy_from_store(policies[1]).succeed
+        assert_consistent(store)
+
+
+def test_nodes_of_other_stores_are_not_found():
+    with test_flask.app_context():
+        store = make_store("index_mine", STOCK, owner)
+        other = make_store("index_other", STOCK, owner)
+        first = other.add_simple_product_discount(VALID, 0.1, "milk").data
+        second = other.add_simple_product_discount(VALID, 0.1, "bread").data
+        combined = other.combine_discounts([first, second], "or").data
+        policy = other.add_policy(None, None, "milk", 1, None, None, None, None, "").data
+        for node_id in [first, combined, other.discount_root.id]:
+            assert store.discount_index.find(node_id) is None and store.discount_index.parent_of(node_id) is None
+        assert policy not in store.policy_index
+        assert not store.remove_discount_from_store(first).succeed
+        assert not store.remove_policy_from_store(policy).succeed
+        assert other.discount_index.parent_of(first).id == combined
+        assert_consistent(store)
+        assert_consistent(other)
+
+
+def test_nodes_of_a_loaded_store_are_found():
+    with test_flask.app_context():
+        dal.renew_session()
+        dal.add(owner, add_only=True)
+        store = make_store("index_loaded", STOCK, owner)
+        first = store.add_simple_product_discount(VALID, 0.1, "milk").data
+        second = store.add_simple_product_discount(VALID, 0.1, "bread").data
+        combined = store.combine_discounts([first, second], "xor").data
+        dal.drop_session()
+
+        dal.renew_session()
+        loaded: Store = dal.query(Store).filter_by(_name="index_loaded").one()
+        assert loaded.discount_index.parent_of(second).id == combined
+        assert loaded.remove_discount_from_store(second).succeed
+        assert_consistent(loaded)
+        dal.drop_session()